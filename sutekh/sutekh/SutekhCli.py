@@ -24,10 +24,16 @@ from sutekh.core.Filters import PhysicalCardSetFilter, FilterAndBox, \
 from sutekh.core.FilterParser import FilterParser
 from sutekh.SutekhUtility import refresh_tables, read_white_wolf_list, \
         read_rulings, gen_temp_dir, prefs_dir, ensure_dir_exists, sqlite_uri, \
-        is_crypt_card, format_text, read_exp_date_list
+        is_crypt_card, format_text, read_exp_date_list, update_white_wolf_list
 from sutekh.core.DatabaseUpgrade import attempt_database_upgrade
 from sutekh.core.CardSetHolder import CardSetWrapper
+from sutekh.core.CardLookup import DEFAULT_LOOKUP, FuzzyLookup
 from sutekh.core.CardSetUtilities import format_cs_list
+from sutekh.core.CountedRelatedJoin import set_count_storage
+from sutekh.core.QueryProfiler import start_profiling, stop_profiling, \
+        get_profiler
+from sutekh.core.SutekhObjectCache import invalidate_cache_snapshot, \
+        get_snapshot_file
 from sutekh.io.XmlFileHandling import PhysicalCardXmlFile, \
         PhysicalCardSetXmlFile, AbstractCardSetXmlFile, \
         write_all_pcs
@@ -53,6 +59,16 @@ def parse_options(aArgs):
                   type="string", dest="extra_file", default=None,
                   help="Text file to read extra storyline"
                           "cards from.")
+    oOptParser.add_option("-j", "--processes",
+                  type="int", dest="processes", default=1,
+                  help="Number of processes to use when parsing the "
+                          "card lists and writing zip files. [1]")
+    oOptParser.add_option("--update-cards",
+                  action="store_true", dest="update_cards", default=False,
+                  help="Update the existing card list from the --ww-file and"
+                          " --extra-file card lists, changing only the"
+                          " cards which differ and keeping the card sets."
+                          " Cannot be used with --refresh-tables")
     oOptParser.add_option("--ruling-file",
                   type="string", dest="ruling_file", default=None,
                   help="HTML file (probably from WW website) to read "
@@ -75,6 +91,14 @@ def parse_options(aArgs):
     oOptParser.add_option("--sql-debug",
                   action="store_true", dest="sql_debug", default=False,
                   help="Print out SQL statements.")
+    oOptParser.add_option("--profile",
+                  action="store_true", dest="profile", default=False,
+                  help="Print a summary of the SQL queries run by each "
+                          "operation to stderr when done.")
+    oOptParser.add_option("--count-storage",
+                  action="store_true", dest="count_storage", default=False,
+                  help="Store a single counted entry for each card in a "
+                          "card set, rather than one entry per copy.")
     oOptParser.add_option("-l", "--read-physical-cards-from",
                   type="string", dest="read_physical_cards_from", default=None,
                   help="Read physical card list from the given XML file.")
@@ -111,6 +135,10 @@ def parse_options(aArgs):
     oOptParser.add_option("--restore-zip",
             type="string", dest="restore_zip_name", default=None,
             help="Restore everything from the given zipfile")
+    oOptParser.add_option("--fuzzy-names",
+            action="store_true", dest="fuzzy_names", default=False,
+            help="When reading card sets, replace unknown card names with "
+                    "the closest card name, if the match is close enough.")
     oOptParser.add_option("--print-cs",
             type="string", dest="print_cs", default=None,
             help="Print the given card set (ARDB Text format)")
@@ -210,7 +238,7 @@ def run_filter(oFilter, oCardSet, bDetailed, sEncoding):
         for oCard in aResults:
             oAbsCard = IAbstractCard(oCard)
             dResults.setdefault(oAbsCard, 0)
-            dResults[oAbsCard] += 1
+            dResults[oAbsCard] += oCard.count
     else:
         # Filter WW cardlist
         oBaseFilter = PhysicalCardFilter()
@@ -258,6 +286,12 @@ def main_with_args(aTheArgs):
     if oOpts.sql_debug:
         oConn.debug = True
 
+    if oOpts.profile:
+        start_profiling(oConn)
+
+    if oOpts.count_storage:
+        set_count_storage(True)
+
     # Only log critical messages by default
     oRootLogger = logging.getLogger()
     oRootLogger.setLevel(level=logging.CRITICAL)
@@ -272,6 +306,12 @@ def main_with_args(aTheArgs):
         oLogHandler = logging.StreamHandler(sys.stderr)
         oRootLogger.addHandler(oLogHandler)
 
+    if oOpts.update_cards and (oOpts.refresh_tables or
+            oOpts.ww_file is None):
+        print "--update-cards requires --ww-file, and cannot be used with" \
+                " --refresh-tables"
+        return 1
+
     if oOpts.reload:
         if not oOpts.refresh_tables:
             print "reload should be called with --refresh-tables"
@@ -282,7 +322,7 @@ def main_with_args(aTheArgs):
                     tempfile.mkstemp('.zip', 'sutekh', sTempdir)
             os.close(fTemp)
             oZipFile = ZipFileWrapper(sReloadZipName)
-            oZipFile.do_dump_all_to_zip(oLogHandler)
+            oZipFile.do_dump_all_to_zip(oLogHandler, oOpts.processes)
             # We dump the databases here
             # We will reload them later
 
@@ -301,11 +341,18 @@ def main_with_args(aTheArgs):
             print "refresh failed"
             return 1
 
-    if not oOpts.ww_file is None:
-        read_white_wolf_list([WwFile(oOpts.ww_file)], oLogHandler)
+    if oOpts.update_cards:
+        aFiles = [WwFile(oOpts.ww_file)]
+        if not oOpts.extra_file is None:
+            aFiles.append(WwFile(oOpts.extra_file))
+        update_white_wolf_list(aFiles, oLogHandler, oOpts.processes)
+    elif not oOpts.ww_file is None:
+        read_white_wolf_list([WwFile(oOpts.ww_file)], oLogHandler,
+                oOpts.processes)
 
-    if not oOpts.extra_file is None:
-        read_white_wolf_list([WwFile(oOpts.extra_file)], oLogHandler)
+    if not oOpts.extra_file is None and not oOpts.update_cards:
+        read_white_wolf_list([WwFile(oOpts.extra_file)], oLogHandler,
+                oOpts.processes)
 
     if not oOpts.date_file is None:
         read_exp_date_list([WwFile(oOpts.date_file)], oLogHandler)
@@ -314,14 +361,23 @@ def main_with_args(aTheArgs):
         read_rulings([WwFile(oOpts.ruling_file)], oLogHandler)
 
     if oOpts.fetch:
-        read_white_wolf_list([WwFile(WW_CARDLIST_URL, True)], oLogHandler)
+        read_white_wolf_list([WwFile(WW_CARDLIST_URL, True)], oLogHandler,
+                oOpts.processes)
         aRulings = [WwFile(sUrl, True) for sUrl in WW_RULINGS_URL]
         read_rulings(aRulings, oLogHandler)
-        read_white_wolf_list([WwFile(EXTRA_CARD_URL, True)], oLogHandler)
+        read_white_wolf_list([WwFile(EXTRA_CARD_URL, True)], oLogHandler,
+                oOpts.processes)
         read_exp_date_list([WwFile(EXP_DATE_URL, True)], oLogHandler)
 
+    # There's no user to ask about unknown card names, so the closest
+    # match is used if requested
+    oCardLookup = DEFAULT_LOOKUP
+    if oOpts.fuzzy_names:
+        oCardLookup = FuzzyLookup()
+
     if not oOpts.read_physical_cards_from is None:
-        oFile = PhysicalCardXmlFile(oOpts.read_physical_cards_from)
+        oFile = PhysicalCardXmlFile(oOpts.read_physical_cards_from,
+                oLookup=oCardLookup)
         oFile.read()
 
     if oOpts.save_all_css and not oOpts.save_cs is None:
@@ -333,11 +389,11 @@ def main_with_args(aTheArgs):
 
     if oOpts.dump_zip_name is not None:
         oZipFile = ZipFileWrapper(oOpts.dump_zip_name)
-        oZipFile.do_dump_all_to_zip(oLogHandler)
+        oZipFile.do_dump_all_to_zip(oLogHandler, oOpts.processes)
 
     if oOpts.restore_zip_name is not None:
         oZipFile = ZipFileWrapper(oOpts.restore_zip_name)
-        oZipFile.do_restore_from_zip(oLogHandler=oLogHandler)
+        oZipFile.do_restore_from_zip(oCardLookup, oLogHandler)
 
     if not oOpts.save_cs is None:
         oFile = PhysicalCardSetXmlFile(oOpts.cs_filename)
@@ -406,16 +462,16 @@ def main_with_args(aTheArgs):
             return 1
 
     if not oOpts.read_cs is None:
-        oFile = PhysicalCardSetXmlFile(oOpts.read_cs)
+        oFile = PhysicalCardSetXmlFile(oOpts.read_cs, oCardLookup)
         oFile.read()
 
     if not oOpts.read_acs is None:
-        oFile = AbstractCardSetXmlFile(oOpts.read_acs)
+        oFile = AbstractCardSetXmlFile(oOpts.read_acs, oCardLookup)
         oFile.read()
 
     if oOpts.reload:
         oZipFile = ZipFileWrapper(sReloadZipName)
-        oZipFile.do_restore_from_zip(oLogHandler=oLogHandler)
+        oZipFile.do_restore_from_zip(oCardLookup, oLogHandler)
         os.remove(sReloadZipName)
         os.rmdir(sTempdir)
 
@@ -426,6 +482,17 @@ def main_with_args(aTheArgs):
     if oOpts.upgrade_db:
         attempt_database_upgrade(oLogHandler)
 
+    if oOpts.refresh_tables or oOpts.refresh_ruling_tables or \
+            oOpts.refresh_physical_card_tables or oOpts.ww_file or \
+            oOpts.extra_file or oOpts.date_file or oOpts.ruling_file or \
+            oOpts.fetch or oOpts.upgrade_db:
+        # The cached card data may be stale, so ensure the gui rebuilds it
+        invalidate_cache_snapshot(get_snapshot_file())
+
+    if oOpts.profile:
+        sys.stderr.write(get_profiler().get_report() + '\n')
+        stop_profiling()
+
     return 0
 
 
@@ -17,6 +17,8 @@ from sutekh.SutekhUtility import prefs_dir, ensure_dir_exists, sqlite_uri, \
         get_database_url
 from sutekh.gui.SutekhMainWindow import SutekhMainWindow
 from sutekh.core.DatabaseVersion import DatabaseVersion
+from sutekh.core.CountedRelatedJoin import set_count_storage
+from sutekh.core.QueryProfiler import start_profiling
 from sutekh.gui.ConfigFile import ConfigFile
 from sutekh.gui.GuiDBManagement import do_db_upgrade, initialize_db
 from sutekh.gui.SutekhDialog import do_complaint_error, do_complaint_warning, \
@@ -43,6 +45,15 @@ def parse_options(aArgs):
     oOptParser.add_option("--sql-debug",
                   action="store_true", dest="sql_debug", default=False,
                   help="Print out SQL statements.")
+    oOptParser.add_option("--profile",
+                  action="store_true", dest="profile", default=False,
+                  help="Record the SQL queries run by each operation from "
+                          "startup. The results are shown by the SQL Query "
+                          "Profile plugin.")
+    oOptParser.add_option("--count-storage",
+                  action="store_true", dest="count_storage", default=False,
+                  help="Store a single counted entry for each card in a "
+                          "card set, rather than one entry per copy.")
     oOptParser.add_option("--verbose",
             action="store_true", dest="verbose", default=False,
             help="Display warning messages")
@@ -166,6 +177,12 @@ def main():
     if oOpts.sql_debug:
         oConn.debug = True
 
+    if oOpts.profile:
+        start_profiling(oConn)
+
+    if oOpts.count_storage:
+        set_count_storage(True)
+
     # Check we have the correct gtk version
     sMessage = gtk.check_version(2, 16, 0)
     if sMessage is not None:
@@ -198,7 +215,7 @@ def main():
 
     _oRootLogger = setup_logging(oOpts)
 
-    oMainWindow.setup(oConfig)
+    oMainWindow.setup(oConfig, bProgressiveLoad=True)
     oMainWindow.run()
 
     # Save Config Changes
@@ -18,7 +18,9 @@ import urlparse
 from sutekh.core.SutekhObjects import VersionTable, flush_cache, CRYPT_TYPES, \
         PhysicalCardSet, canonical_to_csv
 from sutekh.core.DatabaseVersion import DatabaseVersion
-from sutekh.io.WhiteWolfTextParser import WhiteWolfTextParser
+from sutekh.core.BulkCardWriter import BulkCardWriter
+from sutekh.core.QueryProfiler import profile_operation
+from sutekh.io.WhiteWolfTextParser import parse_card_records
 from sutekh.io.RulingParser import RulingParser
 from sutekh.io.ExpDateCSVParser import ExpDateCSVParser
 
@@ -44,22 +46,38 @@ def refresh_tables(aTables, oConn, bMakeCache=True):
     return True
 
 
-def read_white_wolf_list(aWwFiles, oLogHandler=None):
+@profile_operation('Read card list')
+def read_white_wolf_list(aWwFiles, oLogHandler=None, iProcesses=1):
     """Parse in a new White Wolf cardlist
 
        aWwList is a list of objects with a .open() method (e.g.
        sutekh.io.WwFile.WwFile's)
+
+       The card list is parsed into CardRecords, using iProcesses
+       processes, which are then written to the database in bulk.
        """
     flush_cache()
-    oOldConn = sqlhub.processConnection
-    sqlhub.processConnection = oOldConn.transaction()
-    oParser = WhiteWolfTextParser(oLogHandler)
-    for oFile in aWwFiles:
-        fIn = oFile.open()
-        oParser.parse(fIn)
-        fIn.close()
-    sqlhub.processConnection.commit(close=True)
-    sqlhub.processConnection = oOldConn
+    aRecords = parse_card_records(aWwFiles, oLogHandler, iProcesses)
+    oWriter = BulkCardWriter(oLogHandler)
+    oWriter.write(aRecords, sqlhub.processConnection)
+    # Ensure nothing cached refers to the old card list
+    flush_cache()
+
+
+def update_white_wolf_list(aWwFiles, oLogHandler=None, iProcesses=1):
+    """Update the existing card list to match a new White Wolf cardlist.
+
+       aWwFiles should contain all the card list files (including the
+       extra card list), since cards which aren't listed are removed.
+       Only the changed cards are updated, and card sets are left alone,
+       so this is much quicker than refreshing the tables and reloading
+       the card sets when only a few cards have changed.
+
+       Returns the ids of the cards which were added, changed or
+       removed."""
+    aRecords = parse_card_records(aWwFiles, oLogHandler, iProcesses)
+    oWriter = BulkCardWriter(oLogHandler)
+    return oWriter.update(aRecords, sqlhub.processConnection)
 
 
 def read_rulings(aRulings, oLogHandler=None):
@@ -263,10 +281,12 @@ def norm_xml_quotes(sData):
     return sData.replace('&apos;', "'")
 
 
-def get_database_url():
+def get_database_url(oConn=None):
     """Return the database url, with the password stripped out if
        needed"""
-    sDBuri = sqlhub.processConnection.uri()
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    sDBuri = oConn.uri()
     # pylint: disable-msg=E1103
     # pylint doesn't like the SpiltResult named tuple
     tParsed = urlparse.urlsplit(sDBuri)
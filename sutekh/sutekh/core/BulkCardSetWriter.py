@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Create several card sets, or change the cards in them, in bulk.
+
+   This is used when restoring backups, where creating each card set and
+   card set entry as a separate SQLObject is the main cost, and when
+   pasting or changing the counts of many cards at once."""
+
+import time
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Table, Select, IN, AND
+from sutekh.core.SutekhObjects import PhysicalCardSet, PhysicalCard, \
+        MapPhysicalCardToPhysicalCardSet, make_adaptor_caches
+from sutekh.core.CountedRelatedJoin import get_count_storage
+from sutekh.core.BulkCardWriter import BulkWriter, db_value, \
+        get_db_names, refresh_cached
+from sutekh.core.QueryProfiler import profile_operation
+
+# The PhysicalCardSet columns, as returned by
+# CardSetHolder.get_card_set_values
+CARD_SET_COLUMNS = ('name', 'author', 'comment', 'annotations', 'inuse')
+
+
+class BulkCardSetWriter(BulkWriter):
+    """Write card sets from card set holders to the database.
+
+       The card sets are inserted with a single executemany call, the
+       parents are filled in with a second, and all the card set entries
+       are written with a third, all inside one transaction, so either
+       all the card sets are created or none of them are.
+       """
+
+    def __init__(self, oLogHandler=None):
+        super(BulkCardSetWriter, self).__init__('Bulk card set writer',
+                oLogHandler)
+
+    def _read_card_set_ids(self):
+        """Return a dictionary of card set name to id, for all the card
+           sets in the database.
+
+           The names are utf8 encoded, as for CardSetHolder names."""
+        oTable = Table(PhysicalCardSet.sqlmeta.table)
+        return dict([(db_value(sName), iId) for iId, sName in
+            self._query(Select([oTable.id, oTable.name]))])
+
+    def _delete_card_sets(self):
+        """Remove all the existing card sets and their entries.
+
+           Returns the ids of the removed card sets."""
+        aOldIds = self._read_card_set_ids().values()
+        for cClass in (MapPhysicalCardToPhysicalCardSet, PhysicalCardSet):
+            self._oTrans.query('DELETE FROM %s' % cClass.sqlmeta.table)
+        self.oLogger.info('Removed %d existing card sets', len(aOldIds))
+        return aOldIds
+
+    def _write_card_sets(self, aCardSets):
+        """Insert the card sets and set their parents.
+
+           Returns the dictionary of card set name to id."""
+        sTable = PhysicalCardSet.sqlmeta.table
+        aRows = []
+        for oHolder, _aPhysCards in aCardSets:
+            dValues = oHolder.get_card_set_values()
+            aRows.append([dValues[sAttr] for sAttr in CARD_SET_COLUMNS])
+        self._insert(sTable, get_db_names(PhysicalCardSet,
+            CARD_SET_COLUMNS), aRows)
+        dIds = self._read_card_set_ids()
+        aParents = []
+        for oHolder, _aPhysCards in aCardSets:
+            if not oHolder.parent:
+                continue
+            sParent = db_value(oHolder.parent)
+            if sParent in dIds:
+                aParents.append((dIds[sParent], dIds[oHolder.name]))
+            else:
+                # Same as CardSetHolder.get_parent_pcs
+                oHolder.add_warning("Parent Card Set %s not found" %
+                        oHolder.parent)
+        self._update(sTable, get_db_names(PhysicalCardSet, ('parentID',)),
+                aParents)
+        return dIds
+
+    def _write_cards(self, aCardSets, dIds):
+        """Insert the card set entries, honouring the count storage
+           setting"""
+        aRows = []
+        bCountStorage = get_count_storage()
+        for oHolder, aPhysCards in aCardSets:
+            iSetId = dIds[oHolder.name]
+            if bCountStorage:
+                # A single counted entry for each distinct card
+                dCounts = {}
+                for oPhysCard in aPhysCards:
+                    if not oPhysCard:
+                        continue
+                    dCounts.setdefault(oPhysCard.id, 0)
+                    dCounts[oPhysCard.id] += 1
+                aRows.extend([(iCardId, iSetId, iCount) for iCardId, iCount
+                    in sorted(dCounts.iteritems())])
+            else:
+                aRows.extend([(oPhysCard.id, iSetId, 1) for oPhysCard in
+                    aPhysCards if oPhysCard])
+        self._insert(MapPhysicalCardToPhysicalCardSet.sqlmeta.table,
+                get_db_names(MapPhysicalCardToPhysicalCardSet,
+                    ('physicalCardID', 'physicalCardSetID', 'count')), aRows)
+
+    def _read_entry_ids(self, aSetIds):
+        """Return the ids of the card set entries for the given card
+           sets"""
+        oTable = Table(MapPhysicalCardToPhysicalCardSet.sqlmeta.table)
+        oSetCol = getattr(oTable, get_db_names(
+            MapPhysicalCardToPhysicalCardSet, ('physicalCardSetID',))[0])
+        return [tRow[0] for tRow in self._query(Select(oTable.id,
+            where=IN(oSetCol, aSetIds)))]
+
+    # pylint: disable-msg=W0702
+    # We want to rollback on any error
+    def write(self, aCardSets, oConn=None, bReplace=False):
+        """Create the card sets in the database.
+
+           aCardSets is a list of (card set holder, list of physical cards)
+           pairs, with the physical cards as returned by
+           CachedCardSetHolder.lookup_physical_cards. The parents can
+           either be in aCardSets or already in the database. Any warnings
+           are added to the holders.
+
+           If bReplace is True, all the existing card sets are removed in
+           the same transaction, so they are only lost if the new card
+           sets are written successfully.
+
+           Returns the dictionary of card set name to id."""
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        fStart = time.time()
+        self._start(oConn)
+        aOldIds = []
+        try:
+            if bReplace:
+                aOldIds = self._delete_card_sets()
+            dIds = self._write_card_sets(aCardSets)
+            self._write_cards(aCardSets, dIds)
+            aSetIds = [dIds[oHolder.name] for oHolder, _aPhysCards in
+                    aCardSets]
+            aEntryIds = self._read_entry_ids(aSetIds)
+        except:
+            self._finish(False)
+            raise
+        self._finish(True)
+        # The ids may have been used by deleted card sets, so ensure any
+        # cached copies of those are reloaded, and drop the removed ones
+        refresh_cached(oConn, PhysicalCardSet, set(aOldIds) | set(aSetIds))
+        if bReplace:
+            oConn.cache.clear(MapPhysicalCardToPhysicalCardSet)
+            make_adaptor_caches()
+        else:
+            refresh_cached(oConn, MapPhysicalCardToPhysicalCardSet,
+                    aEntryIds)
+        fTime = max(time.time() - fStart, 0.001)
+        self.oLogger.info('Wrote %d card sets (%d rows) in %.2f seconds,'
+                ' %.0f rows per second', len(aCardSets), self._iRows, fTime,
+                self._iRows / fTime)
+        return dIds
+
+
+class CardCountWriter(BulkWriter):
+    """Change the number of copies of cards in several card sets at once.
+
+       The existing entries are read with one query per card set, and all
+       the inserts, updates and deletes are done with an executemany call
+       each, inside one transaction, rather than with a few queries for
+       each copy.
+       """
+
+    def __init__(self, oLogHandler=None):
+        super(CardCountWriter, self).__init__('Card count writer',
+                oLogHandler)
+        self._aInserts = []
+        self._dUpdates = {}
+        self._aDeletes = []
+
+    def _read_entries(self, iSetId, aAbsIds):
+        """Read the card set's entries for the cards with the given
+           abstract card ids.
+
+           Returns a dictionary of physical card id to the list of
+           [entry id, count] pairs, oldest first, and a dictionary of
+           abstract card id to the list of physical card ids."""
+        oMap = Table(MapPhysicalCardToPhysicalCardSet.sqlmeta.table)
+        oCard = Table(PhysicalCard.sqlmeta.table)
+        sCardCol, sSetCol, sCountCol = get_db_names(
+                MapPhysicalCardToPhysicalCardSet, ('physicalCardID',
+                    'physicalCardSetID', 'count'))
+        oCardCol = getattr(oMap, sCardCol)
+        oAbsCol = getattr(oCard, get_db_names(PhysicalCard,
+            ('abstractCardID',))[0])
+        dEntries = {}
+        dByAbs = {}
+        for iEntryId, iCardId, iAbsId, iCount in self._query(Select([
+                oMap.id, oCardCol, oAbsCol, getattr(oMap, sCountCol)],
+                where=AND(getattr(oMap, sSetCol) == iSetId,
+                    oCard.id == oCardCol, IN(oAbsCol, aAbsIds)),
+                orderBy=oMap.id)):
+            if iCardId not in dEntries:
+                dEntries[iCardId] = []
+                dByAbs.setdefault(iAbsId, []).append(iCardId)
+            dEntries[iCardId].append([iEntryId, iCount])
+        return dEntries, dByAbs
+
+    def _remove(self, aEntries, iNum):
+        """Remove up to iNum copies from the entries, newest entry first,
+           as remove_map_card does. Returns the number removed."""
+        iRemoved = 0
+        while aEntries and iRemoved < iNum:
+            aEntry = aEntries[-1]
+            iTake = min(iNum - iRemoved, aEntry[1])
+            aEntry[1] -= iTake
+            iRemoved += iTake
+            if aEntry[1] > 0:
+                self._dUpdates[aEntry[0]] = aEntry[1]
+            else:
+                self._dUpdates.pop(aEntry[0], None)
+                self._aDeletes.append((aEntry[0],))
+                aEntries.pop()
+        return iRemoved
+
+    def _add(self, iSetId, iCardId, aEntries, iNum):
+        """Add iNum copies, honouring the count storage setting"""
+        if not get_count_storage():
+            self._aInserts.extend([(iCardId, iSetId, 1)] * iNum)
+        elif aEntries:
+            # Add to the first entry, as SOCountedRelatedJoin.add does
+            aEntries[0][1] += iNum
+            self._dUpdates[aEntries[0][0]] = aEntries[0][1]
+        else:
+            self._aInserts.append((iCardId, iSetId, iNum))
+
+    def _change_card_set(self, iSetId, dCardChanges):
+        """Work out the changes needed for a single card set.
+
+           Returns a dictionary of physical card id to the change made."""
+        dEntries, dByAbs = self._read_entries(iSetId, list(set([
+            oCard.abstractCardID for oCard in dCardChanges])))
+        dDone = {}
+        # Removals first, so copies added to other expansions aren't
+        # removed in their place
+        for oCard, iChg in dCardChanges.iteritems():
+            if iChg >= 0:
+                continue
+            aCardIds = [oCard.id]
+            if oCard.expansionID is None:
+                # As for CardSetController.dec_card, we remove the
+                # copies without an expansion first, and then copies
+                # from the other expansions.
+                aCardIds.extend(sorted([iId for iId in
+                    dByAbs.get(oCard.abstractCardID, []) if iId != oCard.id]))
+            iLeft = -iChg
+            for iCardId in aCardIds:
+                iRemoved = self._remove(dEntries.get(iCardId, []), iLeft)
+                if iRemoved:
+                    dDone[iCardId] = dDone.get(iCardId, 0) - iRemoved
+                    iLeft -= iRemoved
+        for oCard, iChg in dCardChanges.iteritems():
+            if iChg > 0:
+                self._add(iSetId, oCard.id, dEntries.setdefault(oCard.id,
+                    []), iChg)
+                dDone[oCard.id] = dDone.get(oCard.id, 0) + iChg
+        return dDone
+
+    # pylint: disable-msg=W0702
+    # We want to rollback on any error
+    @profile_operation('Change card counts')
+    def write(self, dChanges, oConn=None):
+        """Apply the changes to the card sets.
+
+           dChanges is a dictionary of card set to a dictionary of
+           physical card to the number of copies to add (or remove, if
+           negative). Removing more copies than the card set has removes
+           all the copies.
+
+           Returns a dictionary of card set to a dictionary of physical
+           card to the change actually made, leaving out the cards which
+           didn't change."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        self._aInserts = []
+        self._dUpdates = {}
+        self._aDeletes = []
+        dDone = {}
+        self._start(oConn)
+        try:
+            for oCardSet, dCardChanges in dChanges.iteritems():
+                dDone[oCardSet] = self._change_card_set(oCardSet.id,
+                        dCardChanges)
+            sTable = MapPhysicalCardToPhysicalCardSet.sqlmeta.table
+            self._delete(sTable, ['id'], self._aDeletes)
+            self._update(sTable, get_db_names(
+                MapPhysicalCardToPhysicalCardSet, ('count',)),
+                [(iCount, iId) for iId, iCount in self._dUpdates.iteritems()])
+            self._insert(sTable, get_db_names(
+                MapPhysicalCardToPhysicalCardSet, ('physicalCardID',
+                    'physicalCardSetID', 'count')), self._aInserts)
+        except:
+            self._finish(False)
+            raise
+        self._finish(True)
+        # Ensure cached copies of the changed entries are reloaded, and
+        # the deleted ones dropped
+        refresh_cached(oConn, MapPhysicalCardToPhysicalCardSet,
+                self._dUpdates.keys() + [x[0] for x in self._aDeletes])
+        dResults = {}
+        for oCardSet, dCardIds in dDone.iteritems():
+            dCards = dict([(PhysicalCard.get(iCardId), iChg) for iCardId,
+                iChg in dCardIds.iteritems() if iChg])
+            if dCards:
+                dResults[oCardSet] = dCards
+        return dResults
@@ -0,0 +1,795 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Write the card list to the database in bulk.
+
+   The card list parser fills in plain CardRecords rather than creating
+   the database objects one at a time. BulkCardWriter then writes the
+   records out a table at a time, using batched inserts inside a single
+   transaction."""
+
+import time
+from logging import Logger, NullHandler
+from sqlobject import sqlhub, SQLObjectNotFound
+from sqlobject.sqlbuilder import Table, Select
+from sutekh.core.Abbreviations import CardTypes, Clans, Creeds, Disciplines, \
+        Expansions, Rarities, Sects, Titles, Virtues
+from sutekh.core.SutekhObjects import AbstractCard, PhysicalCard, \
+        Expansion, Rarity, RarityPair, Discipline, DisciplinePair, Clan, \
+        Creed, Virtue, CardType, Sect, Title, Keyword, Artist, \
+        MapPhysicalCardToPhysicalCardSet, make_adaptor_caches
+from sutekh.core.CachedRelatedJoin import SOCachedRelatedJoin
+
+# The AbstractCard columns filled in by the card list parser
+CARD_COLUMNS = ('text', 'search_text', 'group', 'capacity', 'cost',
+        'costtype', 'life', 'level')
+
+# The AbstractCard joins filled in by the card list parser
+CARD_JOINS = ('discipline', 'rarity', 'clan', 'cardtype', 'sect', 'title',
+        'creed', 'virtue', 'artists', 'keywords')
+
+
+def _to_unicode(oValue):
+    """Convert strings read from the database to unicode, so they can be
+       compared with the parsed values."""
+    if isinstance(oValue, str):
+        return oValue.decode('utf8')
+    elif isinstance(oValue, tuple):
+        return tuple([_to_unicode(x) for x in oValue])
+    return oValue
+
+
+def db_value(oValue):
+    """Encode unicode values for the database, as UnicodeCol does"""
+    if isinstance(oValue, unicode):
+        return oValue.encode('utf8')
+    return oValue
+
+
+def refresh_cached(oConn, cClass, aIds):
+    """Reload the cached instances of cClass with the given ids.
+
+       Expiring the ids from the connection cache isn't enough, since
+       objects still in use (such as those held by the adaptor caches)
+       keep their old values. Instances of rows which are no longer in
+       the database are dropped from the cache."""
+    for iId in aIds:
+        oObj = oConn.cache.tryGet(iId, cClass)
+        if oObj is None:
+            continue
+        try:
+            oObj.sync()
+        except SQLObjectNotFound:
+            oConn.cache.expire(iId, cClass)
+
+
+def get_db_names(cClass, aAttrs):
+    """Return the database column names for the given attributes"""
+    return [cClass.sqlmeta.columns[sAttr].dbName for sAttr in aAttrs]
+
+
+class RarityPairRecord(tuple):
+    """(expansion, rarity) names, with the expansion available as for
+       RarityPair objects."""
+
+    expansion = property(lambda self: self[0])
+
+
+class CardRecord(object):
+    """Plain record of the card details, used by the card list parser in
+       place of an AbstractCard.
+
+       This provides the parts of the AbstractCard interface the parser
+       uses. The joins are lists of the names (or name pairs) of the
+       related objects. Columns which haven't been set read as None, and
+       get_values only returns those which have been set, so records for
+       the same card can be merged as the parser would update the
+       database.
+       """
+    # pylint: disable-msg=C0103
+    # Names match the AbstractCard ones
+
+    text = None
+    search_text = None
+    group = None
+    capacity = None
+    cost = None
+    costtype = None
+    life = None
+    level = None
+
+    def __init__(self, sName):
+        self.name = sName
+        self.canonicalName = sName.lower()
+        for sJoin in CARD_JOINS:
+            setattr(self, sJoin, [])
+        # The expansions to create physical cards for
+        self.expansions = []
+
+    def get_values(self):
+        """Return a dictionary of the columns which have been set"""
+        return dict([(sCol, getattr(self, sCol)) for sCol in CARD_COLUMNS
+            if sCol in self.__dict__])
+
+    def merge(self, oRecord):
+        """Merge in the details from a later record for the same card"""
+        for sCol, oValue in oRecord.get_values().iteritems():
+            setattr(self, sCol, oValue)
+        for sJoin in CARD_JOINS + ('expansions',):
+            aItems = getattr(self, sJoin)
+            for oItem in getattr(oRecord, sJoin):
+                if oItem not in aItems:
+                    aItems.append(oItem)
+
+    def addDisciplinePair(self, tPair):
+        """Add a (discipline, level) pair"""
+        self.discipline.append(tPair)
+
+    def addRarityPair(self, tPair):
+        """Add an (expansion, rarity) pair"""
+        self.rarity.append(tPair)
+
+    def addClan(self, sClan):
+        """Add a clan"""
+        self.clan.append(sClan)
+
+    def addCardType(self, sType):
+        """Add a card type"""
+        self.cardtype.append(sType)
+
+    def addSect(self, sSect):
+        """Add a sect"""
+        self.sect.append(sSect)
+
+    def addTitle(self, sTitle):
+        """Add a title"""
+        self.title.append(sTitle)
+
+    def addCreed(self, sCreed):
+        """Add a creed"""
+        self.creed.append(sCreed)
+
+    def addVirtue(self, sVirtue):
+        """Add a virtue"""
+        self.virtue.append(sVirtue)
+
+    def addArtist(self, sArtist):
+        """Add an artist"""
+        self.artists.append(sArtist)
+
+    def addKeyword(self, sKeyword):
+        """Add a keyword"""
+        self.keywords.append(sKeyword)
+
+    def syncUpdate(self):
+        """Records don't have pending updates, so there's nothing to do"""
+        pass
+
+
+class CardRecordMaker(object):
+    """Drop in replacement for SutekhObjectMaker which creates CardRecords
+       and the canonical names of the related objects, rather than
+       database objects.
+
+       The records are kept, in the order they were made, for the
+       BulkCardWriter.
+       """
+    # pylint: disable-msg=R0201
+    # Methods to match SutekhObjectMaker
+
+    def __init__(self):
+        self._aRecords = []
+
+    def get_records(self):
+        """Return the list of records"""
+        return self._aRecords
+
+    def make_card_type(self, sType):
+        """Return the canonical card type"""
+        return CardTypes.canonical(sType)
+
+    def make_clan(self, sClan):
+        """Return the canonical clan name"""
+        return Clans.canonical(sClan)
+
+    def make_creed(self, sCreed):
+        """Return the canonical creed name"""
+        return Creeds.canonical(sCreed)
+
+    def make_sect(self, sSect):
+        """Return the canonical sect name"""
+        return Sects.canonical(sSect)
+
+    def make_title(self, sTitle):
+        """Return the canonical title"""
+        return Titles.canonical(sTitle)
+
+    def make_virtue(self, sVirtue):
+        """Return the canonical virtue name"""
+        return Virtues.canonical(sVirtue)
+
+    def make_keyword(self, sKeyword):
+        """Return the keyword unchanged"""
+        return sKeyword
+
+    def make_artist(self, sArtist):
+        """Return the artist name unchanged"""
+        return sArtist
+
+    def make_rarity_pair(self, sExp, sRarity):
+        """Return the canonical expansion and rarity names"""
+        return RarityPairRecord((Expansions.canonical(sExp),
+            Rarities.canonical(sRarity)))
+
+    def make_discipline_pair(self, sDiscipline, sLevel):
+        """Return the canonical discipline name and level"""
+        return (Disciplines.canonical(sDiscipline), sLevel)
+
+    def make_abstract_card(self, sCard):
+        """Create a new record for the card"""
+        oRecord = CardRecord(sCard.strip())
+        self._aRecords.append(oRecord)
+        return oRecord
+
+    def make_physical_card(self, oRecord, sExp):
+        """Add the expansion to the card record"""
+        if sExp not in oRecord.expansions:
+            oRecord.expansions.append(sExp)
+
+
+def merge_records(aRecords):
+    """Combine the records for the same card, keeping the order in which
+       the cards first appear."""
+    aMerged = []
+    dSeen = {}
+    for oRecord in aRecords:
+        if oRecord.canonicalName in dSeen:
+            dSeen[oRecord.canonicalName].merge(oRecord)
+        else:
+            dSeen[oRecord.canonicalName] = oRecord
+            aMerged.append(oRecord)
+    return aMerged
+
+
+def _name_row(cAbbrev, bShortname=False, bFullname=False):
+    """Return a function which gives the key and column values for the
+       lookup tables keyed on the canonical name."""
+
+    def _make_row(sName):
+        """Return the key and columns for sName"""
+        dRow = {'name': sName}
+        if bShortname:
+            dRow['shortname'] = cAbbrev.shortname(sName)
+        if bFullname:
+            dRow['fullname'] = cAbbrev.fullname(sName)
+        return sName, dRow
+
+    return _make_row
+
+
+def _artist_row(sArtist):
+    """Return the key and columns for an artist"""
+    return sArtist.lower(), {'canonicalName': sArtist.lower(),
+            'name': sArtist}
+
+
+def _keyword_row(sKeyword):
+    """Return the key and columns for a keyword"""
+    return sKeyword, {'keyword': sKeyword}
+
+
+# The lookup tables, in the order they're written, with the attributes
+# used as the key and a function giving the key and columns for an item
+LOOKUP_TABLES = (
+        (Expansion, ('name',), _name_row(Expansions, bShortname=True)),
+        (Rarity, ('name',), _name_row(Rarities, bShortname=True)),
+        (Discipline, ('name',), _name_row(Disciplines, bFullname=True)),
+        (Clan, ('name',), _name_row(Clans, bShortname=True)),
+        (Creed, ('name',), _name_row(Creeds, bShortname=True)),
+        (Virtue, ('name',), _name_row(Virtues, bFullname=True)),
+        (CardType, ('name',), _name_row(CardTypes)),
+        (Sect, ('name',), _name_row(Sects)),
+        (Title, ('name',), _name_row(Titles)),
+        (Keyword, ('keyword',), _keyword_row),
+        (Artist, ('canonicalName',), _artist_row),
+        )
+
+# The pair tables, with their key attributes and the CardRecord join
+PAIR_TABLES = (
+        (RarityPair, ('expansionID', 'rarityID'), 'rarity'),
+        (DisciplinePair, ('disciplineID', 'level'), 'discipline'),
+        )
+
+
+class BulkWriter(object):
+    """Base class for writing rows to the database in bulk.
+
+       This provides the helpers for batched inserts, updates and deletes
+       inside a single transaction. Subclasses call _start and _finish
+       around their writes."""
+
+    def __init__(self, sLoggerName, oLogHandler=None):
+        self.oLogger = Logger(sLoggerName)
+        if oLogHandler is None:
+            # Avoid the missing handler warning when there's no one to
+            # report to
+            oLogHandler = NullHandler()
+        self.oLogger.addHandler(oLogHandler)
+        self._oTrans = None
+        self._sMarker = None
+        self._iRows = 0
+
+    # pylint: disable-msg=W0212
+    # We need the DB-API connection from the transaction for executemany
+    def _query(self, oSelect):
+        """Run the select in the transaction"""
+        return self._oTrans.queryAll(self._oTrans.sqlrepr(oSelect))
+
+    def _insert(self, sTable, aColumns, aRows):
+        """Insert the rows using executemany"""
+        if not aRows:
+            return
+        sSQL = 'INSERT INTO %s (%s) VALUES (%s)' % (sTable,
+                ', '.join(aColumns), ', '.join([self._sMarker] *
+                    len(aColumns)))
+        oCursor = self._oTrans._connection.cursor()
+        oCursor.executemany(sSQL, [[db_value(x) for x in tRow]
+            for tRow in aRows])
+        oCursor.close()
+        self._iRows += len(aRows)
+        self.oLogger.info('Wrote %d rows to %s', len(aRows), sTable)
+
+    def _delete(self, sTable, aColumns, aRows):
+        """Delete the rows matching the given column values"""
+        if not aRows:
+            return
+        sSQL = 'DELETE FROM %s WHERE %s' % (sTable, ' AND '.join(
+            ['%s = %s' % (sCol, self._sMarker) for sCol in aColumns]))
+        oCursor = self._oTrans._connection.cursor()
+        oCursor.executemany(sSQL, aRows)
+        iRows = oCursor.rowcount
+        oCursor.close()
+        if iRows < 0:
+            # The database can't tell us how many rows were deleted
+            iRows = len(aRows)
+        self._iRows += iRows
+        self.oLogger.info('Removed %d rows from %s', iRows, sTable)
+
+    def _update(self, sTable, aColumns, aRows):
+        """Update the rows with the given ids. The id is the last value in
+           each row."""
+        if not aRows:
+            return
+        sSQL = 'UPDATE %s SET %s WHERE id = %s' % (sTable,
+                ', '.join(['%s = %s' % (sCol, self._sMarker) for sCol in
+                    aColumns]), self._sMarker)
+        oCursor = self._oTrans._connection.cursor()
+        oCursor.executemany(sSQL, [[db_value(x) for x in tRow]
+            for tRow in aRows])
+        oCursor.close()
+        self._iRows += len(aRows)
+        self.oLogger.info('Wrote %d rows to %s', len(aRows), sTable)
+    # pylint: enable-msg=W0212
+
+    def _start(self, oConn):
+        """Start the transaction"""
+        self._iRows = 0
+        self._sMarker = '%s'
+        if oConn.module.paramstyle == 'qmark':
+            self._sMarker = '?'
+        self._oTrans = oConn.transaction()
+
+    def _finish(self, bCommit):
+        """Commit or rollback the transaction"""
+        if bCommit:
+            self._oTrans.commit(close=True)
+        else:
+            self._oTrans.rollback()
+        self._oTrans = None
+
+
+class BulkCardWriter(BulkWriter):
+    """Write CardRecords to the database.
+
+       Each table is written with a single executemany call, and
+       everything is written inside one transaction, so the database
+       is either fully updated or left untouched. Cards already in the
+       database are updated, and the existing rows in the join tables
+       are kept, so this can be used to add extra cards to an existing
+       card list, as the WhiteWolfTextParser does.
+
+       The rows are inserted in the order in which the items first appear
+       in the records, so the ids are assigned in a consistent order.
+       """
+
+    def __init__(self, oLogHandler=None):
+        super(BulkCardWriter, self).__init__('Bulk card writer', oLogHandler)
+        self._dIds = {}
+        self._dJoins = {}
+        for oJoin in AbstractCard.sqlmeta.joins:
+            if oJoin.joinMethodName in CARD_JOINS:
+                self._dJoins[oJoin.joinMethodName] = oJoin
+
+    def _read_ids(self, cClass, aAttrs):
+        """Read the ids from cClass's table, keyed on the given
+           attributes."""
+        oTable = Table(cClass.sqlmeta.table)
+        aSelect = [oTable.id] + [getattr(oTable, sCol) for sCol in
+                get_db_names(cClass, aAttrs)]
+        dIds = {}
+        for tRow in self._query(Select(aSelect)):
+            if len(tRow) == 2:
+                dIds[_to_unicode(tRow[1])] = tRow[0]
+            else:
+                dIds[_to_unicode(tuple(tRow[1:]))] = tRow[0]
+        self._dIds[cClass] = dIds
+
+    def _read_pairs(self, sTable, sJoinColumn, sOtherColumn):
+        """Read the existing (id, other id) pairs in sTable"""
+        oTable = Table(sTable)
+        return set([tuple(tRow) for tRow in self._query(Select(
+            [getattr(oTable, sJoinColumn), getattr(oTable, sOtherColumn)]))])
+
+    def _write_new(self, cClass, aAttrs, aRows):
+        """Insert the rows into cClass's table"""
+        self._insert(cClass.sqlmeta.table, get_db_names(cClass, aAttrs),
+                aRows)
+
+    def _get_pair_key(self, cClass, tPair):
+        """Return the key for a rarity or discipline pair"""
+        if cClass is RarityPair:
+            return (self._dIds[Expansion][_to_unicode(tPair[0])],
+                    self._dIds[Rarity][_to_unicode(tPair[1])])
+        return (self._dIds[Discipline][_to_unicode(tPair[0])],
+                _to_unicode(tPair[1]))
+
+    def _get_id(self, cClass, oItem):
+        """Return the id for the item in the record"""
+        if cClass in (RarityPair, DisciplinePair):
+            return self._dIds[cClass][self._get_pair_key(cClass, oItem)]
+        elif cClass is Artist:
+            return self._dIds[cClass][_to_unicode(oItem.lower())]
+        return self._dIds[cClass][_to_unicode(oItem)]
+
+    def _write_lookups(self, aRecords):
+        """Add any new entries to the lookup tables"""
+        dItems = {}
+        for cClass, _aAttrs, _fRow in LOOKUP_TABLES:
+            dItems[cClass] = []
+        for oRecord in aRecords:
+            for tPair in oRecord.rarity:
+                dItems[Expansion].append(tPair[0])
+                dItems[Rarity].append(tPair[1])
+            for tPair in oRecord.discipline:
+                dItems[Discipline].append(tPair[0])
+            for sJoin in ('clan', 'creed', 'virtue', 'cardtype', 'sect',
+                    'title', 'keywords', 'artists'):
+                dItems[self._dJoins[sJoin].otherClass].extend(
+                        getattr(oRecord, sJoin))
+        for cClass, aAttrs, fRow in LOOKUP_TABLES:
+            self._read_ids(cClass, aAttrs)
+            dIds = self._dIds[cClass]
+            aNew = []
+            aAllAttrs = None
+            dAdded = {}
+            for sItem in dItems[cClass]:
+                oKey, dRow = fRow(sItem)
+                oKey = _to_unicode(oKey)
+                if oKey in dIds or oKey in dAdded:
+                    continue
+                dAdded[oKey] = True
+                if aAllAttrs is None:
+                    aAllAttrs = sorted(dRow)
+                aNew.append([dRow[sAttr] for sAttr in aAllAttrs])
+            if aNew:
+                self._write_new(cClass, aAllAttrs, aNew)
+                self._read_ids(cClass, aAttrs)
+
+    def _write_pairs(self, aRecords):
+        """Add any new rarity and discipline pairs"""
+        for cClass, aAttrs, sJoin in PAIR_TABLES:
+            self._read_ids(cClass, aAttrs)
+            dIds = self._dIds[cClass]
+            aNew = []
+            for oRecord in aRecords:
+                for tPair in getattr(oRecord, sJoin):
+                    oKey = self._get_pair_key(cClass, tPair)
+                    if oKey not in dIds:
+                        dIds[oKey] = None
+                        aNew.append(list(oKey))
+            if aNew:
+                self._write_new(cClass, aAttrs, aNew)
+                self._read_ids(cClass, aAttrs)
+
+    def _write_cards(self, aRecords):
+        """Insert the new cards and update the existing ones.
+
+           Returns the set of ids of the existing cards."""
+        self._read_ids(AbstractCard, ('canonicalName',))
+        dIds = self._dIds[AbstractCard]
+        aNewCols = ('canonicalName', 'name') + CARD_COLUMNS
+        aNew = []
+        dUpdates = {}
+        aExisting = set()
+        for oRecord in aRecords:
+            sKey = _to_unicode(oRecord.canonicalName)
+            dValues = oRecord.get_values()
+            if sKey in dIds:
+                aExisting.add(dIds[sKey])
+                if dValues:
+                    aCols = tuple(sorted(dValues))
+                    dUpdates.setdefault(aCols, []).append(
+                            [dValues[sCol] for sCol in aCols] + [dIds[sKey]])
+            else:
+                # Match the defaults used by SutekhObjectMaker
+                dValues.setdefault('text', '')
+                dValues.setdefault('search_text', '')
+                aNew.append([oRecord.canonicalName, oRecord.name] +
+                        [dValues.get(sCol) for sCol in CARD_COLUMNS])
+        self._write_new(AbstractCard, aNewCols, aNew)
+        for aCols, aRows in dUpdates.iteritems():
+            self._update(AbstractCard.sqlmeta.table,
+                    get_db_names(AbstractCard, aCols), aRows)
+        if aNew:
+            self._read_ids(AbstractCard, ('canonicalName',))
+        return aExisting
+
+    def _write_joins(self, aRecords, aExisting):
+        """Fill in the join tables"""
+        for sJoin in CARD_JOINS:
+            oJoin = self._dJoins[sJoin]
+            if aExisting:
+                aSeen = self._read_pairs(oJoin.intermediateTable,
+                        oJoin.joinColumn, oJoin.otherColumn)
+            else:
+                aSeen = set()
+            aRows = []
+            for oRecord in aRecords:
+                iCardId = self._get_id(AbstractCard, oRecord.canonicalName)
+                for oItem in getattr(oRecord, sJoin):
+                    tPair = (iCardId, self._get_id(oJoin.otherClass, oItem))
+                    if tPair not in aSeen:
+                        aSeen.add(tPair)
+                        aRows.append(tPair)
+            self._insert(oJoin.intermediateTable,
+                    (oJoin.joinColumn, oJoin.otherColumn), aRows)
+
+    def _write_physical_cards(self, aRecords, aExisting):
+        """Create the physical cards"""
+        aCols = get_db_names(PhysicalCard, ('abstractCardID',
+            'expansionID'))
+        if aExisting:
+            aSeen = self._read_pairs(PhysicalCard.sqlmeta.table, *aCols)
+        else:
+            aSeen = set()
+        aRows = []
+        for oRecord in aRecords:
+            iCardId = self._get_id(AbstractCard, oRecord.canonicalName)
+            for sExp in oRecord.expansions:
+                if sExp is None:
+                    tPair = (iCardId, None)
+                else:
+                    tPair = (iCardId, self._get_id(Expansion, sExp))
+                if tPair not in aSeen:
+                    aSeen.add(tPair)
+                    aRows.append(tPair)
+        self._insert(PhysicalCard.sqlmeta.table, aCols, aRows)
+
+    def _update_cards(self, aRecords):
+        """Insert the new cards and update the changed ones.
+
+           Returns the ids of the changed cards and a dictionary of the
+           ids of the cards which aren't in the records, keyed on name."""
+        aAttrs = ('name',) + CARD_COLUMNS
+        oTable = Table(AbstractCard.sqlmeta.table)
+        aSelect = [oTable.id] + [getattr(oTable, sCol) for sCol in
+                get_db_names(AbstractCard, ('canonicalName',) + aAttrs)]
+        dCurrent = {}
+        for tRow in self._query(Select(aSelect)):
+            dCurrent[_to_unicode(tRow[1])] = (tRow[0],
+                    _to_unicode(tuple(tRow[2:])))
+        aNew = []
+        aChanged = []
+        for oRecord in aRecords:
+            dValues = oRecord.get_values()
+            # Columns missing from the new card list revert to the defaults
+            dValues.setdefault('text', '')
+            dValues.setdefault('search_text', '')
+            tValues = _to_unicode(tuple([oRecord.name] +
+                [dValues.get(sCol) for sCol in CARD_COLUMNS]))
+            sKey = _to_unicode(oRecord.canonicalName)
+            if sKey not in dCurrent:
+                aNew.append([oRecord.canonicalName] + list(tValues))
+                continue
+            iCardId, tCurValues = dCurrent.pop(sKey)
+            if tValues != tCurValues:
+                aChanged.append(list(tValues) + [iCardId])
+        self._write_new(AbstractCard, ('canonicalName',) + aAttrs, aNew)
+        self._update(AbstractCard.sqlmeta.table,
+                get_db_names(AbstractCard, aAttrs), aChanged)
+        self._read_ids(AbstractCard, ('canonicalName',))
+        return set([tRow[-1] for tRow in aChanged]), dict([(sKey, tCur[0])
+            for sKey, tCur in dCurrent.iteritems()])
+
+    def _update_joins(self, aRecords, aRetired):
+        """Bring the join tables into line with the records.
+
+           Returns the ids of the cards whose joins changed."""
+        aChanged = set()
+        for sJoin in CARD_JOINS:
+            oJoin = self._dJoins[sJoin]
+            dCurrent = {}
+            for iCardId, iOtherId in self._read_pairs(oJoin.intermediateTable,
+                    oJoin.joinColumn, oJoin.otherColumn):
+                dCurrent.setdefault(iCardId, set()).add(iOtherId)
+            aNew = []
+            aRemoved = []
+            for oRecord in aRecords:
+                iCardId = self._get_id(AbstractCard, oRecord.canonicalName)
+                aCurrent = dCurrent.get(iCardId, set())
+                aWanted = set()
+                for oItem in getattr(oRecord, sJoin):
+                    iOtherId = self._get_id(oJoin.otherClass, oItem)
+                    if iOtherId not in aCurrent and iOtherId not in aWanted:
+                        aNew.append((iCardId, iOtherId))
+                    aWanted.add(iOtherId)
+                aRemoved.extend([(iCardId, iOtherId) for iOtherId in
+                    aCurrent - aWanted])
+            for iCardId in aRetired:
+                aRemoved.extend([(iCardId, iOtherId) for iOtherId in
+                    dCurrent.get(iCardId, [])])
+            aChanged.update([tPair[0] for tPair in aNew + aRemoved])
+            self._delete(oJoin.intermediateTable,
+                    (oJoin.joinColumn, oJoin.otherColumn), aRemoved)
+            self._insert(oJoin.intermediateTable,
+                    (oJoin.joinColumn, oJoin.otherColumn), aNew)
+        return aChanged
+
+    def _get_used_physical_cards(self):
+        """Return the set of physical card ids used in card sets"""
+        oTable = Table(MapPhysicalCardToPhysicalCardSet.sqlmeta.table)
+        oCol = getattr(oTable, get_db_names(
+            MapPhysicalCardToPhysicalCardSet, ('physicalCardID',))[0])
+        return set([tRow[0] for tRow in self._query(Select(oCol,
+            distinct=True))])
+
+    def _update_physical_cards(self, aRecords, dMissing):
+        """Add the new physical cards, and remove those which are no longer
+           needed and aren't used in any card set.
+
+           Returns the ids of the cards missing from the records which can
+           be removed, and the ids of the removed physical cards."""
+        aCols = get_db_names(PhysicalCard, ('abstractCardID',
+            'expansionID'))
+        oTable = Table(PhysicalCard.sqlmeta.table)
+        dCurrent = {}
+        for iId, iCardId, iExpId in self._query(Select([oTable.id] +
+                [getattr(oTable, sCol) for sCol in aCols])):
+            dCurrent[(iCardId, iExpId)] = iId
+        aUsed = self._get_used_physical_cards()
+        aNew = []
+        for oRecord in aRecords:
+            iCardId = self._get_id(AbstractCard, oRecord.canonicalName)
+            for sExp in oRecord.expansions:
+                if sExp is None:
+                    tPair = (iCardId, None)
+                else:
+                    tPair = (iCardId, self._get_id(Expansion, sExp))
+                if tPair in dCurrent:
+                    del dCurrent[tPair]
+                elif tPair not in aNew:
+                    aNew.append(tPair)
+        # Cards which have gone from the card list can only be removed if
+        # they're not in any card set
+        aMissingIds = set(dMissing.itervalues())
+        aKept = set([iCardId for (iCardId, _iExpId), iId in
+            dCurrent.iteritems() if iCardId in aMissingIds and iId in aUsed])
+        for sName, iCardId in sorted(dMissing.iteritems()):
+            if iCardId in aKept:
+                self.oLogger.warn('Kept %s since it is used in card sets,'
+                        ' although it is no longer in the card list', sName)
+        aRetired = aMissingIds - aKept
+        aRemoved = [iId for (iCardId, _iExpId), iId in dCurrent.iteritems()
+                if iId not in aUsed and iCardId not in aKept]
+        self._delete(PhysicalCard.sqlmeta.table, ('id',),
+                [(iId,) for iId in aRemoved])
+        self._insert(PhysicalCard.sqlmeta.table, aCols, aNew)
+        return aRetired, aRemoved
+
+    def _retire_cards(self, aRetired):
+        """Remove the cards which are no longer in the card list"""
+        aRows = [(iCardId,) for iCardId in aRetired]
+        for oJoin in AbstractCard.sqlmeta.joins:
+            if oJoin.joinMethodName not in CARD_JOINS and \
+                    hasattr(oJoin, 'intermediateTable'):
+                # The joins the card list doesn't fill in, such as rulings
+                self._delete(oJoin.intermediateTable, (oJoin.joinColumn,),
+                        aRows)
+        self._delete(AbstractCard.sqlmeta.table, ('id',), aRows)
+
+    def _start(self, oConn):
+        """Start the transaction"""
+        super(BulkCardWriter, self)._start(oConn)
+        self._dIds = {}
+
+    def _log_throughput(self, fStart, iCards):
+        """Report the time taken"""
+        fTime = max(time.time() - fStart, 0.001)
+        self.oLogger.info('Wrote %d cards (%d rows) in %.2f seconds,'
+                ' %.0f rows per second', iCards, self._iRows, fTime,
+                self._iRows / fTime)
+
+    # pylint: disable-msg=W0702
+    # We want to rollback on any error
+    def write(self, aRecords, oConn=None):
+        """Write the records to the database.
+
+           Records for the same card are merged first. Returns the ids of
+           the cards which were already in the database."""
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        fStart = time.time()
+        aRecords = merge_records(aRecords)
+        self._start(oConn)
+        try:
+            self._write_lookups(aRecords)
+            self._write_pairs(aRecords)
+            aExisting = self._write_cards(aRecords)
+            self._write_joins(aRecords, aExisting)
+            self._write_physical_cards(aRecords, aExisting)
+        except:
+            self._finish(False)
+            raise
+        self._finish(True)
+        # Ensure cached copies of the updated cards are reloaded
+        refresh_cached(oConn, AbstractCard, aExisting)
+        self._log_throughput(fStart, len(aRecords))
+        return aExisting
+
+    def update(self, aRecords, oConn=None):
+        """Update the card list in the database to match the records.
+
+           Unlike write, this treats the records as the complete card
+           list. Cards are matched on the canonical name. New cards are
+           added, and only the changed cards and join table rows are
+           updated. Cards no longer in the card list are removed, unless
+           they're used in a card set. Card sets are not touched.
+
+           The cached joins are flushed for the affected cards only.
+           Returns the ids of the cards which were added, changed or
+           removed."""
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        fStart = time.time()
+        aRecords = merge_records(aRecords)
+        self._start(oConn)
+        try:
+            self._read_ids(AbstractCard, ('canonicalName',))
+            aOldIds = set(self._dIds[AbstractCard].itervalues())
+            self._write_lookups(aRecords)
+            self._write_pairs(aRecords)
+            aChanged, dMissing = self._update_cards(aRecords)
+            aRetired, aRemovedPhys = self._update_physical_cards(aRecords,
+                    dMissing)
+            aChanged.update(self._update_joins(aRecords, aRetired))
+            self._retire_cards(aRetired)
+        except:
+            self._finish(False)
+            raise
+        self._finish(True)
+        aAdded = set(self._dIds[AbstractCard].itervalues()) - aOldIds
+        aAffected = aAdded | aChanged | aRetired
+        refresh_cached(oConn, AbstractCard, aChanged | aRetired)
+        for iId in aRemovedPhys:
+            oConn.cache.expire(iId, PhysicalCard)
+        for oJoin in AbstractCard.sqlmeta.joins:
+            if type(oJoin) is SOCachedRelatedJoin:
+                oJoin.flush_cache_ids(aAffected)
+        if aRemovedPhys:
+            make_adaptor_caches()
+        self.oLogger.info('Added %d, changed %d and removed %d cards',
+                len(aAdded), len(aChanged - aAdded), len(aRetired))
+        self._log_throughput(fStart, len(aAffected))
+        return aAffected
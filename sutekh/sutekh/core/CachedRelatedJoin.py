@@ -47,19 +47,37 @@ class SOCachedRelatedJoin(joins.SORelatedJoin):
         """Flush the contents of the cache."""
         self._dJoinCache = {}
 
-    def init_cache(self):
-        """Initialise the cache with the data from the database."""
-        self._find_other_join()
+    def flush_cache_ids(self, aIds):
+        """Flush the cached results for the objects with the given ids."""
+        for oInst in [oInst for oInst in self._dJoinCache if
+                oInst.id in aIds]:
+            del self._dJoinCache[oInst]
 
+    def get_join_pairs(self):
+        """Return a list of the (id, other id) pairs in the intermediate
+           table."""
         oIntermediateTable = Table(self.intermediateTable)
         oJoinColumn = getattr(oIntermediateTable, self.joinColumn)
         oOtherColumn = getattr(oIntermediateTable, self.otherColumn)
         # pylint: disable-msg=W0212
         # We need to access _connection here
         oConn = self.soClass._connection
+        return oConn.queryAll(repr(Select((oJoinColumn, oOtherColumn))))
+
+    def init_cache(self, aPairs=None):
+        """Initialise the cache with the data from the database.
+
+           If aPairs is given, it is used instead of querying the
+           intermediate table."""
+        self._find_other_join()
+
+        if aPairs is None:
+            aPairs = self.get_join_pairs()
+        # pylint: disable-msg=W0212
+        # We need to access _connection here
+        oConn = self.soClass._connection
 
-        for (oId, oOtherId) in oConn.queryAll(repr(Select(
-            (oJoinColumn, oOtherColumn)))):
+        for (oId, oOtherId) in aPairs:
             oInst = self.soClass.get(oId, oConn)
             oOther = self.otherClass.get(oOtherId, oConn)
             self._dJoinCache.setdefault(oInst, [])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Vectorised k-means clustering of card tables.
+
+   This works on the NumPy arrays produced by
+   CardListTabulator.tabulate_array. NumPy is optional, so callers should
+   check HAVE_NUMPY and fall back to a pure python implementation if it's
+   missing."""
+
+# pylint: disable-msg=F0401
+# numpy may not be installed
+try:
+    import numpy
+    HAVE_NUMPY = True
+except ImportError:
+    numpy = None
+    HAVE_NUMPY = False
+# pylint: enable-msg=F0401
+
+EUCLIDEAN = 'Euclidean Distance'
+SUTEKH = 'Sutekh Distance'
+
+
+def euclidean_distances(aData, aMeans):
+    """Return the matrix of Euclidean distances between each row of aData
+       and each row of aMeans."""
+    # |x - c|^2 = |x|^2 + |c|^2 - 2 x.c, so we only need a single matrix
+    # product
+    aSq = (aData ** 2).sum(axis=1)[:, numpy.newaxis] + \
+            (aMeans ** 2).sum(axis=1)[numpy.newaxis, :] - \
+            2.0 * numpy.dot(aData, aMeans.T)
+    # Rounding errors can give small negative values
+    return numpy.sqrt(numpy.maximum(aSq, 0.0))
+
+
+def sutekh_distances(aData, aMeans):
+    """Return the matrix of Sutekh distances between each row of aData
+       and each row of aMeans.
+
+       As for Euclidean distance, except that -1 (a cost of X) is distance
+       0.25 from anything, and 0 is distance 4.0 from anything other than
+       0."""
+    # Each term depends on whether the table entry and the center
+    # entry are -1, 0 or something else, so we split both into masks
+    # and sum each case with a matrix product.
+    aDataX = (aData == -1).astype(float)
+    aDataZero = (aData == 0).astype(float)
+    aDataOther = 1.0 - aDataX - aDataZero
+    aMeansX = (aMeans == -1).astype(float)
+    aMeansZero = (aMeans == 0).astype(float)
+    aMeansOther = 1.0 - aMeansX - aMeansZero
+    # -1 in the center: 0.25 for every row
+    aSq = 0.25 * aMeansX.sum(axis=1)[numpy.newaxis, :]
+    # -1 in the table, with the center not -1: 0.25
+    aSq = aSq + 0.25 * numpy.dot(aDataX, (aMeansZero + aMeansOther).T)
+    # exactly one of the two is 0: 4.0
+    aSq = aSq + 4.0 * (numpy.dot(aDataOther, aMeansZero.T) +
+            numpy.dot(aDataZero, aMeansOther.T))
+    # neither is -1 or 0: (x - c) ** 2, expanded as for euclidean_distances
+    aSq = aSq + numpy.dot(aDataOther * aData ** 2, aMeansOther.T) - \
+            2.0 * numpy.dot(aDataOther * aData, (aMeansOther * aMeans).T) + \
+            numpy.dot(aDataOther, (aMeansOther * aMeans ** 2).T)
+    # Rounding errors can give small negative values
+    return numpy.sqrt(numpy.maximum(aSq, 0.0))
+
+
+METRICS = {
+        EUCLIDEAN: euclidean_distances,
+        SUTEKH: sutekh_distances,
+        }
+
+
+def k_means_plus_plus(aData, iNumClust, fDist, oRandom):
+    """Pick iNumClust rows of aData as the initial centers using the
+       k-means++ algorithm.
+
+       See http://www.stanford.edu/~darthur/kMeansPlusPlus.pdf.
+       oRandom is the numpy RandomState used to make the choices."""
+    iRows = aData.shape[0]
+    aChosen = [oRandom.randint(iRows)]
+    # Squared distance from each row to the nearest chosen center
+    aMinDists = fDist(aData, aData[aChosen]).min(axis=1) ** 2
+    while len(aChosen) < iNumClust:
+        fSumSq = aMinDists.sum()
+        if fSumSq > 0:
+            aCumulative = numpy.cumsum(aMinDists)
+            iRow = int(numpy.searchsorted(aCumulative,
+                oRandom.uniform(0, fSumSq)))
+            # guard against the slight possibility of rounding past the
+            # end of aCumulative
+            iRow = min(iRow, iRows - 1)
+        else:
+            # All the rows are at a center already
+            iRow = oRandom.randint(iRows)
+        aChosen.append(iRow)
+        aMinDists = numpy.minimum(aMinDists,
+                fDist(aData, aData[[iRow]])[:, 0] ** 2)
+    return aData[aChosen].astype(float)
+
+
+# pylint: disable-msg=R0913
+# We need all these arguments
+def k_means(aData, iNumClust, iIterations, sMetric=EUCLIDEAN, iSeed=None,
+        fTolerance=1e-6):
+    """Perform k-means clustering on the rows of aData using Lloyd's
+       algorithm, with k-means++ to choose the initial centers.
+
+       Stops after iIterations, or earlier if no row changes cluster or
+       no center moves by more than fTolerance. iSeed seeds the random
+       choices, so runs can be repeated.
+
+       Returns an array of the cluster centers and a list of clusters,
+       each of which is a list of row indexes."""
+    aData = numpy.asarray(aData, dtype=float)
+    if aData.ndim != 2 or 0 in aData.shape:
+        # empty card set or zero-length vectors
+        return [], []
+    fDist = METRICS[sMetric]
+    oRandom = numpy.random.RandomState(iSeed)
+    aMeans = k_means_plus_plus(aData, iNumClust, fDist, oRandom)
+
+    aLabels = None
+    for _iIter in range(iIterations):
+        # calculate membership in clusters
+        aNewLabels = fDist(aData, aMeans).argmin(axis=1)
+        # recompute the centroids. Empty clusters keep their old center
+        aNewMeans = aMeans.copy()
+        for iClust in xrange(iNumClust):
+            aMembers = aNewLabels == iClust
+            if aMembers.any():
+                aNewMeans[iClust] = aData[aMembers].mean(axis=0)
+        bStable = aLabels is not None and (aLabels == aNewLabels).all()
+        fShift = numpy.abs(aNewMeans - aMeans).max()
+        aLabels, aMeans = aNewLabels, aNewMeans
+        if bStable or fShift <= fTolerance:
+            break
+
+    aClusters = [numpy.flatnonzero(aLabels == iClust).tolist() for iClust in
+            xrange(iNumClust)]
+    return aMeans, aClusters
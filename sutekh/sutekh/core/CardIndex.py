@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""In-memory index of the abstract card properties, used to evaluate
+   filters without querying the database."""
+
+import re
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Table, Select
+from sutekh.core.SutekhObjects import AbstractCard
+
+# The mapping tables indexed. These are the tables used by SingleFilter
+# and MultiFilter
+INDEXED_MAPS = ('abs_clan_map', 'abs_discipline_pair_map',
+        'abs_rarity_pair_map', 'abs_type_map', 'abs_sect_map',
+        'abs_title_map', 'abs_creed_map', 'abs_virtue_map', 'abs_artist_map',
+        'abs_keyword_map')
+
+# The AbstractCard columns indexed by value, as (attribute name,
+# database name)
+VALUE_COLUMNS = (('group', 'grp'), ('capacity', 'capacity'),
+        ('cost', 'cost'), ('costtype', 'costtype'), ('life', 'life'))
+
+# The AbstractCard columns with a text index
+TEXT_COLUMNS = (('canonicalName', 'canonical_name'), ('text', 'text'),
+        ('search_text', 'search_text'))
+
+INDEXED_COLUMNS = VALUE_COLUMNS + TEXT_COLUMNS
+
+EMPTY = frozenset()
+
+# Words are runs of letters and digits. We exclude '_', since it's a
+# wildcard in LIKE patterns
+WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def _add_to_index(dIndex, oKey, iCardId):
+    """Add iCardId to the id list for oKey"""
+    dIndex.setdefault(oKey, []).append(iCardId)
+
+
+def _freeze(dIndex):
+    """Convert the id lists to frozensets"""
+    return dict([(oKey, frozenset(aIds)) for oKey, aIds in
+        dIndex.iteritems()])
+
+
+def _to_unicode(sText):
+    """Decode the UTF-8 strings returned by the database, so they can be
+       compared with the unicode filter patterns."""
+    if sText is None:
+        return u''
+    if isinstance(sText, str):
+        return sText.decode('utf8')
+    return sText
+
+
+def like_to_regex(sPattern):
+    """Convert a SQL LIKE pattern to an equivalent regular expression.
+
+       % matches any sequence of characters and _ any single character.
+       As with the database, there is no escape character. Matching is
+       expected to be done on lower case strings."""
+    aParts = []
+    for sPart in re.split('([%_])', sPattern):
+        if sPart == '%':
+            aParts.append('.*')
+        elif sPart == '_':
+            aParts.append('.')
+        else:
+            aParts.append(re.escape(sPart))
+    return re.compile('(?s)' + ''.join(aParts) + r'\Z', re.UNICODE)
+
+
+class TextIndex(object):
+    """Inverted index from words to the cards containing them.
+
+       A LIKE pattern is matched by finding the words which contain the
+       longest word in the pattern, and then checking the pattern against
+       only the texts of those cards.
+       """
+
+    def __init__(self, dTexts):
+        self._dTexts = dTexts
+        dWords = {}
+        for iCardId, sText in dTexts.iteritems():
+            for sWord in set(WORD_RE.findall(sText)):
+                _add_to_index(dWords, sWord, iCardId)
+        self._dWords = _freeze(dWords)
+
+    def _get_candidates(self, sPattern):
+        """Return the cards which may match sPattern"""
+        aTokens = []
+        for sFragment in re.split('[%_]', sPattern):
+            aTokens.extend(WORD_RE.findall(sFragment))
+        if not aTokens:
+            # Nothing to look up, so we must check everything
+            return self._dTexts.iterkeys()
+        # Any word in the pattern must be part of a word in the text
+        sToken = max(aTokens, key=len)
+        return EMPTY.union(*[aIds for sWord, aIds in self._dWords.iteritems()
+            if sToken in sWord])
+
+    def get_ids(self, sPattern):
+        """Return the set of cards whose text matches the LIKE pattern"""
+        sPattern = sPattern.lower()
+        oRegex = like_to_regex(sPattern)
+        return frozenset([iCardId for iCardId in
+            self._get_candidates(sPattern) if
+            oRegex.match(self._dTexts[iCardId])])
+
+
+class CardIndex(object):
+    """Sets of AbstractCard ids keyed on the card properties.
+
+       For each mapping table (clan, discipline pair, card type, etc.),
+       we hold the set of cards mapped to each item, and for the simple
+       AbstractCard columns (group, cost, etc.) the set of cards with each
+       value. Filters combine these with set operations. The card names
+       and texts have a TextIndex, so LIKE patterns on them can be
+       matched without scanning the table.
+
+       The index is a snapshot of the card list, so it must be rebuilt
+       whenever the card list changes.
+
+       aCardRows and dJoinPairs can be used to supply the data (as
+       read by the object cache) rather than querying the database.
+       aCardRows is a list of (id, attribute values) tuples, with the values
+       in the order of INDEXED_COLUMNS. dJoinPairs maps the table names to
+       lists of (card id, item id) pairs.
+       """
+
+    def __init__(self, aCardRows=None, dJoinPairs=None, oConn=None):
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        if aCardRows is None:
+            oTable = Table(AbstractCard.sqlmeta.table)
+            aSelect = [oTable.id] + [getattr(oTable, sDbName) for
+                    _sAttr, sDbName in INDEXED_COLUMNS]
+            aCardRows = [(tRow[0], tRow[1:]) for tRow in
+                    oConn.queryAll(oConn.sqlrepr(Select(aSelect)))]
+        dColumns = {}
+        for sAttr, _sDbName in INDEXED_COLUMNS:
+            dColumns[sAttr] = {}
+        aAll = []
+        iNumValues = len(VALUE_COLUMNS)
+        for iCardId, aValues in aCardRows:
+            aAll.append(iCardId)
+            for (sAttr, _sDbName), oValue in zip(VALUE_COLUMNS, aValues):
+                _add_to_index(dColumns[sAttr], oValue, iCardId)
+            for (sAttr, _sDbName), sText in zip(TEXT_COLUMNS,
+                    aValues[iNumValues:]):
+                dColumns[sAttr][iCardId] = _to_unicode(sText).lower()
+        self._aAll = frozenset(aAll)
+        self._dColumns = {}
+        for sAttr, _sDbName in VALUE_COLUMNS:
+            self._dColumns[sAttr] = _freeze(dColumns[sAttr])
+        self._dText = {}
+        for sAttr, _sDbName in TEXT_COLUMNS:
+            self._dText[sAttr] = TextIndex(dColumns[sAttr])
+
+        self._dMaps = {}
+        for oJoin in AbstractCard.sqlmeta.joins:
+            sTable = getattr(oJoin, 'intermediateTable', None)
+            if sTable not in INDEXED_MAPS:
+                continue
+            if dJoinPairs is not None and sTable in dJoinPairs:
+                aPairs = dJoinPairs[sTable]
+            else:
+                aPairs = oJoin.get_join_pairs()
+            dIndex = {}
+            for iCardId, iItemId in aPairs:
+                _add_to_index(dIndex, iItemId, iCardId)
+            self._dMaps[sTable] = _freeze(dIndex)
+
+    def get_all(self):
+        """Return the set of all the card ids"""
+        return self._aAll
+
+    def get_ids(self, sTable, aItemIds):
+        """Return the set of cards mapped to any of aItemIds in the
+           mapping table sTable, or None if the table isn't indexed."""
+        if sTable not in self._dMaps:
+            return None
+        dIndex = self._dMaps[sTable]
+        return EMPTY.union(*[dIndex.get(iItemId, EMPTY) for iItemId in
+            aItemIds])
+
+    def get_column_ids(self, sAttr, aValues):
+        """Return the set of cards for which the AbstractCard attribute
+           sAttr has any of the values in aValues."""
+        dIndex = self._dColumns[sAttr]
+        return EMPTY.union(*[dIndex.get(oValue, EMPTY) for oValue in
+            aValues])
+
+    def get_text_ids(self, sAttr, sPattern):
+        """Return the set of cards for which the AbstractCard text
+           attribute sAttr matches the LIKE pattern sPattern.
+
+           The match ignores case."""
+        return self._dText[sAttr].get_ids(sPattern)
@@ -3,10 +3,12 @@
 # Copyright 2006 Simon Cross <hodgestar@gmail.com>
 # GPL - see COPYING for details
 
-"""Create a table (as a list of list) from a list of cards"""
+"""Create a table (as a list of list, or a NumPy array) from a list of
+   cards"""
 
 from sutekh.core.SutekhObjects import Discipline, Clan, Rarity, Expansion, \
         CardType, IAbstractCard
+from sutekh.core.CardClustering import numpy, HAVE_NUMPY
 
 
 class CardListTabulator(object):
@@ -135,3 +137,23 @@ class CardListTabulator(object):
             aTable.append(aRow)
 
         return aTable
+
+    def tabulate_array(self, aCards):
+        """Create a table from the list of cards as a 2 dimensional NumPy
+           array of floats.
+
+           The rows and columns are ordered as for tabulate. This requires
+           NumPy, so callers should check HAVE_NUMPY first.
+           """
+        if not HAVE_NUMPY:
+            raise RuntimeError("NumPy is needed for array tables")
+        aColFuncs = [self._dPropFuncs[x] for x in self._aColNames]
+        aCards = list(aCards)
+
+        aTable = numpy.zeros((len(aCards), len(aColFuncs)))
+
+        for iRow, oCard in enumerate(aCards):
+            oCard = IAbstractCard(oCard)
+            aTable[iRow] = [fProp(oCard) for fProp in aColFuncs]
+
+        return aTable
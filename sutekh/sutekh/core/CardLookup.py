@@ -11,7 +11,9 @@ from sqlobject import SQLObjectNotFound
 # we need string.punctuation
 import string
 # pylint: enable-msg=W0402
-from sutekh.core.SutekhObjects import IPhysicalCard, IExpansion, IAbstractCard
+from sutekh.core.SutekhObjects import IPhysicalCard, IExpansion, \
+        IAbstractCard, AbstractCard
+from sutekh.core.CardNameIndex import NameIndexCache
 from sutekh.core.Filters import CardNameFilter, FilterAndBox, \
         make_illegal_filter
 
@@ -139,6 +141,32 @@ class SimpleLookup(AbstractCardLookup, PhysicalCardLookup, ExpansionLookup):
         return aExps
 
 
+class FuzzyLookup(SimpleLookup):
+    """A lookup which replaces unknown card names with the closest card
+       name, if the match is close enough to be trusted.
+
+       This is intended for non-interactive imports, where there's no
+       user to ask about the unknown cards, such as the command line
+       --fuzzy-names option."""
+
+    def lookup(self, aNames, sInfo):
+        """Lookup the cards, trying the closest match for unknown names."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        aCards = super(FuzzyLookup, self).lookup(aNames, sInfo)
+        oIndex = None
+        for iPos, sName in enumerate(aNames):
+            if aCards[iPos] is not None or not sName:
+                continue
+            if oIndex is None:
+                oIndex = NameIndexCache.get_index()
+            sMatch = oIndex.best_match(sName)
+            if sMatch is not None:
+                aCards[iPos] = AbstractCard.byCanonicalName(
+                        sMatch.encode('utf8').lower())
+        return aCards
+
+
 def best_guess_filter(sName):
     """Create a filter for selecting close matches to a card name."""
     # Set the filter on the Card List to one the does a
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""In-memory index for finding card names close to a misspelt name.
+
+   Names are normalised (case, accents, punctuation and the position of
+   articles are ignored), and split into trigrams. Candidates sharing
+   trigrams with the name are ranked by edit distance, so finding the
+   closest cards doesn't need to query the database."""
+
+import heapq
+import unicodedata
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Select, func
+from sutekh.core.SutekhObjects import AbstractCard, canonical_to_csv, \
+        csv_to_canonical
+
+# Number of trigram matches that are checked with the edit distance
+CANDIDATES = 8
+# Score needed for a match to be used without asking the user
+AUTO_MATCH = 0.8
+# How much better than the next card a match must be to be used without
+# asking the user
+AUTO_MARGIN = 0.1
+
+
+def normalise_name(sName):
+    """Reduce a card name to lower case ascii letters and digits, with
+       articles moved to the front and the common spellings of advanced
+       normalised.
+
+       Spaces are dropped along with the punctuation, so 'AK-47' and
+       'AK47' match."""
+    if isinstance(sName, str):
+        sName = sName.decode('utf8', 'replace')
+    sName = unicodedata.normalize('NFKD', sName).encode('ascii', 'ignore')
+    sName = csv_to_canonical(sName.strip()).lower()
+    sName = sName.replace('(adv)', '(advanced)')
+    return ''.join([sChar for sChar in sName if sChar.isalnum()])
+
+
+def get_trigrams(sKey):
+    """Return the set of trigrams in a normalised name, padded so the
+       start and end of the name count."""
+    sKey = '  %s  ' % sKey
+    return set([sKey[iPos:iPos + 3] for iPos in range(len(sKey) - 2)])
+
+
+def edit_distance(sFirst, sSecond):
+    """Return the Levenshtein distance between the strings"""
+    if len(sFirst) < len(sSecond):
+        sFirst, sSecond = sSecond, sFirst
+    aPrev = range(len(sSecond) + 1)
+    for sChar in sFirst:
+        iDiag = aPrev[0]
+        iLeft = iDiag + 1
+        aCur = [iLeft]
+        for iOther, sOther in enumerate(sSecond):
+            iUp = aPrev[iOther + 1]
+            if sChar != sOther:
+                iLeft = 1 + min(iUp, iLeft, iDiag)
+            else:
+                iLeft = iDiag
+            iDiag = iUp
+            aCur.append(iLeft)
+        aPrev = aCur
+    return aPrev[-1]
+
+
+class CardNameIndex(object):
+    """Trigram index of the card names and their common variants.
+
+       The ELDB and Lackey names mostly differ from the card names in
+       the quoting and the spelling of advanced, so normalise to the same
+       keys. dAliases maps any other extra names, such as the results of
+       gen_name_lookups, to the card names. The index stores card names,
+       not card objects, so it can be kept between lookups.
+
+       Different cards may normalise to the same key. These keys match
+       all the cards equally, so they are never used without asking the
+       user."""
+
+    def __init__(self, aNames, dAliases=None):
+        # normalised name -> card name
+        self._dKeys = {}
+        # normalised names shared by several cards -> the card names
+        self._dAmbiguous = {}
+        # trigram -> list of normalised names
+        self._dTrigrams = {}
+        for sName in aNames:
+            self._add(sName, sName)
+            # The csv form is used by several other tools
+            self._add(canonical_to_csv(sName), sName)
+        if dAliases:
+            for sAlias, sName in dAliases.iteritems():
+                self._add(sAlias, sName)
+
+    def _add(self, sVariant, sName):
+        """Add a variant of the card name to the index"""
+        sKey = normalise_name(sVariant)
+        if not sKey:
+            return
+        if sKey in self._dKeys:
+            if self._dKeys[sKey] != sName:
+                self._dAmbiguous.setdefault(sKey,
+                        set([self._dKeys[sKey]])).add(sName)
+            return
+        self._dKeys[sKey] = sName
+        for sTrigram in get_trigrams(sKey):
+            self._dTrigrams.setdefault(sTrigram, []).append(sKey)
+
+    def __len__(self):
+        return len(self._dKeys)
+
+    def _get_cards(self, sKey):
+        """Return the card names for the normalised name sKey"""
+        if sKey in self._dAmbiguous:
+            return self._dAmbiguous[sKey]
+        return [self._dKeys[sKey]]
+
+    def find(self, sName, iNum=5):
+        """Return the iNum card names closest to sName, as a list of
+           (score, card name) pairs, best first.
+
+           The score is 1.0 for names that only differ in case, accents,
+           punctuation and so on, and drops towards 0 as more edits are
+           needed."""
+        sKey = normalise_name(sName)
+        if not sKey:
+            return []
+        # card name -> best score
+        dBest = {}
+        if sKey in self._dKeys:
+            for sCard in self._get_cards(sKey):
+                dBest[sCard] = 1.0
+        # Count the shared trigrams for each indexed name
+        dShared = {}
+        aTrigrams = get_trigrams(sKey)
+        for sTrigram in aTrigrams:
+            for sOther in self._dTrigrams.get(sTrigram, []):
+                dShared[sOther] = dShared.get(sOther, 0) + 1
+        # Dice coefficient, to pick the candidates for the edit distance
+        aCandidates = heapq.nsmallest(max(CANDIDATES, iNum), dShared,
+                key=lambda x: (-2.0 * dShared[x] / (len(aTrigrams) + len(x)
+                    + 2), x))
+        for sOther in aCandidates:
+            fLen = float(max(len(sKey), len(sOther)))
+            if len(dBest) >= iNum and 1.0 - abs(len(sKey) -
+                    len(sOther)) / fLen < sorted(dBest.values())[-iNum]:
+                # The difference in length already rules this out
+                continue
+            fScore = 1.0 - edit_distance(sKey, sOther) / fLen
+            for sCard in self._get_cards(sOther):
+                if fScore > dBest.get(sCard, -1.0):
+                    dBest[sCard] = fScore
+        aResults = sorted([(fScore, sCard) for sCard, fScore in
+            dBest.iteritems()], key=lambda x: (-x[0], x[1]))
+        return aResults[:iNum]
+
+    def exact_match(self, sName):
+        """Return the card name if sName only differs from the name of a
+           single card in the case, accents, punctuation and so on, or
+           None otherwise."""
+        sKey = normalise_name(sName)
+        if sKey in self._dKeys and sKey not in self._dAmbiguous:
+            return self._dKeys[sKey]
+        return None
+
+    def best_match(self, sName):
+        """Return the card name matching sName, or None if there's no
+           match good enough to use without asking the user."""
+        aResults = self.find(sName, 2)
+        if not aResults or aResults[0][0] < AUTO_MATCH:
+            return None
+        if len(aResults) > 1 and \
+                aResults[0][0] - aResults[1][0] < AUTO_MARGIN:
+            # Too close to call
+            return None
+        return aResults[0][1]
+
+
+class NameIndexCache(object):
+    """Keep the name index between lookups, rebuilding it when the card
+       list changes."""
+    # pylint: disable-msg=R0903
+    # Simple cache
+
+    _oIndex = None
+    _tKey = None
+
+    @classmethod
+    def get_index(cls, oConn=None):
+        """Return the index for the current card list"""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        oSelect = Select([func.COUNT(AbstractCard.q.id),
+            func.MAX(AbstractCard.q.id)])
+        tKey = (oConn.uri(), tuple(oConn.queryOne(oConn.sqlrepr(oSelect))))
+        if cls._tKey != tKey:
+            # The names are UTF-8 encoded in the database, but the
+            # callers expect the unicode names, as from AbstractCard.name
+            aNames = [x[0].decode('utf8') for x in oConn.queryAll(
+                oConn.sqlrepr(Select(AbstractCard.q.name)))]
+            cls._oIndex = CardNameIndex(aNames)
+            cls._tKey = tKey
+        return cls._oIndex
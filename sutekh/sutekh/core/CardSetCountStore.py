@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Shared store of the card counts in each card set, kept up to date
+   from the database signals."""
+
+from sutekh.core.SutekhObjects import PhysicalCardSet, PhysicalCard, \
+        MapPhysicalCardToPhysicalCardSet
+from sutekh.core.DBSignals import listen_changed, listen_row_destroy, \
+        disconnect_changed, disconnect_row_destroy, listen_bulk_changed, \
+        disconnect_bulk_changed
+
+# The store shared by all the card set models, if any
+_oCountStore = None
+
+
+def set_card_set_counts(oStore):
+    """Set the shared CardSetCountStore.
+
+       None disables the store, so the card set models query the database
+       directly."""
+    # pylint: disable-msg=W0603
+    # We want a single store for the whole application
+    global _oCountStore
+    _oCountStore = oStore
+
+
+def get_card_set_counts():
+    """Return the shared CardSetCountStore, or None"""
+    return _oCountStore
+
+
+class CardSetCountStore(object):
+    """Card counts for each card set, keyed by card set id.
+
+       The counts for a card set are read from the database the first time
+       they are needed, and then updated from the changed signal, so
+       keeping them current costs O(1) per card change, however many card
+       set panes are using them.
+
+       This relies on everyone calling send_changed_signal (or
+       send_bulk_changed_signal), in the same way the card set models do.
+       The store should be created before any model listens for the
+       changed signals, so it's updated before the models are told about
+       the change.
+       """
+
+    def __init__(self):
+        self._dCounts = {}
+        listen_changed(self.card_changed, PhysicalCardSet)
+        listen_bulk_changed(self.cards_changed, PhysicalCardSet)
+        listen_row_destroy(self.card_set_deleted, PhysicalCardSet)
+
+    def cleanup(self):
+        """Disconnect from the database signals"""
+        disconnect_changed(self.card_changed, PhysicalCardSet)
+        disconnect_bulk_changed(self.cards_changed, PhysicalCardSet)
+        disconnect_row_destroy(self.card_set_deleted, PhysicalCardSet)
+
+    def flush(self):
+        """Forget all the counts, for database reloads and the like"""
+        self._dCounts = {}
+
+    def get_counts(self, iCardSetId):
+        """Return a dictionary of physical card to count for the card set.
+
+           The dictionary belongs to the store, so callers must not modify
+           it."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        if iCardSetId not in self._dCounts:
+            dCounts = {}
+            for oMapCard in MapPhysicalCardToPhysicalCardSet.selectBy(
+                    physicalCardSetID=iCardSetId):
+                oCard = PhysicalCard.get(oMapCard.physicalCardID)
+                dCounts.setdefault(oCard, 0)
+                dCounts[oCard] += oMapCard.count
+            self._dCounts[iCardSetId] = dCounts
+        return self._dCounts[iCardSetId]
+
+    def get_count(self, iCardSetId, oPhysCard):
+        """Return the number of copies of oPhysCard in the card set"""
+        return self.get_counts(iCardSetId).get(oPhysCard, 0)
+
+    def card_changed(self, oCardSet, oPhysCard, iChg):
+        """Update the counts after a change to a card set"""
+        if oCardSet.id not in self._dCounts:
+            # Not loaded yet, so we'll get the correct counts when needed
+            return
+        dCounts = self._dCounts[oCardSet.id]
+        iCount = dCounts.get(oPhysCard, 0) + iChg
+        if iCount > 0:
+            dCounts[oPhysCard] = iCount
+        elif oPhysCard in dCounts:
+            del dCounts[oPhysCard]
+
+    def cards_changed(self, oCardSet, dChanges):
+        """Update the counts after a bulk change to a card set"""
+        for oPhysCard, iChg in dChanges.iteritems():
+            self.card_changed(oCardSet, oPhysCard, iChg)
+
+    # _fPostFuncs is passed by SQLObject 0.10, but not by 0.9, so we need to
+    # support both
+    def card_set_deleted(self, oCardSet, _fPostFuncs=None):
+        """Drop the counts for deleted card sets"""
+        if oCardSet.id in self._dCounts:
+            del self._dCounts[oCardSet.id]
@@ -7,7 +7,10 @@
    to a database."""
 
 from sutekh.core.CardLookup import DEFAULT_LOOKUP
-from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.core.SutekhObjects import PhysicalCardSet, \
+        MapPhysicalCardToPhysicalCardSet
+from sutekh.core.CountedRelatedJoin import get_count_storage
+from sutekh.core.QueryProfiler import profile_operation
 from sqlobject import SQLObjectNotFound, sqlhub
 
 
@@ -113,6 +116,7 @@ class CardSetHolder(object):
         """Reset the warning messages list"""
         self._aWarnings = []
 
+    @profile_operation('Import card set')
     def create_pcs(self, oCardLookup=DEFAULT_LOOKUP):
         """Create a Physical Card Set.
            """
@@ -160,25 +164,46 @@ class CardSetHolder(object):
                         'Used Ascii fallback.' % sIdentifier)
         return sSane
 
-    def _commit_pcs(self, aPhysCards):
-        """Commit the card set to the database."""
-        oParent = self.get_parent_pcs()
-        oPCS = PhysicalCardSet(name=self.name,
-                author=self._sanitise_text(self.author,
+    def get_card_set_values(self):
+        """Return a dictionary of the values used to create the card set,
+           with any encoding issues sanitised."""
+        return {
+                'name': self.name,
+                'author': self._sanitise_text(self.author,
                     'the card set author', True),
-                comment=self._sanitise_text(self.comment, 'the comments',
+                'comment': self._sanitise_text(self.comment, 'the comments',
                     False),
-                annotations=self._sanitise_text(self.annotations,
+                'annotations': self._sanitise_text(self.annotations,
                     'the annotations', False),
-                inuse=self.inuse, parent=oParent)
+                'inuse': self.inuse,
+                }
+
+    def _commit_pcs(self, aPhysCards):
+        """Commit the card set to the database."""
+        oParent = self.get_parent_pcs()
+        # pylint: disable-msg=W0142
+        # ** magic is the simplest approach here
+        oPCS = PhysicalCardSet(parent=oParent, **self.get_card_set_values())
         oPCS.syncUpdate()
 
-        for oPhysCard in aPhysCards:
-            # pylint: disable-msg=E1101
-            # SQLObject confuses pylint
-            if not oPhysCard:
-                continue
-            oPCS.addPhysicalCard(oPhysCard.id)
+        if get_count_storage():
+            # Write a single counted entry for each distinct card
+            dCounts = {}
+            for oPhysCard in aPhysCards:
+                if not oPhysCard:
+                    continue
+                dCounts.setdefault(oPhysCard.id, 0)
+                dCounts[oPhysCard.id] += 1
+            for iPhysCardId, iCount in dCounts.iteritems():
+                MapPhysicalCardToPhysicalCardSet(physicalCardID=iPhysCardId,
+                        physicalCardSetID=oPCS.id, count=iCount)
+        else:
+            for oPhysCard in aPhysCards:
+                # pylint: disable-msg=E1101
+                # SQLObject confuses pylint
+                if not oPhysCard:
+                    continue
+                oPCS.addPhysicalCard(oPhysCard.id)
         oPCS.syncUpdate()
 
 
@@ -251,12 +276,27 @@ class CachedCardSetHolder(CardSetHolder):
     # pylint: disable-msg=W0102, W0221
     # W0102 - {} is the right thing here
     # W0221 - We need the extra argument
+    @profile_operation('Import card set')
     def create_pcs(self, oCardLookup=DEFAULT_LOOKUP, dLookupCache={}):
         """Create a Physical Card Set.
 
            dLookupCache is updated as soon as possible, i.e. immediately after
            calling oCardLookup.lookup(...).
            """
+        aPhysCards = self.lookup_physical_cards(oCardLookup, dLookupCache)
+
+        if hasattr(sqlhub.processConnection, 'commit'):
+            self._commit_pcs(aPhysCards)
+        else:
+            sqlhub.doInTransaction(self._commit_pcs, aPhysCards)
+
+    def lookup_physical_cards(self, oCardLookup=DEFAULT_LOOKUP,
+            dLookupCache={}):
+        """Return the physical cards for the card set, without creating
+           the card set.
+
+           The lookups are cached in dLookupCache, as for create_pcs.
+           """
         # Need to cache both abstract card lookups & expansion lookups
         # pylint: disable-msg=R0914
         # We use a lot of local variables for clarity
@@ -297,10 +337,5 @@ class CachedCardSetHolder(CardSetHolder):
             else:
                 dLookupCache['expansions'][sName] = oExp.name
 
-        aPhysCards = oCardLookup.physical_lookup(dCardExpansions,
+        return oCardLookup.physical_lookup(dCardExpansions,
                 dNameCards, dExpansionLookup, 'Card Set "%s"' % self.name)
-
-        if hasattr(sqlhub.processConnection, 'commit'):
-            self._commit_pcs(aPhysCards)
-        else:
-            sqlhub.doInTransaction(self._commit_pcs, aPhysCards)
@@ -6,7 +6,9 @@
 """Utility functions for dealing with managing the CardSet Objects"""
 
 from sqlobject import SQLObjectNotFound, sqlhub
-from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.core.SutekhObjects import PhysicalCardSet, \
+        MapPhysicalCardToPhysicalCardSet, \
+        PhysicalCardMappingToPhysicalCardAdapter
 
 
 def get_loop(oCardSet):
@@ -114,3 +116,34 @@ def format_cs_list(oParent=None, sIndent=' '):
         if has_children(oCS):
             aResult.append(format_cs_list(oCS, sIndent + '   '))
     return '\n'.join(aResult)
+
+
+def count_map_cards(oMapIter):
+    """Return the number of cards represented by the given
+       MapPhysicalCardToPhysicalCardSet entries.
+
+       Each entry can represent several copies of the card, so this
+       differs from counting the entries."""
+    return sum([oMapCard.count for oMapCard in oMapIter])
+
+
+def expand_map_cards(oMapIter):
+    """Return a list of the physical cards in the given
+       MapPhysicalCardToPhysicalCardSet entries, with one entry per copy."""
+    aCards = []
+    for oMapCard in oMapIter:
+        aCards.extend([PhysicalCardMappingToPhysicalCardAdapter(oMapCard)] *
+                oMapCard.count)
+    return aCards
+
+
+def remove_map_card(oMapCard):
+    """Remove a single copy of the card from the given
+       MapPhysicalCardToPhysicalCardSet entry, deleting the entry when
+       the last copy is removed."""
+    if oMapCard.count > 1:
+        oMapCard.count -= 1
+        # lazyUpdate is set for all the objects, so save the change now
+        oMapCard.syncUpdate()
+    else:
+        MapPhysicalCardToPhysicalCardSet.delete(oMapCard.id)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Implement RelatedJoin over a mapping table with a count column"""
+
+from sqlobject import joins
+from sqlobject.sqlbuilder import Table, Select, Insert, Update, AND
+
+# Name of the count column in the intermediate table
+COUNT_COLUMN = 'cnt'
+
+
+class SOCountedRelatedJoin(joins.SORelatedJoin):
+    """Version of RelatedJoin for intermediate tables with a count column.
+
+       Each row of the intermediate table stands for 'count' copies of
+       the related object. performJoin expands the counts, so the join
+       returns one entry per copy, exactly as a RelatedJoin over a table
+       with one row per copy would.
+
+       By default, add inserts a new row with a count of 1 for each copy.
+       When count based storage is enabled (see set_count_storage), add
+       increments the count of an existing row for the pair instead, so
+       there is a single row per distinct pair.
+       """
+
+    _bCountStorage = False
+
+    @classmethod
+    def set_count_storage(cls, bCountStorage):
+        """Set whether new copies are stored as counts on existing rows."""
+        cls._bCountStorage = bCountStorage
+
+    @classmethod
+    def get_count_storage(cls):
+        """Return True if count based storage is enabled."""
+        return cls._bCountStorage
+
+    def _get_columns(self):
+        """Return the intermediate table and the join, other and count
+           columns."""
+        oTable = Table(self.intermediateTable)
+        return (oTable, getattr(oTable, self.joinColumn),
+                getattr(oTable, self.otherColumn),
+                getattr(oTable, COUNT_COLUMN))
+
+    # pylint: disable-msg=C0103, W0212
+    # C0103: Name must match SQLObject conventions
+    # W0212: We need to access _connection and _perConnection here
+    def performJoin(self, oInst):
+        """Return the related objects, repeated according to the counts."""
+        _oTable, oJoinColumn, oOtherColumn, oCountColumn = \
+                self._get_columns()
+        oConn = oInst._connection
+        if oInst.sqlmeta._perConnection:
+            oGetConn = oConn
+        else:
+            oGetConn = None
+        aResults = []
+        for oOtherId, iCount in oConn.queryAll(oConn.sqlrepr(Select(
+                (oOtherColumn, oCountColumn),
+                where=oJoinColumn == oInst.id))):
+            if oOtherId is None:
+                continue
+            oOther = self.otherClass.get(oOtherId, oGetConn)
+            aResults.extend([oOther] * iCount)
+        return self._applyOrderBy(aResults, self.otherClass)
+
+    def add(self, oInst, oOther):
+        """Add a single copy of oOther to the join."""
+        oTable, oJoinColumn, oOtherColumn, oCountColumn = self._get_columns()
+        oConn = oInst._connection
+        iInstId = joins.getID(oInst)
+        iOtherId = joins.getID(oOther)
+        if self._bCountStorage:
+            aRows = oConn.queryAll(oConn.sqlrepr(Select(oTable.id,
+                where=AND(oJoinColumn == iInstId,
+                    oOtherColumn == iOtherId))))
+            if aRows:
+                oConn.query(oConn.sqlrepr(Update(self.intermediateTable,
+                    {COUNT_COLUMN: oCountColumn + 1},
+                    where=oTable.id == aRows[0][0])))
+                return
+        oConn.query(oConn.sqlrepr(Insert(self.intermediateTable,
+            values={self.joinColumn: iInstId, self.otherColumn: iOtherId,
+                COUNT_COLUMN: 1})))
+
+
+class CountedRelatedJoin(joins.RelatedJoin):
+    """Provide CountedRelatedJoin object to Sutekh"""
+    baseClass = SOCountedRelatedJoin
+
+
+def set_count_storage(bCountStorage):
+    """Choose between one row per copy (the default) and count based
+       storage for card sets."""
+    SOCountedRelatedJoin.set_count_storage(bCountStorage)
+
+
+def get_count_storage():
+    """Return True if card sets use count based storage."""
+    return SOCountedRelatedJoin.get_count_storage()
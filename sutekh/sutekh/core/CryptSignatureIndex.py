@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Index of the disciplines, virtues and groups of the crypt cards.
+
+   Each crypt card is reduced to a signature of its group and bitmasks
+   of its disciplines, superior disciplines and virtues, so finding
+   similar crypt cards is a matter of comparing integers."""
+
+import heapq
+from itertools import combinations
+from sutekh.core.SutekhObjects import AbstractCard
+from sutekh.SutekhUtility import is_crypt_card, is_vampire
+
+# The shared index, built when first needed
+_oSignatureIndex = None
+
+
+def count_bits(iMask):
+    """Return the number of bits set in iMask"""
+    return bin(iMask).count('1')
+
+
+class CryptSignature(object):
+    """The group, disciplines and virtues of a crypt card, as bitmasks"""
+    # pylint: disable-msg=R0903
+    # Simple data holder
+
+    def __init__(self, oCard, bVampire, iDisciplines, iSuperior, iVirtues):
+        self.oCard = oCard
+        self.bVampire = bVampire
+        self.iGroup = oCard.group
+        # All the disciplines, at any level
+        self.iDisciplines = iDisciplines
+        self.iSuperior = iSuperior
+        self.iVirtues = iVirtues
+
+    def get_mask(self, bSuperior):
+        """Return the mask of the traits matched by 'find like'
+           searches."""
+        if not self.bVampire:
+            return self.iVirtues
+        elif bSuperior:
+            return self.iSuperior
+        return self.iDisciplines
+
+    def is_compatible(self, oOther):
+        """True if the cards are the same type and the groups can be used
+           in the same crypt."""
+        # Any group cards (group -1) are excluded, as they are currently
+        # uninteresting
+        return oOther.bVampire == self.bVampire and oOther.iGroup > 0 and \
+                abs(oOther.iGroup - self.iGroup) <= 1
+
+    def similarity(self, oOther):
+        """Return the similarity of the two cards' traits, between 0 and 1.
+
+           This is the fraction of the combined traits the cards share,
+           with superior disciplines counting twice."""
+        if self.bVampire:
+            iShared = count_bits(self.iDisciplines & oOther.iDisciplines) + \
+                    count_bits(self.iSuperior & oOther.iSuperior)
+            iTotal = count_bits(self.iDisciplines | oOther.iDisciplines) + \
+                    count_bits(self.iSuperior | oOther.iSuperior)
+        else:
+            iShared = count_bits(self.iVirtues & oOther.iVirtues)
+            iTotal = count_bits(self.iVirtues | oOther.iVirtues)
+        if not iTotal:
+            return 0.0
+        return iShared / float(iTotal)
+
+
+class CryptSignatureIndex(object):
+    """Signatures for all the crypt cards.
+
+       Disciplines and virtues are each given a bit in the masks."""
+
+    def __init__(self):
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        self._dBits = {}
+        self._dSignatures = {}
+        for oCard in AbstractCard.select():
+            if not is_crypt_card(oCard):
+                continue
+            iDisciplines = iSuperior = 0
+            for oPair in oCard.discipline:
+                iBit = self._get_bit(oPair.discipline)
+                iDisciplines |= iBit
+                if oPair.level == 'superior':
+                    iSuperior |= iBit
+            iVirtues = self.get_mask(oCard.virtue)
+            self._dSignatures[oCard] = CryptSignature(oCard,
+                    is_vampire(oCard), iDisciplines, iSuperior, iVirtues)
+
+    def _get_bit(self, oItem):
+        """Return the bit for the discipline or virtue, adding it if
+           needed"""
+        if oItem not in self._dBits:
+            self._dBits[oItem] = 1 << len(self._dBits)
+        return self._dBits[oItem]
+
+    def get_mask(self, aItems):
+        """Return the mask for a list of disciplines or virtues"""
+        iMask = 0
+        for oItem in aItems:
+            iMask |= self._get_bit(oItem)
+        return iMask
+
+    def get_signature(self, oCard):
+        """Return the signature for the card, or None if it's not a crypt
+           card"""
+        return self._dSignatures.get(oCard, None)
+
+    def _get_candidates(self, oSig, aCandidates):
+        """Return the signatures of the compatible cards, restricted
+           to aCandidates if given"""
+        if aCandidates is None:
+            aSigs = self._dSignatures.itervalues()
+        else:
+            aSigs = [self._dSignatures[oCard] for oCard in aCandidates if
+                    oCard in self._dSignatures]
+        return [oOther for oOther in aSigs if oOther.oCard is not oSig.oCard
+                and oSig.is_compatible(oOther)]
+
+    # pylint: disable-msg=R0913
+    # We need all these arguments
+    def find_like(self, oCard, aItems, iNum, bSuperior=False,
+            aCandidates=None):
+        """Find the cards like oCard that share at least iNum of the
+           disciplines or virtues in aItems.
+
+           bSuperior matches superior disciplines only, and aCandidates
+           restricts the search to the given cards.
+
+           Returns the set of all the matching cards and a dictionary of
+           each combination of iNum items (as a tuple) to the list of
+           matching cards with all of them."""
+        oSig = self._dSignatures[oCard]
+        iSelected = self.get_mask(aItems)
+        aMatches = [oOther for oOther in self._get_candidates(oSig,
+            aCandidates) if count_bits(oOther.get_mask(bSuperior) &
+                iSelected) >= iNum]
+        dGroups = {}
+        for tItems in combinations(aItems, iNum):
+            iMask = self.get_mask(tItems)
+            aGroup = [oOther.oCard for oOther in aMatches if
+                    oOther.get_mask(bSuperior) & iMask == iMask]
+            if aGroup:
+                dGroups[tItems] = aGroup
+        return set([oOther.oCard for oOther in aMatches]), dGroups
+
+    def most_similar(self, oCard, iTop, aCandidates=None):
+        """Return the iTop cards most similar to oCard, as a list of
+           (similarity, card) pairs, most similar first."""
+        oSig = self._dSignatures[oCard]
+        aScored = [(oSig.similarity(oOther), oOther.oCard) for oOther in
+                self._get_candidates(oSig, aCandidates)]
+        # Ties are broken by name, so the results are stable
+        return heapq.nsmallest(iTop, aScored, key=lambda x: (-x[0],
+            x[1].name))
+
+
+def get_signature_index():
+    """Return the CryptSignatureIndex for the current card list.
+
+       The index is built on first use and kept until
+       flush_signature_index is called."""
+    # pylint: disable-msg=W0603
+    # We want a single index for the whole application
+    global _oSignatureIndex
+    if _oSignatureIndex is None:
+        _oSignatureIndex = CryptSignatureIndex()
+    return _oSignatureIndex
+
+
+def flush_signature_index():
+    """Drop the shared index, since the card list has changed"""
+    # pylint: disable-msg=W0603
+    # We want a single index for the whole application
+    global _oSignatureIndex
+    _oSignatureIndex = None
@@ -23,18 +23,38 @@ class ChangedSignal(Signal):
        """
 
 
+class BulkChangedSignal(Signal):
+    """Syncronisation signal for changes to many cards in a card set.
+
+       Sent instead of a ChangedSignal for each card, so listeners can
+       handle the changes in one pass.
+       """
+
+
 # Senders
 def send_changed_signal(oCardSet, oPhysCard, iChange, cClass=PhysicalCardSet):
     """Sent when card counts change, as card sets may need to update."""
     cClass.sqlmeta.send(ChangedSignal, oCardSet, oPhysCard, iChange)
 
 
+def send_bulk_changed_signal(oCardSet, dChanges, cClass=PhysicalCardSet):
+    """Sent when the counts of several cards in a card set change.
+
+       dChanges is a dictionary of physical card to change in count."""
+    cClass.sqlmeta.send(BulkChangedSignal, oCardSet, dChanges)
+
+
 # Listeners
 def listen_changed(fListener, cClass):
     """Listens for the changed_signal."""
     listen(fListener, cClass, ChangedSignal)
 
 
+def listen_bulk_changed(fListener, cClass):
+    """Listens for the bulk changed signal."""
+    listen(fListener, cClass, BulkChangedSignal)
+
+
 def listen_row_destroy(fListener, cClass):
     """listen for the row destroyed signal sent when a card set is deleted."""
     listen(fListener, cClass, RowDestroySignal)
@@ -55,6 +75,12 @@ def disconnect_changed(fListener, cClass):
     dispatcher.disconnect(fListener, signal=ChangedSignal, sender=cClass)
 
 
+def disconnect_bulk_changed(fListener, cClass):
+    """Disconnects from the bulk changed signal."""
+    dispatcher.disconnect(fListener, signal=BulkChangedSignal,
+            sender=cClass)
+
+
 def disconnect_row_destroy(fListener, cClass):
     """Disconnect from the row destroyed signal."""
     dispatcher.disconnect(fListener, signal=RowDestroySignal, sender=cClass)
@@ -25,11 +25,14 @@ from logging import Logger
 from sutekh.core.SutekhObjects import PhysicalCard, AbstractCard, \
         PhysicalCardSet, Expansion, Clan, Virtue, Discipline, Rarity, \
         RarityPair, CardType, Ruling, TABLE_LIST, DisciplinePair, Creed, \
-        Sect, Title, Keyword, Artist, flush_cache, MAX_ID_LENGTH
+        Sect, Title, Keyword, Artist, flush_cache, MAX_ID_LENGTH, \
+        MapPhysicalCardToPhysicalCardSet
 from sutekh.core.CardSetHolder import CachedCardSetHolder
+from sutekh.core.CountedRelatedJoin import get_count_storage
 from sutekh.io.WhiteWolfTextParser import strip_braces
 from sutekh.SutekhUtility import refresh_tables
 from sutekh.core.DatabaseVersion import DatabaseVersion
+from sutekh.core.QueryProfiler import profile_operation
 
 # This file handles all the grunt work of the database upgrades. We have some
 # (arguablely overly) complex trickery to read old databases, and we create a
@@ -142,6 +145,18 @@ class RarityPair_Ev3(SQLObject):
     rarity = ForeignKey('Rarity')
 
 
+class MapPhysicalCardToPhysicalCardSet_v1(SQLObject):
+    """Table used to upgrade the card set mapping table from v1"""
+
+    class sqlmeta:
+        """meta class used to set the correct table"""
+        table = MapPhysicalCardToPhysicalCardSet.sqlmeta.table
+        cacheValues = False
+
+    physicalCard = ForeignKey('PhysicalCard', notNull=True)
+    physicalCardSet = ForeignKey('PhysicalCardSet', notNull=True)
+
+
 # pylint: enable-msg=C0103, W0232
 
 
@@ -208,6 +223,11 @@ def check_can_read_old_database(oConn):
     if not oVer.check_tables_and_versions([PhysicalCardSet],
             [PhysicalCardSet.tableversion], oConn):
         raise UnknownVersion("PhysicalCardSet")
+    if not oVer.check_tables_and_versions([MapPhysicalCardToPhysicalCardSet],
+            [MapPhysicalCardToPhysicalCardSet.tableversion], oConn) \
+            and not oVer.check_tables_and_versions(
+                    [MapPhysicalCardToPhysicalCardSet], [1], oConn):
+        raise UnknownVersion("MapPhysicalCardToPhysicalCardSet")
     return True
 
 
@@ -618,11 +638,42 @@ def copy_old_physical_card(oOrigConn, oTrans, oLogger, oVer):
     return (True, aMessages)
 
 
-def _copy_physical_card_set_loop(aSets, oTrans, oOrigConn, oLogger):
+def _get_card_counts(oSet, oOrigConn, cMapClass):
+    """Return a dictionary of physical card id to number of copies in
+       the card set, reading the mapping table with cMapClass."""
+    dCounts = {}
+    for oMapCard in cMapClass.selectBy(physicalCardSetID=oSet.id,
+            connection=oOrigConn):
+        # Version 1 mapping table entries always represent a single copy
+        iCount = getattr(oMapCard, 'count', 1)
+        dCounts.setdefault(oMapCard.physicalCardID, 0)
+        dCounts[oMapCard.physicalCardID] += iCount
+    return dCounts
+
+
+def _copy_card_counts(oCopy, dCounts, oTrans):
+    """Add the cards in dCounts to the copied card set.
+
+       Uses a single counted entry per card if count storage is enabled,
+       otherwise one entry per copy."""
+    bCountStorage = get_count_storage()
+    for iPhysCardId, iCount in dCounts.iteritems():
+        if bCountStorage:
+            MapPhysicalCardToPhysicalCardSet(physicalCardID=iPhysCardId,
+                    physicalCardSetID=oCopy.id, count=iCount,
+                    connection=oTrans)
+        else:
+            for _iCopy in range(iCount):
+                MapPhysicalCardToPhysicalCardSet(physicalCardID=iPhysCardId,
+                        physicalCardSetID=oCopy.id, connection=oTrans)
+
+
+def _copy_physical_card_set_loop(aSets, oTrans, oOrigConn, oLogger,
+        cMapClass=MapPhysicalCardToPhysicalCardSet):
     """Central loop for copying card sets.
 
        Copy the list of card sets in aSet, ensuring we copy parents before
-       children."""
+       children. cMapClass is used to read the card set contents."""
     bDone = False
     dDone = {}
     # SQLObject < 0.11.4 does this automatically, but later versions don't
@@ -647,8 +698,8 @@ def _copy_physical_card_set_loop(aSets, oTrans, oOrigConn, oLogger):
                         author=oSet.author, comment=oSet.comment,
                         annotations=oSet.annotations, inuse=oSet.inuse,
                         parent=oParent, connection=oTrans)
-                for oCard in oSet.cards:
-                    oCopy.addPhysicalCard(oCard.id)
+                _copy_card_counts(oCopy, _get_card_counts(oSet, oOrigConn,
+                    cMapClass), oTrans)
                 oCopy.syncUpdate()
                 oLogger.info('Copied PCS %s', oCopy.name)
                 dDone[oSet.id] = oCopy
@@ -672,11 +723,20 @@ def copy_old_physical_card_set(oOrigConn, oTrans, oLogger, oVer):
     # pylint: disable-msg=E1101, E1103
     # SQLObject confuses pylint
     aMessages = []
-    if oVer.check_tables_and_versions([PhysicalCardSet],
+    if not oVer.check_tables_and_versions([PhysicalCardSet],
             [PhysicalCardSet.tableversion], oOrigConn) \
-            and oVer.check_tables_and_versions([PhysicalCard],
+            or not oVer.check_tables_and_versions([PhysicalCard],
                     [PhysicalCard.tableversion], oOrigConn):
+        return (False, ["Unknown PhysicalCardSet version"])
+    if oVer.check_tables_and_versions([MapPhysicalCardToPhysicalCardSet],
+            [MapPhysicalCardToPhysicalCardSet.tableversion], oOrigConn):
         copy_physical_card_set(oOrigConn, oTrans, oLogger)
+    elif oVer.check_tables_and_versions([MapPhysicalCardToPhysicalCardSet],
+            [1], oOrigConn):
+        # Convert the one entry per copy mapping to counts
+        aSets = list(PhysicalCardSet.select(connection=oOrigConn))
+        _copy_physical_card_set_loop(aSets, oTrans, oOrigConn, oLogger,
+                MapPhysicalCardToPhysicalCardSet_v1)
     else:
         return (False, ["Unknown PhysicalCardSet version"])
     return (True, aMessages)
@@ -822,11 +882,14 @@ def make_card_set_holder(oCardSet, oOrigConn):
     oCS.inuse = oCardSet.inuse
     if oCardSet.parent:
         oCS.parent = oCardSet.parent.name
-    for oCard in oCardSet.cards:
+    for oMapCard in MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardSetID=oCardSet.id, connection=oOrigConn):
+        oCard = oMapCard.physicalCard
         if oCard.expansion is None:
-            oCS.add(1, oCard.abstractCard.canonicalName, None)
+            oCS.add(oMapCard.count, oCard.abstractCard.canonicalName, None)
         else:
-            oCS.add(1, oCard.abstractCard.canonicalName, oCard.expansion.name)
+            oCS.add(oMapCard.count, oCard.abstractCard.canonicalName,
+                    oCard.expansion.name)
     sqlhub.processConnection = oCurConn
     return oCS
 
@@ -906,6 +969,7 @@ def create_final_copy(oTempConn, oLogHandler=None):
     return (False, ["Unable to create tables"])
 
 
+@profile_operation('Upgrade database')
 def attempt_database_upgrade(oLogHandler=None):
     """Attempt to upgrade the database, going via a temporary memory copy."""
     oTempConn = connectionForURI("sqlite:///:memory:")
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Inverted index from abstract cards to the card sets containing them.
+
+   This is used to search large collections of decks, such as the TWDA,
+   for decks containing some cards without querying the card set map
+   table for each search. The index can be saved to a file, and is
+   checked against the database when loaded."""
+
+import os
+import marshal
+import logging
+from bisect import bisect_left
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Select, IN, AND, func
+from sutekh.core.SutekhObjects import PhysicalCard, \
+        MapPhysicalCardToPhysicalCardSet
+from sutekh.SutekhUtility import get_database_url
+
+# Bump this if the layout of the saved index changes
+INDEX_VERSION = 1
+
+
+def _get_index_key(aDeckIds, oConn):
+    """Return the key identifying the database state an index is valid
+       for.
+
+       This covers the card set ids and the number, total count and
+       largest id of their card set map rows, which catches card sets
+       being replaced and cards being added or removed. The database url
+       is included without any password, since the key is written to
+       disk."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    aDeckIds = sorted(aDeckIds)
+    aStats = [0, 0, 0]
+    if aDeckIds:
+        oMapQ = MapPhysicalCardToPhysicalCardSet.q
+        oSelect = Select([func.COUNT(oMapQ.id), func.SUM(oMapQ.count),
+            func.MAX(oMapQ.id)], where=IN(oMapQ.physicalCardSetID,
+                aDeckIds))
+        aStats = [int(x or 0) for x in oConn.queryOne(
+            oConn.sqlrepr(oSelect))]
+    return (INDEX_VERSION, get_database_url(oConn), aDeckIds, aStats)
+
+
+class DeckIndex(object):
+    """Index of the abstract cards in a set of decks.
+
+       For each abstract card id, the index holds the sorted list of ids of
+       the decks containing the card, and the matching list of counts, so
+       ANY and ALL searches are unions and intersections of sorted lists.
+       """
+
+    def __init__(self, aDeckIds, dCards):
+        self.aDeckIds = sorted(aDeckIds)
+        # abstract card id -> (deck ids, counts)
+        self.dCards = dCards
+
+    def _get_decks(self, iCardId):
+        """Return the sorted list of deck ids containing the card"""
+        if iCardId in self.dCards:
+            return self.dCards[iCardId][0]
+        return []
+
+    def find_any(self, aCardIds):
+        """Return the sorted list of ids of the decks containing any of
+           the cards"""
+        oDecks = set()
+        for iCardId in aCardIds:
+            oDecks.update(self._get_decks(iCardId))
+        return sorted(oDecks)
+
+    def find_all(self, aCardIds):
+        """Return the sorted list of ids of the decks containing all of the
+           cards"""
+        if not aCardIds:
+            return []
+        # Start with the shortest list, so each step is as small as
+        # possible
+        aLists = sorted([self._get_decks(iCardId) for iCardId in
+            set(aCardIds)], key=len)
+        aResult = aLists[0]
+        for aDecks in aLists[1:]:
+            aMatched = []
+            iPos = 0
+            for iDeck in aResult:
+                iPos = bisect_left(aDecks, iDeck, iPos)
+                if iPos == len(aDecks):
+                    break
+                if aDecks[iPos] == iDeck:
+                    aMatched.append(iDeck)
+            aResult = aMatched
+            if not aResult:
+                break
+        return list(aResult)
+
+    def get_count(self, iDeckId, iCardId):
+        """Return the number of copies of the card in the deck"""
+        if iCardId not in self.dCards:
+            return 0
+        aDecks, aCounts = self.dCards[iCardId]
+        iPos = bisect_left(aDecks, iDeckId)
+        if iPos < len(aDecks) and aDecks[iPos] == iDeckId:
+            return aCounts[iPos]
+        return 0
+
+    def get_cards(self, iDeckId, aCardIds):
+        """Return a dictionary of card id to count for the cards in
+           aCardIds that are in the deck"""
+        dCards = {}
+        for iCardId in aCardIds:
+            iCount = self.get_count(iDeckId, iCardId)
+            if iCount:
+                dCards[iCardId] = iCount
+        return dCards
+
+    def rank(self, aDeckIds, aCardIds):
+        """Sort the decks by how many of the cards they contain, and then
+           by the total number of copies, most first."""
+        def sort_key(iDeckId):
+            """Number of cards and copies in the deck"""
+            dCards = self.get_cards(iDeckId, aCardIds)
+            return (-len(dCards), -sum(dCards.values()), iDeckId)
+        return sorted(aDeckIds, key=sort_key)
+
+    def save(self, sIndexFile, oConn=None):
+        """Save the index to sIndexFile.
+
+           Returns True if the index was written."""
+        if oConn is None:
+            oConn = sqlhub.processConnection
+        sTempFile = sIndexFile + '.tmp'
+        try:
+            sData = marshal.dumps((_get_index_key(self.aDeckIds, oConn),
+                self.dCards))
+            fOut = open(sTempFile, 'wb')
+            try:
+                fOut.write(sData)
+            finally:
+                fOut.close()
+            if os.path.exists(sIndexFile):
+                # Needed for windows, which won't rename over existing files
+                os.remove(sIndexFile)
+            os.rename(sTempFile, sIndexFile)
+        except (IOError, OSError, ValueError), oErr:
+            logging.warn('Unable to write deck index %s: %s', sIndexFile,
+                    oErr)
+            return False
+        return True
+
+
+def build_deck_index(aDeckIds, oConn=None):
+    """Build the index for the given decks with a single query over the
+       card set map table."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    dCards = {}
+    if aDeckIds:
+        oMapQ = MapPhysicalCardToPhysicalCardSet.q
+        oSelect = Select([PhysicalCard.q.abstractCardID,
+            oMapQ.physicalCardSetID, func.SUM(oMapQ.count)],
+            where=AND(oMapQ.physicalCardID == PhysicalCard.q.id,
+                IN(oMapQ.physicalCardSetID, sorted(aDeckIds))),
+            groupBy=[PhysicalCard.q.abstractCardID, oMapQ.physicalCardSetID],
+            orderBy=[PhysicalCard.q.abstractCardID, oMapQ.physicalCardSetID])
+        for iCardId, iDeckId, iCount in oConn.queryAll(
+                oConn.sqlrepr(oSelect)):
+            aDecks, aCounts = dCards.setdefault(iCardId, ([], []))
+            aDecks.append(iDeckId)
+            aCounts.append(int(iCount))
+    return DeckIndex(aDeckIds, dCards)
+
+
+def load_deck_index(sIndexFile, aDeckIds, oConn=None):
+    """Load the index from sIndexFile, returning None if the file is
+       missing or doesn't match the database."""
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    if not os.path.exists(sIndexFile):
+        return None
+    try:
+        fIn = open(sIndexFile, 'rb')
+        try:
+            tKey, dCards = marshal.load(fIn)
+        finally:
+            fIn.close()
+    except (IOError, OSError, ValueError, EOFError, TypeError), oErr:
+        logging.warn('Unable to read deck index %s: %s', sIndexFile, oErr)
+        return None
+    if tKey != _get_index_key(aDeckIds, oConn):
+        return None
+    return DeckIndex(aDeckIds, dCards)
+
+
+def get_deck_index(sIndexFile, aDeckIds, oConn=None, bRebuild=False):
+    """Return the index for the given decks, loading it from sIndexFile if
+       it's up to date, and rebuilding and saving it otherwise.
+
+       bRebuild forces the index to be rebuilt, and should be used after
+       the decks have been changed."""
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    oIndex = None
+    if not bRebuild:
+        oIndex = load_deck_index(sIndexFile, aDeckIds, oConn)
+    if oIndex is None:
+        oIndex = build_deck_index(aDeckIds, oConn)
+        # There's no point in saving indexes of temporary databases
+        if ':memory:' not in oConn.uri():
+            oIndex.save(sIndexFile, oConn)
+    return oIndex
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Hypergeometric probabilities for drawing groups of cards.
+
+   The cards of interest are split into groups (usually all the copies of
+   a single card), with all the remaining cards treated as a final 'other'
+   group. DrawProbabilities calculates the probability of drawing exactly,
+   or at least, a given number of cards from each group for a whole table
+   of choices and draw counts at once, sharing the work between entries."""
+
+from math import log, exp
+
+# Cache of log(n!), extended as needed
+_LOG_FACTORIALS = [0.0]
+
+
+def _log_factorial(iNum):
+    """Return log(iNum!), using the cached values."""
+    while len(_LOG_FACTORIALS) <= iNum:
+        _LOG_FACTORIALS.append(_LOG_FACTORIALS[-1] +
+                log(len(_LOG_FACTORIALS)))
+    return _LOG_FACTORIALS[iNum]
+
+
+def choose(iChoices, iTotal):
+    """Returns number of unordered combinations of iChoices objects from
+       iTotal (iTotal)(iTotal-1)...(iTotal-iChoices+1)/iChoices!"""
+    if iChoices < 0 or iChoices > iTotal:
+        return 0
+    iNumerator = 1
+    iDenom = 1
+    for iNum in range(iChoices):
+        iNumerator *= (iTotal - iNum)
+        iDenom *= (iNum + 1)
+    return iNumerator // iDenom
+
+
+def log_choose(iChoices, iTotal):
+    """Returns log(choose(iChoices, iTotal)). iChoices must be between
+       0 and iTotal."""
+    return _log_factorial(iTotal) - _log_factorial(iChoices) - \
+            _log_factorial(iTotal - iChoices)
+
+
+def gen_choice_list(aCounts, iMaxCards=None):
+    """Generate all the possible choices from groups of aCounts cards.
+
+       Each choice is a list of the number of cards from each group.
+       If iMaxCards is given, only choices of at most iMaxCards cards are
+       generated. The choices are sorted by the total number of cards,
+       and then by the number from each group in order."""
+    if iMaxCards is None:
+        iMaxCards = sum(aCounts)
+    aList = [[]]
+    for iCount in reversed(aCounts):
+        aList = [[iChoice] + aChoices for iChoice in range(iCount + 1)
+                for aChoices in aList if iChoice + sum(aChoices) <= iMaxCards]
+    aList.sort(key=lambda x: [sum(x)] + x)
+    return aList
+
+
+def _check_counts(aFound, aObjects):
+    """Raise a RuntimeError if aFound and aObjects don't match"""
+    if len(aFound) != len(aObjects):
+        raise RuntimeError('Invalid input: aFound : %s, aObjects: %s' % (
+            ','.join([str(x) for x in aFound]), ','.join([str(x) for x in
+                aObjects])))
+
+
+class DrawProbabilities(object):
+    """Calculate draw probabilities for a fixed set of card groups.
+
+       aObjects is the list of the number of cards in each group, and
+       iTotal is the total number of cards being drawn from.
+
+       Writing the probability of drawing at least aFound from the groups
+       in iDraws draws as a sum over the total number of interesting cards
+       drawn, the number of ways of drawing those cards is the product of
+       the polynomials sum(choose(j, n) x^j for j >= k) for each group,
+       which is built up one group at a time. The partial products are
+       cached, so choices with the same leading counts share the work, and
+       the result gives the probabilities for every number of draws
+       directly."""
+
+    def __init__(self, aObjects, iTotal):
+        if min(aObjects + [0]) < 0 or iTotal <= 0 or \
+                sum(aObjects) > iTotal:
+            raise RuntimeError('Invalid values for multivariate'
+                    ' hypergeometric probability calculation: aObjects: %s'
+                    ' iTotal: %d' % (','.join([str(x) for x in aObjects]),
+                        iTotal))
+        self.aObjects = list(aObjects)
+        self.iTotal = iTotal
+        self.iOther = iTotal - sum(aObjects)
+        # prefix of aFound -> ways of drawing at least the prefix,
+        # indexed by the number of cards drawn from those groups
+        self._dAtLeast = {(): [1]}
+        # (cards from the groups, draws) -> probability
+        self._dDrawProbs = {}
+
+    def _get_ways(self, aFound):
+        """Return the list of the number of ways of drawing at least
+           aFound from the groups, indexed by the total number of cards
+           drawn from the groups."""
+        tFound = tuple(aFound)
+        if tFound in self._dAtLeast:
+            return self._dAtLeast[tFound]
+        aPrev = self._get_ways(tFound[:-1])
+        iObjects = self.aObjects[len(tFound) - 1]
+        # Convolve with this group's choices of at least iFound cards
+        iFound = tFound[-1]
+        aWays = [0] * (len(aPrev) + iObjects)
+        for iCur in range(iFound, iObjects + 1):
+            iChoices = choose(iCur, iObjects)
+            for iPrev, iPrevWays in enumerate(aPrev):
+                if iPrevWays:
+                    aWays[iPrev + iCur] += iPrevWays * iChoices
+        self._dAtLeast[tFound] = aWays
+        return aWays
+
+    def _draw_prob(self, iNum, iDraws):
+        """Probability of any specific way of drawing iNum interesting
+           cards, with the rest of the iDraws cards coming from the other
+           cards"""
+        tKey = (iNum, iDraws)
+        if tKey not in self._dDrawProbs:
+            iRest = iDraws - iNum
+            if iRest < 0 or iRest > self.iOther:
+                self._dDrawProbs[tKey] = 0.0
+            else:
+                self._dDrawProbs[tKey] = exp(log_choose(iRest,
+                    self.iOther) - log_choose(iDraws, self.iTotal))
+        return self._dDrawProbs[tKey]
+
+    def _check_draws(self, iDraws):
+        """Raise a RuntimeError for an invalid number of draws"""
+        if iDraws <= 0 or iDraws > self.iTotal:
+            raise RuntimeError('Invalid number of draws for multivariate'
+                    ' hypergeometric probability calculation: iDraws: %d'
+                    ' iTotal: %d' % (iDraws, self.iTotal))
+
+    def exact(self, aFound, iDraws):
+        """Return the probablity of drawing exactly aFound from the groups
+           in iDraws draws."""
+        _check_counts(aFound, self.aObjects)
+        self._check_draws(iDraws)
+        if min(aFound + [0]) < 0:
+            raise RuntimeError('Invalid values for multivariate'
+                    ' hypergeometric probability calculation: aFound: %s'
+                    % ','.join([str(x) for x in aFound]))
+        iWays = 1
+        for iFound, iObjects in zip(aFound, self.aObjects):
+            iWays *= choose(iFound, iObjects)
+        if not iWays:
+            return 0.0
+        return iWays * self._draw_prob(sum(aFound), iDraws)
+
+    def at_least(self, aFound, iDraws):
+        """Return the probablity of drawing at least aFound from the groups
+           in iDraws draws."""
+        _check_counts(aFound, self.aObjects)
+        self._check_draws(iDraws)
+        aWays = self._get_ways([max(x, 0) for x in aFound])
+        return sum([iWays * self._draw_prob(iNum, iDraws) for iNum, iWays
+            in enumerate(aWays) if iWays and iNum <= iDraws])
+
+    def get_table(self, aChoices, aDraws):
+        """Return a dictionary of choice (as a tuple) to a list of
+           (exact probability, at least probability) pairs, one for each
+           number of draws in aDraws."""
+        dTable = {}
+        for aFound in aChoices:
+            dTable[tuple(aFound)] = [(self.exact(aFound, iDraws),
+                self.at_least(aFound, iDraws)) for iDraws in aDraws]
+        return dTable
+
+
+def multi_hyper_prob(aFound, iDraws, aObjects, iTotal):
+    """Multivariate hypergeometric probability:
+
+       Given a list of draw numbers: aFound = [iFound1, iFound2 ... iFoundN]
+       form aObjects = [iObjects1, iObjects2 ... iObjectsN]
+       return the probably of seeing exactly aFound from iDraws
+       """
+    _check_counts(aFound, aObjects)
+    return DrawProbabilities(aObjects, iTotal).exact(aFound, iDraws)
+
+
+def hyper_prob_at_least(aFound, iDraws, aObjects, iTotal):
+    """Returns the probablity of drawing at least aFound from aObjects objects
+       of interest from iTotal objects in iDraw draws."""
+    _check_counts(aFound, aObjects)
+    return DrawProbabilities(aObjects, iTotal).at_least(aFound, iDraws)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Monte Carlo simulation of card draws.
+
+   Large numbers of hands are drawn from a deck, and the number of cards
+   drawn from each group of interest is aggregated into means and
+   confidence intervals, alongside the exact values for comparison.
+
+   The draws are vectorised with NumPy if it's available, and done one
+   hand at a time otherwise."""
+
+import random
+from math import sqrt
+from sutekh.core.DrawProbabilities import DrawProbabilities
+
+# pylint: disable-msg=F0401
+# numpy may not be installed
+try:
+    import numpy
+    HAVE_NUMPY = True
+except ImportError:
+    numpy = None
+    HAVE_NUMPY = False
+# pylint: enable-msg=F0401
+
+# Number of hands drawn together, to limit the memory used
+BATCH_SIZE = 2000
+# z value for 95% confidence intervals
+CONFIDENCE_Z = 1.96
+
+
+def hypergeometric_mean(iItems, iDraws, iTotal):
+    """Mean of the hypergeometric distribution for a population of iTotal
+       with iItems of interest and drawing iDraws items.
+       In the usual notation, iItems=n, iDraws=m, iTotal=N
+       """
+    return iItems * iDraws / float(iTotal)  # mean = nm/N
+
+
+class DrawSimulator(object):
+    """Simulate drawing hands from a deck.
+
+       aCards is the list of card names in the deck, including duplicates,
+       and dGroups is a dictionary of group name to the set of card names
+       in that group. The cards are encoded as integers, so each drawn hand
+       is an array of card indexes."""
+
+    def __init__(self, aCards, dGroups, iSeed=None):
+        self.aNames = sorted(set(aCards))
+        dIndex = dict([(sName, iIdx) for iIdx, sName in
+            enumerate(self.aNames)])
+        self.aDeck = [dIndex[sName] for sName in aCards]
+        self.aGroups = sorted(dGroups)
+        # card index -> list of the group indexes the card is in
+        self.aCardGroups = [[iGroup for iGroup, sGroup in
+            enumerate(self.aGroups) if sName in dGroups[sGroup]]
+            for sName in self.aNames]
+        # Number of cards in the deck in each group
+        self.aGroupSizes = [0] * len(self.aGroups)
+        for iCard in self.aDeck:
+            for iGroup in self.aCardGroups[iCard]:
+                self.aGroupSizes[iGroup] += 1
+        self.iSeed = iSeed
+
+    def _numpy_counts(self, aDraws, iHands):
+        """Yield arrays of the number of cards in each group, of shape
+           (draw steps, hands, groups), for batches of hands"""
+        oRandom = numpy.random.RandomState(self.iSeed)
+        aDeck = numpy.array(self.aDeck)
+        aMembership = numpy.zeros((len(self.aNames), len(self.aGroups)),
+                dtype=int)
+        for iCard, aGroups in enumerate(self.aCardGroups):
+            aMembership[iCard, aGroups] = 1
+        iMax = max(aDraws)
+        iDone = 0
+        while iDone < iHands:
+            iBatch = min(BATCH_SIZE, iHands - iDone)
+            # Sorting random keys shuffles every hand at once
+            aOrder = oRandom.random_sample((iBatch, len(aDeck))).argsort(
+                    axis=1)[:, :iMax]
+            aDrawn = aMembership[aDeck[aOrder]].cumsum(axis=1)
+            yield aDrawn[:, [iDraws - 1 for iDraws in aDraws], :].swapaxes(
+                    0, 1)
+            iDone += iBatch
+
+    def _python_counts(self, aDraws, iHands):
+        """Yield the number of cards in each group, as nested lists
+           indexed by draw step, hand and group, one hand at a time"""
+        oRandom = random.Random(self.iSeed)
+        for _iHand in xrange(iHands):
+            aHand = oRandom.sample(self.aDeck, max(aDraws))
+            aResult = []
+            for iDraws in aDraws:
+                aCounts = [0] * len(self.aGroups)
+                for iCard in aHand[:iDraws]:
+                    for iGroup in self.aCardGroups[iCard]:
+                        aCounts[iGroup] += 1
+                aResult.append([aCounts])
+            yield aResult
+
+    def simulate(self, aDraws, iHands):
+        """Draw iHands hands and summarise the number of cards from each
+           group after each of the numbers of draws in aDraws.
+
+           Returns a dictionary of number of draws to a dictionary of group
+           name to a dictionary of statistics:
+           'mean', 'low', 'high': the mean number of cards drawn and the 95%
+           confidence interval, 'any', 'any low', 'any high': the fraction of
+           hands with at least one card from the group and its 95%
+           confidence interval, and 'expected' and 'expected any', the
+           exact values of the mean and the fraction."""
+        if max(aDraws) > len(self.aDeck):
+            raise RuntimeError('Can not draw %d cards from %d' % (
+                max(aDraws), len(self.aDeck)))
+        iGroups = len(self.aGroups)
+        aSum = [[0] * iGroups for _iDraws in aDraws]
+        aSumSq = [[0] * iGroups for _iDraws in aDraws]
+        aAny = [[0] * iGroups for _iDraws in aDraws]
+        if HAVE_NUMPY:
+            for aCounts in self._numpy_counts(aDraws, iHands):
+                for iStep, aStep in enumerate(aCounts):
+                    aSum[iStep] = aStep.sum(axis=0) + aSum[iStep]
+                    aSumSq[iStep] = (aStep ** 2).sum(axis=0) + aSumSq[iStep]
+                    aAny[iStep] = (aStep > 0).sum(axis=0) + aAny[iStep]
+        else:
+            for aCounts in self._python_counts(aDraws, iHands):
+                for iStep, aStep in enumerate(aCounts):
+                    for iGroup, iCount in enumerate(aStep[0]):
+                        aSum[iStep][iGroup] += iCount
+                        aSumSq[iStep][iGroup] += iCount * iCount
+                        aAny[iStep][iGroup] += iCount > 0
+        dResults = {}
+        for iStep, iDraws in enumerate(aDraws):
+            dResults[iDraws] = {}
+            for iGroup, sGroup in enumerate(self.aGroups):
+                dResults[iDraws][sGroup] = self._get_stats(iGroup, iDraws,
+                        iHands, float(aSum[iStep][iGroup]),
+                        float(aSumSq[iStep][iGroup]),
+                        float(aAny[iStep][iGroup]))
+        return dResults
+
+    # pylint: disable-msg=R0913
+    # We need all these arguments
+    def _get_stats(self, iGroup, iDraws, iHands, fSum, fSumSq, fAny):
+        """Calculate the statistics for a single group and number of
+           draws"""
+        fMean = fSum / iHands
+        if iHands > 1:
+            fVar = max(fSumSq / iHands - fMean * fMean, 0.0) * iHands / \
+                    (iHands - 1)
+        else:
+            fVar = 0.0
+        fMeanErr = CONFIDENCE_Z * sqrt(fVar / iHands)
+        fFrac = fAny / iHands
+        fFracErr = CONFIDENCE_Z * sqrt(fFrac * (1 - fFrac) / iHands)
+        iSize = self.aGroupSizes[iGroup]
+        oProbs = DrawProbabilities([iSize], len(self.aDeck))
+        return {
+                'mean': fMean,
+                'low': fMean - fMeanErr,
+                'high': fMean + fMeanErr,
+                'any': fFrac,
+                'any low': max(fFrac - fFracErr, 0.0),
+                'any high': min(fFrac + fFracErr, 1.0),
+                'expected': hypergeometric_mean(iSize, iDraws,
+                    len(self.aDeck)),
+                'expected any': oProbs.at_least([1], iDraws),
+                }
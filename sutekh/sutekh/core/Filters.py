@@ -42,6 +42,37 @@ def IN(oCol, oListOrSelect):
         return SQLOBJ_IN(oCol, oListOrSelect)
 # pylint: enable-msg=C0103
 
+# The CardIndex used to evaluate filters in memory, if any
+_oCardIndex = None
+
+
+def set_card_index(oIndex):
+    """Set the CardIndex used to evaluate filters without queries.
+
+       None disables the index, so all filters are evaluated by the
+       database."""
+    # pylint: disable-msg=W0603
+    # We want a single index for the whole application
+    global _oCardIndex
+    _oCardIndex = oIndex
+
+
+def get_card_index():
+    """Return the current CardIndex, or None"""
+    return _oCardIndex
+
+
+def get_filter_card_ids(oFilter):
+    """Return the set of AbstractCard ids matched by oFilter.
+
+       Returns None if there is no card index, or the filter can't be
+       evaluated using it."""
+    if _oCardIndex is None:
+        return None
+    # pylint: disable-msg=W0212
+    # We delibrately access the protected member
+    return oFilter._get_card_ids(_oCardIndex)
+
 
 # Filter Base Class
 class Filter(object):
@@ -63,9 +94,18 @@ class Filter(object):
         return self.is_physical_card_only()
 
     def select(self, cCardClass):
-        """cCardClass.select(...) applying the filter to the selection."""
-        return cCardClass.select(self._get_expression(),
-                join=self._get_joins())
+        """cCardClass.select(...) applying the filter to the selection.
+
+           If a card index has been set, the parts of the filter the index
+           can handle are evaluated in memory and passed to the database
+           as lists of card ids."""
+        # pylint: disable-msg=W0212
+        # we delibrately access protected members
+        oFilter = self
+        if _oCardIndex is not None:
+            oFilter = _apply_card_index(self, cCardClass, _oCardIndex)
+        return cCardClass.select(oFilter._get_expression(),
+                join=oFilter._get_joins())
 
     def _get_expression(self):
         """Actual filter expression"""
@@ -75,6 +115,16 @@ class Filter(object):
         """joins needed by the filter"""
         raise NotImplementedError
 
+    # pylint: disable-msg=W0613
+    # oIndex is needed by the subclasses
+    def _get_card_ids(self, oIndex):
+        """Set of AbstractCard ids matched by the filter, looked up in
+           the CardIndex oIndex.
+
+           Returns None if the filter can't be evaluated using the index.
+           """
+        return None
+
     def is_physical_card_only(self):
         """Return true if this filter only operates on physical cards.
 
@@ -134,6 +184,16 @@ class FilterAndBox(FilterBox):
         """Combine filters with AND"""
         return AND(*[x._get_expression() for x in self])
 
+    def _get_card_ids(self, oIndex):
+        """Intersection of the ids of the subfilters"""
+        aResult = oIndex.get_all()
+        for oSubFilter in self:
+            aIds = oSubFilter._get_card_ids(oIndex)
+            if aIds is None:
+                return None
+            aResult = aResult & aIds
+        return aResult
+
 
 class FilterOrBox(FilterBox):
     """OR a list of filters."""
@@ -145,6 +205,19 @@ class FilterOrBox(FilterBox):
         """Combine filters with OR"""
         return OR(*[x._get_expression() for x in self])
 
+    def _get_card_ids(self, oIndex):
+        """Union of the ids of the subfilters"""
+        if not self:
+            # Empty OR doesn't restrict the results, as in the SQL case
+            return oIndex.get_all()
+        aResult = frozenset()
+        for oSubFilter in self:
+            aIds = oSubFilter._get_card_ids(oIndex)
+            if aIds is None:
+                return None
+            aResult = aResult | aIds
+        return aResult
+
 
 # NOT Filter
 class FilterNot(Filter):
@@ -189,6 +262,13 @@ class FilterNot(Filter):
         else:
             raise RuntimeError("FilterNot unable to handle sub-filter type.")
 
+    def _get_card_ids(self, oIndex):
+        """All the cards not matched by the subfilter"""
+        aIds = self.__oSubFilter._get_card_ids(oIndex)
+        if aIds is None:
+            return None
+        return oIndex.get_all() - aIds
+
 
 class CachedFilter(Filter):
     """A filter which caches joins and expression lookups"""
@@ -207,6 +287,11 @@ class CachedFilter(Filter):
     def _get_joins(self):
         return self._aJoins
 
+    def _get_card_ids(self, oIndex):
+        # pylint: disable-msg=W0212
+        # We delibrately access the protected members here
+        return self._oSubFilter._get_card_ids(oIndex)
+
     # pylint: disable-msg=W0212
     # W0212 - we are delibrately accesing protected members her
     types = property(fget=lambda self: self._oSubFilter.types,
@@ -227,6 +312,9 @@ class NullFilter(Filter):
     def _get_joins(self):
         return []
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_all()
+
 
 # NotNullFilter
 class NotNullFilter(NullFilter):
@@ -237,13 +325,17 @@ class NotNullFilter(NullFilter):
     def _get_expression(self):
         return NOT(TRUE)  # See Null Filter
 
+    def _get_card_ids(self, oIndex):
+        return frozenset()
+
 
 # Base Classes for Common Filter Idioms
 class SingleFilter(Filter):
     """Base class for filters on single items which connect to AbstractCard
        via a mapping table.
 
-       Sub-class should set self._oMapTable, self._oMapField and self._oId.
+       Sub-class should set self._sMapTable, self._oMapTable,
+       self._oMapField and self._oId.
        """
     # pylint: disable-msg=E1101, C0111
     # E1101 - We expect subclasses to provide _oMapTable and friends
@@ -255,12 +347,16 @@ class SingleFilter(Filter):
     def _get_expression(self):
         return self._oIdField == self._oId
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_ids(self._sMapTable, [self._oId])
+
 
 class MultiFilter(Filter):
     """Base class for filters on multiple items which connect to AbstractCard
        via a mapping table.
 
-       Sub-class should set self._oMapTable, self._oMapField and self._aIds.
+       Sub-class should set self._sMapTable, self._oMapTable,
+       self._oMapField and self._aIds.
        """
 
     # pylint: disable-msg=E1101, C0111
@@ -273,6 +369,12 @@ class MultiFilter(Filter):
     def _get_expression(self):
         return IN(self._oIdField, self._aIds)
 
+    def _get_card_ids(self, oIndex):
+        if 'AbstractCard' not in self.types:
+            # Subclasses which don't filter cards (ParentCardSetFilter)
+            return None
+        return oIndex.get_ids(self._sMapTable, self._aIds)
+
 
 class DirectFilter(Filter):
     """Base class for filters which query AbstractTable directly."""
@@ -319,7 +421,8 @@ class ClanFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = IClan(sClan).id
-        self._oMapTable = make_table_alias('abs_clan_map')
+        self._sMapTable = 'abs_clan_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.clan_id
 
 
@@ -336,7 +439,8 @@ class MultiClanFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [IClan(x).id for x in aClans]
-        self._oMapTable = make_table_alias('abs_clan_map')
+        self._sMapTable = 'abs_clan_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.clan_id
 
     # pylint: disable-msg=C0111
@@ -354,7 +458,8 @@ class DisciplineFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [oP.id for oP in IDiscipline(sDiscipline).pairs]
-        self._oMapTable = make_table_alias('abs_discipline_pair_map')
+        self._sMapTable = 'abs_discipline_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.discipline_pair_id
 
 
@@ -374,7 +479,8 @@ class MultiDisciplineFilter(MultiFilter):
         for sDis in aDisciplines:
             oPairs += IDiscipline(sDis).pairs
         self._aIds = [oP.id for oP in oPairs]
-        self._oMapTable = make_table_alias('abs_discipline_pair_map')
+        self._sMapTable = 'abs_discipline_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.discipline_pair_id
 
     # pylint: disable-msg=C0111
@@ -392,7 +498,8 @@ class ExpansionFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [oP.id for oP in IExpansion(sExpansion).pairs]
-        self._oMapTable = make_table_alias('abs_rarity_pair_map')
+        self._sMapTable = 'abs_rarity_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.rarity_pair_id
 
 
@@ -407,7 +514,8 @@ class MultiExpansionFilter(MultiFilter):
         for sExp in aExpansions:
             oPairs += IExpansion(sExp).pairs
         self._aIds = [oP.id for oP in oPairs]
-        self._oMapTable = make_table_alias('abs_rarity_pair_map')
+        self._sMapTable = 'abs_rarity_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.rarity_pair_id
 
 
@@ -422,7 +530,8 @@ class ExpansionRarityFilter(SingleFilter):
         # SQLObject methods not detected by pylint
         sExpansion, sRarity = tExpanRarity
         self._oId = IRarityPair((IExpansion(sExpansion), IRarity(sRarity))).id
-        self._oMapTable = make_table_alias('abs_rarity_pair_map')
+        self._sMapTable = 'abs_rarity_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.rarity_pair_id
 
 
@@ -449,7 +558,8 @@ class MultiExpansionRarityFilter(MultiFilter):
         for sExpansion, sRarity in aValues:
             self._aIds.append(IRarityPair((IExpansion(sExpansion),
                 IRarity(sRarity))).id)
-        self._oMapTable = make_table_alias('abs_rarity_pair_map')
+        self._sMapTable = 'abs_rarity_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.rarity_pair_id
 
     # pylint: disable-msg=C0111
@@ -481,7 +591,8 @@ class DisciplineLevelFilter(MultiFilter):
         # There will be 0 or 1 ids
         self._aIds = [oP.id for oP in IDiscipline(sDiscipline).pairs if
                 oP.level == sLevel]
-        self._oMapTable = make_table_alias('abs_discipline_pair_map')
+        self._sMapTable = 'abs_discipline_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.discipline_pair_id
 
 
@@ -509,7 +620,8 @@ class MultiDisciplineLevelFilter(MultiFilter):
             assert sLevel in ('inferior', 'superior')
             self._aIds.extend([oP.id for oP in IDiscipline(sDiscipline).pairs
                     if oP.level == sLevel])
-        self._oMapTable = make_table_alias('abs_discipline_pair_map')
+        self._sMapTable = 'abs_discipline_pair_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.discipline_pair_id
 
     # pylint: disable-msg=C0111
@@ -538,7 +650,8 @@ class CardTypeFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = ICardType(sCardType).id
-        self._oMapTable = make_table_alias('abs_type_map')
+        self._sMapTable = 'abs_type_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.card_type_id
 
 
@@ -554,7 +667,8 @@ class MultiCardTypeFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [ICardType(x).id for x in aCardTypes]
-        self._oMapTable = make_table_alias('abs_type_map')
+        self._sMapTable = 'abs_type_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.card_type_id
 
     # pylint: disable-msg=C0111
@@ -572,7 +686,8 @@ class CryptCardFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [ICardType(x).id for x in CRYPT_TYPES]
-        self._oMapTable = make_table_alias('abs_type_map')
+        self._sMapTable = 'abs_type_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.card_type_id
 
 
@@ -584,7 +699,8 @@ class SectFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = ISect(sSect).id
-        self._oMapTable = make_table_alias('abs_sect_map')
+        self._sMapTable = 'abs_sect_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.sect_id
 
 
@@ -601,7 +717,8 @@ class MultiSectFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [ISect(x).id for x in aSects]
-        self._oMapTable = make_table_alias('abs_sect_map')
+        self._sMapTable = 'abs_sect_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.sect_id
 
     # pylint: disable-msg=C0111
@@ -619,7 +736,8 @@ class TitleFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = ITitle(sTitle).id
-        self._oMapTable = make_table_alias('abs_title_map')
+        self._sMapTable = 'abs_title_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.title_id
 
 
@@ -635,7 +753,8 @@ class MultiTitleFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [ITitle(x).id for x in aTitles]
-        self._oMapTable = make_table_alias('abs_title_map')
+        self._sMapTable = 'abs_title_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.title_id
 
     # pylint: disable-msg=C0111
@@ -653,7 +772,8 @@ class CreedFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = ICreed(sCreed).id
-        self._oMapTable = make_table_alias('abs_creed_map')
+        self._sMapTable = 'abs_creed_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.creed_id
 
 
@@ -670,7 +790,8 @@ class MultiCreedFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [ICreed(x).id for x in aCreeds]
-        self._oMapTable = make_table_alias('abs_creed_map')
+        self._sMapTable = 'abs_creed_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.creed_id
 
     # pylint: disable-msg=C0111
@@ -688,7 +809,8 @@ class VirtueFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = IVirtue(sVirtue).id
-        self._oMapTable = make_table_alias('abs_virtue_map')
+        self._sMapTable = 'abs_virtue_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.virtue_id
 
 
@@ -705,7 +827,8 @@ class MultiVirtueFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [IVirtue(x).id for x in aVirtues]
-        self._oMapTable = make_table_alias('abs_virtue_map')
+        self._sMapTable = 'abs_virtue_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.virtue_id
 
     # pylint: disable-msg=C0111
@@ -723,7 +846,8 @@ class ArtistFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = IArtist(sArtist).id
-        self._oMapTable = make_table_alias('abs_artist_map')
+        self._sMapTable = 'abs_artist_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.artist_id
 
 
@@ -740,7 +864,8 @@ class MultiArtistFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [IArtist(x).id for x in aArtists]
-        self._oMapTable = make_table_alias('abs_artist_map')
+        self._sMapTable = 'abs_artist_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.artist_id
 
     # pylint: disable-msg=C0111
@@ -758,7 +883,8 @@ class KeywordFilter(SingleFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._oId = IKeyword(sKeyword).id
-        self._oMapTable = make_table_alias('abs_keyword_map')
+        self._sMapTable = 'abs_keyword_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.keyword_id
 
 
@@ -775,7 +901,8 @@ class MultiKeywordFilter(MultiFilter):
         # pylint: disable-msg=E1101
         # SQLObject methods not detected by pylint
         self._aIds = [IKeyword(x).id for x in aKeywords]
-        self._oMapTable = make_table_alias('abs_keyword_map')
+        self._sMapTable = 'abs_keyword_map'
+        self._oMapTable = make_table_alias(self._sMapTable)
         self._oIdField = self._oMapTable.q.keyword_id
 
     # pylint: disable-msg=C0111
@@ -799,6 +926,9 @@ class GroupFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.group == self.__iGroup
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('group', [self.__iGroup])
+
 
 class MultiGroupFilter(DirectFilter):
     """Filter on multiple Groups"""
@@ -828,6 +958,9 @@ class MultiGroupFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return IN(AbstractCard.q.group, self.__aGroups)
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('group', self.__aGroups)
+
 
 class CapacityFilter(DirectFilter):
     """Filter on Capacity"""
@@ -843,6 +976,9 @@ class CapacityFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.capacity == self.__iCap
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('capacity', [self.__iCap])
+
 
 class MultiCapacityFilter(DirectFilter):
     """Filter on a list of Capacities"""
@@ -870,6 +1006,9 @@ class MultiCapacityFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return IN(AbstractCard.q.capacity, self.__aCaps)
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('capacity', self.__aCaps)
+
 
 class CostFilter(DirectFilter):
     """Filter on Cost"""
@@ -890,6 +1029,9 @@ class CostFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.cost == self.__iCost
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('cost', [self.__iCost])
+
 
 class MultiCostFilter(DirectFilter):
     """Filter on a list of Costs"""
@@ -928,6 +1070,11 @@ class MultiCostFilter(DirectFilter):
                 return AbstractCard.q.cost == None
         return IN(AbstractCard.q.cost, self.__aCost)
 
+    def _get_card_ids(self, oIndex):
+        if self.__bZeroCost:
+            return oIndex.get_column_ids('cost', self.__aCost + [None])
+        return oIndex.get_column_ids('cost', self.__aCost)
+
 
 class CostTypeFilter(DirectFilter):
     """Filter on cost type"""
@@ -944,6 +1091,9 @@ class CostTypeFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.costtype == self.__sCostType.lower()
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('costtype', [self.__sCostType])
+
 
 class MultiCostTypeFilter(DirectFilter):
     """Filter on a list of cost types"""
@@ -972,6 +1122,9 @@ class MultiCostTypeFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return IN(AbstractCard.q.costtype, self.__aCostTypes)
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('costtype', self.__aCostTypes)
+
 
 class LifeFilter(DirectFilter):
     """Filter on life"""
@@ -987,6 +1140,9 @@ class LifeFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.life == self.__iLife
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('life', [self.__iLife])
+
 
 class MultiLifeFilter(DirectFilter):
     """Filter on a list of list values"""
@@ -1016,6 +1172,9 @@ class MultiLifeFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return IN(AbstractCard.q.life, self.__aLife)
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_column_ids('life', self.__aLife)
+
 
 class CardTextFilter(DirectFilter):
     """Filter on Card Text"""
@@ -1045,6 +1204,12 @@ class CardTextFilter(DirectFilter):
         return LIKE(func.LOWER(AbstractCard.q.search_text),
                 '%' + self.__sPattern + '%')
 
+    def _get_card_ids(self, oIndex):
+        sPattern = '%' + self.__sPattern.decode('utf-8') + '%'
+        if self.__bBraces:
+            return oIndex.get_text_ids('text', sPattern)
+        return oIndex.get_text_ids('search_text', sPattern)
+
 
 class CardNameFilter(DirectFilter):
     """Filter on the name of the card"""
@@ -1079,6 +1244,12 @@ class CardNameFilter(DirectFilter):
         return LIKE(AbstractCard.q.canonicalName,
                 '%' + self.__sPattern + '%')
 
+    def _get_card_ids(self, oIndex):
+        sPattern = self.__sPattern
+        if not isinstance(sPattern, unicode):
+            sPattern = sPattern.decode('utf-8')
+        return oIndex.get_text_ids('canonicalName', '%' + sPattern + '%')
+
 
 class CardFunctionFilter(DirectFilter):
     """Filter for various interesting card properties - untap, stealth, etc."""
@@ -1165,6 +1336,10 @@ class CardFunctionFilter(DirectFilter):
         """Expression for the constructed filter"""
         return self._oFilter._get_expression()
 
+    def _get_card_ids(self, oIndex):
+        """Ids for the constructed filter"""
+        return self._oFilter._get_card_ids(oIndex)
+
 
 class PhysicalCardFilter(Filter):
     """Filter for converting a filter on abstract cards to a filter on
@@ -1257,6 +1432,8 @@ class CardSetMultiCardCountFilter(DirectFilter):
         self._oFilters = []
         self._aCardSetIds = aIds
         self._oZeroQuery = None
+        # Each mapping row holds count copies, so we sum the counts
+        # rather than counting the rows
         if '0' in aCounts:
             aCounts.remove('0')
             self._oZeroQuery = Select(
@@ -1279,7 +1456,8 @@ class CardSetMultiCardCountFilter(DirectFilter):
                     MapPhysicalCardToPhysicalCardSet.q.physicalCardID),
                 groupBy=(PhysicalCard.q.abstractCardID,
                     MapPhysicalCardToPhysicalCardSet.q.physicalCardSetID),
-                having=func.COUNT(PhysicalCard.q.abstractCardID) > 30)
+                having=func.SUM(
+                    MapPhysicalCardToPhysicalCardSet.q.count) > 30)
             self._oFilters.append(oGreater30Query)
         if aCounts:
             # SQLite doesn't like strings here, so convert to int
@@ -1292,7 +1470,8 @@ class CardSetMultiCardCountFilter(DirectFilter):
                     MapPhysicalCardToPhysicalCardSet.q.physicalCardID),
                 groupBy=(PhysicalCard.q.abstractCardID,
                     MapPhysicalCardToPhysicalCardSet.q.physicalCardSetID),
-                having=IN(func.COUNT(PhysicalCard.q.abstractCardID),
+                having=IN(func.SUM(
+                    MapPhysicalCardToPhysicalCardSet.q.count),
                     [int(x) for x in aCounts]))
             self._oFilters.append(oCountFilter)
 
@@ -1567,6 +1746,9 @@ class SpecificCardFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.id == self.__iCardId
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_all() & frozenset([self.__iCardId])
+
 
 class SpecificCardIdFilter(DirectFilter):
     """This filter matches a single card by id."""
@@ -1584,6 +1766,9 @@ class SpecificCardIdFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return AbstractCard.q.id == self.__iCardId
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_all() & frozenset([self.__iCardId])
+
 
 class MultiSpecificCardIdFilter(DirectFilter):
     """This filter matches multiple cards by id."""
@@ -1601,6 +1786,9 @@ class MultiSpecificCardIdFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return IN(AbstractCard.q.id, self.__aCardIds)
 
+    def _get_card_ids(self, oIndex):
+        return oIndex.get_all() & frozenset(self.__aCardIds)
+
 
 class SpecificPhysCardIdFilter(DirectFilter):
     """This filter matches a single physical card by id.
@@ -1621,6 +1809,93 @@ class SpecificPhysCardIdFilter(DirectFilter):
         # SQLObject methods not detected by pylint
         return PhysicalCard.q.id == self.__iCardId
 
+
+class CardIdSetFilter(DirectFilter):
+    """This filter matches a set of AbstractCard ids.
+
+       It is used to replace the parts of a filter evaluated using the
+       CardIndex. oCol is the column holding the AbstractCard id, and
+       aAll the set of all card ids.
+       """
+    types = ('AbstractCard', 'PhysicalCard')
+
+    def __init__(self, aIds, aAll, oCol):
+        self.__aIds = aIds
+        self.__aAll = aAll
+        self.__oCol = oCol
+
+    # pylint: disable-msg=C0111
+    # don't need docstrings for _get_expression, get_values & _get_joins
+    def _get_expression(self):
+        if self.__aIds >= self.__aAll:
+            return TRUE
+        elif not self.__aIds:
+            return NOT(TRUE)
+        elif 2 * len(self.__aIds) > len(self.__aAll):
+            # Shorter to list the cards which don't match
+            return NOT(IN(self.__oCol, sorted(self.__aAll - self.__aIds)))
+        return IN(self.__oCol, sorted(self.__aIds))
+
+    def _get_card_ids(self, oIndex):
+        return self.__aIds
+
+
+# pylint: disable-msg=W0212
+# We delibrately access protected members in these functions
+def _replace_indexed(oFilter, oIndex):
+    """Replace the subfilters of oFilter which can be evaluated by the
+       card index with CardIdSetFilters.
+
+       Returns oFilter if nothing can be replaced."""
+    aIds = oFilter._get_card_ids(oIndex)
+    if aIds is not None:
+        # pylint: disable-msg=E1101
+        # SQLObject methods not detected by pylint
+        return CardIdSetFilter(aIds, oIndex.get_all(), AbstractCard.q.id)
+    if isinstance(oFilter, CachedFilter):
+        oSubFilter = _replace_indexed(oFilter._oSubFilter, oIndex)
+        if oSubFilter is not oFilter._oSubFilter:
+            return oSubFilter
+    elif isinstance(oFilter, (FilterAndBox, FilterOrBox)):
+        aSubFilters = [_replace_indexed(x, oIndex) for x in oFilter]
+        aIndexed = [x for x in aSubFilters if isinstance(x, CardIdSetFilter)]
+        if aIndexed:
+            if len(aIndexed) > 1:
+                # Combine these into a single set of ids
+                aSubFilters = [x for x in aSubFilters if
+                        not isinstance(x, CardIdSetFilter)]
+                aSubFilters.append(_replace_indexed(
+                    oFilter.__class__(aIndexed), oIndex))
+            return oFilter.__class__(aSubFilters)
+    return oFilter
+
+
+def _apply_card_index(oFilter, cCardClass, oIndex):
+    """Return the filter to use for cCardClass.select, with as much of
+       oFilter as possible evaluated using the card index.
+
+       Only the AbstractCard and PhysicalCard selections, and selections
+       which join the AbstractCard table, can use the index. Everything
+       else is left to the database."""
+    # pylint: disable-msg=E1101
+    # SQLObject methods not detected by pylint
+    aIds = oFilter._get_card_ids(oIndex)
+    if aIds is not None:
+        if cCardClass is AbstractCard:
+            return CardIdSetFilter(aIds, oIndex.get_all(), AbstractCard.q.id)
+        elif cCardClass is PhysicalCard:
+            return CardIdSetFilter(aIds, oIndex.get_all(),
+                    PhysicalCard.q.abstractCardID)
+    if cCardClass is not AbstractCard:
+        # The ids are only useful if one of the other filters joins the
+        # AbstractCard table (PhysicalCardFilter, PhysicalCardSetFilter).
+        sTable = AbstractCard.sqlmeta.table
+        if not [oJoin for oJoin in oFilter._get_joins() if
+                str(getattr(oJoin, 'table2', None)) == sTable]:
+            return oFilter
+    return _replace_indexed(oFilter, oIndex)
+# pylint: enable-msg=W0212
+
 # Card Set Filters
 # These filters are designed to select card sets from the database
 # rather than cards, hence they aren't intended to be joined
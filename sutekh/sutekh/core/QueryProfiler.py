@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Record the SQL queries issued by each high-level operation.
+
+   The profiler wraps the query methods of an SQLObject connection, so
+   every statement is timed, including those from attribute access and
+   select iterations. Functions decorated with profile_operation mark
+   the operations the statements are recorded against.
+
+   Statements which only differ in their literal values are grouped, so
+   code paths which issue one query per row (such as repeated single row
+   get() calls) stand out in the report."""
+
+import re
+import time
+from sqlobject import sqlhub
+
+# How often a statement must be repeated before it's reported as a likely
+# N+1 pattern
+REPEAT_LIMIT = 20
+# Name used for queries issued outside any profiled operation
+OTHER = '(other)'
+# Length at which statements are truncated in the report
+QUERY_LEN = 160
+
+_oLiteralRe = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_oListRe = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def normalise_query(sQuery):
+    """Replace the literal values in the statement with ?, so statements
+       that differ only in the values are the same."""
+    sQuery = _oLiteralRe.sub('?', ' '.join(sQuery.split()))
+    return _oListRe.sub('(?)', sQuery)
+
+
+def _truncate(sQuery):
+    """Shorten long statements for the report"""
+    sQuery = ' '.join(sQuery.split())
+    if len(sQuery) > QUERY_LEN:
+        return sQuery[:QUERY_LEN - 3] + '...'
+    return sQuery
+
+
+class OperationStats(object):
+    """The queries recorded for a single operation"""
+    # pylint: disable-msg=R0902
+    # Simple data holder, so many attributes
+
+    def __init__(self, sName):
+        self.sName = sName
+        self.iCalls = 0
+        self.iStatements = 0
+        self.iRows = 0
+        self.fTotal = 0.0
+        self.fSlowest = 0.0
+        self.sSlowest = None
+        # normalised statement -> number of times run
+        self.dPatterns = {}
+
+    def add_query(self, sQuery, fTime):
+        """Record a statement"""
+        self.iStatements += 1
+        self.fTotal += fTime
+        if self.sSlowest is None or fTime > self.fSlowest:
+            self.fSlowest = fTime
+            self.sSlowest = sQuery
+        sPattern = normalise_query(sQuery)
+        self.dPatterns[sPattern] = self.dPatterns.get(sPattern, 0) + 1
+
+    def get_repeated(self, iLimit=REPEAT_LIMIT):
+        """Return the statements run at least iLimit times, as a list of
+           (count, normalised statement) pairs, most frequent first."""
+        return sorted([(iCount, sPattern) for sPattern, iCount in
+            self.dPatterns.iteritems() if iCount >= iLimit],
+            key=lambda x: (-x[0], x[1]))
+
+
+class QueryProfiler(object):
+    """Wrap a connection and record its queries for each operation.
+
+       Operations can be nested. Statements are recorded against every
+       operation in progress, so the totals for an operation include the
+       operations it calls, and statements outside any operation are
+       recorded as OTHER."""
+
+    # Connection methods replaced while profiling
+    aWrapped = ('_executeRetry', '_queryAll', '_queryOne', 'iterSelect')
+
+    def __init__(self):
+        self._oConn = None
+        self._aStack = []
+        self._dStats = {}
+
+    def install(self, oConn):
+        """Start recording the queries run on oConn"""
+        # pylint: disable-msg=W0212
+        # We deliberately wrap the protected methods, since every query
+        # goes through them
+        self.uninstall()
+        self._oConn = oConn
+        fExecute = oConn._executeRetry
+        fQueryAll = oConn._queryAll
+        fQueryOne = oConn._queryOne
+        fIterSelect = oConn.iterSelect
+
+        def _execute_retry(oRawConn, oCursor, sQuery):
+            """Time the statement"""
+            fStart = time.time()
+            try:
+                return fExecute(oRawConn, oCursor, sQuery)
+            finally:
+                self._record_query(sQuery, time.time() - fStart)
+
+        def _query_all(oRawConn, sQuery):
+            """Count the rows returned"""
+            aResults = fQueryAll(oRawConn, sQuery)
+            self._record_rows(len(aResults))
+            return aResults
+
+        def _query_one(oRawConn, sQuery):
+            """Count the row returned"""
+            oResult = fQueryOne(oRawConn, sQuery)
+            if oResult is not None:
+                self._record_rows(1)
+            return oResult
+
+        def _iter_select(oSelect):
+            """Count the objects as they are returned"""
+            for oObj in fIterSelect(oSelect):
+                self._record_rows(1)
+                yield oObj
+
+        oConn._executeRetry = _execute_retry
+        oConn._queryAll = _query_all
+        oConn._queryOne = _query_one
+        oConn.iterSelect = _iter_select
+
+    def uninstall(self):
+        """Restore the connection's own methods"""
+        if self._oConn is None:
+            return
+        for sMethod in self.aWrapped:
+            if sMethod in self._oConn.__dict__:
+                delattr(self._oConn, sMethod)
+        self._oConn = None
+
+    def reset(self):
+        """Discard the recorded queries"""
+        self._dStats = {}
+        # Operations in progress are still counted
+        for sName in self._aStack:
+            self._get_stats(sName).iCalls += 1
+
+    def push(self, sName):
+        """Mark the start of an operation"""
+        self._aStack.append(sName)
+        self._get_stats(sName).iCalls += 1
+
+    def pop(self):
+        """Mark the end of the current operation"""
+        self._aStack.pop()
+
+    def _get_stats(self, sName):
+        """Get the stats for the operation, adding them if needed"""
+        if sName not in self._dStats:
+            self._dStats[sName] = OperationStats(sName)
+        return self._dStats[sName]
+
+    def _get_current(self):
+        """Get the stats for all the operations in progress"""
+        if not self._aStack:
+            return [self._get_stats(OTHER)]
+        return [self._get_stats(sName) for sName in set(self._aStack)]
+
+    def _record_query(self, sQuery, fTime):
+        """Add the statement to the current operations"""
+        for oStats in self._get_current():
+            oStats.add_query(sQuery, fTime)
+
+    def _record_rows(self, iRows):
+        """Add the rows returned to the current operations"""
+        for oStats in self._get_current():
+            oStats.iRows += iRows
+
+    def get_stats(self):
+        """Return the stats for all the operations, most expensive
+           first."""
+        return sorted(self._dStats.values(),
+                key=lambda x: (-x.fTotal, x.sName))
+
+    def get_report(self):
+        """Return the recorded stats as text"""
+        aStats = self.get_stats()
+        if not aStats:
+            return 'No queries recorded'
+        aLines = ['%-32s %6s %9s %9s %11s %12s' % ('Operation', 'Calls',
+            'Queries', 'Rows', 'Total (ms)', 'Slowest (ms)')]
+        for oStats in aStats:
+            aLines.append('%-32s %6d %9d %9d %11.1f %12.2f' % (
+                oStats.sName[:32], oStats.iCalls, oStats.iStatements,
+                oStats.iRows, 1000 * oStats.fTotal, 1000 * oStats.fSlowest))
+        for oStats in aStats:
+            if not oStats.iStatements:
+                continue
+            aLines.append('')
+            aLines.append('%s:' % oStats.sName)
+            aLines.append('  Slowest (%.2fms): %s' % (
+                1000 * oStats.fSlowest, _truncate(oStats.sSlowest)))
+            for iCount, sPattern in oStats.get_repeated():
+                aLines.append('  Repeated %d times (possible N+1): %s' % (
+                    iCount, _truncate(sPattern)))
+        return '\n'.join(aLines)
+
+
+# The profiler used by profile_operation, if any
+_oProfiler = None
+
+
+def start_profiling(oConn=None):
+    """Start profiling the queries run on oConn (the process connection
+       by default), discarding any earlier profile."""
+    # pylint: disable-msg=W0603
+    # We want a single profiler for the whole application
+    global _oProfiler
+    stop_profiling()
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    _oProfiler = QueryProfiler()
+    _oProfiler.install(oConn)
+    return _oProfiler
+
+
+def stop_profiling():
+    """Stop profiling and restore the connection"""
+    # pylint: disable-msg=W0603
+    # We want a single profiler for the whole application
+    global _oProfiler
+    if _oProfiler is not None:
+        _oProfiler.uninstall()
+    _oProfiler = None
+
+
+def get_profiler():
+    """Return the current profiler, or None if we're not profiling"""
+    return _oProfiler
+
+
+def profile_operation(sName):
+    """Decorator which records the queries issued by the function against
+       the operation sName.
+
+       This does nothing unless profiling has been started."""
+    def _decorator(fFunc):
+        """Wrap the function"""
+        def _wrapped(*aArgs, **kwargs):
+            """Push the operation on the profiler stack while calling
+               fFunc"""
+            oProfiler = _oProfiler
+            if oProfiler is None:
+                return fFunc(*aArgs, **kwargs)
+            oProfiler.push(sName)
+            try:
+                return fFunc(*aArgs, **kwargs)
+            finally:
+                oProfiler.pop()
+        _wrapped.__name__ = fFunc.__name__
+        _wrapped.__doc__ = fFunc.__doc__
+        return _wrapped
+    return _decorator
@@ -5,9 +5,177 @@
 
 """Cache various objects used by sutekh to speed up database queries."""
 
+import os
+import mmap
+import marshal
+import logging
+from sqlobject import sqlhub
+from sqlobject.col import SOIntCol
+from sqlobject.sqlbuilder import Table, Select, func
 from sutekh.core.SutekhObjects import AbstractCard, RarityPair, Rarity, Clan, \
         Discipline, DisciplinePair, CardType, Expansion, Ruling, Sect, Title, \
-        Creed, Virtue, PhysicalCard, Keyword, Artist, init_cache
+        Creed, Virtue, PhysicalCard, Keyword, Artist, TABLE_LIST, \
+        init_cache, get_cache_join_pairs
+from sutekh.core.DatabaseVersion import DatabaseVersion
+from sutekh.core.CardIndex import CardIndex, INDEXED_COLUMNS
+from sutekh.core.CachedRelatedJoin import SOCachedRelatedJoin
+from sutekh.SutekhUtility import prefs_dir, get_database_url
+
+# Bump this if the layout of the snapshot changes
+SNAPSHOT_VERSION = 2
+
+CACHED_TYPES = [Rarity, Expansion, RarityPair, Discipline, DisciplinePair,
+        Clan, CardType, AbstractCard, Ruling, Creed, Virtue, Sect, Title,
+        PhysicalCard, Keyword, Artist]
+
+
+def get_snapshot_file():
+    """Return the default location of the object cache snapshot."""
+    return os.path.join(prefs_dir("Sutekh"), "object_cache.snapshot")
+
+
+def _get_card_checksums(oConn):
+    """Return sums over the card columns and the cached join tables.
+
+       Changing cards in place, such as by errata, doesn't change the
+       number of rows, so these catch the changes without reading all
+       the card data. The text columns are summed by length."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    oTable = Table(AbstractCard.sqlmeta.table)
+    aSums = [func.SUM(oTable.id)]
+    for oCol in AbstractCard.sqlmeta.columnList:
+        oDbCol = getattr(oTable, oCol.dbName)
+        if isinstance(oCol, SOIntCol):
+            aSums.append(func.SUM(oDbCol))
+        else:
+            aSums.append(func.SUM(func.LENGTH(oDbCol)))
+    aChecks = [oConn.queryOne(oConn.sqlrepr(Select(aSums)))]
+    for oJoin in AbstractCard.sqlmeta.joins:
+        if type(oJoin) is SOCachedRelatedJoin:
+            oJoinTable = Table(oJoin.intermediateTable)
+            oCardCol = getattr(oJoinTable, oJoin.joinColumn)
+            oOtherCol = getattr(oJoinTable, oJoin.otherColumn)
+            aChecks.append(oConn.queryOne(oConn.sqlrepr(Select([
+                func.SUM(oOtherCol), func.SUM(oCardCol * oOtherCol)]))))
+    # The database may return longs or decimals, which marshal can't
+    # always handle
+    return tuple([tuple([int(x or 0) for x in tRow]) for tRow in aChecks])
+
+
+def _get_snapshot_key(oConn):
+    """Return the key identifying the database state a snapshot is valid
+       for.
+
+       This covers the table versions, the number of rows in each of
+       the cached tables and checksums of the card data, so a snapshot is
+       invalidated by upgrades and stale data is detected. The database
+       url is included without any password, since the key is written
+       to disk."""
+    oVer = DatabaseVersion(oConn)
+    aVersions = tuple([(cTable.sqlmeta.table,
+        oVer.get_table_version(cTable, oConn)) for cTable in TABLE_LIST])
+    aCounts = tuple([(cType.sqlmeta.table,
+        cType.select(connection=oConn).count()) for cType in CACHED_TYPES])
+    return (SNAPSHOT_VERSION, get_database_url(oConn), aVersions, aCounts,
+            _get_card_checksums(oConn))
+
+
+def _get_columns(cType):
+    """Return the database names of the columns of cType, in the order
+       SQLObject expects them."""
+    return tuple([oCol.dbName for oCol in cType.sqlmeta.columnList])
+
+
+def _read_tables(oConn):
+    """Read the raw rows for all the cached tables."""
+    dTables = {}
+    for cType in CACHED_TYPES:
+        oTable = Table(cType.sqlmeta.table)
+        aColumns = _get_columns(cType)
+        aSelect = [getattr(oTable, cType.sqlmeta.idName)] + \
+                [getattr(oTable, sCol) for sCol in aColumns]
+        dTables[cType.sqlmeta.table] = (aColumns,
+                oConn.queryAll(oConn.sqlrepr(Select(aSelect))))
+    return dTables
+
+
+def _get_index_rows(tTable):
+    """Extract the rows needed by the CardIndex from the abstract card
+       table data."""
+    aColumns, aRows = tTable
+    aPos = [aColumns.index(sDbName) + 1 for _sAttr, sDbName in
+            INDEXED_COLUMNS]
+    return [(tRow[0], [tRow[iPos] for iPos in aPos]) for tRow in aRows]
+
+
+def _load_snapshot(sSnapshotFile, oConn):
+    """Load the snapshot data, returning None if the snapshot is missing
+       or doesn't match the database."""
+    if not os.path.exists(sSnapshotFile):
+        return None
+    try:
+        fIn = open(sSnapshotFile, 'rb')
+        try:
+            oMap = mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                tKey, dTables, dJoinPairs = marshal.loads(oMap)
+            finally:
+                oMap.close()
+        finally:
+            fIn.close()
+    except (IOError, OSError, ValueError, EOFError, TypeError), oErr:
+        logging.warn('Unable to read object cache snapshot %s: %s',
+                sSnapshotFile, oErr)
+        return None
+    if tKey != _get_snapshot_key(oConn):
+        return None
+    for cType in CACHED_TYPES:
+        sTable = cType.sqlmeta.table
+        if sTable not in dTables or dTables[sTable][0] != _get_columns(cType):
+            return None
+    return dTables, dJoinPairs
+
+
+def write_cache_snapshot(sSnapshotFile, oConn=None, dTables=None,
+        dJoinPairs=None):
+    """Write a snapshot of the cached tables to sSnapshotFile.
+
+       Returns True if the snapshot was written."""
+    if oConn is None:
+        oConn = sqlhub.processConnection
+    if dTables is None:
+        dTables = _read_tables(oConn)
+    if dJoinPairs is None:
+        dJoinPairs = get_cache_join_pairs()
+    sTempFile = sSnapshotFile + '.tmp'
+    try:
+        sData = marshal.dumps((_get_snapshot_key(oConn), dTables,
+            dJoinPairs))
+        fOut = open(sTempFile, 'wb')
+        try:
+            fOut.write(sData)
+        finally:
+            fOut.close()
+        if os.path.exists(sSnapshotFile):
+            # Needed for windows, which won't rename over existing files
+            os.remove(sSnapshotFile)
+        os.rename(sTempFile, sSnapshotFile)
+    except (IOError, OSError, ValueError), oErr:
+        logging.warn('Unable to write object cache snapshot %s: %s',
+                sSnapshotFile, oErr)
+        return False
+    return True
+
+
+def invalidate_cache_snapshot(sSnapshotFile):
+    """Remove the snapshot, so it will be recreated on next use."""
+    if os.path.exists(sSnapshotFile):
+        try:
+            os.remove(sSnapshotFile)
+        except OSError, oErr:
+            logging.warn('Unable to remove object cache snapshot %s: %s',
+                    sSnapshotFile, oErr)
 
 
 class SutekhObjectCache(object):
@@ -20,16 +188,45 @@ class SutekhObjectCache(object):
        Including Ruling costs about an extra 1MB for no real speed up, but
        we threw it in anyway (on the assumption it may be useful sometime
        in the future).
+
+       If sSnapshotFile is given, the cache is filled from the snapshot
+       when it matches the database, avoiding the queries at startup.
+       Otherwise the cache is filled from the database and the snapshot
+       is rewritten. bRefreshSnapshot forces the snapshot to be rewritten,
+       and should be used after the card list has been changed.
+
+       The CardIndex used to evaluate filters is built from the same data.
        """
 
-    def __init__(self):
-        aTypesToCache = [Rarity, Expansion, RarityPair, Discipline,
-                DisciplinePair, Clan, CardType, AbstractCard, Ruling,
-                Creed, Virtue, Sect, Title, PhysicalCard, Keyword,
-                Artist]
+    def __init__(self, sSnapshotFile=None, bRefreshSnapshot=False):
+        oConn = sqlhub.processConnection
+        tSnapshot = None
+        if sSnapshotFile and not bRefreshSnapshot:
+            tSnapshot = _load_snapshot(sSnapshotFile, oConn)
+        if tSnapshot:
+            dTables, dJoinPairs = tSnapshot
+        else:
+            dTables = _read_tables(oConn)
+            dJoinPairs = get_cache_join_pairs()
 
         self._dCache = {}
-        for cType in aTypesToCache:
-            self._dCache[cType] = list(cType.select())
+        for cType in CACHED_TYPES:
+            _aColumns, aRows = dTables[cType.sqlmeta.table]
+            # This creates the objects from the rows without further
+            # queries, as select does
+            self._dCache[cType] = [cType.get(tRow[0],
+                selectResults=tRow[1:]) for tRow in aRows]
+
+        init_cache(dJoinPairs)
+
+        self._oCardIndex = CardIndex(
+                _get_index_rows(dTables[AbstractCard.sqlmeta.table]),
+                dJoinPairs, oConn)
+
+        # There's no point in keeping snapshots of temporary databases
+        if sSnapshotFile and not tSnapshot and ':memory:' not in oConn.uri():
+            write_cache_snapshot(sSnapshotFile, oConn, dTables, dJoinPairs)
 
-        init_cache()
+    def get_card_index(self):
+        """Return the CardIndex for the cached card list"""
+        return self._oCardIndex
@@ -12,6 +12,7 @@
 
 from sutekh.core.CachedRelatedJoin import CachedRelatedJoin, \
         SOCachedRelatedJoin
+from sutekh.core.CountedRelatedJoin import CountedRelatedJoin
 from sutekh.core.Abbreviations import CardTypes, Clans, Creeds, Disciplines, \
         Expansions, Rarities, Sects, Titles, Virtues
 # pylint: disable-msg=E0611
@@ -176,8 +177,8 @@ class PhysicalCard(SQLObject):
     abstractCardIndex = DatabaseIndex(abstractCard)
     # Explicitly allow None as expansion
     expansion = ForeignKey('Expansion', notNull=False)
-    sets = RelatedJoin('PhysicalCardSet', intermediateTable='physical_map',
-            createRelatedTable=False)
+    sets = CountedRelatedJoin('PhysicalCardSet',
+            intermediateTable='physical_map', createRelatedTable=False)
 
 
 class PhysicalCardSet(SQLObject):
@@ -190,8 +191,8 @@ class PhysicalCardSet(SQLObject):
     annotations = UnicodeCol(default='')
     inuse = BoolCol(default=False)
     parent = ForeignKey('PhysicalCardSet', default=None)
-    cards = RelatedJoin('PhysicalCard', intermediateTable='physical_map',
-            createRelatedTable=False)
+    cards = CountedRelatedJoin('PhysicalCard',
+            intermediateTable='physical_map', createRelatedTable=False)
 
 
 class RarityPair(SQLObject):
@@ -341,10 +342,13 @@ class MapPhysicalCardToPhysicalCardSet(SQLObject):
     class sqlmeta:
         table = 'physical_map'
 
-    tableversion = 1
+    tableversion = 2
 
     physicalCard = ForeignKey('PhysicalCard', notNull=True)
     physicalCardSet = ForeignKey('PhysicalCardSet', notNull=True)
+    # Each row represents count copies of the card in the card set.
+    # count is a reserved word in SQL, hence the dbName
+    count = IntCol(default=1, notNull=True, dbName='cnt')
 
     physicalCardIndex = DatabaseIndex(physicalCard, unique=False)
     physicalCardSetIndex = DatabaseIndex(physicalCardSet, unique=False)
@@ -1000,15 +1004,31 @@ def flush_cache(bMakeCache=True):
         make_adaptor_caches()
 
 
-def init_cache():
-    """Initiliase the cached join tables."""
+def init_cache(dJoinPairs=None):
+    """Initiliase the cached join tables.
+
+       dJoinPairs, if given, maps intermediate table names to the list of
+       id pairs to use instead of querying the database."""
     for oJoin in AbstractCard.sqlmeta.joins:
         if type(oJoin) is SOCachedRelatedJoin:
-            oJoin.init_cache()
+            if dJoinPairs is not None:
+                oJoin.init_cache(dJoinPairs[oJoin.intermediateTable])
+            else:
+                oJoin.init_cache()
 
     make_adaptor_caches()
 
 
+def get_cache_join_pairs():
+    """Return the id pairs for all the cached join tables, keyed by
+       intermediate table name."""
+    dJoinPairs = {}
+    for oJoin in AbstractCard.sqlmeta.joins:
+        if type(oJoin) is SOCachedRelatedJoin:
+            dJoinPairs[oJoin.intermediateTable] = oJoin.get_join_pairs()
+    return dJoinPairs
+
+
 # helper conversion functions
 # We define them here to avoid circular imports, since pretty much everything
 # else requires SutekhObjects
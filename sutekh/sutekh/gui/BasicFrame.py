@@ -90,10 +90,10 @@ class BasicFrame(gtk.Frame):
 
     def init_plugins(self):
         """Loop through the plugins, and enable those appropriate for us."""
-        for cPlugin in \
-                self._oMainWindow.plugin_manager.get_card_list_plugins():
-            self._aPlugins.append(cPlugin(self._oController.view,
-                self._oController.view.get_model(), self._cModelType))
+        self._aPlugins.extend(
+                self._oMainWindow.plugin_manager.create_plugins(
+                    self._oController.view,
+                    self._oController.view.get_model(), self._cModelType))
 
     def set_title(self, sTitle):
         """Set the title of the pane to sTitle"""
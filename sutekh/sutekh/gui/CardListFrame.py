@@ -86,7 +86,7 @@ class CardListFrame(BasicFrame):
         if oToolbar is not None:
             oMbox.pack_start(oToolbar, False, False)
 
-        self._oController.view.load()
+        self._oController.view.initial_load()
 
         self.set_drag_handler(self._oMenu)
         self.set_drop_handler(self._oMenu)
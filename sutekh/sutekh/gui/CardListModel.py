@@ -16,6 +16,7 @@ from sutekh.core.SutekhObjects import PhysicalCardToAbstractCardAdapter, \
         PhysicalCard, PhysicalCardAdapter, ExpansionNameAdapter, \
         canonical_to_csv
 from sutekh.core.FilterParser import FilterParser
+from sutekh.core.QueryProfiler import profile_operation
 from sutekh.gui.ConfigFile import WW_CARDLIST
 from sutekh.gui.MessageBus import MessageBus, CONFIG_MSG
 
@@ -68,6 +69,7 @@ class CardListModel(gtk.TreeStore):
         self.bUseIcons = True
         self._bHideIllegal = True
         self._oController = None
+        self._oLoadSteps = None
         self._oFilterParser = FilterParser()
         MessageBus.subscribe(CONFIG_MSG, 'replace_filter', self.replace_filter)
         MessageBus.subscribe(CONFIG_MSG, 'profile_option_changed',
@@ -108,6 +110,7 @@ class CardListModel(gtk.TreeStore):
 
     def cleanup(self):
         """Remove the config file listener if needed"""
+        self.cancel_load()
         self._oController = None
         MessageBus.unsubscribe(CONFIG_MSG, 'replace_filter',
                 self.replace_filter)
@@ -218,11 +221,38 @@ class CardListModel(gtk.TreeStore):
         if iSortColumn is not None:
             self.set_sort_column_id(iSortColumn, iSortOrder)
 
+    @profile_operation('Load card list')
     def load(self):
-        # pylint: disable-msg=R0914
-        # we use many local variables for clarity
         """Clear and reload the underlying store. For use after initialisation
            or when the filter or grouping changes."""
+        for _oStep in self.load_steps():
+            pass
+
+    def load_steps(self):
+        """Return an iterator which reloads the store, one card at a time.
+
+           This allows the load to be spread over several idle callbacks.
+           Starting a new load abandons any unfinished one."""
+        self.cancel_load()
+        self._oLoadSteps = self._fill_model()
+        return self._oLoadSteps
+
+    def cancel_load(self):
+        """Abandon any unfinished load"""
+        if self._oLoadSteps is not None:
+            # Closing the generator restores the sort settings
+            self._oLoadSteps.close()
+        self._oLoadSteps = None
+
+    def is_loading(self):
+        """Return True if an incremental load has yet to finish"""
+        return self._oLoadSteps is not None
+
+    def _fill_model(self):
+        # pylint: disable-msg=R0914
+        # we use many local variables for clarity
+        """Generator which does the work of load, yielding after each
+           card is added."""
         self.clear()
 
         oCardIter = self.get_card_iterator(self.get_current_filter())
@@ -236,63 +266,66 @@ class CardListModel(gtk.TreeStore):
         if iSortColumn is not None:
             self.set_sort_column_id(-2, 0)
 
-        # Iterate over groups
-        bEmpty = True
-        bPostfix = self._oConfig.get_postfix_the_display()
-        for sGroup, oGroupIter in oGroupedIter:
-            # Check for null group
-            sGroup = self._fix_group_name(sGroup)
-
-            # Create Group Section
-            oSectionIter = self.append(None)
-
-            # Fill in Cards
-            for oItem in oGroupIter:
-                oCard = fGetCard(oItem)
-                oChildIter = self.prepend(oSectionIter)
-                # We need to lookup the card directly, since aExpansionInfo
-                # may not have the info we need
-                # Names will be set by _set_display_name
-                sName = oCard.name
-                if bPostfix:
-                    sName = canonical_to_csv(sName)
-                self.set(oChildIter,
-                    0, sName,
-                    8, oCard,
-                    9, PhysicalCardAdapter((oCard, None)),
-                )
-                aExpansionInfo = self.get_expansion_info(oCard,
-                        fGetExpanInfo(oItem))
-                for oPhysCard, sExpansion in aExpansionInfo:
-                    oExpansionIter = self.append(oChildIter)
-                    self.set(oExpansionIter,
-                            0, sExpansion,
-                            9, oPhysCard,
-                            )
-                bEmpty = False
-
-            # Update Group Section
-            aTexts, aIcons = self.lookup_icons(sGroup)
-            if aTexts:
-                self.set(oSectionIter, 0, sGroup,
-                    5, aTexts, 6, aIcons,
-                )
-            else:
-                self.set(oSectionIter, 0, sGroup)
-
-        if bEmpty:
-            # Showing nothing
-            self.oEmptyIter = self.append(None)
-            sText = self._get_empty_text()
-            self.set(self.oEmptyIter, 0, sText)
-
-        # Notify Listeners
-        MessageBus.publish(self, 'load', aCards)
-
-        # We only re-enable sorting after filling listeners, so sorting on
-        # listeners which cache information works properly
-        if iSortColumn is not None:
-            self.set_sort_column_id(iSortColumn, iSortOrder)
+        try:
+            # Iterate over groups
+            bEmpty = True
+            bPostfix = self._oConfig.get_postfix_the_display()
+            for sGroup, oGroupIter in oGroupedIter:
+                # Check for null group
+                sGroup = self._fix_group_name(sGroup)
+
+                # Create Group Section
+                oSectionIter = self.append(None)
+
+                # Fill in Cards
+                for oItem in oGroupIter:
+                    oCard = fGetCard(oItem)
+                    oChildIter = self.prepend(oSectionIter)
+                    # We need to lookup the card directly, since
+                    # aExpansionInfo may not have the info we need
+                    # Names will be set by _set_display_name
+                    sName = oCard.name
+                    if bPostfix:
+                        sName = canonical_to_csv(sName)
+                    self.set(oChildIter,
+                        0, sName,
+                        8, oCard,
+                        9, PhysicalCardAdapter((oCard, None)),
+                    )
+                    aExpansionInfo = self.get_expansion_info(oCard,
+                            fGetExpanInfo(oItem))
+                    for oPhysCard, sExpansion in aExpansionInfo:
+                        oExpansionIter = self.append(oChildIter)
+                        self.set(oExpansionIter,
+                                0, sExpansion,
+                                9, oPhysCard,
+                                )
+                    bEmpty = False
+                    yield oCard
+
+                # Update Group Section
+                aTexts, aIcons = self.lookup_icons(sGroup)
+                if aTexts:
+                    self.set(oSectionIter, 0, sGroup,
+                        5, aTexts, 6, aIcons,
+                    )
+                else:
+                    self.set(oSectionIter, 0, sGroup)
+
+            if bEmpty:
+                # Showing nothing
+                self.oEmptyIter = self.append(None)
+                sText = self._get_empty_text()
+                self.set(self.oEmptyIter, 0, sText)
+
+            self._oLoadSteps = None
+            # Notify Listeners
+            MessageBus.publish(self, 'load', aCards)
+        finally:
+            # We only re-enable sorting after filling listeners, so sorting
+            # on listeners which cache information works properly
+            if iSortColumn is not None:
+                self.set_sort_column_id(iSortColumn, iSortOrder)
 
     def get_card_iterator(self, oFilter):
         """Return an interator over the card model.
@@ -305,6 +338,14 @@ class CardListModel(gtk.TreeStore):
 
         return oFilter.select(self.cardclass).distinct()
 
+    def get_card_copies(self, oFilter):
+        """Return a list of the cards matching oFilter, with an entry for
+           each copy of the card.
+
+           Unlike get_card_iterator, this is suitable for counting the
+           cards."""
+        return list(self.get_card_iterator(oFilter))
+
     def grouped_card_iter(self, oCardIter):
         """Return iterator over the card list grouping.
 
@@ -7,9 +7,14 @@
 """gtk.TreeView classes for displaying the card list."""
 
 import gtk
+import gobject
 from sutekh.gui.FilteredView import FilteredView
 from sutekh.gui.FilterDialog import FilterDialog
 
+# Number of cards added to the model in each idle callback when loading
+# progressively
+LOAD_CHUNK = 100
+
 
 class CardListView(FilteredView):
     """Base class for all the card list views in Sutekh."""
@@ -66,6 +71,8 @@ class CardListView(FilteredView):
         self.connect('drag_data_delete', self.drag_delete)
         self.connect('drag_data_received', self.card_drop)
         self.bSelectTop = 0
+        self._iLoadIdleID = None
+        self._iLoadMapID = None
 
     def can_select(self, oPath):
         """disable selecting top level rows"""
@@ -300,3 +307,68 @@ class CardListView(FilteredView):
         """Expand the tree and select all the nodes"""
         self.expand_all()
         self._oSelection.select_all()
+
+    # Loading the model
+
+    def use_progressive_load(self):
+        """Check if the main window wants panes loaded progressively"""
+        return getattr(self._oMainWin, 'progressive_load', False)
+
+    def load(self):
+        """Called when the model needs to be reloaded."""
+        self.cancel_progressive_load()
+        super(CardListView, self).load()
+        self.post_load()
+
+    def initial_load(self):
+        """Load the model when the pane is created.
+
+           When loading progressively, this waits until the view is shown,
+           so panes that aren't visible don't hold up the others."""
+        if not self.use_progressive_load():
+            self.load()
+        elif self.flags() & gtk.MAPPED:
+            self.load_progressively()
+        elif self._iLoadMapID is None:
+            self._iLoadMapID = self.connect('map', self._load_when_mapped)
+
+    def _load_when_mapped(self, _oWidget):
+        """Start the progressive load the first time we're shown"""
+        self.disconnect(self._iLoadMapID)
+        self._iLoadMapID = None
+        self.load_progressively()
+        # Allow other map signals to run as well
+        return True
+
+    def load_progressively(self):
+        """Fill the model from idle callbacks.
+
+           The query is run at the start, and the cards are then added
+           in chunks of LOAD_CHUNK, so the rest of the interface stays
+           responsive while large card lists load. The model is only
+           sorted once all the cards have been added."""
+        self.cancel_progressive_load()
+        self._iLoadIdleID = gobject.idle_add(self._load_chunk,
+                self._oModel.load_steps())
+
+    def _load_chunk(self, oSteps):
+        """Add the next chunk of cards to the model"""
+        for _iCard in xrange(LOAD_CHUNK):
+            try:
+                oSteps.next()
+            except StopIteration:
+                self._iLoadIdleID = None
+                self.post_load()
+                return False
+        return True
+
+    def cancel_progressive_load(self):
+        """Stop any unfinished progressive load"""
+        if self._iLoadIdleID is not None:
+            gobject.source_remove(self._iLoadIdleID)
+            self._iLoadIdleID = None
+            self._oModel.cancel_load()
+
+    def post_load(self):
+        """Hook for updating the display after the model is loaded"""
+        pass
@@ -11,11 +11,14 @@ from sutekh.gui.GuiCardSetFunctions import check_ok_to_delete, \
         update_card_set
 from sutekh.gui.CardSetView import CardSetView
 from sutekh.gui.MessageBus import MessageBus, CARD_TEXT_MSG
-from sutekh.core.DBSignals import send_changed_signal
+from sutekh.core.DBSignals import send_changed_signal, \
+        send_bulk_changed_signal
 from sutekh.core.SutekhObjects import IPhysicalCardSet, PhysicalCardSet, \
         IAbstractCard, PhysicalCard, MapPhysicalCardToPhysicalCardSet, \
         IExpansion, IPhysicalCard
-from sutekh.core.CardSetUtilities import delete_physical_card_set
+from sutekh.core.CardSetUtilities import delete_physical_card_set, \
+        remove_map_card
+from sutekh.core.BulkCardSetWriter import CardCountWriter
 
 
 class CardSetController(object):
@@ -93,8 +96,8 @@ class CardSetController(object):
                     physicalCardID=oCard.id,
                     physicalCardSetID=oThePCS.id))
             if len(aCandCards) > 0:
-                # Found candidates, so remove last one
-                MapPhysicalCardToPhysicalCardSet.delete(aCandCards[-1].id)
+                # Found candidates, so remove a copy from the last one
+                remove_map_card(aCandCards[-1])
                 oThePCS.syncUpdate()
                 # signal to update the model
                 send_changed_signal(oThePCS, oCard, -1)
@@ -121,6 +124,35 @@ class CardSetController(object):
         send_changed_signal(oThePCS, oPhysCard, 1)
         return True
 
+    def change_card_counts(self, dChanges):
+        """Change the number of copies of several cards at once.
+
+           dChanges is a dictionary of card set name (None for this card
+           set) to a dictionary of physical card to the number of copies
+           to add, or remove if negative. The changes are made in a single
+           transaction, and a single bulk changed signal is sent for each
+           card set."""
+        # pylint: disable-msg=E1101, E1103
+        # SQLObject + PyProtocols methods confuse pylint
+        dCardSets = {}
+        for sCardSetName, dCards in dChanges.iteritems():
+            try:
+                if sCardSetName:
+                    oThePCS = IPhysicalCardSet(sCardSetName)
+                else:
+                    oThePCS = self.__oPhysCardSet
+            except SQLObjectNotFound:
+                # Skip card sets that have gone away
+                continue
+            dSetChanges = dCardSets.setdefault(oThePCS, {})
+            for oPhysCard, iChg in dCards.iteritems():
+                dSetChanges[oPhysCard] = dSetChanges.get(oPhysCard, 0) + iChg
+        dDone = CardCountWriter().write(dCardSets)
+        for oThePCS, dCards in dDone.iteritems():
+            oThePCS.syncUpdate()
+            # Signal to update the models
+            send_bulk_changed_signal(oThePCS, dCards)
+
     def edit_properties(self, _oMenuWidget):
         """Run the dialog to update the card set properties"""
         update_card_set(self.__oPhysCardSet, self._oMainWindow)
@@ -190,33 +222,30 @@ class CardSetController(object):
             return False
         if aSources[0] in ("Phys", PhysicalCardSet.sqlmeta.table):
             # Add the cards, Count Matters
+            dCards = {}
             for iCount, sCardName, sExpansion in aCards:
-                # Use None to indicate this card set
                 oPhysCard = self._get_card(sCardName, sExpansion)
                 if not oPhysCard:
                     # error, so skip this. (Warn user?)
                     continue
                 if aSources[0] == "Phys":
                     # Only ever add 1 when dragging from physical card list
-                    self.add_card(oPhysCard, None)
-                else:
-                    for _iLoop in range(iCount):
-                        self.add_card(oPhysCard, None)
+                    iCount = 1
+                dCards[oPhysCard] = dCards.get(oPhysCard, 0) + iCount
+            # Use None to indicate this card set
+            self.change_card_counts({None: dCards})
             return True
         else:
             return False
 
     def change_selected_card_count(self, dSelectedData):
         """Helper function to set the selected cards to the specified number"""
+        dChanges = {}
         for oPhysCard in dSelectedData:
             for sCardSetName, (iCardCount, iNewCnt) in \
                     dSelectedData[oPhysCard].iteritems():
-                if iNewCnt < iCardCount:
-                    # remove cards
-                    for _iAttempt in range(iCardCount - iNewCnt):
-                        # None as card set indicates this card set
-                        self.dec_card(oPhysCard, sCardSetName)
-                elif iNewCnt > iCardCount:
-                    # add cards
-                    for _iAttempt in range(iNewCnt - iCardCount):
-                        self.inc_card(oPhysCard, sCardSetName)
+                if iNewCnt != iCardCount:
+                    # None as card set indicates this card set
+                    dChanges.setdefault(sCardSetName, {})[oPhysCard] = \
+                            iNewCnt - iCardCount
+        self.change_card_counts(dChanges)
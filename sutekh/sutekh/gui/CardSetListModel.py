@@ -12,7 +12,7 @@
 from sutekh.core.Filters import FilterAndBox, NullFilter, PhysicalCardFilter, \
         PhysicalCardSetFilter, SpecificCardIdFilter, \
         MultiPhysicalCardSetMapFilter, SpecificPhysCardIdFilter, \
-        MultiSpecificCardIdFilter, CachedFilter
+        MultiSpecificCardIdFilter, CachedFilter, get_filter_card_ids
 # We use the adapters directly, rather than going through PyProtocols
 # because we know the types explicitly, and thus don't need the overhead
 # of PyPrortocols dispatch logic.
@@ -22,9 +22,12 @@ from sutekh.core.SutekhObjects import PhysicalCard, IAbstractCard, \
         canonical_to_csv, PhysicalCardToAbstractCardAdapter, \
         PhysicalCardMappingToPhysicalCardAdapter
 from sutekh.gui.CardListModel import CardListModel, USE_ICONS, HIDE_ILLEGAL
+from sutekh.core.CardSetUtilities import count_map_cards, expand_map_cards
+from sutekh.core.CardSetCountStore import get_card_set_counts
+from sutekh.core.QueryProfiler import profile_operation
 from sutekh.core.DBSignals import listen_changed, disconnect_changed, \
         listen_row_destroy, listen_row_update, disconnect_row_destroy, \
-        disconnect_row_update
+        disconnect_row_update, listen_bulk_changed, disconnect_bulk_changed
 from sutekh.gui.ConfigFile import CARDSET, FRAME
 from sutekh.gui.MessageBus import MessageBus
 import gtk
@@ -77,6 +80,17 @@ BOTH_EXP_CARD_SETS = set([CARD_SETS_AND_EXP, EXP_AND_CARD_SETS])
 PARENT_OR_MINUS = set([PARENT_COUNT, MINUS_THIS_SET])
 
 
+def _update_card_list(aCards, oPhysCard, iChg):
+    """Add or remove iChg copies of oPhysCard from a cached list of
+       cards"""
+    if iChg > 0:
+        aCards.extend([oPhysCard] * iChg)
+    else:
+        for _iCopy in range(-iChg):
+            if oPhysCard in aCards:
+                aCards.remove(oPhysCard)
+
+
 class CardSetModelRow(object):
     """Object which holds the data needed for a card set row."""
     # pylint: disable-msg=R0902
@@ -93,6 +107,15 @@ class CardSetModelRow(object):
         self.oAbsCard = oAbsCard
         self.oPhysCard = PhysicalCardAdapter((self.oAbsCard, None))
 
+    def has_children(self):
+        """Check if the row will have any expansion or child card set
+           entries below it."""
+        if self.iExtraLevelsMode in EXPANSIONS_2ND_LEVEL:
+            return len(self.dExpansions) > 0
+        elif self.iExtraLevelsMode in CARD_SETS_2ND_LEVEL:
+            return len(self.dChildCardSets) > 0
+        return False
+
     def get_inc_dec_flags(self, iCnt):
         """Determine the status of the button flags."""
         if self.bEditable:
@@ -164,11 +187,16 @@ class CardSetCardListModel(CardListModel):
         self._dCache = {}
         self.bChildren = False
         self.bEditable = False
+        # If set, the expansion and child card set rows are only added
+        # when the card's row is expanded (see build_children)
+        self.bLazyChildren = False
         self._bPhysicalFilter = False
         self._dAbs2Iter = {}
         self._dAbs2Phys = {}
         self._dAbsSecondLevel2Iter = {}
         self._dAbs2nd3rdLevel2Iter = {}
+        # Rows for the cards whose children haven't been added yet
+        self._dAbs2Row = {}
         self._dGroupName2Iter = {}
         self.oEditColour = None
         self._oCountColour = BLACK
@@ -179,6 +207,7 @@ class CardSetCardListModel(CardListModel):
 
         # Add database listeners
         listen_changed(self.card_changed, PhysicalCardSet)
+        listen_bulk_changed(self.cards_changed, PhysicalCardSet)
         listen_row_update(self.card_set_changed, PhysicalCardSet)
         listen_row_destroy(self.card_set_deleted, PhysicalCardSet)
         # We don't listen for card set creation, since newly created card
@@ -210,6 +239,7 @@ class CardSetCardListModel(CardListModel):
         """Remove the signal handler - avoids issues when card sets are
            deleted, but the objects are still around."""
         disconnect_changed(self.card_changed, PhysicalCardSet)
+        disconnect_bulk_changed(self.cards_changed, PhysicalCardSet)
         disconnect_row_update(self.card_set_changed, PhysicalCardSet)
         disconnect_row_destroy(self.card_set_deleted, PhysicalCardSet)
         MessageBus.clear(self)
@@ -243,19 +273,27 @@ class CardSetCardListModel(CardListModel):
             self.oEmptyIter = self.append(None, (sText, 0, 0, False, False, [],
                 [], BLACK, None, None))
 
+    @profile_operation('Load card set')
     def load(self):
-        # pylint: disable-msg=R0914
-        # we use many local variables for clarity
         """Clear and reload the underlying store. For use after initialisation,
            when the filter or grouping changes or when card set relationships
            change.
            """
+        for _oStep in self.load_steps():
+            pass
+
+    def _fill_model(self):
+        # pylint: disable-msg=R0914
+        # we use many local variables for clarity
+        """Generator which does the work of load, yielding after each
+           card is added."""
         self.set_count_colour()
         self.clear()
         self._dAbs2Phys = {}
         self._dAbs2Iter = {}
         self._dAbsSecondLevel2Iter = {}
         self._dAbs2nd3rdLevel2Iter = {}
+        self._dAbs2Row = {}
         self._dGroupName2Iter = {}
         # Clear cache (we can't do this in grouped_card_iter, since that
         # is also called by add_new_card)
@@ -280,69 +318,74 @@ class CardSetCardListModel(CardListModel):
             # gtk+ docs says this disables sorting
             self.set_sort_column_id(-2, 0)
 
-        # Iterate over groups
+        try:
+            # Iterate over groups
 
-        bPostfix = self._oConfig.get_postfix_the_display()
+            bPostfix = self._oConfig.get_postfix_the_display()
 
-        for sGroup, oGroupIter in oGroupedIter:
-            # Check for null group
-            sGroup = self._fix_group_name(sGroup)
+            for sGroup, oGroupIter in oGroupedIter:
+                # Check for null group
+                sGroup = self._fix_group_name(sGroup)
 
-            # Create Group Section
-            oSectionIter = self.prepend(None)
-            self._dGroupName2Iter[sGroup] = oSectionIter
+                # Create Group Section
+                oSectionIter = self.prepend(None)
+                self._dGroupName2Iter[sGroup] = oSectionIter
 
-            # Fill in Cards
-            iGrpCnt = 0
-            iParGrpCnt = 0
-            # We prepend rather than append -
-            # this is a lot faster for long lists.
-            for _oId, oRow in oGroupIter:
-                oCard = oRow.oAbsCard
-                iCnt = oRow.iCount
-                iParCnt = oRow.iParentCount
-                iGrpCnt += iCnt
-                iParGrpCnt += iParCnt
-                bIncCard, bDecCard = self.check_inc_dec(iCnt)
-                oChildIter = self.prepend(oSectionIter)
-                # Direct lookup, for same reason as in CardListModel
-                # We skip name here, as that gets reset in _set_display_name
-                sName = oCard.name
-                if bPostfix:
-                    sName = canonical_to_csv(sName)
-                self.set(oChildIter,
-                    0, sName,
-                    1, iCnt, 2, iParCnt,
-                    3, bIncCard, 4, bDecCard,
-                    8, oCard,
-                    9, oRow.oPhysCard,
-                    )
-                self.set_par_count_colour(oChildIter, iParCnt, iCnt)
-                self._dAbs2Iter.setdefault(oCard.id, []).append(oChildIter)
-                self._add_children(oChildIter, oRow)
-            # Update Group Section
-            aTexts, aIcons = self.lookup_icons(sGroup)
-            if aTexts:
-                self.set(oSectionIter, 0, sGroup,
-                        1, iGrpCnt, 2, iParGrpCnt,
-                        5, aTexts, 6, aIcons,
-                        )
-            else:
-                self.set(oSectionIter, 0, sGroup,
-                        1, iGrpCnt, 2, iParGrpCnt,
+                # Fill in Cards
+                iGrpCnt = 0
+                iParGrpCnt = 0
+                # We prepend rather than append -
+                # this is a lot faster for long lists.
+                for _oId, oRow in oGroupIter:
+                    oCard = oRow.oAbsCard
+                    iCnt = oRow.iCount
+                    iParCnt = oRow.iParentCount
+                    iGrpCnt += iCnt
+                    iParGrpCnt += iParCnt
+                    bIncCard, bDecCard = self.check_inc_dec(iCnt)
+                    oChildIter = self.prepend(oSectionIter)
+                    # Direct lookup, for same reason as in CardListModel
+                    # We skip name here, as that gets reset in
+                    # _set_display_name
+                    sName = oCard.name
+                    if bPostfix:
+                        sName = canonical_to_csv(sName)
+                    self.set(oChildIter,
+                        0, sName,
+                        1, iCnt, 2, iParCnt,
+                        3, bIncCard, 4, bDecCard,
+                        8, oCard,
+                        9, oRow.oPhysCard,
                         )
+                    self.set_par_count_colour(oChildIter, iParCnt, iCnt)
+                    self._dAbs2Iter.setdefault(oCard.id, []).append(
+                            oChildIter)
+                    self._add_children(oChildIter, oRow)
+                    yield oCard
+                # Update Group Section
+                aTexts, aIcons = self.lookup_icons(sGroup)
+                if aTexts:
+                    self.set(oSectionIter, 0, sGroup,
+                            1, iGrpCnt, 2, iParGrpCnt,
+                            5, aTexts, 6, aIcons,
+                            )
+                else:
+                    self.set(oSectionIter, 0, sGroup,
+                            1, iGrpCnt, 2, iParGrpCnt,
+                            )
 
-            self.set_par_count_colour(oSectionIter, iParGrpCnt, iGrpCnt)
+                self.set_par_count_colour(oSectionIter, iParGrpCnt, iGrpCnt)
 
-        self._check_if_empty()
+            self._check_if_empty()
 
-        # Notify Listeners
-        MessageBus.publish(self, 'load', aCards)
-
-        # Restore sorting
-        # See comments in CardListModel
-        if iSortColumn is not None:
-            self.set_sort_column_id(iSortColumn, iSortOrder)
+            self._oLoadSteps = None
+            # Notify Listeners
+            MessageBus.publish(self, 'load', aCards)
+        finally:
+            # Restore sorting
+            # See comments in CardListModel
+            if iSortColumn is not None:
+                self.set_sort_column_id(iSortColumn, iSortOrder)
 
     def _try_queue_reload(self):
         """Attempt to setup a call to queue_reload, otherwise just reload"""
@@ -352,7 +395,39 @@ class CardSetCardListModel(CardListModel):
             self.load()
 
     def _add_children(self, oChildIter, oRow):
-        """Add the needed children for a card in the model."""
+        """Add the needed children for a card in the model.
+
+           In lazy mode, we only add a placeholder row, so the card can be
+           expanded, and keep oRow until the children are needed."""
+        if not self.bLazyChildren:
+            self._add_child_rows(oChildIter, oRow)
+        elif oRow.has_children():
+            self._dAbs2Row[oRow.oAbsCard.id] = oRow
+            oIter = self.prepend(oChildIter)
+            self.set(oIter, 0, '', 9, oRow.oPhysCard)
+
+    def build_children(self, oIter):
+        """Ensure the expansion and child card set rows for the card at
+           oIter have been added to the model."""
+        if self._dAbs2Row and self.iter_depth(oIter) == 1:
+            self._build_card_children(
+                    self.get_abstract_card_from_iter(oIter).id)
+
+    def _build_card_children(self, oAbsId):
+        """Replace the placeholders for the card with the actual rows"""
+        oRow = self._dAbs2Row.pop(oAbsId, None)
+        if oRow is None:
+            # Already added, or nothing to add
+            return
+        for oCardIter in self._dAbs2Iter.get(oAbsId, []):
+            oIter = self.iter_children(oCardIter)
+            while oIter:
+                if not self.remove(oIter):
+                    break
+            self._add_child_rows(oCardIter, oRow)
+
+    def _add_child_rows(self, oChildIter, oRow):
+        """Add the expansion and child card set rows for a card."""
         dExpansionInfo = oRow.get_expansion_info()
         dChildInfo = oRow.get_child_info()
         oAbsId = oRow.oAbsCard.id
@@ -519,6 +594,7 @@ class CardSetCardListModel(CardListModel):
                 self._iExtraLevelsMode in EXPANSIONS_2ND_LEVEL):
             return {}  # Not at the right level
         dResult = {}
+        self.build_children(oIter)
         if self._iExtraLevelsMode == SHOW_EXPANSIONS or \
             self._iExtraLevelsMode == EXP_AND_CARD_SETS:
             # Can read off the data from the model, so do so
@@ -540,7 +616,7 @@ class CardSetCardListModel(CardListModel):
                 oPhysCard = PhysicalCardMappingToPhysicalCardAdapter(oCard)
                 sExpansion = ExpansionNameAdapter(oPhysCard)
                 dResult.setdefault(sExpansion, 0)
-                dResult[sExpansion] += 1
+                dResult[sExpansion] += oCard.count
         elif self._iExtraLevelsMode == CARD_SETS_AND_EXP:
             # can read info from the model
             oChildIter = self.iter_children(oIter)
@@ -563,9 +639,22 @@ class CardSetCardListModel(CardListModel):
                 oPhysCard = PhysicalCardMappingToPhysicalCardAdapter(oCard)
                 sExpansion = ExpansionNameAdapter(oPhysCard)
                 dResult.setdefault(sExpansion, 0)
-                dResult[sExpansion] += 1
+                dResult[sExpansion] += oCard.count
         return dResult
 
+    def get_all_iter_children(self, oIter):
+        """Get a list of all the subiters of this iter, adding them
+           first if needed"""
+        self.build_children(oIter)
+        return super(CardSetCardListModel, self).get_all_iter_children(oIter)
+
+    def get_child_entries_from_path(self, oPath):
+        """Return a list of (sExpansion, iCount) pairs for the children of
+           this path, adding them first if needed"""
+        self.build_children(self.get_iter(oPath))
+        return super(CardSetCardListModel,
+                self).get_child_entries_from_path(oPath)
+
     def _init_expansions(self, dExpanInfo, oAbsCard):
         """Initialise the expansion dict for a card"""
         if self.bEditable:
@@ -574,8 +663,9 @@ class CardSetCardListModel(CardListModel):
                     dExpanInfo.setdefault((ExpansionNameAdapter(oPhysCard),
                         oPhysCard), 0)
 
-    def _adjust_row(self, dAbsCards, oPhysCard, dChildCache, bInc):
-        """Initialize the entry for oAbsCard in dAbsCards"""
+    def _adjust_row(self, dAbsCards, oPhysCard, dChildCache, iInc):
+        """Initialize the entry for oAbsCard in dAbsCards, and increase
+           the count by iInc"""
         if oPhysCard.abstractCardID not in dAbsCards:
             oAbsCard = PhysicalCardToAbstractCardAdapter(oPhysCard)
             oRow = CardSetModelRow(self.bEditable,
@@ -601,21 +691,41 @@ class CardSetCardListModel(CardListModel):
                 oRow.oPhysCard = aPhysCards[0]
         else:
             oRow = dAbsCards[oPhysCard.abstractCardID]
-        if bInc:
-            oRow.iCount += 1
+        oRow.iCount += iInc
         dExpanInfo = oRow.dExpansions
         dChildInfo = oRow.dChildCardSets
         if self._iExtraLevelsMode in EXPANSIONS_2ND_LEVEL:
             sExpName = ExpansionNameAdapter(oPhysCard)
             dExpanInfo.setdefault((sExpName, oPhysCard), 0)
-            if bInc:
-                dExpanInfo[(sExpName, oPhysCard)] += 1
+            dExpanInfo[(sExpName, oPhysCard)] += iInc
         if not dChildInfo and self._iExtraLevelsMode in CARD_SETS_LEVEL:
             self.get_child_set_info(oRow.oAbsCard, dChildInfo, dExpanInfo,
                     dChildCache)
         if self._iExtraLevelsMode == EXP_AND_CARD_SETS:
             dChildInfo.setdefault(sExpName, {})
 
+    def _get_store_counts(self, aCardSetIds, oCurFilter):
+        """Get the card counts for the card sets from the shared count
+           store, restricted to the cards matching oCurFilter.
+
+           Returns a list of (card set id, physical card, count) tuples,
+           or None if the database needs to be queried instead."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        oStore = get_card_set_counts()
+        if oStore is None:
+            return None
+        aIds = get_filter_card_ids(oCurFilter)
+        if aIds is None:
+            # Need the database to evaluate the filter
+            return None
+        aCounts = []
+        for iCardSetId in aCardSetIds:
+            for oCard, iCount in oStore.get_counts(iCardSetId).iteritems():
+                if oCard.abstractCardID in aIds:
+                    aCounts.append((iCardSetId, oCard, iCount))
+        return aCounts
+
     def _get_child_filters(self, oCurFilter):
         """Get the filters for the child card sets of this card set."""
         # pylint: disable-msg=E1101, E1103, R0912
@@ -623,13 +733,13 @@ class CardSetCardListModel(CardListModel):
         # R0912 - The various cache cases intoduce many branches, but can't
         #   reasonably split away.
 
-        def _update_child_caches(oCard):
+        def _update_child_caches(oCard, iCount):
             """Add card info to the cache"""
             oAbsId = oCard.abstractCardID
             self._dCache['child cards'].setdefault(oCard, 0)
             self._dCache['child abstract cards'].setdefault(oAbsId, 0)
-            self._dCache['child cards'][oCard] += 1
-            self._dCache['child abstract cards'][oAbsId] += 1
+            self._dCache['child cards'][oCard] += iCount
+            self._dCache['child abstract cards'][oAbsId] += iCount
             return oAbsId
 
         if self._iExtraLevelsMode in CARD_SETS_LEVEL or \
@@ -653,17 +763,26 @@ class CardSetCardListModel(CardListModel):
                                 CachedFilter(PhysicalCardSetFilter(sName))
                     self._dCache['set map'] = dChildren
         dChildCardCache = {}
+        # List of (card set id, card, count) tuples
+        aChildCounts = []
         if not self.is_filtered() and self._dCache['full child card list']:
-            aChildCards = self._dCache['full child card list']
+            aChildCounts = self._dCache['full child card list']
         elif self._iShowCardMode != CHILD_CARDS and \
                 self._dCache['full child card list']:
-            aChildCards = self._dCache['full child card list']
+            aChildCounts = self._dCache['full child card list']
         elif self._dCache['all children filter']:
-            oFullFilter = FilterAndBox([self._dCache['all children filter'],
-                oCurFilter])
-            aChildCards = list(oFullFilter.select(self.cardclass).distinct())
+            aChildCounts = self._get_store_counts(self._dCache['set map'],
+                    oCurFilter)
+            if aChildCounts is None:
+                # Pull all cards of interest in a single query
+                oFullFilter = FilterAndBox([
+                    self._dCache['all children filter'], oCurFilter])
+                aChildCounts = [(oMapCard.physicalCardSetID,
+                    PhysicalCardMappingToPhysicalCardAdapter(oMapCard),
+                    oMapCard.count) for oMapCard in
+                    oFullFilter.select(self.cardclass).distinct()]
             if not self.is_filtered():
-                self._dCache['full child card list'] = aChildCards
+                self._dCache['full child card list'] = aChildCounts
         if self._iExtraLevelsMode in CARD_SETS_LEVEL and \
                 self._dCache['child filters']:
             dChildren = self._dCache['set map']
@@ -671,20 +790,18 @@ class CardSetCardListModel(CardListModel):
                 # Ensure we have entries for the zero cases
                 self._dCache['child card sets'].setdefault(sName, {})
                 dChildCardCache.setdefault(sName, {})
-            # Pull all cards of interest in a single query
-            for oMapCard in aChildCards:
-                sName = dChildren[oMapCard.physicalCardSetID]
-                oCard = PhysicalCardMappingToPhysicalCardAdapter(oMapCard)
-                oAbsId = _update_child_caches(oCard)
-                dChildCardCache[sName].setdefault(oAbsId, []).append(oCard)
+            for iCardSetId, oCard, iCount in aChildCounts:
+                sName = dChildren[iCardSetId]
+                oAbsId = _update_child_caches(oCard, iCount)
+                dChildCardCache[sName].setdefault(oAbsId, []).extend(
+                        [oCard] * iCount)
                 self._dCache['child card sets'][sName].setdefault(oCard, 0)
-                self._dCache['child card sets'][sName][oCard] += 1
+                self._dCache['child card sets'][sName][oCard] += iCount
         elif self._iShowCardMode == CHILD_CARDS and \
                 self._dCache['child filters']:
             # Need to setup the cache
-            for oMapCard in aChildCards:
-                oCard = PhysicalCardMappingToPhysicalCardAdapter(oMapCard)
-                _update_child_caches(oCard)
+            for _iCardSetId, oCard, iCount in aChildCounts:
+                _update_child_caches(oCard, iCount)
         return dChildCardCache
 
     def _get_parent_list(self, oCurFilter, oCardIter, iIterCnt):
@@ -706,20 +823,28 @@ class CardSetCardListModel(CardListModel):
                     self._dCache['parent filter'] = \
                             CachedFilter(PhysicalCardSetFilter(
                                 self._oCardSet.parent.name))
-                aFilters = [self._dCache['parent filter'], oCurFilter]
-                if self._iShowCardMode == THIS_SET_ONLY and \
-                        iIterCnt < 200:
-                    # Restrict filter to the cards in this set, to save time
-                    # oCardIter.count() > 0, due to check in grouped_card_iter
-                    aAbsCardIds = set([IAbstractCard(x).id for x in oCardIter])
-                    self._dCache['cardset cards filter'] = \
-                            CachedFilter(MultiSpecificCardIdFilter(
-                                aAbsCardIds))
-                    aFilters.append(self._dCache['cardset cards filter'])
-                oParentFilter = FilterAndBox(aFilters)
-                aParentCards = [PhysicalCardMappingToPhysicalCardAdapter(x)
-                        for x in
-                        oParentFilter.select(self.cardclass).distinct()]
+                aParentCounts = self._get_store_counts(
+                        [self._oCardSet.parentID], oCurFilter)
+                if aParentCounts is not None:
+                    aParentCards = []
+                    for _iCardSetId, oCard, iCount in aParentCounts:
+                        aParentCards.extend([oCard] * iCount)
+                else:
+                    aFilters = [self._dCache['parent filter'], oCurFilter]
+                    if self._iShowCardMode == THIS_SET_ONLY and \
+                            iIterCnt < 200:
+                        # Restrict filter to the cards in this set, to save
+                        # time. oCardIter.count() > 0, due to check in
+                        # grouped_card_iter
+                        aAbsCardIds = set([IAbstractCard(x).id for x in
+                            oCardIter])
+                        self._dCache['cardset cards filter'] = \
+                                CachedFilter(MultiSpecificCardIdFilter(
+                                    aAbsCardIds))
+                        aFilters.append(self._dCache['cardset cards filter'])
+                    oParentFilter = FilterAndBox(aFilters)
+                    aParentCards = expand_map_cards(
+                            oParentFilter.select(self.cardclass).distinct())
                 if not self.is_filtered():
                     self._dCache['full parent card list'] = aParentCards
             for oPhysCard in aParentCards:
@@ -773,6 +898,7 @@ class CardSetCardListModel(CardListModel):
         self._dCache.setdefault('all children filter', None)
         self._dCache.setdefault('set map', None)
         self._dCache.setdefault('sibling filter', None)
+        self._dCache.setdefault('sibling ids', [])
         self._dCache.setdefault('parent filter', None)
 
         if bClearFilters:
@@ -793,6 +919,14 @@ class CardSetCardListModel(CardListModel):
         self._dCache['filtered cards'] = None
         self._dCache['cardset cards filter'] = None
 
+    def get_card_copies(self, oFilter):
+        """Return a list of the physical cards matching oFilter, with an
+           entry for each copy of the card.
+
+           A mapping entry can represent several copies of a card, so
+           get_card_iterator can't be used to count the cards."""
+        return expand_map_cards(self.get_card_iterator(oFilter))
+
     def grouped_card_iter(self, oCardIter):
         """Get the data that needs to fill the model, handling the different
            CardShow modes, the different counts, the filter, etc.
@@ -841,23 +975,25 @@ class CardSetCardListModel(CardListModel):
 
         # Other card show modes
         for oPhysCard in self._get_extra_cards(oCurFilter):
-            self._adjust_row(dAbsCards, oPhysCard, dChildCardCache, False)
+            self._adjust_row(dAbsCards, oPhysCard, dChildCardCache, 0)
 
         if not self.is_filtered() and self._dCache['this card list']:
             for oPhysCard in self._dCache['this card list']:
                 self._adjust_row(dAbsCards, oPhysCard,
-                        dChildCardCache, True)
+                        dChildCardCache, 1)
                 dPhysCards.setdefault(oPhysCard, 0)
                 dPhysCards[oPhysCard] += 1
             aCards = self._dCache['this card list']
         else:
             for oCard in oCardIter:
+                # Each mapping entry may represent several copies
                 oPhysCard = PhysicalCardMappingToPhysicalCardAdapter(oCard)
+                iCount = oCard.count
                 self._adjust_row(dAbsCards, oPhysCard,
-                        dChildCardCache, True)
+                        dChildCardCache, iCount)
                 dPhysCards.setdefault(oPhysCard, 0)
-                dPhysCards[oPhysCard] += 1
-                aCards.append(oPhysCard)
+                dPhysCards[oPhysCard] += iCount
+                aCards.extend([oPhysCard] * iCount)
                 if self._bPhysicalFilter:
                     # We need to be able to give the correct list of physical
                     # cards to the listeners if we remove these via _clear_iter
@@ -870,7 +1006,7 @@ class CardSetCardListModel(CardListModel):
                     oAbsId = oPhysCard.abstractCardID
                     self._dAbs2Phys.setdefault(oAbsId, {})
                     self._dAbs2Phys[oAbsId].setdefault(oPhysCard, 0)
-                    self._dAbs2Phys[oAbsId][oPhysCard] += 1
+                    self._dAbs2Phys[oAbsId][oPhysCard] += iCount
             if not self.is_filtered():
                 self._dCache['this card list'] = aCards
 
@@ -932,8 +1068,10 @@ class CardSetCardListModel(CardListModel):
         # pyprotocols confusion
         dSiblingCards = {}
         if self._dCache['sibling filter'] is None:
-            aChildren = [x.name for x in PhysicalCardSet.selectBy(
-                parentID=self._oCardSet.parentID, inuse=True)]
+            aSiblings = list(PhysicalCardSet.selectBy(
+                parentID=self._oCardSet.parentID, inuse=True))
+            aChildren = [x.name for x in aSiblings]
+            self._dCache['sibling ids'] = [x.id for x in aSiblings]
             if aChildren:
                 self._dCache['sibling filter'] = \
                         CachedFilter(MultiPhysicalCardSetMapFilter(aChildren))
@@ -942,8 +1080,18 @@ class CardSetCardListModel(CardListModel):
                 # calls to add_new_card
                 self._dCache['sibling filter'] = False
         if self._dCache['sibling filter']:
+            aSiblingCounts = None
+            if not self._dCache['full sibling card list']:
+                aSiblingCounts = self._get_store_counts(
+                        self._dCache['sibling ids'], oCurFilter)
             if self._dCache['full sibling card list']:
                 aInUseCards = self._dCache['full sibling card list']
+            elif aSiblingCounts is not None:
+                aInUseCards = []
+                for _iCardSetId, oCard, iCount in aSiblingCounts:
+                    aInUseCards.extend([oCard] * iCount)
+                if not self.is_filtered():
+                    self._dCache['full sibling card list'] = aInUseCards
             else:
                 if self._dCache['cardset cards filter']:
                     oSibFilter = FilterAndBox([
@@ -957,8 +1105,8 @@ class CardSetCardListModel(CardListModel):
                         oCurFilter,
                         ])
 
-                aInUseCards = [PhysicalCardMappingToPhysicalCardAdapter(x)
-                        for x in oSibFilter.select(self.cardclass).distinct()]
+                aInUseCards = expand_map_cards(
+                        oSibFilter.select(self.cardclass).distinct())
                 if not self.is_filtered():
                     self._dCache['full sibling card list'] = aInUseCards
             for oPhysCard in aInUseCards:
@@ -1065,11 +1213,16 @@ class CardSetCardListModel(CardListModel):
             else:
                 # Because of how we construct the cache, we may have
                 # missing entries
-                oParentFilter = FilterAndBox([
-                    SpecificPhysCardIdFilter(oPhysCard.id),
-                    self._dCache['parent filter']])
-                iParCnt = oParentFilter.select(
-                        self.cardclass).count()
+                oStore = get_card_set_counts()
+                if oStore is not None:
+                    iParCnt = oStore.get_count(self._oCardSet.parentID,
+                            oPhysCard)
+                else:
+                    oParentFilter = FilterAndBox([
+                        SpecificPhysCardIdFilter(oPhysCard.id),
+                        self._dCache['parent filter']])
+                    iParCnt = count_map_cards(oParentFilter.select(
+                            self.cardclass))
                 # Cache this lookup for the future
                 self._dCache['parent cards'][oPhysCard] = iParCnt
                 self._dCache['parent abstract cards'].setdefault(
@@ -1078,19 +1231,25 @@ class CardSetCardListModel(CardListModel):
                         oPhysCard.abstractCardID] += iParCnt
             if self._iParentCountMode == MINUS_THIS_SET:
                 if iThisSetCnt is None:
-                    iThisSetCnt = self.get_card_iterator(
-                            SpecificPhysCardIdFilter(oPhysCard.id)).count()
+                    iThisSetCnt = count_map_cards(self.get_card_iterator(
+                            SpecificPhysCardIdFilter(oPhysCard.id)))
                 iParCnt -= iThisSetCnt
             elif self._iParentCountMode == MINUS_SETS_IN_USE:
                 if self._dCache['sibling filter']:
                     if oPhysCard in self._dCache['sibling cards']:
                         iParCnt -= self._dCache['sibling cards'][oPhysCard]
                     else:
-                        oInUseFilter = FilterAndBox([
-                            SpecificPhysCardIdFilter(oPhysCard.id),
-                            self._dCache['sibling filter']])
-                        iSibCnt = oInUseFilter.select(
-                                self.cardclass).count()
+                        oStore = get_card_set_counts()
+                        if oStore is not None:
+                            iSibCnt = sum([oStore.get_count(iCardSetId,
+                                oPhysCard) for iCardSetId in
+                                self._dCache['sibling ids']])
+                        else:
+                            oInUseFilter = FilterAndBox([
+                                SpecificPhysCardIdFilter(oPhysCard.id),
+                                self._dCache['sibling filter']])
+                            iSibCnt = count_map_cards(oInUseFilter.select(
+                                    self.cardclass))
                         iParCnt -= iSibCnt
                         self._dCache['sibling cards'][oPhysCard] = iSibCnt
                         self._dCache['sibling abstract cards'].setdefault(
@@ -1259,12 +1418,9 @@ class CardSetCardListModel(CardListModel):
                 # due to card sets filter limies, so just invalidate cache
                 self._dCache[sFullCache] = None
             elif self._dCache[sFullCache]:
-                if iChg > 0:
-                    self._dCache[sFullCache].append(oPhysCard)
-                elif iChg < 0 and oPhysCard in self._dCache[sFullCache]:
-                    # may be cases (THIS_SET_ONLY), were card is not in cache,
-                    # so we do need to check fot that.
-                    self._dCache[sFullCache].remove(oPhysCard)
+                # may be cases (THIS_SET_ONLY), were card is not in cache,
+                # so _update_card_list does check for that.
+                _update_card_list(self._dCache[sFullCache], oPhysCard, iChg)
 
     def _update_child_set_cache(self, oPhysCard, iChg, sName):
         """Update the number in the card cache"""
@@ -1400,6 +1556,44 @@ class CardSetCardListModel(CardListModel):
         # Other card set deletions don't need to be watched here, since the
         # fiddling on parents should generate changed signals for us.
 
+    def _affected_by(self, oCardSet):
+        """Return True if changes to the cards in oCardSet can change
+           the model."""
+        # pylint: disable-msg=E1101, E1103
+        # Pyprotocols confuses pylint
+        return oCardSet.id == self._oCardSet.id \
+                or (self._bPhysicalFilter and
+                        self.get_current_filter().involves(oCardSet)) \
+                or (self.changes_with_parent() and
+                        self.is_parent(oCardSet)) \
+                or (self.changes_with_children() and
+                        self.is_child(oCardSet)) \
+                or (self.changes_with_siblings() and
+                        self.is_sibling(oCardSet))
+
+    def cards_changed(self, oCardSet, dChanges):
+        """Listen on bulk card changes.
+
+           We only check if the card set affects us once, and then update
+           each card as for card_changed. Sorting is disabled while the
+           model is updated."""
+        if not self._affected_by(oCardSet):
+            # expire short-lived cache, as for card_changed
+            self._dCache['visible'] = {}
+            return
+        if self.is_loading():
+            # We can't tell which cards have been added so far, so start
+            # again
+            self._try_queue_reload()
+            return
+        iSortColumn, iSortOrder = self.get_sort_column_id()
+        if iSortColumn is not None:
+            self.set_sort_column_id(-2, 0)
+        for oPhysCard, iChg in dChanges.iteritems():
+            self._update_card(oCardSet, oPhysCard, iChg)
+        if iSortColumn is not None:
+            self.set_sort_column_id(iSortColumn, iSortOrder)
+
     def card_changed(self, oCardSet, oPhysCard, iChg):
         """Listen on card changes.
 
@@ -1408,25 +1602,34 @@ class CardSetCardListModel(CardListModel):
            as we can query the database and obtain accurate results.
            Does rely on everyone calling send_changed_signal.
            """
+        if not self._affected_by(oCardSet):
+            # Doesn't affect us, so ignore
+            # expire short-lived cache
+            self._dCache['visible'] = {}
+            return
+        if self.is_loading():
+            # See cards_changed
+            self._try_queue_reload()
+            return
+        self._update_card(oCardSet, oPhysCard, iChg)
+
+    def _update_card(self, oCardSet, oPhysCard, iChg):
+        """Update the model for a change to the cards in oCardSet.
+
+           The caller has checked that changes to oCardSet affect the
+           model, and that the model isn't loading."""
         # pylint: disable-msg=E1101, R0912, E1103, R0915
         # E1101, E1103 - Pyprotocols confuses pylint
         # R0912, R0915 - need to consider several cases, so lots of
         #     branches and statements
         oAbsId = oPhysCard.abstractCardID
+        if oAbsId in self._dAbs2Row and not self._bPhysicalFilter:
+            # The updates below assume the card's children are present
+            self._build_card_children(oAbsId)
         if self._bPhysicalFilter:
-            oCurFilter = self.get_current_filter()
             # Physical filters checks are quite expensive, due to the
             # calls to add_new_Card and iter fiddling, so it's worth trying
             # to avoid going down this path if at all possible.
-            if oCardSet.id != self._oCardSet.id \
-                    and not oCurFilter.involves(oCardSet) \
-                    and not (self.changes_with_parent() and
-                            self.is_parent(oCardSet)) \
-                    and not (self.changes_with_children() and
-                        self.is_child(oCardSet))  \
-                    and not (self.changes_with_siblings() and
-                        self.is_sibling(oCardSet)):
-                return
             # If we have a card count filter, any change can affect us,
             # so we always consider these cases.
             if not self._needs_update(oAbsId, oPhysCard):
@@ -1450,13 +1653,11 @@ class CardSetCardListModel(CardListModel):
             # Changing a card from this card set
             if self._oCardSet.inuse:
                 self._update_cache(oPhysCard, iChg, 'sibling')
-            if (iChg > 0 and self._dCache['this card list'] is not None
+            if (self._dCache['this card list'] is not None
                     and self.configfilter is None):
                 # this card list can be empty
-                self._dCache['this card list'].append(oPhysCard)
-            elif (self._dCache['this card list']
-                    and self.configfilter is None):
-                self._dCache['this card list'].remove(oPhysCard)
+                _update_card_list(self._dCache['this card list'], oPhysCard,
+                        iChg)
             if self._iShowCardMode == THIS_SET_ONLY and iChg > 0:
                 # This cache may no longer be valid in this case
                 self._dCache['full parent card list'] = None
@@ -1500,7 +1701,6 @@ class CardSetCardListModel(CardListModel):
                 # the model
                 self.alter_parent_count(oPhysCard, -iChg, False)
             self._clean_cache(oPhysCard, 'sibling')
-        # Doesn't affect us, so ignore
         # expire short-lived cache
         self._dCache['visible'] = {}
 
@@ -1645,6 +1845,9 @@ class CardSetCardListModel(CardListModel):
             if oAbsId in self._dCache['parent abstract cards']:
                 bResult = self._dCache['parent abstract cards'][oAbsId] > 0
         elif self._iShowCardMode == CHILD_CARDS:
+            if self._iExtraLevelsMode in CARD_SETS_LEVEL:
+                # We need the children to check them
+                self.build_children(oIter)
             if self._iExtraLevelsMode in CARD_SETS_2ND_LEVEL:
                 # Check if any top level child iters have non-zero counts
                 oChildIter = self.iter_children(oIter)
@@ -1728,7 +1931,7 @@ class CardSetCardListModel(CardListModel):
             else:
                 oFilter = FilterAndBox([SpecificPhysCardIdFilter(oPhysCard.id),
                     oSetFilter])
-                iCnt = oFilter.select(self.cardclass).count()
+                iCnt = count_map_cards(oFilter.select(self.cardclass))
                 # Cache this lookup
                 self._dCache['child card sets'].setdefault(sCardSet, {})
                 self._dCache['child card sets'][sCardSet][oPhysCard] = iCnt
@@ -1829,7 +2032,7 @@ class CardSetCardListModel(CardListModel):
                     oFilter = FilterAndBox([
                         self._dCache['child filters'][sCardSetName],
                         SpecificPhysCardIdFilter(oPhysCard.id)])
-                    iCnt = oFilter.select(self.cardclass).count()
+                    iCnt = count_map_cards(oFilter.select(self.cardclass))
                     # Cache this lookup
                     self._dCache['child card sets'].setdefault(sCardSetName,
                             {})
@@ -1869,6 +2072,8 @@ class CardSetCardListModel(CardListModel):
                 self.set_par_count_colour(oGrpIter, iParGrpCnt, iGrpCnt)
 
         del self._dAbs2Iter[oAbsId]
+        if oAbsId in self._dAbs2Row:
+            del self._dAbs2Row[oAbsId]
 
         self._check_if_empty()
 
@@ -2032,8 +2237,8 @@ class CardSetCardListModel(CardListModel):
         # PyProtocols confuses pylint
         iCnt = 1
         oAbsId, sExpName = tExpKey
-        iThisCSCnt = self.get_card_iterator(SpecificPhysCardIdFilter(
-            oPhysCard.id)).count()
+        iThisCSCnt = count_map_cards(self.get_card_iterator(
+            SpecificPhysCardIdFilter(oPhysCard.id)))
         iParCnt = self._get_parent_count(oPhysCard, iThisCSCnt)
         bIncCard, bDecCard = self.check_inc_dec(iCnt)
         for oIter in self._dAbsSecondLevel2Iter[oAbsId][sCardSetName]:
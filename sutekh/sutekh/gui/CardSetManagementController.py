@@ -68,7 +68,7 @@ class CardSetManagementController(object):
             self._oMainWindow.config_file.clear_cardset_profile(
                     'cs%d' % oCS.id)
             delete_physical_card_set(sSetName)
-            self.view.reload_keep_expanded(False)
+            self._oFrame.update_list()
 
     def toggle_in_use_flag(self, _oMenuWidget):
         """Toggle the in-use status of the card set"""
@@ -83,4 +83,4 @@ class CardSetManagementController(object):
             return
         oCS.inuse = not oCS.inuse
         oCS.syncUpdate()
-        self.view.reload_keep_expanded(True)
+        self._oFrame.update_list()
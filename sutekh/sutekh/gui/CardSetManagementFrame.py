@@ -12,6 +12,7 @@ from sutekh.gui.BasicFrame import BasicFrame
 from sutekh.gui.CardSetManagementController import CardSetManagementController
 from sutekh.gui.CardSetManagementMenu import CardSetManagementMenu
 from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
+from sutekh.gui.MessageBus import MessageBus, DATABASE_MSG
 
 
 class CardSetManagementFrame(BasicFrame):
@@ -83,6 +84,41 @@ class CardSetManagementFrame(BasicFrame):
         oVertAdj.value_changed()
         oHorzAdj.value_changed()
 
+    def update_list(self):
+        """Update the list after card sets have been changed, or card set
+           panes have been opened or closed.
+
+           If the model follows the database changes, we only need to
+           update the card set formatting, otherwise we reload."""
+        oModel = self._oController.model
+        if oModel.follows_changes():
+            oModel.update_markup()
+        else:
+            self.reload()
+
+    def frame_setup(self):
+        """Subscribe to the database upgrade messages as well"""
+        super(CardSetManagementFrame, self).frame_setup()
+        MessageBus.subscribe(DATABASE_MSG, "prepare_for_db_update",
+                self.prepare_for_db_update)
+
+    def cleanup(self):
+        """Disconnect the model from the database signals"""
+        super(CardSetManagementFrame, self).cleanup()
+        MessageBus.unsubscribe(DATABASE_MSG, "prepare_for_db_update",
+                self.prepare_for_db_update)
+        self._oController.model.cleanup()
+
+    def prepare_for_db_update(self):
+        """Stop following the database signals during the update"""
+        self._oController.model.cleanup()
+
+    def update_to_new_db(self):
+        """Reload the list, and start following the database signals
+           again"""
+        self._oController.model.listen_for_changes()
+        self.reload()
+
     def get_menu_name(self):
         """Get the menu key"""
         return self._sName
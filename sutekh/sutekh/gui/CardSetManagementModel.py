@@ -7,11 +7,35 @@
 
 import gtk
 import gobject
-from sutekh.core.SutekhObjects import PhysicalCardSet, IPhysicalCardSet
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Select
+from sutekh.core.SutekhObjects import PhysicalCardSet
 from sutekh.core.Filters import NullFilter
+from sutekh.core.QueryProfiler import profile_operation
+from sutekh.core.DBSignals import listen_row_created, listen_row_update, \
+        listen_row_destroy, disconnect_row_created, disconnect_row_update, \
+        disconnect_row_destroy
 from sutekh.gui.ConfigFile import CARDSET_LIST
 
 
+def _read_card_sets():
+    """Return a dictionary of card set id to (name, parent id, in use) for
+       all the card sets, using a single query."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    oConn = sqlhub.processConnection
+    oQuery = Select([PhysicalCardSet.q.id, PhysicalCardSet.q.name,
+        PhysicalCardSet.q.parentID, PhysicalCardSet.q.inuse])
+    dSets = {}
+    for iId, sName, iParentId, bInUse in oConn.queryAll(
+            oConn.sqlrepr(oQuery)):
+        if isinstance(sName, str):
+            # Some backends return the utf8 encoded value
+            sName = sName.decode('utf8')
+        dSets[iId] = (sName, iParentId, bool(bInUse))
+    return dSets
+
+
 class CardSetManagementModel(gtk.TreeStore):
     # pylint: disable-msg=R0904
     # gtk.Widget, so lots of public methods
@@ -23,6 +47,9 @@ class CardSetManagementModel(gtk.TreeStore):
         # that's all handleded in load
         super(CardSetManagementModel, self).__init__(str, str)
         self._dName2Iter = {}
+        # Names of the in use card sets in the model
+        self._aInUse = set()
+        self._bListening = False
 
         self._oMainWin = oMainWindow
 
@@ -63,15 +90,15 @@ class CardSetManagementModel(gtk.TreeStore):
         return oFilter.select(PhysicalCardSet).distinct()
     # pylint: enable-msg=R0201
 
-    def _format_set(self, oSet):
+    def _format_set(self, sName):
         """Format the card set name for display"""
-        sMarkup = gobject.markup_escape_text(oSet.name)
-        if oSet.name in self._aExcludedSet:
+        sMarkup = gobject.markup_escape_text(sName)
+        if sName in self._aExcludedSet:
             sMarkup = '<span foreground="grey">%s</span>' % sMarkup
         elif hasattr(self._oMainWin, 'find_cs_pane_by_set_name') and \
-                self._oMainWin.find_cs_pane_by_set_name(oSet.name):
+                self._oMainWin.find_cs_pane_by_set_name(sName):
             sMarkup = '<span foreground="blue">%s</span>' % sMarkup
-        if oSet.inuse:
+        if sName in self._aInUse:
             # In use sets are in bold
             sMarkup = '<b>%s</b>' % sMarkup
         return sMarkup
@@ -80,12 +107,10 @@ class CardSetManagementModel(gtk.TreeStore):
         """Mark the given set as excluded"""
         self._aExcludedSet.add(sSetName)
         # Update markup if required
-        oPath = self.get_path_from_name(sSetName)
-        if oPath:
-            oIter = self.get_iter(oPath)
-            sMarkup = self._format_set(IPhysicalCardSet(sSetName))
+        if sSetName in self._dName2Iter:
+            sMarkup = self._format_set(sSetName)
             # gtk signals will do the rest for us
-            self.set(oIter, 0, sMarkup)
+            self.set(self._dName2Iter[sSetName], 0, sMarkup)
 
     def unexclude_set(self, sSetName):
         """Unmark the given set as excluded"""
@@ -103,50 +128,191 @@ class CardSetManagementModel(gtk.TreeStore):
         # sort on card set name by default, for consistency elsewhere
         self.set_sort_column_id(0, gtk.SORT_ASCENDING)
 
+    @profile_operation('Load card set list')
     def load(self):
-        """Load the card sets into the card view"""
+        """Load the card sets into the card view.
+
+           The card set hierarchy is read with a single query, and the
+           tree is built from that, so we don't need to look up the
+           parents one card set at a time."""
         self.clear()
-        oCardSetIter = self.get_card_set_iterator(self.get_current_filter())
         self._dName2Iter = {}
+        self._aInUse = set()
+        self.oEmptyIter = None
+        dSets = _read_card_sets()
+        oFilter = self.get_current_filter()
+        if oFilter:
+            aIds = [oCardSet.id for oCardSet in
+                    self.get_card_set_iterator(oFilter)]
+        else:
+            aIds = dSets.keys()
 
         # Disable sorting while we do the insertions - speeds things up
         iSortColumn, iSortOrder = self.get_sort_column_id()
         if iSortColumn is not None:
             self.set_sort_column_id(-2, 0)
 
-        # Loop through the card sets, getting the parent->child relationships
-        for oCardSet in oCardSetIter:
-            if oCardSet.name in self._dName2Iter:
-                # We've already loaded this card set, so skip
-                continue
-            if oCardSet.parent:
-                # Do funky stuff to make sure parent is shown in the view
-                oParent = oCardSet
-                aToAdd = []
-                oIter = None
-                while oParent and oParent.name not in self._dName2Iter:
-                    aToAdd.insert(0, oParent)  # Insert at the head
-                    oParent = oParent.parent
-                if oParent and oParent.name in self._dName2Iter:
-                    oIter = self._dName2Iter[oParent.name]
-            else:
-                # Just add
-                oIter = None
-                aToAdd = [oCardSet]
-            for oSet in aToAdd:
-                oIter = self.append(oIter)
-                sMarkup = self._format_set(oSet)
-                self.set(oIter, 0, sMarkup, 1, oSet.name)
-                self._dName2Iter[oSet.name] = oIter
-
-        if not self._dName2Iter:
+        for iId in sorted(aIds):
+            self._add_with_parents(iId, dSets)
+
+        self._check_if_empty()
+
+        if iSortColumn is not None:
+            self.set_sort_column_id(iSortColumn, iSortOrder)
+
+    def _add_with_parents(self, iId, dSets):
+        """Add the card set to the model, adding its parents first to
+           ensure they are shown in the view."""
+        sName, iParentId, bInUse = dSets[iId]
+        if sName in self._dName2Iter:
+            # We've already loaded this card set
+            return self._dName2Iter[sName]
+        oParIter = None
+        if iParentId in dSets:
+            oParIter = self._add_with_parents(iParentId, dSets)
+        return self._add_set(oParIter, sName, bInUse)
+
+    def _add_set(self, oParIter, sName, bInUse):
+        """Add a row for the card set below oParIter"""
+        if bInUse:
+            self._aInUse.add(sName)
+        oIter = self.append(oParIter)
+        self.set(oIter, 0, self._format_set(sName), 1, sName)
+        self._dName2Iter[sName] = oIter
+        return oIter
+
+    def _check_if_empty(self):
+        """Add or remove the empty entry as needed"""
+        if not self._dName2Iter and not self.oEmptyIter:
             # Showing nothing
             self.oEmptyIter = self.append(None)
             sText = self._get_empty_text()
             self.set(self.oEmptyIter, 0, sText)
+        elif self._dName2Iter and self.oEmptyIter:
+            self.remove(self.oEmptyIter)
+            self.oEmptyIter = None
 
-        if iSortColumn is not None:
-            self.set_sort_column_id(iSortColumn, iSortOrder)
+    def update_markup(self):
+        """Update the formatting of all the card sets, for when card set
+           panes are opened or closed."""
+        for sName, oIter in self._dName2Iter.iteritems():
+            self.set(oIter, 0, self._format_set(sName))
+
+    # Database signal handling
+
+    def listen_for_changes(self):
+        """Keep the model up to date by applying the card set creation,
+           deletion and update signals to the tree, rather than reloading.
+
+           This is only done while no filter is applied, since we can't
+           easily tell if the changed card sets match the filter."""
+        if not self._bListening:
+            listen_row_created(self.card_set_added, PhysicalCardSet)
+            listen_row_update(self.card_set_changed, PhysicalCardSet)
+            listen_row_destroy(self.card_set_deleted, PhysicalCardSet)
+            self._bListening = True
+
+    def cleanup(self):
+        """Disconnect the database listeners"""
+        if self._bListening:
+            disconnect_row_created(self.card_set_added, PhysicalCardSet)
+            disconnect_row_update(self.card_set_changed, PhysicalCardSet)
+            disconnect_row_destroy(self.card_set_deleted, PhysicalCardSet)
+            self._bListening = False
+
+    def follows_changes(self):
+        """Return True if the model is kept up to date by the database
+           signals"""
+        return self._bListening and not self.get_current_filter()
+
+    def card_set_added(self, _oCardSet, _dKW=None, fPostFuncs=None):
+        """Add new card sets to the tree once they've been created"""
+        if fPostFuncs is not None:
+            fPostFuncs.append(self._add_new_card_set)
+
+    def _add_new_card_set(self, oCardSet):
+        """Add the newly created card set to the tree"""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        if not self.follows_changes() or oCardSet.name in self._dName2Iter:
+            return
+        oParIter = None
+        if oCardSet.parentID:
+            oParIter = self._dName2Iter.get(oCardSet.parent.name)
+        self._add_set(oParIter, oCardSet.name, oCardSet.inuse)
+        self._check_if_empty()
+
+    def card_set_changed(self, oCardSet, dChanges):
+        """Update the tree for renamed, reparented and in use card sets.
+
+           This is called before the card set is updated, so the new values
+           are in dChanges."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        if not self.follows_changes() or \
+                oCardSet.name not in self._dName2Iter:
+            return
+        sName = oCardSet.name
+        oIter = self._dName2Iter[sName]
+        bInUse = sName in self._aInUse
+        if 'inuse' in dChanges:
+            bInUse = bool(dChanges['inuse'])
+        if 'name' in dChanges:
+            del self._dName2Iter[sName]
+            self._aInUse.discard(sName)
+            sName = dChanges['name']
+            self._dName2Iter[sName] = oIter
+        if bInUse:
+            self._aInUse.add(sName)
+        else:
+            self._aInUse.discard(sName)
+        if 'parentID' in dChanges and \
+                dChanges['parentID'] != oCardSet.parentID:
+            oParIter = None
+            if dChanges['parentID'] is not None:
+                oParent = PhysicalCardSet.get(dChanges['parentID'])
+                oParIter = self._dName2Iter.get(oParent.name)
+            if oParIter is None or not (oParent.id == oCardSet.id or
+                    self.is_ancestor(oIter, oParIter)):
+                # Loops will be undone by the caller, so we only move the
+                # row if it doesn't create one
+                oIter = self._move_row(oIter, oParIter)
+        self.set(oIter, 0, self._format_set(sName), 1, sName)
+
+    def _move_row(self, oIter, oParIter):
+        """Move the row at oIter, and all its children, below oParIter.
+
+           Returns the row's new iter."""
+        oNewIter = self.append(oParIter)
+        sName = self.get_name_from_iter(oIter)
+        self.set(oNewIter, 0, self.get_value(oIter, 0), 1, sName)
+        self._dName2Iter[sName] = oNewIter
+        # Moving the child removes it, so we always move the first child
+        oChildIter = self.iter_children(oIter)
+        while oChildIter:
+            self._move_row(oChildIter, oNewIter)
+            oChildIter = self.iter_children(oIter)
+        self.remove(oIter)
+        return oNewIter
+
+    # _fPostFuncs is passed by SQLObject 0.10, but not by 0.9, so we need to
+    # support both
+    def card_set_deleted(self, oCardSet, _fPostFuncs=None):
+        """Remove deleted card sets from the tree.
+
+           Any remaining children are moved up to the card set's parent."""
+        if not self.follows_changes() or \
+                oCardSet.name not in self._dName2Iter:
+            return
+        oIter = self._dName2Iter.pop(oCardSet.name)
+        self._aInUse.discard(oCardSet.name)
+        oParIter = self.iter_parent(oIter)
+        oChildIter = self.iter_children(oIter)
+        while oChildIter:
+            self._move_row(oChildIter, oParIter)
+            oChildIter = self.iter_children(oIter)
+        self.remove(oIter)
+        self._check_if_empty()
 
     def get_current_filter(self):
         """Get the current applied filter."""
@@ -166,26 +332,8 @@ class CardSetManagementModel(gtk.TreeStore):
 
     def get_path_from_name(self, sName):
         """Get the tree path corresponding to the name"""
-        def check_iter(oIter, sName):
-            """Recursively descend the children of the given gtk.TreeIter,
-               looking for a path matching sName."""
-            oPath = None
-            if sName == self.get_name_from_iter(oIter):
-                return self.get_path(oIter)
-            oChildIter = self.iter_children(oIter)
-            while oChildIter:
-                oPath = check_iter(oChildIter, sName)
-                if oPath:
-                    return oPath
-                oChildIter = self.iter_next(oChildIter)
-            return oPath
-
-        oIter = self.get_iter_root()
-        while oIter:
-            oPath = check_iter(oIter, sName)
-            if oPath:
-                return oPath
-            oIter = self.iter_next(oIter)
+        if sName in self._dName2Iter:
+            return self.get_path(self._dName2Iter[sName])
         return None
 
     def get_name_from_path(self, oPath):
@@ -46,6 +46,9 @@ class CardSetManagementView(CardSetsListView):
 
         self.set_name('card set management view')
 
+        # Follow the database changes, rather than reloading
+        self._oModel.listen_for_changes()
+
     def make_drag_icon(self, oWidget, oDragContext):
         """Drag begin signal handler to set custom icon"""
         sSetName = self.get_selected_card_set()
@@ -66,6 +66,8 @@ class CardSetView(CardListView):
         oModel.enable_sorting()
         if bStartEditable:
             oModel.bEditable = True
+        # Only add the expansion and card set rows when they're shown
+        oModel.bLazyChildren = True
         # The only path here is via the main window, so config_file exists
         super(CardSetView, self).__init__(oController, oMainWindow,
                 oModel, oMainWindow.config_file)
@@ -129,6 +131,7 @@ class CardSetView(CardListView):
 
         self.__iMapID = self.connect('map', self.mapped)
         self.connect('key-press-event', self.key_press)
+        self.connect('test-expand-row', self.add_row_children)
 
         self._oMenu = None
 
@@ -308,6 +311,12 @@ class CardSetView(CardListView):
 
     # functions related to tweaking widget display
 
+    def add_row_children(self, _oWidget, oIter, _oPath):
+        """Add the children of the row before it's expanded, if the model
+           has left them until needed."""
+        self._oModel.build_children(oIter)
+        return False  # Allow the row to expand
+
     def mapped(self, _oWidget):
         """Called when the view has been mapped, so we can twiddle the
            display
@@ -323,7 +332,10 @@ class CardSetView(CardListView):
         # panes moving, etc.
         self.disconnect(self.__iMapID)
         self.__iMapID = None
-        self.reload_keep_expanded()
+        if self.use_progressive_load():
+            self.load_progressively()
+        else:
+            self.reload_keep_expanded()
         # Allow other map signals to run as well (needed for drag-n-drop in
         # some gtk versions)
         return True
@@ -357,18 +369,30 @@ class CardSetView(CardListView):
             # skip loading until we're mapped, to save double loads in
             # some cases
             return
+        self.cancel_progressive_load()
         if hasattr(self._oMainWin, 'set_busy_cursor'):
             self._oMainWin.set_busy_cursor()
         self.freeze_child_notify()
         self.set_model(None)
         self._oModel.load()
         self.set_model(self._oModel)
-        self.oNumCell.set_property('foreground-gdk',
-                self._oModel.get_count_colour())
+        self.post_load()
         self.thaw_child_notify()
         if hasattr(self._oMainWin, 'restore_cursor'):
             self._oMainWin.restore_cursor()
 
+    def initial_load(self):
+        """Load the model when the pane is created.
+
+           We always wait until we're mapped (see mapped), so this
+           just calls load."""
+        self.load()
+
+    def post_load(self):
+        """Update the count colour to match the model"""
+        self.oNumCell.set_property('foreground-gdk',
+                self._oModel.get_count_colour())
+
     def set_color_edit_cue(self):
         """Set a visual cue that the card set is editable."""
         if not self._oModel.oEditColour:
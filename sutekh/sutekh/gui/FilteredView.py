@@ -8,6 +8,7 @@
 
 import gtk
 import unicodedata
+from sutekh.core.QueryProfiler import profile_operation
 from sutekh.gui.CustomDragIconView import CustomDragIconView
 
 
@@ -124,6 +125,7 @@ class FilteredView(CustomDragIconView):
         oFilter = self._oFilterDialog.get_filter()
         self.set_filter(oFilter, oMenu)
 
+    @profile_operation('Apply filter')
     def run_filter(self, bState):
         """Enable or disable the current filter based on bState"""
         if self._oModel.applyfilter != bState:
@@ -257,6 +259,7 @@ class FilteredView(CustomDragIconView):
         """set selection to multiple mode"""
         self._oSelection.set_mode(gtk.SELECTION_MULTIPLE)
 
+    @profile_operation('Apply filter')
     def set_filter(self, oFilter, oMenu=None):
         """Set the current filter to oFilter & apply it."""
         if oFilter:
@@ -15,6 +15,7 @@ from sutekh.core.SutekhObjects import AbstractCard, PhysicalCard, IExpansion, \
         Expansion, IPhysicalCard, IAbstractCard
 from sutekh.core.CardLookup import AbstractCardLookup, PhysicalCardLookup, \
         ExpansionLookup, LookupFailed, best_guess_filter
+from sutekh.core.CardNameIndex import NameIndexCache
 from sutekh.gui.SutekhDialog import SutekhDialog, do_complaint_error
 from sutekh.gui.CellRendererSutekhButton import CellRendererSutekhButton
 from sutekh.gui.PhysicalCardView import PhysicalCardView
@@ -323,6 +324,20 @@ class GuiLookup(AbstractCardLookup, PhysicalCardLookup, ExpansionLookup):
 
             aNewNames.append(sName)
 
+        if dUnknownCards:
+            # Names which only differ from a card name in the
+            # punctuation, accents and so on don't need to be checked by
+            # the user
+            # pylint: disable-msg=E1101
+            # SQLObject methods confuse pylint
+            oIndex = NameIndexCache.get_index()
+            for sName in dUnknownCards.keys():
+                sMatch = oIndex.exact_match(sName)
+                if sMatch is not None:
+                    dCards[sName] = AbstractCard.byCanonicalName(
+                            sMatch.encode('utf8').lower())
+                    del dUnknownCards[sName]
+
         if dUnknownCards:
             if not self._handle_unknown_abstract_cards(dUnknownCards, sInfo):
                 raise LookupFailed("Lookup of missing cards aborted by the"
@@ -615,11 +630,10 @@ class GuiLookup(AbstractCardLookup, PhysicalCardLookup, ExpansionLookup):
         oModel = oReplacementView.get_model()
 
         # Populate the model with the card names and best guesses
+        oIndex = NameIndexCache.get_index()
         for sName in dUnknownCards:
-            oBestGuessFilter = best_guess_filter(sName)
-            aCards = list(oBestGuessFilter.select(AbstractCard))
-            if len(aCards) == 1:
-                sBestGuess = aCards[0].name
+            sBestGuess = oIndex.best_match(sName)
+            if sBestGuess is not None:
                 iWeight = pango.WEIGHT_NORMAL
             else:
                 sBestGuess = NO_CARD
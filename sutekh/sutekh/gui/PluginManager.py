@@ -8,6 +8,7 @@
 import os
 import glob
 import logging
+import marshal
 import sutekh.gui.plugins as plugins
 from gobject import markup_escape_text
 import gtk
@@ -15,11 +16,17 @@ import zipimport
 import zipfile
 import re
 from sqlobject import sqlhub
+from sutekh.core.CardSetUtilities import count_map_cards
 from sutekh.core.DatabaseVersion import DatabaseVersion
-from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.core.SutekhObjects import PhysicalCardSet, TABLE_LIST
 from sutekh.gui.ConfigFile import CARDSET, WW_CARDLIST, CARDSET_LIST, FRAME
 from sutekh.gui.MessageBus import MessageBus, CONFIG_MSG, DATABASE_MSG
 from sutekh.gui.SutekhDialog import do_complaint_warning
+from sutekh.SutekhInfo import SutekhInfo
+from sutekh.SutekhUtility import prefs_dir
+
+# Bump this if the layout of the manifest changes
+MANIFEST_VERSION = 1
 
 
 def submodules(oPackage):
@@ -51,46 +58,386 @@ def submodules(oPackage):
     return list(aModules)
 
 
+def get_manifest_file():
+    """Return the default location of the plugin manifest cache."""
+    return os.path.join(prefs_dir("Sutekh"), "plugin_manifest.cache")
+
+
+def _get_model_key(cModelType):
+    """Return the key used for a model type in the manifest.
+
+       Model types are either strings or SQLObject classes, so we use the
+       class name for classes."""
+    if isinstance(cModelType, basestring):
+        return cModelType
+    return getattr(cModelType, '__name__', str(cModelType))
+
+
+def _get_menu_label(oMenuItem):
+    """Return the text of a simple menu item, including any mnemonic"""
+    return oMenuItem.get_child().get_label()
+
+
+def _get_menu_list(aMenuItems):
+    """Return the menu items returned by get_menu_item as a list of
+       ('Menu', gtk.MenuItem) pairs."""
+    if aMenuItems is None:
+        return []
+    if not isinstance(aMenuItems, list):
+        if not isinstance(aMenuItems, tuple):
+            # Just straight menu item
+            return [('Plugins', aMenuItems)]
+        # Wrap tuple in a list
+        return [aMenuItems]
+    return aMenuItems
+
+
+def _add_menu_items(aMenuItems, dAllMenus, oCatchAllMenu):
+    """Add the ('Menu', gtk.MenuItem) pairs to the frame's menus"""
+    for sMenu, oMenuItem in aMenuItems:
+        if sMenu in dAllMenus:
+            dAllMenus[sMenu].add(oMenuItem)
+        else:
+            # Plugins acts as a catchall Menu
+            oCatchAllMenu.add(oMenuItem)
+
+
+class PluginInfo(object):
+    """The manifest entry for a plugin.
+
+       This holds what we need to know about the plugin without importing
+       it - the supported models, table versions and config specs, and,
+       for plugins which allow lazy loading, the menu entries they added
+       the last time they were used with each model type. The plugin
+       module is only imported when the class is actually needed."""
+
+    def __init__(self, sModule, dEntry, cPlugin=None):
+        self.sModule = sModule
+        self._dEntry = dEntry
+        self._cPlugin = cPlugin
+        self._bFailed = False
+
+    # pylint: disable-msg=W0212
+    # we allow access to the members via these properties
+    name = property(fget=lambda self: self._dEntry['name'],
+            doc="Class name of the plugin")
+    entry = property(fget=lambda self: self._dEntry,
+            doc="Manifest entry for the plugin")
+    # pylint: enable-msg=W0212
+
+    @classmethod
+    def from_class(cls, sModule, cPlugin):
+        """Create the manifest entry from the plugin class"""
+        dTables = {}
+        for oTable, aVersions in cPlugin.dTableVersions.iteritems():
+            dTables[oTable.sqlmeta.table] = tuple(aVersions)
+        dEntry = {
+                'name': cPlugin.__name__,
+                'models': tuple([_get_model_key(x) for x in
+                    cPlugin.aModelsSupported]),
+                'tables': dTables,
+                'config': (dict(cPlugin.dGlobalConfig),
+                    dict(cPlugin.dPerPaneConfig),
+                    dict(cPlugin.dCardListConfig),
+                    dict(cPlugin.dCardSetListConfig)),
+                'lazy': bool(cPlugin.bLazyLoad),
+                'menus': {},
+                }
+        return cls(sModule, dEntry, cPlugin)
+
+    def supports(self, cModelType):
+        """Check whether the plugin will do anything for this model type"""
+        return _get_model_key(cModelType) in self._dEntry['models']
+
+    def register_with_config(self, oConfig):
+        """Register the plugin's config specs with the given config."""
+        dGlobal, dPerPane, dCardList, dCardSetList = self._dEntry['config']
+        oConfig.add_plugin_specs(self.name, dGlobal)
+        oConfig.add_deck_specs(self.name, dPerPane)
+        oConfig.add_cardlist_specs(self.name, dCardList)
+        oConfig.add_cardset_list_specs(self.name, dCardSetList)
+
+    def check_versions(self):
+        """Check the table versions, as SutekhPlugin.check_versions does,
+           without needing the plugin class."""
+        dTables = dict([(x.sqlmeta.table, x) for x in TABLE_LIST])
+        oDBVer = DatabaseVersion()
+        for sTable, aVersions in self._dEntry['tables'].iteritems():
+            if sTable not in dTables or not oDBVer.check_table_in_versions(
+                    dTables[sTable], aVersions):
+                return False
+        return True
+
+    def get_class(self):
+        """Return the plugin class, importing the module if needed.
+
+           Returns None if the module can't be loaded."""
+        if self._cPlugin is None and not self._bFailed:
+            cPlugin = _import_plugin(self.sModule)
+            if cPlugin is not None and cPlugin.__name__ == self.name:
+                self._cPlugin = cPlugin
+            else:
+                self._bFailed = True
+        return self._cPlugin
+
+    def get_menus(self, cModelType):
+        """Return the recorded ('Menu', label) pairs for the model type.
+
+           Returns None if the plugin needs to be loaded to create its
+           menus."""
+        if not self._dEntry['lazy']:
+            return None
+        return self._dEntry['menus'].get(_get_model_key(cModelType), None)
+
+    def record_menus(self, cModelType, aMenuItems):
+        """Record the menu items the plugin created for the model type.
+
+           Only simple menu items can be recreated by the LazyPlugin, so
+           anything else means the plugin is always loaded."""
+        aMenus = []
+        for sMenu, oMenuItem in _get_menu_list(aMenuItems):
+            if type(oMenuItem) is not gtk.MenuItem or \
+                    oMenuItem.get_submenu() is not None:
+                self._dEntry['lazy'] = False
+                return
+            aMenus.append((sMenu, _get_menu_label(oMenuItem)))
+        self._dEntry['menus'][_get_model_key(cModelType)] = aMenus
+
+
+class LazyPlugin(object):
+    """Stand-in for a plugin which only adds simple menu items.
+
+       The menu items are created from the manifest, and the plugin is
+       imported and created the first time one of them is activated."""
+
+    def __init__(self, oInfo, oCardListView, oCardListModel, cModelType):
+        self._oInfo = oInfo
+        self._tArgs = (oCardListView, oCardListModel, cModelType)
+        self._oPlugin = None
+        self._dMenuItems = None
+
+    def add_to_menu(self, dAllMenus, oCatchAllMenu):
+        """Add the recorded menu items to the frame"""
+        if not self._oInfo.check_versions():
+            return
+        aMenuItems = []
+        for sMenu, sLabel in self._oInfo.get_menus(self._tArgs[2]):
+            oMenuItem = gtk.MenuItem(sLabel)
+            oMenuItem.connect("activate", self.activate, sLabel)
+            aMenuItems.append((sMenu, oMenuItem))
+        _add_menu_items(aMenuItems, dAllMenus, oCatchAllMenu)
+
+    def activate(self, _oWidget, sLabel):
+        """Load the plugin and pass on the activation to the real menu
+           item"""
+        if self._dMenuItems is None:
+            cPlugin = self._oInfo.get_class()
+            if cPlugin is None:
+                return
+            # pylint: disable-msg=W0142
+            # ** magic OK here
+            self._oPlugin = cPlugin(*self._tArgs)
+            self._dMenuItems = {}
+            for _sMenu, oMenuItem in _get_menu_list(
+                    self._oPlugin.get_menu_item()):
+                self._dMenuItems[_get_menu_label(oMenuItem)] = oMenuItem
+        if sLabel in self._dMenuItems:
+            self._dMenuItems[sLabel].activate()
+
+    # pylint: disable-msg=R0201
+    # These match the SutekhPlugin API
+    def setup(self):
+        """Lazy plugins don't need any setup"""
+        return None
+
+    def get_toolbar_widget(self):
+        """Lazy plugins don't have toolbar widgets"""
+        return None
+
+    def get_frame_from_config(self, _sType):
+        """Lazy plugins don't supply frames"""
+        return None
+
+    # pylint: enable-msg=R0201
+
+    def cleanup(self):
+        """Cleanup the plugin, if it has been loaded"""
+        if self._oPlugin is not None:
+            self._oPlugin.cleanup()
+        self._oPlugin = None
+        self._dMenuItems = None
+
+
+def _import_plugin(sPluginName):
+    """Import the plugin module and return the plugin class.
+
+       Returns None if the module can't be imported or doesn't contain a
+       plugin."""
+    # pylint: disable-msg=C0103
+    # mPlugin is legal name here
+    try:
+        mPlugin = __import__("sutekh.gui.plugins.%s" % sPluginName,
+                None, None, [plugins])
+    except ImportError, oExp:
+        logging.warn("Failed to load plugin %s (%s).",
+                sPluginName, oExp, exc_info=1)
+        return None
+
+    # find plugin class
+    try:
+        cPlugin = mPlugin.plugin
+    except AttributeError, oExp:
+        logging.warn("Plugin module %s appears not to contain a"
+                " plugin (%s).", sPluginName, oExp, exc_info=1)
+        return None
+
+    if not issubclass(cPlugin, SutekhPlugin):
+        return None
+    return cPlugin
+
+
+def _get_manifest_key(aModules):
+    """Return the key identifying the plugin modules a manifest is valid
+       for.
+
+       This covers the Sutekh version and the modification times of the
+       plugin modules, so adding or changing a plugin rebuilds the
+       manifest."""
+    oLoader = getattr(plugins, "__loader__", None)
+    if type(oLoader) is zipimport.zipimporter:
+        aStamps = [(oLoader.archive, os.path.getmtime(oLoader.archive))]
+    else:
+        sPackageDir = os.path.dirname(plugins.__file__)
+        aStamps = []
+        for sModule in sorted(aModules):
+            for sExt in ('.py', '.pyc', '.pyo'):
+                sFile = os.path.join(sPackageDir, sModule + sExt)
+                if os.path.exists(sFile):
+                    aStamps.append((sModule, os.path.getmtime(sFile)))
+                    break
+    return (MANIFEST_VERSION, SutekhInfo.VERSION_STR, tuple(aStamps))
+
+
 class PluginManager(object):
     """Manages plugins for Sutekh
 
        Plugin modules should be placed in the plugins package directory and
        contain an attribute named 'plugin' which points to the plugin class the
        module contains.
+
+       The details of the plugins are kept in a manifest cached on disk,
+       so the plugin modules are only imported when a plugin supports a
+       pane's model, and plugins which set bLazyLoad are only imported
+       when their menu items are first used.
        """
 
-    def __init__(self):
+    def __init__(self, sManifestFile=None):
         self._aPlugins = []
+        self._sManifestFile = sManifestFile
+        self._tKey = None
 
     def load_plugins(self):
-        """Load list of Plugin Classes from plugin dir."""
-        for sPluginName in submodules(plugins):
-            # load module
-            # pylint: disable-msg=C0103
-            # mPlugin is legal name here
-            try:
-                mPlugin = __import__("sutekh.gui.plugins.%s" % sPluginName,
-                        None, None, [plugins])
-            except ImportError, oExp:
-                logging.warn("Failed to load plugin %s (%s).",
-                        sPluginName, oExp, exc_info=1)
+        """Load the list of plugins, from the manifest if it's still valid
+           or from the plugin dir."""
+        aModules = submodules(plugins)
+        self._tKey = _get_manifest_key(aModules)
+        if self._load_manifest():
+            return
+        bComplete = True
+        for sPluginName in aModules:
+            cPlugin = _import_plugin(sPluginName)
+            if cPlugin is None:
+                bComplete = False
                 continue
+            self._aPlugins.append(PluginInfo.from_class(sPluginName,
+                cPlugin))
+        # Don't cache failed imports, so fixing the problem isn't hidden
+        # by the manifest
+        if bComplete:
+            self.save_manifest()
+
+    def _load_manifest(self):
+        """Load the plugin list from the manifest.
+
+           Returns False if the manifest is missing or out of date."""
+        if self._sManifestFile is None or \
+                not os.path.exists(self._sManifestFile):
+            return False
+        try:
+            fIn = open(self._sManifestFile, 'rb')
+            try:
+                tKey, aEntries = marshal.load(fIn)
+            finally:
+                fIn.close()
+        except (IOError, OSError, ValueError, EOFError, TypeError), oErr:
+            logging.warn('Unable to read plugin manifest %s: %s',
+                    self._sManifestFile, oErr)
+            return False
+        if tKey != self._tKey:
+            return False
+        self._aPlugins = [PluginInfo(sModule, dEntry) for sModule, dEntry
+                in aEntries]
+        return True
 
-            # find plugin class
+    def save_manifest(self):
+        """Write the manifest to the manifest file, if we have one."""
+        if self._sManifestFile is None:
+            return
+        aEntries = [(oInfo.sModule, oInfo.entry) for oInfo in
+                self._aPlugins]
+        sTempFile = self._sManifestFile + '.tmp'
+        try:
+            sData = marshal.dumps((self._tKey, aEntries))
+            fOut = open(sTempFile, 'wb')
             try:
-                cPlugin = mPlugin.plugin
-            except AttributeError, oExp:
-                logging.warn("Plugin module %s appears not to contain a"
-                        " plugin (%s).", sPluginName, oExp, exc_info=1)
+                fOut.write(sData)
+            finally:
+                fOut.close()
+            if os.path.exists(self._sManifestFile):
+                # Needed for windows, which won't rename over existing files
+                os.remove(self._sManifestFile)
+            os.rename(sTempFile, self._sManifestFile)
+        except (IOError, OSError, ValueError), oErr:
+            logging.warn('Unable to write plugin manifest %s: %s',
+                    self._sManifestFile, oErr)
+
+    def register_with_config(self, oConfig):
+        """Register the config specs of all the plugins with the config."""
+        for oInfo in self._aPlugins:
+            oInfo.register_with_config(oConfig)
+
+    def create_plugins(self, oCardListView, oCardListModel, cModelType):
+        """Create the plugins for a pane (or the main window).
+
+           Only plugins which support the model type are created, and
+           LazyPlugin stand-ins are used for plugins which don't need
+           to be loaded yet."""
+        aPlugins = []
+        bChanged = False
+        for oInfo in self._aPlugins:
+            if not oInfo.supports(cModelType):
                 continue
-
-            # add to appropriate plugin lists
-            if issubclass(cPlugin, SutekhPlugin):
-                self._aPlugins.append(cPlugin)
+            if oInfo.get_menus(cModelType) is not None:
+                aPlugins.append(LazyPlugin(oInfo, oCardListView,
+                    oCardListModel, cModelType))
+                continue
+            cPlugin = oInfo.get_class()
+            if cPlugin is None:
+                continue
+            oPlugin = cPlugin(oCardListView, oCardListModel, cModelType)
+            if oInfo.entry['lazy'] and oPlugin.check_versions():
+                # Record the menus, so we can be lazy next time
+                oInfo.record_menus(cModelType, oPlugin.get_menu_item())
+                bChanged = True
+            aPlugins.append(oPlugin)
+        if bChanged:
+            self.save_manifest()
+        return aPlugins
 
     def get_card_list_plugins(self):
-        """Get all the plugins loaded"""
-        return list(self._aPlugins)
+        """Get all the plugin classes, importing them if needed"""
+        return [oInfo.get_class() for oInfo in self._aPlugins
+                if oInfo.get_class() is not None]
 
 
 class PluginConfigFileListener(object):
@@ -151,6 +498,9 @@ class SutekhPlugin(object):
     """Base class for card list plugins."""
     dTableVersions = {}
     aModelsSupported = ()
+    # Plugins which only add simple menu items can set this, so they're
+    # only loaded when the menu item is first used
+    bLazyLoad = False
 
     # ConfigObj validation specs as dictionaries
     dGlobalConfig = {}
@@ -197,21 +547,8 @@ class SutekhPlugin(object):
 
     def add_to_menu(self, dAllMenus, oCatchAllMenu):
         """Grunt work of adding menu item to the frame"""
-        aMenuItems = self.get_menu_item()
-        if aMenuItems is not None:
-            if not isinstance(aMenuItems, list):
-                if not isinstance(aMenuItems, tuple):
-                    # Just straight menu item
-                    aMenuItems = [('Plugins', aMenuItems)]
-                else:
-                    # Wrap tuple in a list
-                    aMenuItems = [aMenuItems]
-            for sMenu, oMenuItem in aMenuItems:
-                if sMenu in dAllMenus:
-                    dAllMenus[sMenu].add(oMenuItem)
-                else:
-                    # Plugins acts as a catchall Menu
-                    oCatchAllMenu.add(oMenuItem)
+        _add_menu_items(_get_menu_list(self.get_menu_item()), dAllMenus,
+                oCatchAllMenu)
 
     # pylint: disable-msg=R0201
     # We expect children to override these when needed
@@ -298,18 +635,19 @@ class SutekhPlugin(object):
         return oCardSet
 
     def get_all_cards(self):
-        """Get the cards from the card set."""
+        """Get the cards from the card set, with an entry for each copy
+           of the card."""
         if self._cModelType is PhysicalCardSet:
-            return self.model.get_card_iterator(None)
+            return self.model.get_card_copies(None)
         return []
 
     def check_cs_size(self, sName, iLimit):
         """Check that the card set isn't considerably larger than we
            expect to deal with and warn the user if it is"""
         iCards = 0
-        aCards = self.get_all_cards()
-        if aCards:
-            iCards = aCards.count()
+        if self._cModelType is PhysicalCardSet:
+            # Count the copies without expanding the mapping entries
+            iCards = count_map_cards(self.model.get_card_iterator(None))
         if iCards > iLimit:
             iRes = do_complaint_warning("This card set is very large"
                     " (%d cards), and so using the %s plugin doesn't seem"
@@ -21,7 +21,12 @@ from pkg_resources import resource_stream, resource_exists
 from itertools import chain
 # pylint: enable-msg=E0611
 from sqlobject import SQLObjectNotFound
-from sutekh.core.SutekhObjectCache import SutekhObjectCache
+from sutekh.core.SutekhObjectCache import SutekhObjectCache, \
+        get_snapshot_file
+from sutekh.core.Filters import set_card_index
+from sutekh.core.CryptSignatureIndex import flush_signature_index
+from sutekh.core.CardSetCountStore import CardSetCountStore, \
+        set_card_set_counts, get_card_set_counts
 from sutekh.core.SutekhObjects import PhysicalCardSet, flush_cache, \
         PhysicalCard, IAbstractCard
 from sutekh.gui.MultiPaneWindow import MultiPaneWindow
@@ -33,7 +38,7 @@ from sutekh.gui.MainMenu import MainMenu
 from sutekh.gui.GuiCardLookup import GuiLookup
 from sutekh.gui.GuiCardSetFunctions import break_existing_loops
 from sutekh.gui.CardSetManagementFrame import CardSetManagementFrame
-from sutekh.gui.PluginManager import PluginManager
+from sutekh.gui.PluginManager import PluginManager, get_manifest_file
 from sutekh.gui.GuiDBManagement import refresh_ww_card_list
 from sutekh.gui import SutekhIcon
 from sutekh.gui.MessageBus import MessageBus, DATABASE_MSG
@@ -68,6 +73,7 @@ class SutekhMainWindow(MultiPaneWindow):
 
         self._sCardSelection = ''  # copy + paste selection
         self._aPlugins = []
+        self._bProgressiveLoad = False
         self.__dMenus = {}
 
         # CardText frame is special, and there is only ever one of it
@@ -83,10 +89,15 @@ class SutekhMainWindow(MultiPaneWindow):
 
     # pylint: disable-msg=W0201
     # We define attributes here, since this is called after database checks
-    def setup(self, oConfig):
+    def setup(self, oConfig, bProgressiveLoad=False):
         """After database checks are passed, setup what we need to display
-           data from the database."""
+           data from the database.
+
+           If bProgressiveLoad is True, the card list panes are filled
+           from idle callbacks once they're shown, rather than all being
+           loaded before the window is responsive."""
         self._oConfig = oConfig
+        self._bProgressiveLoad = bProgressiveLoad
         self._oCardLookup = GuiLookup(self._oConfig)
 
         # Check database is correctly populated
@@ -104,13 +115,12 @@ class SutekhMainWindow(MultiPaneWindow):
                 refresh_ww_card_list(self)
 
         # Load plugins
-        self._oPluginManager = PluginManager()
+        self._oPluginManager = PluginManager(get_manifest_file())
         self._oPluginManager.load_plugins()
-        for cPlugin in self._oPluginManager.get_card_list_plugins():
-            # Find plugins that will work on the Main Window
-            self._aPlugins.append(cPlugin(self, None,
-                "MainWindow"))
-            cPlugin.register_with_config(oConfig)
+        self._oPluginManager.register_with_config(oConfig)
+        # Find plugins that will work on the Main Window
+        self._aPlugins = self._oPluginManager.create_plugins(self, None,
+                "MainWindow")
 
         # Re-validate config after adding plugin specs
         oValidationResults = oConfig.validate()
@@ -123,8 +133,15 @@ class SutekhMainWindow(MultiPaneWindow):
                     "\n".join(aErrors))
         oConfig.sanitize()
 
-        # Create object cache
-        self.__oSutekhObjectCache = SutekhObjectCache()
+        # Create object cache, using the snapshot if it's still valid
+        self.__oSutekhObjectCache = SutekhObjectCache(get_snapshot_file())
+        # Evaluate filters in memory where possible
+        set_card_index(self.__oSutekhObjectCache.get_card_index())
+        # Card counts shared by the card set panes. This must be created
+        # before the panes, so it sees card changes before they do.
+        if get_card_set_counts():
+            get_card_set_counts().cleanup()
+        set_card_set_counts(CardSetCountStore())
 
         # Create global icon manager
         self._oIconManager = GuiIconManager(oConfig.get_icon_path())
@@ -160,6 +177,8 @@ class SutekhMainWindow(MultiPaneWindow):
     # Needed for plugins
     plugin_manager = property(fget=lambda self: self._oPluginManager,
             doc="The plugin manager for the application")
+    progressive_load = property(fget=lambda self: self._bProgressiveLoad,
+            doc="Whether card list panes are loaded progressively")
     plugins = property(fget=lambda self: self._aPlugins,
             doc="Plugins enabled for the main window.")
     config_file = property(fget=lambda self: self._oConfig,
@@ -349,7 +368,7 @@ class SutekhMainWindow(MultiPaneWindow):
     def reload_pcs_list(self):
         """Reload the list of physical card sets."""
         if self._oPCSListPane is not None:
-            self._oPCSListPane.reload()
+            self._oPCSListPane.update_list()
 
     def update_to_new_db(self):
         """Resync panes against the database.
@@ -360,8 +379,13 @@ class SutekhMainWindow(MultiPaneWindow):
            """
         # Flush the caches, so we don't hit stale lookups
         flush_cache()
-        # Reset the lookup cache holder
-        self.__oSutekhObjectCache = SutekhObjectCache()
+        # Reset the lookup cache holder. The card list may have changed,
+        # so we always rewrite the snapshot
+        self.__oSutekhObjectCache = SutekhObjectCache(get_snapshot_file(),
+                True)
+        set_card_index(self.__oSutekhObjectCache.get_card_index())
+        get_card_set_counts().flush()
+        flush_signature_index()
         # We publish here, after we've cleared the caches
         MessageBus.publish(DATABASE_MSG, "update_to_new_db")
 
@@ -375,6 +399,11 @@ class SutekhMainWindow(MultiPaneWindow):
 
     def clear_cache(self):
         """Remove the cached set of objects, for card list reloads, etc."""
+        # The card index, card set counts and crypt signatures will be stale
+        # as well
+        set_card_index(None)
+        get_card_set_counts().flush()
+        flush_signature_index()
         del self.__oSutekhObjectCache
 
     def get_editable_panes(self):
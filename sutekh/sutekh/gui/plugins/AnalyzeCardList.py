@@ -475,14 +475,14 @@ class AnalyzeCardList(SutekhPlugin):
         dCardLists = {}
 
         aAllPhysCards = [IPhysicalCard(x) for x in
-                self.model.get_card_iterator(None)]
+                self.model.get_card_copies(None)]
         aAllCards = _get_abstract_cards(aAllPhysCards)
 
         for sCardType in dConstruct:
             if sCardType not in SPECIAL:
                 oFilter = CardTypeFilter(sCardType)
                 dCardLists[sCardType] = _get_abstract_cards(
-                        self.model.get_card_iterator(oFilter))
+                        self.model.get_card_copies(oFilter))
                 self.dTypeNumbers[sCardType] = len(dCardLists[sCardType])
             elif sCardType == 'Multirole':
                  # Multirole values start empty, and are filled in later
@@ -491,7 +491,7 @@ class AnalyzeCardList(SutekhPlugin):
             elif sCardType == 'Not Tournament Legal Cards':
                 oFilter = FilterNot(self.model.oLegalFilter)
                 dCardLists[sCardType] = _get_abstract_cards(
-                        self.model.get_card_iterator(oFilter))
+                        self.model.get_card_copies(oFilter))
                 self.dTypeNumbers[sCardType] = len(dCardLists[sCardType])
                 if bRapid:
                     try:
@@ -499,7 +499,7 @@ class AnalyzeCardList(SutekhPlugin):
                             oKeyword = IKeyword(sType)
                             oFilter = KeywordFilter(oKeyword)
                             dCardLists[sType] = _get_abstract_cards(
-                                    self.model.get_card_iterator(oFilter))
+                                    self.model.get_card_copies(oFilter))
                             self.dTypeNumbers[sType] = \
                                     len(dCardLists[sType])
                     except SQLObjectNotFound:
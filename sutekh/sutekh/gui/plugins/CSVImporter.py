@@ -28,6 +28,7 @@ class CSVImporter(SutekhPlugin):
         PhysicalCardSet: (4, 5, 6),
     }
     aModelsSupported = ("MainWindow",)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Overrides method from base class. Register on the 'Import' menu"""
@@ -65,6 +65,7 @@ class CardSetCompare(SutekhPlugin):
        """
     dTableVersions = {PhysicalCardSet: (5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Register on the 'Analyze' menu."""
@@ -26,6 +26,7 @@ class CardSetExport(SutekhPlugin):
        the appropriate writer to produce the required output."""
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     _dExporters = {
             # sKey : (writer, menu name, extension, [filter name,
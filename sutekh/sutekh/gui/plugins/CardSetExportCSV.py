@@ -19,6 +19,7 @@ class CardSetExportCSV(SutekhPlugin):
        WriteCSV to produce the required output."""
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Register on the 'Export Card Set' Menu"""
@@ -17,6 +17,7 @@ class DeckFromFilter(SutekhPlugin):
 
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet, PhysicalCard)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Register on the 'Filter' Menu"""
@@ -43,7 +44,7 @@ class DeckFromFilter(SutekhPlugin):
         # pylint misses PhysicalCardSet methods
         oCS = IPhysicalCardSet(sCSName)
         aCards = [IPhysicalCard(x) for x in
-                self.model.get_card_iterator(self.model.get_current_filter())]
+                self.model.get_card_copies(self.model.get_current_filter())]
         self._commit_cards(oCS, aCards)
         return oCS
 
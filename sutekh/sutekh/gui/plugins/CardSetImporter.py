@@ -33,6 +33,7 @@ class ACSImporter(SutekhPlugin):
        """
     dTableVersions = {PhysicalCardSet: (5, 6)}
     aModelsSupported = ("MainWindow",)
+    bLazyLoad = True
 
     # pylint: disable-msg=W0142
     # ** magic OK
@@ -70,6 +70,7 @@ class CardSetIndependence(SutekhPlugin):
        """
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Register with the 'Analyze' Menu"""
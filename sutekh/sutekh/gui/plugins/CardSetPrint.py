@@ -44,6 +44,7 @@ class CardSetPrint(SutekhPlugin):
        """
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     dOptions = {
             'No Expansion info': NO_EXPANSION,
@@ -205,7 +206,7 @@ class CardSetPrint(SutekhPlugin):
         aMarkup.append("  Annotations: %s" % self.escape(oCS.annotations))
         aMarkup.append("")
 
-        oCardIter = self.model.get_card_iterator(None)
+        oCardIter = self.model.get_card_copies(None)
         oGroupedIter = self.model.groupby(oCardIter, IAbstractCard)
 
         # Iterate over groups
@@ -29,6 +29,7 @@ class ClanDisciplineStats(SutekhPlugin):
 
     dTableVersions = {}
     aModelsSupported = (PhysicalCard,)
+    bLazyLoad = True
 
     # pylint: disable-msg=W0142
     # **magic OK here
@@ -12,6 +12,7 @@ from sutekh.core.SutekhObjects import PhysicalCard, \
                                       PhysicalCardSet, \
                                       IPhysicalCard
 from sutekh.core.CardListTabulator import CardListTabulator
+from sutekh.core.CardClustering import HAVE_NUMPY, k_means
 from sutekh.gui.PluginManager import SutekhPlugin
 from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
 from sutekh.gui.SutekhDialog import SutekhDialog, do_complaint_error
@@ -48,6 +49,7 @@ class ClusterCardList(SutekhPlugin):
         self._oAutoNumClusters = None
         self._oNumClustersSpin = None
         self._oNumIterSpin = None
+        self._oSeedSpin = None
 
     # pylint: enable-msg=W0142
 
@@ -198,6 +200,17 @@ class ClusterCardList(SutekhPlugin):
 
         self._oAutoNumClusters.connect("toggled", auto_toggled)
 
+        # Random seed, so runs can be repeated
+        oSeedLabel = gtk.Label("Random Seed (0 for a random start):")
+        self._oSeedSpin = gtk.SpinButton()
+        self._oSeedSpin.set_range(0, 2 ** 31 - 1)
+        self._oSeedSpin.set_increments(1, 100)
+        self._oSeedSpin.set_value(0)
+        oHbox = gtk.HBox(False, 0)
+        oHbox.pack_start(oSeedLabel, False)  # left align
+        oHbox.pack_end(self._oSeedSpin, False)  # right align
+        oVbx.pack_start(oHbox, False)
+
         # Separator
         oVbx.pack_start(gtk.HSeparator(), False, False, 10)
 
@@ -327,12 +340,13 @@ class ClusterCardList(SutekhPlugin):
                 self._fMakeCardSetFromCluster(iId)
 
     @staticmethod
-    def k_means_plus_plus(aCards, iNumClust, fDist):
+    def k_means_plus_plus(aCards, iNumClust, fDist, oRandom=random):
         """Find a set of initial centers using the k-means++ algorithm.
 
            See http://www.stanford.edu/~darthur/kMeansPlusPlus.pdf.
+           oRandom is used for the random choices.
            """
-        aMeans = [random.choice(aCards)]
+        aMeans = [oRandom.choice(aCards)]
 
         while len(aMeans) < iNumClust:
             aDists = []
@@ -341,7 +355,7 @@ class ClusterCardList(SutekhPlugin):
                 aDists.append(fMinD)
 
             fSumSq = sum(aDists)
-            fPick = random.uniform(0, fSumSq)
+            fPick = oRandom.uniform(0, fSumSq)
 
             for iCard, fMinD in enumerate(aDists):
                 fPick -= fMinD
@@ -361,15 +375,21 @@ class ClusterCardList(SutekhPlugin):
 
         return aMeans
 
-    def k_means(self, aCards, iNumClust, iIterations, fDist):
+    # pylint: disable-msg=R0913
+    # We need all these arguments
+    def k_means(self, aCards, iNumClust, iIterations, fDist, iSeed=None):
         """Perform k-means clustering on a list of cards using Lloyd's
-           algorithm."""
+           algorithm.
+
+           This is the pure python version, used when NumPy isn't
+           available."""
         if (not aCards) or (not aCards[0]):
             # empty card set or zero-length vectors
             return [], []
 
         aCards = [Vector(x) for x in aCards]
-        aMeans = self.k_means_plus_plus(aCards, iNumClust, fDist)
+        aMeans = self.k_means_plus_plus(aCards, iNumClust, fDist,
+                random.Random(iSeed))
         iCards = len(aCards)
 
         # just do a fixed number of interations (no complex stopping condition)
@@ -395,10 +415,12 @@ class ClusterCardList(SutekhPlugin):
 
         return aMeans, aClusters
 
+    # pylint: enable-msg=R0913
+
     def do_clustering(self):
         """Call the chosen clustering algorithm"""
         # gather cards
-        aCards = list(self.model.get_card_iterator(None))
+        aCards = self.model.get_card_copies(None)
 
         # gather property functions
         dPropFuncs = {}
@@ -414,7 +436,10 @@ class ClusterCardList(SutekhPlugin):
 
         # make tabulator and get table
         oTab = CardListTabulator(aColNames, dPropFuncs)
-        aTable = oTab.tabulate(aCards)
+        if HAVE_NUMPY:
+            aTable = oTab.tabulate_array(aCards)
+        else:
+            aTable = oTab.tabulate(aCards)
 
         # set k-means parameters
         if self._oAutoNumClusters.get_active():
@@ -422,19 +447,23 @@ class ClusterCardList(SutekhPlugin):
         else:
             iNumClusts = max(2, int(self._oNumClustersSpin.get_value()))
         iIterations = max(2, int(self._oNumIterSpin.get_value()))
+        iSeed = int(self._oSeedSpin.get_value()) or None
         for oBut in self._aDistanceMeasureGroup:
             if oBut.get_active():
                 sName = oBut.get_label()
-                fDist = Vector.METRICS[sName]
                 break
         else:
-            fDist = Vector.METRICS['Euclidean Distance']
+            sName = 'Euclidean Distance'
 
         # aMeans -> list of vectors of cluster centroids
         # aClusters -> list of clusters, each cluster is a list of card indexes
 
-        aMeans, aClusters = self.k_means(aTable, iNumClusts, iIterations,
-                fDist)
+        if HAVE_NUMPY:
+            aMeans, aClusters = k_means(aTable, iNumClusts, iIterations,
+                    sName, iSeed)
+        else:
+            aMeans, aClusters = self.k_means(aTable, iNumClusts,
+                    iIterations, Vector.METRICS[sName], iSeed)
 
         self._populate_results(aCards, aColNames, aMeans, aClusters)
 
@@ -28,6 +28,7 @@ class ExpansionStats(SutekhPlugin):
 
     dTableVersions = {}
     aModelsSupported = (PhysicalCard,)
+    bLazyLoad = True
 
     # pylint: disable-msg=W0142
     # **magic OK here
@@ -14,9 +14,11 @@ from sutekh.core.SutekhObjects import PhysicalCardSet, IPhysicalCardSet, \
         MapPhysicalCardToPhysicalCardSet
 from sutekh.core.Filters import PhysicalCardSetFilter, CryptCardFilter, \
         FilterAndBox
+from sutekh.core.CardSetUtilities import count_map_cards
 from sutekh.core.DBSignals import listen_row_destroy, listen_row_update, \
         listen_row_created, listen_changed, disconnect_changed, \
-        disconnect_row_destroy, disconnect_row_update, disconnect_row_created
+        disconnect_row_destroy, disconnect_row_update, \
+        disconnect_row_created, listen_bulk_changed, disconnect_bulk_changed
 from sqlobject import SQLObjectNotFound
 
 SORT_COLUMN_OFFSET = 200  # ensure we don't clash with other extra columns
@@ -106,6 +108,7 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
             listen_row_destroy(self.card_set_added_deleted, PhysicalCardSet)
             listen_row_created(self.card_set_added_deleted, PhysicalCardSet)
             listen_changed(self.card_changed, PhysicalCardSet)
+            listen_bulk_changed(self.cards_changed, PhysicalCardSet)
             self.perpane_config_updated()
     # pylint: enable-msg=W0142
 
@@ -113,6 +116,7 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
         """Disconnect the database listeners"""
         if self.check_versions() and self.check_model_type():
             disconnect_changed(self.card_changed, PhysicalCardSet)
+            disconnect_bulk_changed(self.cards_changed, PhysicalCardSet)
             disconnect_row_update(self.card_set_changed, PhysicalCardSet)
             disconnect_row_destroy(self.card_set_added_deleted,
                     PhysicalCardSet)
@@ -132,6 +136,7 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
             listen_row_destroy(self.card_set_added_deleted, PhysicalCardSet)
             listen_row_created(self.card_set_added_deleted, PhysicalCardSet)
             listen_changed(self.card_changed, PhysicalCardSet)
+            listen_bulk_changed(self.cards_changed, PhysicalCardSet)
             # queue a redraw
             self.view.queue_draw()
 
@@ -139,6 +144,7 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
         """Disconnect the database signals during the upgrade"""
         if self.check_versions() and self.check_model_type():
             disconnect_changed(self.card_changed, PhysicalCardSet)
+            disconnect_bulk_changed(self.cards_changed, PhysicalCardSet)
             disconnect_row_update(self.card_set_changed, PhysicalCardSet)
             disconnect_row_destroy(self.card_set_added_deleted,
                     PhysicalCardSet)
@@ -178,8 +184,8 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
         """Return the total number of cards in the card set"""
         def query(oCardSet):
             """Query the database"""
-            return MapPhysicalCardToPhysicalCardSet.selectBy(
-                    physicalCardSetID=oCardSet.id).count()
+            return count_map_cards(MapPhysicalCardToPhysicalCardSet.selectBy(
+                    physicalCardSetID=oCardSet.id))
 
         if sCardSet:
             # lookup totals
@@ -250,10 +256,10 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
             """Query the database"""
             oFilter = FilterAndBox([PhysicalCardSetFilter(oCardSet.name),
                 CryptCardFilter()])
-            iCrypt = oFilter.select(
-                MapPhysicalCardToPhysicalCardSet).distinct().count()
-            iTot = MapPhysicalCardToPhysicalCardSet.selectBy(
-                    physicalCardSetID=oCardSet.id).count()
+            iCrypt = count_map_cards(oFilter.select(
+                MapPhysicalCardToPhysicalCardSet).distinct())
+            iTot = count_map_cards(MapPhysicalCardToPhysicalCardSet.selectBy(
+                    physicalCardSetID=oCardSet.id))
             return iTot - iCrypt
 
         if sCardSet:
@@ -279,8 +285,8 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
             """Query the database"""
             oFilter = FilterAndBox([PhysicalCardSetFilter(oCardSet.name),
                 CryptCardFilter()])
-            return oFilter.select(
-                MapPhysicalCardToPhysicalCardSet).distinct().count()
+            return count_map_cards(oFilter.select(
+                MapPhysicalCardToPhysicalCardSet).distinct())
 
         if sCardSet:
             # lookup totals
@@ -394,6 +400,11 @@ class ExtraCardSetListViewColumns(SutekhPlugin):
             # queue a redraw
             self.view.queue_draw()
 
+    def cards_changed(self, oCardSet, _dChanges):
+        """Listen for bulk card changes, which invalidate the counts in
+           the same way."""
+        self.card_changed(oCardSet, None, 0)
+
     # Actions
 
     def set_cols_in_use(self, aCols):
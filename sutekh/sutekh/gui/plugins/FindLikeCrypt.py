@@ -9,10 +9,8 @@ import gtk
 import gobject
 import pango
 from sutekh.core.SutekhObjects import (PhysicalCardSet, PhysicalCard,
-        IAbstractCard, AbstractCard, IPhysicalCard, IPhysicalCardSet)
-from sutekh.core.Filters import (MultiGroupFilter, CardTypeFilter,
-        MultiVirtueFilter, MultiDisciplineFilter, MultiDisciplineLevelFilter,
-        FilterAndBox)
+        IAbstractCard, IPhysicalCard, IPhysicalCardSet)
+from sutekh.core.CryptSignatureIndex import get_signature_index
 from sutekh.SutekhUtility import is_crypt_card, is_vampire
 from sutekh.gui.PluginManager import SutekhPlugin
 from sutekh.gui.SutekhDialog import SutekhDialog, do_complaint_error
@@ -20,41 +18,6 @@ from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
 from sutekh.gui.GuiCardSetFunctions import create_card_set
 
 
-def _gen_subsets(aData, iSetSize, iDepth=1):
-    """Generate subsets of the given size from a list"""
-    if iDepth > iSetSize:
-        return []
-    elif iDepth < 1:
-        return []
-    elif iDepth == iSetSize:
-        return [set([x]) for x in aData]
-    else:
-        # I'm arguably overly fond of recursion
-        aNewSets = []
-        aSets = _gen_subsets(aData, iSetSize, iDepth + 1)
-        for oVal in aData:
-            for oSet in aSets:
-                if oVal not in oSet:
-                    oNewSet = oSet.union(set([oVal]))
-                    if oNewSet not in aNewSets:
-                        aNewSets.append(oNewSet)
-        return aNewSets
-
-
-def _get_groups(oCard):
-    """Get compatible groups ranges"""
-    # We ignore the any group cases as they are currently uninteresing
-    # and excluded by the discipline check
-    # If this ever changes, this will need to be revisited.
-    # pylint: disable-msg=E1101
-    # SQLObject confuses pylint
-    iGrp = oCard.group
-    iMaxGrp = AbstractCard.select().max(AbstractCard.q.group)
-    iMax = min(iMaxGrp, iGrp + 1)
-    iMin = max(1, iGrp - 1)
-    return MultiGroupFilter(range(iMin, iMax + 1))
-
-
 def make_key(aSet, bSuperior):
     """Create a suitable key"""
     if bSuperior:
@@ -64,23 +27,15 @@ def make_key(aSet, bSuperior):
     return sKey
 
 
-def _make_superset(oCard, bSuperior, bVampire):
-    """Check if all elements of aSet match oCard"""
-    if bSuperior:
-        return set([oP.discipline for oP in oCard.discipline if
-            oP.level == 'superior'])
-    elif bVampire:
-        return set([oP.discipline for oP in oCard.discipline])
-    else:
-        # Imbued
-        return set(oCard.virtue)
-
-
 class FindLikeVampires(SutekhPlugin):
     """Create a list of vampires 'like' the selected vampire."""
 
     dTableVersions = {PhysicalCardSet: (5, 6)}
     aModelsSupported = (PhysicalCardSet, PhysicalCard)
+    bLazyLoad = True
+
+    # Number of cards on the 'Most Similar' page
+    NUM_SIMILAR = 20
 
     def get_menu_item(self):
         """Register on the 'Analyze' Menu"""
@@ -118,36 +73,23 @@ class FindLikeVampires(SutekhPlugin):
         self.display_results(dGroups)
     # pylint: enable-msg=W0201
 
-    def _group_cards(self, aCards, iNum, aSubSets, bSuperior, bUseCardSet):
-        """Group the cards and return only cards with iNum or more
-           instances.
-
-           This works because of our database structure and query, which
-           ends up returning a match for each discipline in the discipline
-           filter that matches."""
-        aDistinct = set(aCards)
-        dResults = {}
-        aDistinct.remove(self.oSelCard)  # Don't match ourselves
-        bVampire = is_vampire(self.oSelCard)
+    def _group_cards(self, aItems, iNum, bSuperior, bUseCardSet):
+        """Find the cards sharing iNum or more of aItems with the selected
+           card, and group them by the combinations they share."""
         if bUseCardSet:
-            aCardSetCards = set([IAbstractCard(x) for x in
-                self.model.get_card_iterator(self.model.get_current_filter())])
+            aCandidates = set([IAbstractCard(x) for x in
+                self.model.get_card_copies(self.model.get_current_filter())])
         else:
-            aCardSetCards = None
-        for oCard in list(aDistinct):
-            if aCards.count(oCard) < iNum:
-                aDistinct.remove(oCard)
-            elif bUseCardSet and oCard not in aCardSetCards:
-                # Remove cards not in the view from the results
-                aDistinct.remove(oCard)
-        dResults['all'] = aDistinct
-        for oCard in aDistinct:
-            aFullSet = _make_superset(oCard, bSuperior, bVampire)
-            for aSet in aSubSets:
-                # We only add the card if it has all elements of the set
-                if aSet.issubset(aFullSet):
-                    dResults.setdefault(make_key(aSet, bSuperior),
-                            []).append(oCard)
+            aCandidates = None
+        oIndex = get_signature_index()
+        aAll, dCombinations = oIndex.find_like(self.oSelCard, aItems, iNum,
+                bSuperior, aCandidates)
+        dResults = {'all': aAll}
+        for tItems, aCards in dCombinations.iteritems():
+            dResults[make_key(tItems, bSuperior)] = aCards
+        dResults['similar'] = [oCard for _fScore, oCard in
+                oIndex.most_similar(self.oSelCard, self.NUM_SIMILAR,
+                    aCandidates)]
         return dResults
 
     def _get_selected_cards(self):
@@ -175,7 +117,6 @@ class FindLikeVampires(SutekhPlugin):
         """Construct a vampire search from the card"""
         # pylint: disable-msg=E1101
         # SQLObject & gtk confuse pylint
-        aFilters = [CardTypeFilter('Vampire'), _get_groups(self.oSelCard)]
         oDialog = SutekhDialog('Find Vampires like', self.parent,
                 gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
                 (gtk.STOCK_OK, gtk.RESPONSE_OK, gtk.STOCK_CANCEL,
@@ -220,27 +161,16 @@ class FindLikeVampires(SutekhPlugin):
             return
         bUseCardSet = oUseCardSet.get_active()
         iNum = int(oComboBox.get_active_text())
-        bSuperior = oSuperior and oSuperior.get_active()
-        if bSuperior:
-            oDisciplineFilter = MultiDisciplineLevelFilter(
-                    [(x.fullname, 'superior') for x in aSuperior])
-            aSets = _gen_subsets(aSuperior, iNum)
-        else:
-            oDisciplineFilter = MultiDisciplineFilter([
-                x.fullname for x in aDisciplines])
-            aSets = _gen_subsets(aDisciplines, iNum)
-        aFilters.append(oDisciplineFilter)
-        oFullFilter = FilterAndBox(aFilters)
+        bSuperior = bool(oSuperior and oSuperior.get_active())
         oDialog.destroy()
-        aCandCards = list(oFullFilter.select(AbstractCard))
-        return self._group_cards(aCandCards, iNum, aSets, bSuperior,
-                bUseCardSet)
+        if bSuperior:
+            return self._group_cards(aSuperior, iNum, True, bUseCardSet)
+        return self._group_cards(aDisciplines, iNum, False, bUseCardSet)
 
     def find_imbued_like(self):
         """Construct a imbued search from the card"""
         # pylint: disable-msg=E1101
         # SQLObject & gtk confuse pylint
-        aFilters = [CardTypeFilter('Imbued'), _get_groups(self.oSelCard)]
         oDialog = SutekhDialog('Find Imbued like', self.parent,
                 gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
                 (gtk.STOCK_OK, gtk.RESPONSE_OK, gtk.STOCK_CANCEL,
@@ -272,14 +202,8 @@ class FindLikeVampires(SutekhPlugin):
         if oUseCardSet.get_active():
             bUseCardSet = True
         iNum = int(oComboBox.get_active_text())
-        oVirtueFilter = MultiVirtueFilter([x.fullname for x in
-            self.oSelCard.virtue])
-        aSets = _gen_subsets(self.oSelCard.virtue, iNum)
-        aFilters.append(oVirtueFilter)
-        oFullFilter = FilterAndBox(aFilters)
         oDialog.destroy()
-        aCandCards = list(oFullFilter.select(AbstractCard))
-        return self._group_cards(aCandCards, iNum, aSets, False,
+        return self._group_cards(list(self.oSelCard.virtue), iNum, False,
                 bUseCardSet)
 
     def _update_combo_box(self, oDiscipline, oComboBox, aDisciplines,
@@ -330,8 +254,13 @@ class FindLikeVampires(SutekhPlugin):
         oAllView = LikeCardsView(dGroups['all'], 'All Matches', bVampire)
         oNotebook.append_page(AutoScrolledWindow(oAllView),
                 gtk.Label('All Matches'))
+        # Keep the similarity order for this page
+        oSimilarView = LikeCardsView(dGroups['similar'], 'Most Similar',
+                bVampire, False)
+        oNotebook.append_page(AutoScrolledWindow(oSimilarView),
+                gtk.Label('Most Similar'))
         for sSet in sorted(dGroups):
-            if sSet == 'all':
+            if sSet in ('all', 'similar'):
                 # Already handled
                 continue
             oView = LikeCardsView(dGroups[sSet], sSet, bVampire)
@@ -386,7 +315,7 @@ class LikeCardsView(gtk.TreeView):
     VAMP_LABELS = ['Name', 'Group', 'Capacity', 'Clan', 'Disciplines']
     IMBUED_LABELS = ['Name', 'Group', 'Life', 'Creed', 'Virtues']
 
-    def __init__(self, aCards, sLabel, bVampire):
+    def __init__(self, aCards, sLabel, bVampire, bSortByName=True):
         self._oModel = LikeCardsModel(aCards, bVampire)
 
         super(LikeCardsView, self).__init__(self._oModel)
@@ -404,8 +333,9 @@ class LikeCardsView(gtk.TreeView):
             oColumn.set_sort_column_id(iCol)
             self.append_column(oColumn)
 
-        # Sort by the name by default
-        self._oModel.set_sort_column_id(0, gtk.SORT_ASCENDING)
+        if bSortByName:
+            # Sort by the name by default
+            self._oModel.set_sort_column_id(0, gtk.SORT_ASCENDING)
 
         oSelection = self.get_selection()
         oSelection.set_mode(gtk.SELECTION_MULTIPLE)
@@ -24,6 +24,7 @@ class FullBackup(SutekhPlugin):
 
     dTableVersions = {}
     aModelsSupported = ("MainWindow",)
+    bLazyLoad = True
 
     # Dialog and Menu Item Creation
 
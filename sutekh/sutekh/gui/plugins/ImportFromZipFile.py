@@ -147,6 +147,7 @@ class ImportFromZipFile(SutekhPlugin):
 
     dTableVersions = {}
     aModelsSupported = ("MainWindow",)
+    bLazyLoad = True
 
     # Dialog and Menu Item Creation
 
@@ -15,6 +15,12 @@ from sutekh.gui.SutekhDialog import SutekhDialog, do_complaint_error
 from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
 from sutekh.core.Filters import CryptCardFilter, MultiCardTypeFilter, \
         CardTypeFilter, CardFunctionFilter, FilterNot
+from sutekh.core.DrawSimulation import DrawSimulator, hypergeometric_mean
+
+# Library and crypt draws reported by the batch simulation: the opening
+# hand and crypt draw, followed by the same later draws as the sample hands
+LIBRARY_DRAWS = (7, 12, 17, 22)
+CRYPT_DRAWS = (4, 5, 6, 7)
 
 
 # Utility functions
@@ -28,7 +34,7 @@ def convert_to_abs(aCards):
 
 def get_cards_filter(oModel, oFilter):
     """Get abstract card list for the given filter"""
-    return convert_to_abs(list(oModel.get_card_iterator(oFilter)))
+    return convert_to_abs(oModel.get_card_copies(oFilter))
 
 
 def get_probs(dLibProbs, dToCheck, dGroupedProbs):
@@ -74,14 +80,6 @@ def format_dict(dInfo):
     return sResult
 
 
-def hypergeometric_mean(iItems, iDraws, iTotal):
-    """Mean of the hypergeometric distribution for a population of iTotal
-       with iItems of interest and drawing iDraws items.
-       In the usual notation, iItems=n, iDraws=m, iTotal=N
-       """
-    return iItems * iDraws / float(iTotal)  # mean = nm/N
-
-
 def fill_store(oStore, dLibProbs, dGroupedProbs):
     """Fill oStore with the stats about the opening hand"""
     for sName, dEntry in dGroupedProbs.iteritems():
@@ -132,6 +130,39 @@ def create_view(oStore, sHeading):
     return oView
 
 
+def format_stats(dStats):
+    """Format the simulated statistics for a group, with the exact values
+       for comparison"""
+    return '%2.2f [%2.2f, %2.2f] (%2.2f)\n%2.1f%% [%2.1f, %2.1f] (%2.1f%%)' % (
+            dStats['mean'], dStats['low'], dStats['high'],
+            dStats['expected'], 100 * dStats['any'], 100 * dStats['any low'],
+            100 * dStats['any high'], 100 * dStats['expected any'])
+
+
+def setup_simulation_view(aSections, aDraws, sOpening):
+    """Setup the TreeView for the batch simulation results.
+
+       aSections is a list of (heading, dictionary of draws to group
+       statistics) pairs, shown as top level rows, with the groups
+       below them."""
+    aDraws = [x for x in aDraws if x in aSections[0][1]]
+    oStore = gtk.TreeStore(*([gobject.TYPE_STRING] * (len(aDraws) + 1)))
+    for sHeading, dResults in aSections:
+        oParentIter = oStore.append(None, [sHeading] + [''] * len(aDraws))
+        for sGroup in sorted(dResults[aDraws[0]]):
+            oStore.append(oParentIter, [sGroup] + [format_stats(
+                dResults[iDraws][sGroup]) for iDraws in aDraws])
+    oView = gtk.TreeView(oStore)
+    for iCol, sTitle in enumerate(['Group', sOpening] + ['+ %d' % (x -
+            aDraws[0]) for x in aDraws[1:]]):
+        oCell = gtk.CellRendererText()
+        oCol = gtk.TreeViewColumn(sTitle, oCell, text=iCol)
+        oCol.set_sort_column_id(iCol)
+        oView.append_column(oCol)
+    oView.expand_all()
+    return oView
+
+
 class OpeningHandSimulator(SutekhPlugin):
     """Simulate opening hands."""
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
@@ -202,9 +233,22 @@ class OpeningHandSimulator(SutekhPlugin):
         oShowButton = gtk.Button('draw sample hands')
         oShowButton.connect('clicked', self._fill_dialog)
 
+        oSimBox = gtk.HBox(False, 2)
+        oHandsSpin = gtk.SpinButton()
+        oHandsSpin.set_range(1000, 1000000)
+        oHandsSpin.set_increments(1000, 10000)
+        oHandsSpin.set_value(20000)
+        oSimButton = gtk.Button('simulate hands')
+        oSimButton.connect('clicked', self._simulate_hands, oHandsSpin)
+        oSimBox.pack_start(gtk.Label('Number of hands to simulate : '),
+                False, False)
+        oSimBox.pack_start(oHandsSpin, False, False)
+        oSimBox.pack_start(oSimButton)
+
         # pylint: disable-msg=E1101
         # vbox methods not detected by pylint
         oDialog.vbox.pack_start(oShowButton, False, False)
+        oDialog.vbox.pack_start(oSimBox, False, False)
 
         oDialog.show_all()
 
@@ -267,6 +311,47 @@ class OpeningHandSimulator(SutekhPlugin):
             dLibProbs[sName] = hypergeometric_mean(iCount, 7, iTot)
         return dLibProbs
 
+    def _simulate_hands(self, _oButton, oHandsSpin):
+        """Simulate a large number of hands, and show the statistics
+           for each group"""
+        iHands = oHandsSpin.get_value_as_int()
+        aLibNames = [oCard.name for oCard in self.aLibrary]
+        aCryptNames = [oCard.name for oCard in self.aCrypt]
+        aLibDraws = [x for x in LIBRARY_DRAWS if x <= len(aLibNames)]
+        aCryptDraws = [x for x in CRYPT_DRAWS if x <= len(aCryptNames)]
+        aSections = []
+        for sHeading, dGroups in [('Card Types', self.dCardTypes),
+                ('Card Properties', self.dCardProperties)]:
+            oSim = DrawSimulator(aLibNames, dGroups)
+            aSections.append((sHeading, oSim.simulate(aLibDraws, iHands)))
+        dCryptGroups = dict([(sName, set([sName])) for sName in
+            aCryptNames])
+        oSim = DrawSimulator(aCryptNames, dCryptGroups)
+        dCryptResults = oSim.simulate(aCryptDraws, iHands)
+
+        oDialog = SutekhDialog('Simulated Hands', self.parent,
+                gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
+                (gtk.STOCK_CLOSE, gtk.RESPONSE_CLOSE))
+        oDialog.set_size_request(900, 600)
+        oLabel = gtk.Label('Results from %d hands. Each entry is the mean'
+                ' number of cards drawn, and the percentage of hands with'
+                ' at least one card, with the 95%% confidence interval in'
+                ' square brackets and the exact value in brackets.' % iHands)
+        oLabel.set_line_wrap(True)
+        oNotebook = gtk.Notebook()
+        oNotebook.append_page(AutoScrolledWindow(setup_simulation_view(
+            aSections, aLibDraws, 'Opening Hand')), gtk.Label('Library'))
+        oNotebook.append_page(AutoScrolledWindow(setup_simulation_view(
+            [('Crypt Cards', dCryptResults)], aCryptDraws,
+            'Opening Draw')), gtk.Label('Crypt'))
+        # pylint: disable-msg=E1101
+        # vbox methods not detected by pylint
+        oDialog.vbox.pack_start(oLabel, False, False)
+        oDialog.vbox.pack_start(oNotebook)
+        oDialog.show_all()
+        oDialog.run()
+        oDialog.destroy()
+
     def _fill_dialog(self, _oButton):
         """Fill the dialog with the draw results"""
         oDialog = SutekhDialog('Sample Hands', self.parent,
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Show the SQL queries run by each operation, to help track down slow
+   code paths."""
+
+import gtk
+import pango
+from sqlobject import sqlhub
+from sutekh.core.QueryProfiler import start_profiling, stop_profiling, \
+        get_profiler
+from sutekh.gui.PluginManager import SutekhPlugin
+from sutekh.gui.SutekhDialog import SutekhDialog
+from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
+
+
+class QueryProfileDialog(SutekhDialog):
+    # pylint: disable-msg=R0904
+    # R0904 - gtk Widget, so has many public methods
+    """Dialog showing the query profile.
+
+       The dialog isn't modal, so it can be left open while using the
+       rest of the GUI, and refreshed to see the queries run."""
+
+    TOGGLE, RESET, REFRESH = 1, 2, 3
+
+    def __init__(self, oParent):
+        super(QueryProfileDialog, self).__init__('SQL Query Profile',
+                oParent, gtk.DIALOG_DESTROY_WITH_PARENT)
+        # pylint: disable-msg=E1101
+        # pylint doesn't see vbox + action_area methods
+        self._oToggle = self.add_button('Start Profiling', self.TOGGLE)
+        self.add_button('Reset', self.RESET)
+        self.add_button(gtk.STOCK_REFRESH, self.REFRESH)
+        self.add_button(gtk.STOCK_CLOSE, gtk.RESPONSE_CLOSE)
+        self._oBuffer = gtk.TextBuffer()
+        oView = gtk.TextView(self._oBuffer)
+        oView.set_editable(False)
+        oView.modify_font(pango.FontDescription('monospace'))
+        self.vbox.pack_start(AutoScrolledWindow(oView))
+        self.set_default_size(700, 500)
+        self.connect('response', self._button_response)
+        # Closing the window just hides it, like the close button
+        self.connect('delete-event',
+                lambda oWidget, _oEvent: oWidget.hide_on_delete())
+        self.update()
+
+    def update(self):
+        """Show the current profile"""
+        oProfiler = get_profiler()
+        if oProfiler is None:
+            self._oToggle.set_label('Start Profiling')
+            self._oBuffer.set_text('Not profiling. Start profiling, then '
+                    'use Sutekh and refresh to see the queries run.')
+        else:
+            self._oToggle.set_label('Stop Profiling')
+            self._oBuffer.set_text(oProfiler.get_report())
+
+    def _button_response(self, _oWidget, iResponse):
+        """Handle the button presses"""
+        oProfiler = get_profiler()
+        if iResponse == self.TOGGLE:
+            if oProfiler is None:
+                start_profiling(sqlhub.processConnection)
+            else:
+                stop_profiling()
+        elif iResponse == self.RESET:
+            if oProfiler is not None:
+                oProfiler.reset()
+        elif iResponse != self.REFRESH:
+            self.hide()
+            return
+        self.update()
+
+
+class QueryProfile(SutekhPlugin):
+    """Show the SQL query profile for the operations in the main window."""
+
+    dTableVersions = {}
+    aModelsSupported = ("MainWindow",)
+    bLazyLoad = True
+
+    # pylint: disable-msg=W0142
+    # **magic OK here
+    def __init__(self, *args, **kwargs):
+        super(QueryProfile, self).__init__(*args, **kwargs)
+        self._oDialog = None
+
+    def get_menu_item(self):
+        """Register on the Plugins menu"""
+        if not self.check_versions() or not self.check_model_type():
+            return None
+        oShow = gtk.MenuItem("Show SQL Query Profile")
+        oShow.connect("activate", self.activate)
+        return ('Plugins', oShow)
+
+    def activate(self, _oWidget):
+        """Show the dialog, creating it if needed"""
+        if self._oDialog is None:
+            self._oDialog = QueryProfileDialog(self.parent)
+        self._oDialog.update()
+        self._oDialog.show_all()
+        self._oDialog.present()
+
+    def cleanup(self):
+        """Remove the dialog"""
+        if self._oDialog is not None:
+            self._oDialog.destroy()
+            self._oDialog = None
+        super(QueryProfile, self).cleanup()
+
+
+plugin = QueryProfile
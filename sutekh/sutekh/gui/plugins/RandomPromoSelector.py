@@ -94,6 +94,7 @@ class RandomPromoSelector(SutekhPlugin):
     """Generate random groups of cards."""
     dTableVersions = {PhysicalCardSet: (4, 5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     # pylint: disable-msg=W0142
     # **magic OK here
@@ -112,7 +113,7 @@ class RandomPromoSelector(SutekhPlugin):
         """Create the actual dialog, and populate it"""
         oFilter = self.model.get_current_filter()
         aCards = [IAbstractCard(oCard) for oCard
-                  in self.model.get_card_iterator(oFilter)]
+                  in self.model.get_card_copies(oFilter)]
 
         oDialog = RandomPromoDialog(self.parent, aCards)
         oDialog.set_size_request(450, 600)
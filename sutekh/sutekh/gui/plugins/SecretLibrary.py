@@ -459,7 +459,7 @@ class SecretLibrary(SutekhPlugin):
         # populate crypt
         aCrypt = []
         oCryptFilter = CryptCardFilter()
-        oCryptIter = self.model.get_card_iterator(oCryptFilter)
+        oCryptIter = self.model.get_card_copies(oCryptFilter)
 
         for oCard in oCryptIter:
             # pylint: disable-msg=E1101
@@ -474,7 +474,7 @@ class SecretLibrary(SutekhPlugin):
         # populate library
         aLibrary = []
         oLibraryFilter = FilterNot(oCryptFilter)
-        oLibraryIter = self.model.get_card_iterator(oLibraryFilter)
+        oLibraryIter = self.model.get_card_copies(oLibraryFilter)
 
         for oCard in oLibraryIter:
             # pylint: disable-msg=E1101
@@ -493,7 +493,7 @@ class SecretLibrary(SutekhPlugin):
         # populate crypt dict
         dCrypt = {}
         oCryptFilter = CryptCardFilter()
-        oCryptIter = self.model.get_card_iterator(oCryptFilter)
+        oCryptIter = self.model.get_card_copies(oCryptFilter)
 
         for oCard in oCryptIter:
             oAbsCard = IAbstractCard(oCard)
@@ -505,7 +505,7 @@ class SecretLibrary(SutekhPlugin):
         # populate library dict
         dLibrary = {}
         oLibraryFilter = FilterNot(oCryptFilter)
-        oLibraryIter = self.model.get_card_iterator(oLibraryFilter)
+        oLibraryIter = self.model.get_card_copies(oLibraryFilter)
 
         for oCard in oLibraryIter:
             oAbsCard = IAbstractCard(oCard)
@@ -22,6 +22,7 @@ class SetCardExpansions(SutekhPlugin):
 
     dTableVersions = {PhysicalCardSet: (5, 6)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Return a gtk.MenuItem to activate this plugin."""
@@ -88,12 +89,16 @@ class SetCardExpansions(SutekhPlugin):
                                 dSelected[oAbsCard.name]):
                     oNewCard = IPhysicalCard((oAbsCard, oExpansion))
                     # Card in the selection, so replace with changed card
+                    # The mapping entry may represent several copies
+                    iCount = oCard.count
                     MapPhysicalCardToPhysicalCardSet.delete(oCard.id)
-                    oCS.addPhysicalCard(oNewCard.id)
+                    for _iCopy in range(iCount):
+                        oCS.addPhysicalCard(oNewCard.id)
                     oCS.syncUpdate()
                     # Handle updates
-                    send_changed_signal(oCS, oPhysCard, -1)
-                    send_changed_signal(oCS, oNewCard, +1)
+                    for _iCopy in range(iCount):
+                        send_changed_signal(oCS, oPhysCard, -1)
+                        send_changed_signal(oCS, oNewCard, +1)
         self.view.reload_keep_expanded()
 
     def _get_selected_cards(self):
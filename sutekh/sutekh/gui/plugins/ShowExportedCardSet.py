@@ -32,6 +32,7 @@ class ShowExported(SutekhPlugin):
 
     dTableVersions = {}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     _dExporters = {
             # radio button text : Writer
@@ -22,6 +22,7 @@ class SnapshotCardSet(SutekhPlugin):
 
     dTableVersions = {PhysicalCardSet: (6,)}
     aModelsSupported = (PhysicalCardSet,)
+    bLazyLoad = True
 
     def get_menu_item(self):
         """Return a gtk.MenuItem to activate this plugin."""
@@ -15,7 +15,7 @@ from sutekh.gui.ProgressDialog import ProgressDialog, SutekhCountLogHandler
 from sutekh.gui.SutekhDialog import SutekhDialog, do_exception_complaint, \
         do_complaint_error
 from sutekh.core.CardSetUtilities import delete_physical_card_set, \
-        find_children, has_children
+        find_children, has_children, count_map_cards
 from sutekh.io.ZipFileWrapper import ZipFileWrapper
 from sutekh.io.DataPack import DOC_URL, urlopen_with_timeout, find_data_pack
 from sutekh.gui.GuiCardSetFunctions import reparent_all_children, \
@@ -395,8 +395,8 @@ class StarterInfoPlugin(SutekhPlugin):
                 # Sort by exp, name
                 oFilter = FilterAndBox([SpecificCardIdFilter(oAbsCard.id),
                         PhysicalCardSetFilter(oCS.name)])
-                iCount = oFilter.select(
-                        MapPhysicalCardToPhysicalCardSet).count()
+                iCount = count_map_cards(oFilter.select(
+                        MapPhysicalCardToPhysicalCardSet))
                 if iCount > 0:
                     dInfo[sType].append("x %(count)d %(exp)s (%(cardset)s)" % {
                         'count': iCount,
@@ -5,13 +5,9 @@
 
 """Adds info about the TWDA decks cards are found in"""
 
-from sutekh.core.SutekhObjects import (PhysicalCardSet,
-                                       MapPhysicalCardToPhysicalCardSet,
-                                       IPhysicalCardSet, PhysicalCard,
-                                       IAbstractCard)
-from sutekh.core.Filters import (FilterOrBox, FilterAndBox,
-                                 SpecificCardFilter,
-                                 MultiPhysicalCardSetMapFilter)
+from sutekh.core.SutekhObjects import (PhysicalCardSet, IPhysicalCardSet,
+                                       PhysicalCard, IAbstractCard)
+from sutekh.core.DeckIndex import get_deck_index
 from sutekh.gui.PluginManager import SutekhPlugin
 from sutekh.gui.ProgressDialog import ProgressDialog, SutekhCountLogHandler
 from sutekh.gui.SutekhDialog import (SutekhDialog, do_exception_complaint,
@@ -27,12 +23,15 @@ from sutekh.gui.FileOrUrlWidget import FileOrUrlWidget
 from sutekh.gui.SutekhFileWidget import add_filter
 from sutekh.gui.AutoScrolledWindow import AutoScrolledWindow
 from sutekh.gui.GuiDataPack import gui_error_handler
+from sutekh.SutekhUtility import prefs_dir
+import os
 import re
 import gtk
 import datetime
 from logging import Logger
 from StringIO import StringIO
 from sqlobject import sqlhub, SQLObjectNotFound
+from sqlobject.sqlbuilder import Select
 
 
 class BinnedCountLogHandler(SutekhCountLogHandler):
@@ -199,35 +198,23 @@ class TWDAInfoPlugin(SutekhPlugin):
             do_complaint_error('Need to select some cards for this plugin')
             return
 
-        aCardFilters = []
-        iTotCards = len(aAbsCards)
-        for oCard in aAbsCards:
-            aCardFilters.append(SpecificCardFilter(oCard))
-        # needs to be OR, since we're matching against the card to card set
-        # mapping table
-        oCardFilter = FilterOrBox(aCardFilters)
-        aNames = self._get_twda_names()
-        oMapFilter = MultiPhysicalCardSetMapFilter(aNames)
-        oFullFilter = FilterAndBox([oCardFilter, oMapFilter])
+        dDecks = self._get_twda_decks()
+        oIndex = get_deck_index(self._get_index_file(), dDecks.keys())
+        dCardNames = dict([(oCard.id, oCard.name) for oCard in aAbsCards])
+        if sMode == 'all':
+            aDeckIds = oIndex.find_all(dCardNames.keys())
+        else:
+            aDeckIds = oIndex.find_any(dCardNames.keys())
 
         # pylint: disable-msg=E1101
         # Pyprotocols confuses pylint
-        dCardSets = {}
-        for oMapCard in oFullFilter.select(MapPhysicalCardToPhysicalCardSet):
-            oCS = oMapCard.physicalCardSet
-            sCardName = IAbstractCard(oMapCard).name
-            dCardSets.setdefault(oCS, {})
-            dCardSets[oCS].setdefault(sCardName, 0)
-            dCardSets[oCS][sCardName] += 1
-
-        if sMode == 'all' and iTotCards > 1:
-            # This is a little clunky, but, because of how we construct the
-            # filters, we currently have the any match set, so we need to
-            # filter this down to those that match all the cards
-            for oCS in list(dCardSets):
-                if len(dCardSets[oCS]) != iTotCards:
-                    # Not all, so drop this one
-                    del dCardSets[oCS]
+        aMatches = []
+        # Show the decks with the most matching cards first
+        for iDeckId in oIndex.rank(aDeckIds, dCardNames.keys()):
+            dCards = oIndex.get_cards(iDeckId, dCardNames.keys())
+            aMatches.append((PhysicalCardSet.get(iDeckId),
+                dict([(dCardNames[iCardId], iCount) for iCardId, iCount in
+                    dCards.iteritems()])))
 
         sCards = '",  "'.join(sorted([x.name for x in aAbsCards]))
         if sMode == 'any':
@@ -242,8 +229,8 @@ class TWDAInfoPlugin(SutekhPlugin):
         oDlg.set_default_size(700, 600)
         # We create tabs for each year, and then list card
         # sets below them
-        if dCardSets:
-            self._fill_dlg(oDlg, dCardSets, sMatchText)
+        if aMatches:
+            self._fill_dlg(oDlg, aMatches, sMatchText)
         else:
             self._empty_dlg(oDlg, sMatchText)
 
@@ -251,9 +238,12 @@ class TWDAInfoPlugin(SutekhPlugin):
         oDlg.run()
         oDlg.destroy()
 
-    def _fill_dlg(self, oDlg, dCardSets, sMatchText):
-        """Add info about the card sets to the dialog"""
-        aParents = set([oCS.parent.name for oCS in dCardSets])
+    def _fill_dlg(self, oDlg, aMatches, sMatchText):
+        """Add info about the card sets to the dialog.
+
+           aMatches is the list of (card set, dictionary of card name to
+           count) pairs, in the order they should be shown."""
+        aParents = set([oCS.parent.name for oCS, _dCards in aMatches])
         dPages = {}
         oNotebook = gtk.Notebook()
         oNotebook.set_scrollable(True)
@@ -265,18 +255,19 @@ class TWDAInfoPlugin(SutekhPlugin):
             oNotebook.append_page(AutoScrolledWindow(oInfo, True),
                                   oTitle)
             oInfo.pack_start(gtk.Label(sMatchText), expand=False, padding=6)
-            iCardSets = len([x for x in dCardSets if x.parent.name == sName])
+            iCardSets = len([x for x, _dCards in aMatches if
+                             x.parent.name == sName])
             oInfo.pack_start(gtk.Label("%d Card Sets" % iCardSets),
                              expand=False, padding=4)
             dPages[sName] = oInfo
 
-        for oCS in sorted(dCardSets, key=lambda x: x.name):
+        for oCS, dCards in aMatches:
             oInfo = dPages[oCS.parent.name]
             oName = gtk.Label(oCS.name)
             aCardInfo = []
-            for sName in sorted(dCardSets[oCS]):
+            for sName in sorted(dCards):
                 aCardInfo.append(u"  - %s \u00D7 %d" % (sName,
-                                 dCardSets[oCS][sName]))
+                                 dCards[sName]))
             oCards = gtk.Label('\n'.join(aCardInfo))
             oButton = gtk.Button("Open cardset")
             oButton.connect('clicked', self._open_card_set, oCS)
@@ -305,16 +296,40 @@ class TWDAInfoPlugin(SutekhPlugin):
                 break
         return bEnabled
 
+    def _get_twda_decks(self):
+        """Get a dictionary of id to name for all the TWDA entries in the
+           current database.
+
+           This reads the card set names and parents with a single query,
+           rather than loading every card set."""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        oConn = sqlhub.processConnection
+        oSelect = Select([PhysicalCardSet.q.id, PhysicalCardSet.q.name,
+                          PhysicalCardSet.q.parentID,
+                          PhysicalCardSet.q.inuse])
+        aRows = oConn.queryAll(oConn.sqlrepr(oSelect))
+        aHolders = set([iId for iId, sName, _iParent, _bInUse in aRows
+                        if self.oTWDARegex.match(sName)])
+        return dict([(iId, sName) for iId, sName, iParent, bInUse in aRows
+                     if bInUse and iParent in aHolders])
+
     def _get_twda_names(self):
         """Get names of all the TWDA entries in the current database"""
-        aNames = []
-        for oCS in PhysicalCardSet.select():
-            if not oCS.parent or not oCS.inuse:
-                continue
-            oMatch = self.oTWDARegex.match(oCS.parent.name)
-            if oMatch:
-                aNames.append(oCS.name)
-        return aNames
+        return self._get_twda_decks().values()
+
+    # pylint: disable-msg=R0201
+    # Method so it's available to all the plugin methods
+    def _get_index_file(self):
+        """Return the location of the TWDA card index"""
+        return os.path.join(prefs_dir('Sutekh'), 'twda.index')
+
+    # pylint: enable-msg=R0201
+
+    def _update_index(self):
+        """Rebuild the TWDA card index after the decks have changed"""
+        get_deck_index(self._get_index_file(), self._get_twda_decks().keys(),
+                       bRebuild=True)
 
     def _get_twda_holders(self):
         """Return all the TWDA holders in the current database"""
@@ -456,6 +471,7 @@ class TWDAInfoPlugin(SutekhPlugin):
             aCSList.extend(oZipFile.get_all_entries().keys())
         oProgressDialog.destroy()
         self._clean_empty(aCSList, aExistingList)
+        self._update_index()
         self.reload_pcs_list()
         return True
 
@@ -492,6 +508,7 @@ class TWDAInfoPlugin(SutekhPlugin):
             return False
         # Cleanup
         self._clean_empty(oFile.get_all_entries().keys(), aExistingList)
+        self._update_index()
         self.reload_pcs_list()
         oProgressDialog.destroy()
         return True
@@ -5,8 +5,14 @@
 # GPL - see COPYING for details
 
 """Attempt to guess the file format from the first few lines, and then
-   chain to the correct Parser"""
+   chain to the correct Parser.
 
+   The start of the file is checked for the markers of each format (XML
+   root tags, the ARDB and ELDB headers, Lackey's tab separated lines and
+   so on), and the most likely parsers are tried first. The remaining
+   parsers are only tried if none of the likely ones can read the file."""
+
+import re
 import StringIO
 from sutekh.core.CardSetHolder import CardSetHolder
 
@@ -24,6 +30,99 @@ from sutekh.io.LackeyDeckParser import LackeyDeckParser
 from sutekh.io.SLDeckParser import SLDeckParser
 from sutekh.io.SLInventoryParser import SLInventoryParser
 
+# Amount of the file checked for the format markers
+SNIFF_SIZE = 4096
+
+# Scores for the strength of the evidence for a format
+DEFINITE, LIKELY, POSSIBLE = 10, 5, 1
+
+# XML root tag -> parser
+XML_ROOTS = {
+        'physicalcardset': PhysicalCardSetParser,
+        'abstractcardset': AbstractCardSetParser,
+        'cards': PhysicalCardParser,
+        'deck': ARDBXMLDeckParser,
+        'inventory': ARDBXMLInvParser,
+        }
+
+_oTagRe = re.compile(r'<\s*([A-Za-z_][\w.-]*)')
+_oQuotedRe = re.compile(r'^"[^"]*"$')
+_oLackeyRe = re.compile(r'^[0-9]+\t')
+# Card lines, without any of the markers of the other text formats
+_oJOLRe = re.compile(r'^([0-9]+\s*x\s*)?[^"\t<>*]+$')
+
+
+def _get_root_tag(sHead):
+    """Return the first element tag, or None if there isn't one.
+
+       The XML declaration, comments and doctype don't match the tag
+       pattern, so are skipped."""
+    oMatch = _oTagRe.search(sHead)
+    if oMatch:
+        return oMatch.group(1)
+    return None
+
+
+def _sniff_text(aLines):
+    """Score the non-XML formats for the given non-blank lines"""
+    dScores = {}
+    sFirst = aLines[0]
+    if sFirst.startswith('"ELDB - Inv'):
+        dScores[ELDBInventoryParser] = DEFINITE
+    elif sFirst.startswith('***SL***'):
+        if sFirst.upper() == '***SL***CRYPT***':
+            # Inventories start with the crypt, decks with the title
+            dScores[SLInventoryParser] = DEFINITE
+        else:
+            dScores[SLDeckParser] = DEFINITE
+    elif sFirst.startswith('Deck Name') or [sLine for sLine in aLines if
+            sLine.startswith('Crypt [') or sLine.startswith('Crypt: (') or
+            sLine.startswith('Crypt (')]:
+        dScores[ARDBTextParser] = DEFINITE
+    elif len(aLines) > 1 and _oQuotedRe.match(sFirst) and \
+            _oQuotedRe.match(aLines[1]):
+        # Quoted name and author, followed by the description
+        dScores[ELDBDeckFileParser] = LIKELY
+    elif [sLine for sLine in aLines if _oLackeyRe.match(sLine)] and \
+            not [sLine for sLine in aLines if sLine != 'Crypt:' and
+                    not _oLackeyRe.match(sLine)]:
+        dScores[LackeyDeckParser] = LIKELY
+    elif not [sLine for sLine in aLines if not _oJOLRe.match(sLine)]:
+        # JOL accepts almost anything, so it's only a weak guess
+        dScores[JOLDeckParser] = POSSIBLE
+    return dScores
+
+
+def sniff_format(sHead):
+    """Score the likely parsers for a file starting with sHead.
+
+       Returns a list of (score, parser class) pairs, highest scores
+       first. Parsers with no evidence for them are left out, so the list
+       is empty if nothing is recognised."""
+    if sHead.startswith('\xef\xbb\xbf'):
+        # Skip the UTF-8 byte order mark
+        sHead = sHead[3:]
+    sHead = sHead.strip()
+    if not sHead:
+        return []
+    dScores = {}
+    if sHead.startswith('<'):
+        sTag = _get_root_tag(sHead)
+        if sTag in XML_ROOTS:
+            dScores[XML_ROOTS[sTag]] = DEFINITE
+        elif sTag and sTag.lower() == 'html':
+            dScores[ELDBHTMLParser] = DEFINITE
+    else:
+        # The last line may be cut off, so it's dropped if there's more
+        aLines = [sLine.strip() for sLine in sHead.splitlines()]
+        if len(sHead) >= SNIFF_SIZE and len(aLines) > 1:
+            aLines = aLines[:-1]
+        dScores = _sniff_text([sLine for sLine in aLines if sLine])
+    aParsers = GuessFileParser.PARSERS
+    # Ties are broken by the order of the parser list
+    return sorted([(iScore, cParser) for cParser, iScore in
+        dScores.iteritems()], key=lambda x: (-x[0], aParsers.index(x[1])))
+
 
 class GuessFileParser(object):
     """Parser which guesses the file type"""
@@ -48,9 +147,20 @@ class GuessFileParser(object):
     def __init__(self):
         self.oChosenParser = None
 
+    def _get_order(self, oFile):
+        """Return the parsers in the order to try them: the ones suggested
+           by the start of the file, and then the rest in the usual
+           order."""
+        oFile.seek(0)
+        aOrder = [cParser for _iScore, cParser in
+                sniff_format(oFile.read(SNIFF_SIZE))]
+        aOrder.extend([cParser for cParser in self.PARSERS if
+            cParser not in aOrder])
+        return aOrder
+
     def guess_format(self, oFile):
         """Handle the guessing"""
-        for cParser in self.PARSERS:
+        for cParser in self._get_order(oFile):
             oHolder = CardSetHolder()
             oFile.seek(0)
             oParser = cParser()
@@ -95,6 +95,13 @@ class BaseXMLParser(object):
             raise IOError('Not an XML file: %s' % oExp)
         self._convert_tree(oHolder)
 
+    def parse_tree(self, oTree, oHolder):
+        """Fill in the card set holder from an already parsed XML tree,
+           so callers which have parsed the file already needn't parse
+           it again."""
+        self._oTree = oTree
+        self._convert_tree(oHolder)
+
 
 class BaseSutekhXMLParser(BaseXMLParser):
     # pylint: disable-msg=W0223
@@ -12,9 +12,9 @@ from sqlobject import SQLObjectNotFound
 # pylint: disable-msg=E0611, F0401
 # pylint doesn't like the handling of the differences between 2.4 and 2.5
 try:
-    from xml.etree.ElementTree import parse
+    from xml.etree.ElementTree import iterparse
 except ImportError:
-    from elementtree.ElementTree import parse
+    from elementtree.ElementTree import iterparse
 # For compatability with ElementTree 1.3
 try:
     from xml.etree.ElementTree import ParseError
@@ -26,12 +26,19 @@ except ImportError:
 class IdentifyXMLFile(object):
     """Tries to identify the XML file type.
 
-       Parse the file into an ElementTree, and then tests the Root element
-       to see which xml file it matches.
+       Only the root element is needed to identify the file, so parse
+       stops reading as soon as the root element's start tag has been
+       seen, rather than building the whole ElementTree.
+
+       The results of checking whether card sets exist are cached, so
+       identifying a batch of files, such as the contents of a zip file,
+       only queries the database once for each name. clear_cache should
+       be called if the card sets may have changed.
        """
     def __init__(self):
         self._bSetExists = self._bParentExists = False
         self._sType = self._sName = self._sParent = None
+        self._dExists = {}
 
         self._clear_id_results()
 
@@ -58,38 +65,47 @@ class IdentifyXMLFile(object):
             'data')
     # pylint: enable-msg=W0212
 
+    def clear_cache(self):
+        """Forget the cached results of the card set existence checks."""
+        self._dExists = {}
+
+    def _card_set_exists(self, sName):
+        """Check if the card set sName is in the database."""
+        # pylint: disable-msg=E1101
+        # SQLObject classes confuse pylint
+        if sName not in self._dExists:
+            try:
+                PhysicalCardSet.byName(sName.encode('utf8'))
+                self._dExists[sName] = True
+            except SQLObjectNotFound:
+                self._dExists[sName] = False
+        return self._dExists[sName]
+
     def identify_tree(self, oTree):
         """Process the ElementTree to identify the XML file type."""
+        self.identify_root(oTree.getroot())
+
+    def identify_root(self, oRoot):
+        """Identify the XML file type from the root element.
+
+           The children of the root element aren't used, so this can be
+           called with the element from the first start event of
+           iterparse."""
         self._clear_id_results()
-        oRoot = oTree.getroot()
-        # pylint: disable-msg=E1101
-        # SQLObject classes confuse pylint
         if oRoot.tag == 'abstractcardset':
             # only present in legacy backups
             self._sType = 'AbstractCardSet'
             # Same reasoning as on database upgrades
             self._sName = '(ACS) ' + oRoot.attrib['name']
-            try:
-                PhysicalCardSet.byName(self._sName.encode('utf8'))
-                self._bSetExists = True
-            except SQLObjectNotFound:
-                self._bSetExists = False
+            self._bSetExists = self._card_set_exists(self._sName)
             self._bParentExists = True  # Always a top level card set
         elif oRoot.tag == 'physicalcardset':
             self._sType = 'PhysicalCardSet'
             self._sName = oRoot.attrib['name']
-            try:
-                PhysicalCardSet.byName(self._sName.encode('utf8'))
-                self._bSetExists = True
-            except SQLObjectNotFound:
-                self._bSetExists = False
+            self._bSetExists = self._card_set_exists(self._sName)
             if 'parent' in oRoot.attrib:
                 self._sParent = oRoot.attrib['parent']
-                try:
-                    PhysicalCardSet.byName(self._sParent.encode('utf8'))
-                    self._bParentExists = True
-                except SQLObjectNotFound:
-                    self._bParentExists = False
+                self._bParentExists = self._card_set_exists(self._sParent)
             else:
                 self._bParentExists = True  # Top level card set
         elif oRoot.tag == 'cards':
@@ -97,11 +113,7 @@ class IdentifyXMLFile(object):
             # Old Physical Card Collection XML file - it exists if a card
             # set called 'My Collection' exists
             self._sName = 'My Collection'
-            try:
-                PhysicalCardSet.byName(self._sName.encode('utf8'))
-                self._bSetExists = True
-            except SQLObjectNotFound:
-                self._bSetExists = False
+            self._bSetExists = self._card_set_exists(self._sName)
             self._bParentExists = True  # Always a top level card set
         elif oRoot.tag == 'cardmapping':
             # This is ignored now
@@ -111,13 +123,17 @@ class IdentifyXMLFile(object):
             self._bParentExists = False
 
     def parse(self, fIn, _oDummyHolder=None):
-        """Parse the file fIn into the ElementTree."""
+        """Identify the file fIn from the start tag of the root element.
+
+           The rest of the file isn't read, so errors later in the file
+           are only found when it's parsed into a card set."""
+        self._clear_id_results()
         try:
-            oTree = parse(fIn)
+            for _sEvent, oRoot in iterparse(fIn, events=('start',)):
+                self.identify_root(oRoot)
+                break
         except ParseError:
             self._clear_id_results()  # Not an XML file
-            return
-        self.identify_tree(oTree)
 
     def id_file(self, sFileName):
         """Load the file sFileName, and try to identify it."""
@@ -38,9 +38,30 @@ class PhysicalCardSetWriter(BaseXMLWriter):
        """
     sMyVersion = "1.3"
 
+    # pylint: disable-msg=R0201
+    # method so subclasses can supply the counts in other ways
+    def _get_card_counts(self, oHolder):
+        """Return a dictionary of (card name, expansion name) to count for
+           the cards in oHolder."""
+        dPhys = {}
+        for oCard in oHolder.cards:
+            # ElementTree 1.2 doesn't support searching for attributes,
+            # so this is easier than using the tree directly. For
+            # elementtree 1.3, this should be reworked
+            oAbs = oCard.abstractCard
+            if oCard.expansion:
+                sExpName = oCard.expansion.name
+            else:
+                sExpName = 'None Specified'
+            tKey = (oAbs.name, sExpName)
+            dPhys.setdefault(tKey, 0)
+            dPhys[tKey] += 1
+        return dPhys
+
+    # pylint: enable-msg=R0201
+
     def _gen_tree(self, oHolder):
         """Convert the card set wrapped in oHolder to an ElementTree."""
-        dPhys = {}
         bInUse = oHolder.inuse
 
         oRoot = Element('physicalcardset', sutekh_xml_version=self.sMyVersion,
@@ -59,18 +80,7 @@ class PhysicalCardSetWriter(BaseXMLWriter):
         if bInUse:
             oRoot.attrib['inuse'] = 'Yes'
 
-        for oCard in oHolder.cards:
-            # ElementTree 1.2 doesn't support searching for attributes,
-            # so this is easier than using the tree directly. For
-            # elementtree 1.3, this should be reworked
-            oAbs = oCard.abstractCard
-            if oCard.expansion:
-                sExpName = oCard.expansion.name
-            else:
-                sExpName = 'None Specified'
-            tKey = (oAbs.name, sExpName)
-            dPhys.setdefault(tKey, 0)
-            dPhys[tKey] += 1
+        dPhys = self._get_card_counts(oHolder)
 
         # we sort by card name & expansion, as makes results more predictable
         for tKey in sorted(dPhys):
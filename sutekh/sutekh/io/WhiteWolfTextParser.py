@@ -8,9 +8,15 @@
 """Text Parser for extracting cards from the online cardlist.txt."""
 
 import re
+import time
+import multiprocessing
 from sutekh.io.SutekhBaseHTMLParser import LogStateWithInfo
-from logging import Logger
+from logging import Logger, Handler
 from sutekh.core.SutekhObjects import SutekhObjectMaker, csv_to_canonical
+from sutekh.core.BulkCardWriter import CardRecordMaker
+
+# Number of cards handed to each worker process at a time
+CHUNK_SIZE = 100
 
 
 def strip_braces(sText):
@@ -214,10 +220,17 @@ class CardDict(dict):
             'Rebekka, Chantry Elder of Munich': {'stealth': 1},
             }
 
-    def __init__(self, oLogger):
+    def __init__(self, oLogger, oMaker=None):
         super(CardDict, self).__init__()
         self.oLogger = oLogger
-        self._oMaker = SutekhObjectMaker()
+        if oMaker is None:
+            oMaker = SutekhObjectMaker()
+        self._oMaker = oMaker
+
+    def make_next(self):
+        """Return an empty CardDict for the next card, using the same
+           object maker."""
+        return CardDict(self.oLogger, self._oMaker)
 
     def _find_crypt_keywords(self, oCard):
         """Extract the bleed, strength & stealth keywords from the card text"""
@@ -601,6 +614,25 @@ class CardDict(dict):
         # FIXME: Pass back any error confitions? Missing text, etc.
 
 
+class PendingCardDict(CardDict):
+    """CardDict which collects the details of each card as a plain
+       dictionary, rather than saving it, so the cards can be saved later,
+       possibly in another process."""
+
+    def __init__(self, oLogger, aPending):
+        super(PendingCardDict, self).__init__(oLogger)
+        self._aPending = aPending
+
+    def make_next(self):
+        """Return an empty PendingCardDict, adding to the same list"""
+        return PendingCardDict(self.oLogger, self._aPending)
+
+    def save(self):
+        """Add the card details to the pending list"""
+        if 'name' in self:
+            self._aPending.append(dict(self))
+
+
 # Parsing helper functions
 def fix_clarification_markers(sLine):
     """Standardise the clarification markers from the text"""
@@ -637,7 +669,7 @@ class WaitingForCardName(LogStateWithInfo):
         if 'name' in self._dInfo:
             # Ensure we've saved existing card
             self._dInfo.save()
-        self._dInfo = CardDict(self.oLogger)
+        self._dInfo = self._dInfo.make_next()
 
 
 class InCard(LogStateWithInfo):
@@ -726,18 +758,31 @@ class InCardText(LogStateWithInfo):
 
 # Parser
 class WhiteWolfTextParser(object):
-    """Actual Parser for the WW cardlist text file(s)."""
+    """Actual Parser for the WW cardlist text file(s).
+
+       By default, the cards are created in the database as they are
+       parsed. oMaker can be used to supply a different object maker, such
+       as the CardRecordMaker used for bulk imports. If aPending is
+       given, the details of each card are appended to it as a dictionary
+       instead, and can be saved later using save_card_details.
+       """
 
-    def __init__(self, oLogHandler):
+    def __init__(self, oLogHandler, oMaker=None, aPending=None):
         self.oLogger = Logger('White wolf card parser')
         if oLogHandler is not None:
             self.oLogger.addHandler(oLogHandler)
+        self._oMaker = oMaker
+        self._aPending = aPending
         self._oState = None
         self.reset()
 
     def reset(self):
         """Reset the parser"""
-        self._oState = WaitingForCardName({}, self.oLogger)
+        if self._aPending is not None:
+            oCardDict = PendingCardDict(self.oLogger, self._aPending)
+        else:
+            oCardDict = CardDict(self.oLogger, self._oMaker)
+        self._oState = WaitingForCardName(oCardDict, self.oLogger)
 
     def parse(self, fIn):
         """Feed lines to the state machine"""
@@ -757,3 +802,81 @@ class WhiteWolfTextParser(object):
         # Strip BOM from line start
         sLine = sLine.decode('utf8').lstrip(u'\ufeff')
         self._oState = self._oState.transition(sLine, None)
+
+
+class MessageRecorder(Handler, object):
+    """Log handler which keeps the messages, so a worker process can pass
+       them back to be logged by the calling process."""
+    # We explicitly inherit from object, since Handler is a classic class
+    def __init__(self):
+        super(MessageRecorder, self).__init__()
+        self.aMessages = []
+
+    def emit(self, oRecord):
+        """Keep the level and the message"""
+        self.aMessages.append((oRecord.levelno, oRecord.getMessage()))
+
+
+def save_card_details(aCards):
+    """Save the card details collected by a parser with aPending set,
+       returning the list of CardRecords and the messages logged, as
+       (level, message) pairs.
+
+       This is the regex heavy part of the parsing, and doesn't touch the
+       database, so it can be run in a multiprocessing pool."""
+    # The worker's logger has no handlers of its own, so the messages are
+    # passed back to be logged by the calling process
+    oLogger = Logger('White wolf card parser')
+    oRecorder = MessageRecorder()
+    oLogger.addHandler(oRecorder)
+    oMaker = CardRecordMaker()
+    for dDetails in aCards:
+        oCardDict = CardDict(oLogger, oMaker)
+        oCardDict.update(dDetails)
+        oCardDict.save()
+    return oMaker.get_records(), oRecorder.aMessages
+
+
+def parse_card_records(aWwFiles, oLogHandler=None, iProcesses=1):
+    """Parse the card list files into a list of CardRecords, ready for the
+       BulkCardWriter.
+
+       If iProcesses is more than 1, the card list is split into cards
+       serially, and the cards are then saved to records in chunks by a
+       multiprocessing pool. The records are returned in the same order
+       as a serial parse, so the database contents are the same either
+       way."""
+    fStart = time.time()
+    oMaker = CardRecordMaker()
+    aPending = None
+    if iProcesses > 1:
+        aPending = []
+    oParser = WhiteWolfTextParser(oLogHandler, oMaker, aPending)
+    for oFile in aWwFiles:
+        fIn = oFile.open()
+        oParser.parse(fIn)
+        fIn.close()
+    if aPending is None:
+        aRecords = oMaker.get_records()
+    else:
+        aRecords = []
+        aChunks = [aPending[iPos:iPos + CHUNK_SIZE] for iPos in
+                range(0, len(aPending), CHUNK_SIZE)]
+        oPool = multiprocessing.Pool(iProcesses)
+        try:
+            # imap returns the results in order
+            for aChunkRecords, aMessages in oPool.imap(save_card_details,
+                    aChunks):
+                # Report the progress and any problems as a serial parse
+                # does
+                for iLevel, sMessage in aMessages:
+                    oParser.oLogger.log(iLevel, sMessage)
+                aRecords.extend(aChunkRecords)
+        finally:
+            oPool.terminate()
+            oPool.join()
+    fTime = max(time.time() - fStart, 0.001)
+    oParser.oLogger.info('Parsed %d cards in %.2f seconds,'
+            ' %.0f cards per second', len(aRecords), fTime,
+            len(aRecords) / fTime)
+    return aRecords
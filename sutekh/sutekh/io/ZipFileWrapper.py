@@ -10,19 +10,47 @@
    Sutekh needs."""
 
 import zipfile
+import zlib
 import datetime
+import itertools
+import multiprocessing
 from StringIO import StringIO
 from logging import Logger
-from sqlobject import sqlhub, SQLObjectNotFound
-from sutekh.core.SutekhObjects import PhysicalCardSet, PHYSICAL_SET_LIST
+from sqlobject import sqlhub
+from sqlobject.sqlbuilder import Select, IN, AND, func
+from sutekh.core.SutekhObjects import PhysicalCardSet, PhysicalCard, \
+        AbstractCard, Expansion, MapPhysicalCardToPhysicalCardSet
 from sutekh.core.CardLookup import DEFAULT_LOOKUP
 from sutekh.core.CardSetHolder import CachedCardSetHolder, CardSetWrapper
-from sutekh.SutekhUtility import refresh_tables
+from sutekh.core.BulkCardSetWriter import BulkCardSetWriter
+from sutekh.core.QueryProfiler import profile_operation
 from sutekh.io.PhysicalCardParser import PhysicalCardParser
 from sutekh.io.PhysicalCardSetParser import PhysicalCardSetParser
 from sutekh.io.AbstractCardSetParser import AbstractCardSetParser
 from sutekh.io.PhysicalCardSetWriter import PhysicalCardSetWriter
 from sutekh.io.IdentifyXMLFile import IdentifyXMLFile
+# pylint: disable-msg=E0611, F0401
+# pylint doesn't like the handling of the differences between 2.4 and 2.5
+try:
+    from xml.etree.ElementTree import parse
+except ImportError:
+    from elementtree.ElementTree import parse
+# For compatability with ElementTree 1.3
+try:
+    from xml.etree.ElementTree import ParseError
+except ImportError:
+    from xml.parsers.expat import ExpatError as ParseError
+# pylint: enable-msg=E0611, F0401
+
+# Number of card sets handed to a worker process at a time
+CHUNK_SIZE = 20
+
+# The parsers for the card set types we restore
+RESTORE_PARSERS = {
+        'PhysicalCardSet': PhysicalCardSetParser,
+        'AbstractCardSet': AbstractCardSetParser,
+        'PhysicalCard': PhysicalCardParser,
+        }
 
 
 def _parse_string(oParser, sIn, oHolder):
@@ -33,6 +61,158 @@ def _parse_string(oParser, sIn, oHolder):
     oParser.parse(oFile, oHolder)
 
 
+def _parse_tree(sIn):
+    """Parse the string into an ElementTree, returning None if it isn't
+       XML."""
+    try:
+        return parse(StringIO(sIn))
+    except ParseError:
+        return None
+
+
+def _get_key(sName):
+    """Encode card set names as CardSetHolder does, so names from
+       the XML files can be compared with the holder names."""
+    if isinstance(sName, unicode):
+        return sName.encode('utf8')
+    return sName
+
+
+def sort_card_sets(aEntries):
+    """Sort (zip file entry name, card set holder) pairs so each card set
+       comes after its parent.
+
+       Card sets are otherwise kept in the given order. Raises IOError if
+       any parents are missing or the parents form a loop."""
+    dChildren = {}
+    aSorted = []
+    for tEntry in aEntries:
+        oHolder = tEntry[1]
+        if oHolder.parent:
+            dChildren.setdefault(_get_key(oHolder.parent), []).append(tEntry)
+        else:
+            aSorted.append(tEntry)
+    # aSorted grows as we go, so this walks the hierarchy breadth first
+    for _sFilename, oHolder in aSorted:
+        aSorted.extend(dChildren.pop(_get_key(oHolder.name), []))
+    if dChildren:
+        aMissing = []
+        for aChildren in dChildren.itervalues():
+            aMissing.extend([sFilename for sFilename, _oHolder in aChildren])
+        raise IOError('Card sets with unstatisfiable parents %s' %
+                ','.join(sorted(aMissing)))
+    return aSorted
+
+
+def _get_zip_name(sName):
+    """Return the name of the zip file entry for the card set sName"""
+    sZName = sName.replace(" ", "_")
+    sZName = sZName.replace("/", "_")
+    sZipName = '%s.xml' % sZName
+    return sZipName.encode('ascii', 'xmlcharrefreplace')
+
+
+def _read_card_counts(aIds):
+    """Read the card counts for the card sets with the given ids.
+
+       This is a single query over the physical card set map, grouped by
+       card set, rather than a query per card set. Returns a dictionary
+       of card set id to a dictionary of (card name, expansion name) to
+       count, as PhysicalCardSetWriter expects."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    if not aIds:
+        return {}
+    oMapQ = MapPhysicalCardToPhysicalCardSet.q
+    oSelect = Select([oMapQ.physicalCardSetID, PhysicalCard.q.abstractCardID,
+        PhysicalCard.q.expansionID, func.SUM(oMapQ.count)],
+        where=AND(oMapQ.physicalCardID == PhysicalCard.q.id,
+            IN(oMapQ.physicalCardSetID, aIds)),
+        groupBy=[oMapQ.physicalCardSetID, PhysicalCard.q.abstractCardID,
+            PhysicalCard.q.expansionID])
+    oConn = sqlhub.processConnection
+    dCounts = {}
+    dCardNames = {}
+    dExpNames = {None: 'None Specified'}
+    for iSetId, iAbsId, iExpId, iCount in oConn.queryAll(
+            oConn.sqlrepr(oSelect)):
+        # The objects are usually in the object cache, so these are cheap
+        if iAbsId not in dCardNames:
+            dCardNames[iAbsId] = AbstractCard.get(iAbsId).name
+        if iExpId not in dExpNames:
+            dExpNames[iExpId] = Expansion.get(iExpId).name
+        dCounts.setdefault(iSetId, {})[(dCardNames[iAbsId],
+            dExpNames[iExpId])] = int(iCount)
+    return dCounts
+
+
+class CardSetDump(object):
+    """The details of a card set needed to write it to the zip file.
+
+       This is a plain copy of the card set properties and card counts,
+       so it can be handed to the worker processes."""
+    # pylint: disable-msg=R0903
+    # Simple data holder
+
+    def __init__(self, oPCSet, dCounts):
+        oHolder = CardSetWrapper(oPCSet)
+        self.name = oHolder.name
+        self.author = oHolder.author
+        self.comment = oHolder.comment
+        self.annotations = oHolder.annotations
+        self.inuse = oHolder.inuse
+        self.parent = oHolder.parent
+        self.dCounts = dCounts
+
+
+class CardSetDumpWriter(PhysicalCardSetWriter):
+    """Writer for CardSetDumps, which already have the card counts"""
+
+    def _get_card_counts(self, oHolder):
+        """Return the counts read from the database"""
+        return oHolder.dCounts
+
+
+def compress_card_set(oDump):
+    """Generate the XML for the CardSetDump and compress it.
+
+       Returns the card set name, the zip file entry name, the length and
+       CRC of the XML and the compressed XML, ready for the zip file. This
+       doesn't touch the database, so it can be run in a multiprocessing
+       pool."""
+    oFile = StringIO()
+    CardSetDumpWriter().write(oFile, oDump)
+    sData = oFile.getvalue()
+    oFile.close()
+    # Raw deflate stream, as zipfile uses for ZIP_DEFLATED
+    oCompressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+            zlib.DEFLATED, -15)
+    sCompressed = oCompressor.compress(sData) + oCompressor.flush()
+    return (oDump.name, _get_zip_name(oDump.name), len(sData),
+            zlib.crc32(sData) & 0xffffffffL, sCompressed)
+
+
+def _write_compressed(oZip, oInfo, iSize, iCRC, sCompressed):
+    """Add an already deflated entry to the zip file.
+
+       zipfile has no interface for this, so we follow what
+       ZipFile.writestr does after compressing the data."""
+    # pylint: disable-msg=W0212
+    # We need to use zipfile's internals here
+    oInfo.file_size = iSize
+    oInfo.CRC = iCRC
+    oInfo.compress_size = len(sCompressed)
+    oInfo.compress_type = zipfile.ZIP_DEFLATED
+    oInfo.header_offset = oZip.fp.tell()
+    oZip._writecheck(oInfo)
+    oZip._didModify = True
+    oZip.fp.write(oInfo.FileHeader())
+    oZip.fp.write(sCompressed)
+    oZip.fp.flush()
+    oZip.filelist.append(oInfo)
+    oZip.NameToInfo[oInfo.filename] = oInfo
+
+
 class ZipFileWrapper(object):
     """The zip file wrapper.
 
@@ -56,147 +236,137 @@ class ZipFileWrapper(object):
         self.oZip.close()
         self.oZip = None
 
-    def write_pcs_list_to_zip(self, aPCSList, oLogger):
-        """Write the given list of card sets to the zip file"""
+    def write_pcs_list_to_zip(self, aPCSList, oLogger, iProcesses=1):
+        """Write the given list of card sets to the zip file.
+
+           The card counts for all the card sets are read in a single
+           query. If iProcesses is more than 1, the XML is generated and
+           compressed by a multiprocessing pool, and the entries are
+           added to the zip file as they are finished."""
         bClose = False
         tTime = datetime.datetime.now().timetuple()
         if self.oZip is None:
             self.__open_zip_for_write()
             bClose = True
+        aPCSList = list(aPCSList)
+        dCounts = _read_card_counts([oPCSet.id for oPCSet in aPCSList])
+        aDumps = [CardSetDump(oPCSet, dCounts.get(oPCSet.id, {})) for oPCSet
+                in aPCSList]
+        oPool = None
+        if iProcesses > 1:
+            oPool = multiprocessing.Pool(iProcesses)
+            aResults = oPool.imap(compress_card_set, aDumps, CHUNK_SIZE)
+        else:
+            aResults = itertools.imap(compress_card_set, aDumps)
         aList = []
-        for oPCSet in aPCSList:
-            sZName = oPCSet.name
-            oWriter = PhysicalCardSetWriter()
-            oHolder = CardSetWrapper(oPCSet)
-            oFile = StringIO()
-            oWriter.write(oFile, oHolder)
-            oString = oFile.getvalue()
-            oFile.close()
-            sZName = sZName.replace(" ", "_")
-            sZName = sZName.replace("/", "_")
-            sZipName = '%s.xml' % sZName
-            sZipName = sZipName.encode('ascii', 'xmlcharrefreplace')
-            aList.append(sZipName)
-            # ZipInfo will just use the 1st 6 fields in tTime
-            oInfoObj = zipfile.ZipInfo(sZipName, tTime)
-            # Set permissions on the created file - see issue 3394 on the
-            # python bugtracker. Docs say this is safe on all platforms
-            oInfoObj.external_attr = 0600 << 16L
-            oInfoObj.compress_type = zipfile.ZIP_DEFLATED
-            self.oZip.writestr(oInfoObj, oString)
-            oLogger.info('PCS: %s written', oPCSet.name)
+        try:
+            # imap returns the results in order, so the zip file matches
+            # the order of aPCSList
+            for sName, sZipName, iSize, iCRC, sCompressed in aResults:
+                aList.append(sZipName)
+                # ZipInfo will just use the 1st 6 fields in tTime
+                oInfoObj = zipfile.ZipInfo(sZipName, tTime)
+                # Set permissions on the created file - see issue 3394 on
+                # the python bugtracker. Docs say this is safe on all
+                # platforms
+                oInfoObj.external_attr = 0600 << 16L
+                _write_compressed(self.oZip, oInfoObj, iSize, iCRC,
+                        sCompressed)
+                oLogger.info('PCS: %s written', sName)
+        finally:
+            if oPool is not None:
+                oPool.terminate()
+                oPool.join()
         if bClose:
             self.__close_zip()
         return aList
 
+    def _read_card_sets(self, oLogger):
+        """Read all the card sets in the zip file into card set holders.
+
+           Each entry is read once, and only the card sets are parsed
+           into trees. Returns a list of (entry name, holder) pairs, in
+           the zip file order. Raises IOError if there are no physical
+           card sets."""
+        oIdParser = IdentifyXMLFile()
+        aEntries = []
+        aPhysCardSets = []
+        bOldStyle = False
+        for oItem in self.oZip.infolist():
+            sData = self.oZip.read(oItem.filename)
+            # Only build the tree for the entries we restore
+            _parse_string(oIdParser, sData, None)
+            if oIdParser.type not in RESTORE_PARSERS:
+                continue
+            oTree = _parse_tree(sData)
+            if oTree is None:
+                continue
+            oHolder = CachedCardSetHolder()
+            RESTORE_PARSERS[oIdParser.type]().parse_tree(oTree, oHolder)
+            if oIdParser.type == 'PhysicalCard':
+                bOldStyle = True
+            elif oIdParser.type == 'PhysicalCardSet':
+                aPhysCardSets.append(oHolder)
+            aEntries.append((oItem.filename, oHolder))
+            oLogger.info('%s %s read', oIdParser.type, oItem.filename)
+        # The zip file must contain at least 1 PCS or the old PhysicalCard
+        # list
+        if not aPhysCardSets and not bOldStyle:
+            raise IOError("No valid card sets found in the zip file.")
+        if bOldStyle:
+            # Old style backups have the physical card list as
+            # 'My Collection', so the card sets need to be children of it
+            for oHolder in aPhysCardSets:
+                # pylint: disable-msg=E1103
+                # SQLObject confuses pylint
+                oHolder.parent = 'My Collection'
+        return aEntries
+
+    @profile_operation('Restore backup')
     def do_restore_from_zip(self, oCardLookup=DEFAULT_LOOKUP,
             oLogHandler=None):
-        """Recover data from the zip file"""
+        """Recover data from the zip file.
+
+           The card sets are sorted so parents come first, and the cards
+           are looked up before anything is changed. The existing card sets
+           are then replaced by the new ones in a single BulkCardSetWriter
+           transaction, so they are kept if the restore fails."""
         self._aWarnings = []
-        bTablesRefreshed = False
-        bOldStyle = False
         self.__open_zip_for_read()
         oLogger = Logger('Restore zip file')
         if oLogHandler is not None:
             oLogger.addHandler(oLogHandler)
             if hasattr(oLogHandler, 'set_total'):
                 oLogHandler.set_total(len(self.oZip.infolist()))
-        # We do this so we can accomodate user created zipfiles,
-        # that don't nessecarily have the ordering we want
-        oIdParser = IdentifyXMLFile()
-        # check that the zip file contains at least 1 PCS or the old
-        # PhysicalCard list
-        for oItem in self.oZip.infolist():
-            oData = self.oZip.read(oItem.filename)
-            _parse_string(oIdParser, oData, None)
-            if ((oIdParser.type == 'PhysicalCard' or
-                    oIdParser.type == 'PhysicalCardSet') and not
-                    bTablesRefreshed):
-                # We delete the Physical Card Sets
-                # Since this is restoring the contents of a zip file,
-                # hopefully this is safe to do
-                # if we fail, the database will be in an inconsitent state,
-                # but that's going to be true anyway
-                refresh_tables(PHYSICAL_SET_LIST, sqlhub.processConnection)
-                bTablesRefreshed = True
-            if oIdParser.type == 'PhysicalCard':
-                bOldStyle = True
-        if not bTablesRefreshed:
-            raise IOError("No valid card sets found in the zip file.")
-        # We try and restore the old PCS's ensuring parents exist
+        try:
+            # We do this so we can accomodate user created zipfiles,
+            # that don't nessecarily have the ordering we want
+            aEntries = self._read_card_sets(oLogger)
+        finally:
+            self.__close_zip()
+        aEntries = sort_card_sets(aEntries)
+        # The lookups may ask the user about unknown cards, so they must
+        # all be done before the existing card sets are removed
         dLookupCache = {}
-        aToRead = self.oZip.infolist()
-        while len(aToRead) > 0:
-            aToRead = self.read_items(aToRead, oCardLookup, oLogger, bOldStyle,
-                    dLookupCache)
-        self.__close_zip()
-
-    # pylint: disable-msg=R0913
-    # we may need all these arguments
-    def read_items(self, aList, oCardLookup, oLogger, bOldStyle, dLookupCache):
-        """Read a list of CardSet items from the card list, reaturning
-           a list of those that couldn't be read because their parents
-           weren't read first"""
-        aToRead = []
-        oIdParser = IdentifyXMLFile()
-        oOldConn = sqlhub.processConnection
-        oTrans = oOldConn.transaction()
-        sqlhub.processConnection = oTrans
-        for oItem in aList:
-            bReparent = False
-            oData = self.oZip.read(oItem.filename)
-            _parse_string(oIdParser, oData, None)
-            if oIdParser.type == 'PhysicalCardSet':
-                # We check whether the parent has been read already
-                if bOldStyle:
-                    # We need to reparent this card set
-                    try:
-                        # card set holder will handle setting the parent
-                        PhysicalCardSet.selectBy(
-                                name='My Collection').getOne()
-                        bReparent = True
-                        oParser = PhysicalCardSetParser()
-                    except SQLObjectNotFound:
-                        # Card Collection not there yet, so delay
-                        aToRead.append(oItem)
-                        continue
-                elif oIdParser.parent_exists:
-                    oParser = PhysicalCardSetParser()
-                else:
-                    aToRead.append(oItem)
-                    continue
-            elif oIdParser.type == 'AbstractCardSet':
-                oParser = AbstractCardSetParser()
-            elif oIdParser.type == 'PhysicalCard':
-                oParser = PhysicalCardParser()
-            else:
-                continue
-            oHolder = CachedCardSetHolder()
-            _parse_string(oParser, oData, oHolder)
-            if bReparent:
-                # pylint: disable-msg=E1103
-                # SQLObject confuses pylint
-                oHolder.parent = 'My Collection'
-            oHolder.create_pcs(oCardLookup, dLookupCache)
+        aCardSets = []
+        for _sFilename, oHolder in aEntries:
+            aCardSets.append((oHolder, oHolder.lookup_physical_cards(
+                oCardLookup, dLookupCache)))
+        BulkCardSetWriter(oLogHandler).write(aCardSets, bReplace=True)
+        for oHolder, _aPhysCards in aCardSets:
             self._aWarnings.extend(oHolder.get_warnings())
-            oLogger.info('%s %s read', oIdParser.type, oItem.filename)
-        oTrans.commit(close=True)
-        sqlhub.processConnection = oOldConn
-        if len(aToRead) == len(aList):
-            # We were unable to read any items this loop, so we fail
-            raise IOError('Card sets with unstatisfiable parents %s' %
-                    ','.join([x.filename for x in aToRead]))
-        return aToRead
 
-    # pylint: enable-msg=R0913
-
-    def do_dump_all_to_zip(self, oLogHandler=None):
+    def do_dump_all_to_zip(self, oLogHandler=None, iProcesses=1):
         """Dump all the database contents to the zip file"""
         aPhysicalCardSets = PhysicalCardSet.select()
-        return self.do_dump_list_to_zip(aPhysicalCardSets, oLogHandler)
+        return self.do_dump_list_to_zip(aPhysicalCardSets, oLogHandler,
+                iProcesses)
+
+    @profile_operation('Write backup')
+    def do_dump_list_to_zip(self, aCSList, oLogHandler=None, iProcesses=1):
+        """Handle dumping a list of cards to the zip file with log fiddling.
 
-    def do_dump_list_to_zip(self, aCSList, oLogHandler=None):
-        """Handle dumping a list of cards to the zip file with log fiddling"""
+           iProcesses is passed to write_pcs_list_to_zip."""
         self.__open_zip_for_write()
         oLogger = Logger('Write zip file')
         if oLogHandler is not None:
@@ -208,7 +378,7 @@ class ZipFileWrapper(object):
                     oLogHandler.set_total(iTotal)
                 else:
                     oLogHandler.set_total(len(aCSList))
-        aPCSList = self.write_pcs_list_to_zip(aCSList, oLogger)
+        aPCSList = self.write_pcs_list_to_zip(aCSList, oLogger, iProcesses)
         self.__close_zip()
         return aPCSList
 
@@ -230,13 +400,13 @@ class ZipFileWrapper(object):
         """Read a single card set into a card set holder."""
         self.__open_zip_for_read()
         oIdParser = IdentifyXMLFile()
-        oData = self.oZip.read(sFilename)
-        _parse_string(oIdParser, oData, None)
+        oTree = _parse_tree(self.oZip.read(sFilename))
         oHolder = None
-        if oIdParser.type == 'PhysicalCardSet':
-            oParser = PhysicalCardSetParser()
-            oHolder = CachedCardSetHolder()
-            _parse_string(oParser, oData, oHolder)
+        if oTree is not None:
+            oIdParser.identify_tree(oTree)
+            if oIdParser.type == 'PhysicalCardSet':
+                oHolder = CachedCardSetHolder()
+                PhysicalCardSetParser().parse_tree(oTree, oHolder)
         self.__close_zip()
         return oHolder
 
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Benchmarks for the slow paths in Sutekh.
+
+   A synthetic database is generated from the test card list, copied as
+   many times as needed, with a tree of card sets of the requested size,
+   and the card list loading, filtering, card list models, backups and
+   database upgrade are timed on it. The results are written as JSON, so
+   runs can be compared to catch performance regressions.
+
+   Usage: python -m sutekh.tests.Benchmark [options]
+   """
+
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import sqlite3
+import platform
+import tempfile
+import optparse
+from sqlobject import sqlhub, connectionForURI
+from sutekh.core.SutekhObjects import TABLE_LIST, PhysicalCard, \
+        PhysicalCardSet, AbstractCard
+from sutekh.core.CardSetHolder import CardSetHolder
+from sutekh.core.BulkCardSetWriter import BulkCardSetWriter
+from sutekh.core.FilterParser import FilterParser
+from sutekh.core.DatabaseUpgrade import attempt_database_upgrade
+from sutekh.SutekhUtility import read_white_wolf_list, refresh_tables
+from sutekh.io.WwFile import WwFile
+from sutekh.io.ZipFileWrapper import ZipFileWrapper
+from sutekh.tests.TestCore import make_null_handler
+from sutekh.tests.TestData import TEST_CARD_LIST
+
+# Filters timed on the card list
+FILTERS = [
+        'CardType in Vampire',
+        'Clan in "Follower of Set", Ravnos',
+        'Discipline in obf, pot',
+        'Discipline_with_Level in cel with superior',
+        'CardText in strike',
+        'CardName in Path',
+        'CardType in Equipment && Cost in 2,5',
+        ]
+
+# Default sizes of the synthetic database
+DEFAULT_SCALE = {
+        'copies': 10,
+        'card sets': 50,
+        'depth': 4,
+        'cards per set': 60,
+        }
+
+
+def make_card_list(iCopies):
+    """Return a card list with iCopies copies of each of the test cards.
+
+       The copies are renamed, so they're distinct cards."""
+    aCards = [sCard.strip() for sCard in TEST_CARD_LIST.split('\nName: ')
+            if sCard.strip()]
+    aCards[0] = aCards[0][len('Name: '):]
+    aList = []
+    for iCopy in range(iCopies):
+        for sCard in aCards:
+            if iCopy:
+                sName, sRest = sCard.split('\n', 1)
+                sCard = '%s (Copy %d)\n%s' % (sName, iCopy, sRest)
+            aList.append('Name: %s\n' % sCard)
+    return '\n'.join(aList)
+
+
+def make_card_sets(iSets, iDepth, iCards, oRandom):
+    """Create iSets card sets of iCards cards each, arranged in a tree iDepth
+       levels deep.
+
+       Returns the names of the card sets, in the order they were
+       created, so the first is the top of the tree and the last is one of
+       the deepest children."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    aPhysCards = list(PhysicalCard.select())
+    aLevels = [[] for _iLevel in range(iDepth)]
+    aCardSets = []
+    aNames = []
+    for iSet in range(iSets):
+        oHolder = CardSetHolder()
+        oHolder.name = 'Benchmark Set %d' % iSet
+        oHolder.author = 'Benchmark'
+        # The first card sets make a chain, so the tree is as deep as
+        # requested, and the rest are spread over the levels
+        if iSet < iDepth:
+            iLevel = iSet
+        else:
+            iLevel = oRandom.randint(0, iDepth - 1)
+        if iLevel > 0:
+            oHolder.parent = oRandom.choice(aLevels[iLevel - 1])
+        aLevels[iLevel].append(oHolder.name)
+        aNames.append(oHolder.name)
+        aCardSets.append((oHolder, [oRandom.choice(aPhysCards) for _iCard in
+            range(iCards)]))
+    BulkCardSetWriter(make_null_handler()).write(aCardSets)
+    return aNames
+
+
+class BenchmarkRunner(object):
+    """Time functions, keeping the best of several runs"""
+
+    def __init__(self, iRepeats, bVerbose):
+        self.iRepeats = iRepeats
+        self.bVerbose = bVerbose
+        self.aResults = []
+
+    def time(self, sName, fFunc, *aArgs):
+        """Time fFunc(*aArgs), and record the result under sName.
+
+           Returns the result of the last call."""
+        aTimes = []
+        oResult = None
+        for _iRun in range(self.iRepeats):
+            fStart = time.time()
+            oResult = fFunc(*aArgs)
+            aTimes.append(time.time() - fStart)
+        self.add(sName, aTimes)
+        return oResult
+
+    def add(self, sName, aTimes):
+        """Record the times for sName"""
+        self.aResults.append({
+            'name': sName,
+            'best': min(aTimes),
+            'mean': sum(aTimes) / len(aTimes),
+            'times': aTimes,
+            })
+        if self.bVerbose:
+            print >> sys.stderr, '%-60s %8.4f' % (sName, min(aTimes))
+
+    def skip(self, sName, sReason):
+        """Record that sName couldn't be run"""
+        self.aResults.append({'name': sName, 'skipped': sReason})
+        if self.bVerbose:
+            print >> sys.stderr, '%-60s skipped: %s' % (sName, sReason)
+
+
+def bench_card_list(oRunner, sCardList, sTempDir, iProcesses):
+    """Time reading the card list into a fresh database"""
+    sFile = os.path.join(sTempDir, 'cardlist.txt')
+    fOut = open(sFile, 'w')
+    fOut.write(sCardList)
+    fOut.close()
+    oLogHandler = make_null_handler()
+    aTimes = []
+    # This isn't repeated with BenchmarkRunner.time, since the tables
+    # must be recreated each time
+    for _iRun in range(oRunner.iRepeats):
+        refresh_tables(TABLE_LIST, sqlhub.processConnection)
+        fStart = time.time()
+        read_white_wolf_list([WwFile(sFile)], oLogHandler, iProcesses)
+        aTimes.append(time.time() - fStart)
+    oRunner.add('read_white_wolf_list', aTimes)
+
+
+def bench_filters(oRunner):
+    """Time parsing and running the filters"""
+    oParser = FilterParser()
+    for sFilter in FILTERS:
+        oRunner.time('filter parse: %s' % sFilter, oParser.apply, sFilter)
+        oFilter = oParser.apply(sFilter).get_filter()
+        oRunner.time('filter select: %s' % sFilter,
+                lambda: list(oFilter.select(AbstractCard).distinct()))
+
+
+def bench_models(oRunner, aNames, sTempDir):
+    """Time loading the card list models, if gtk is available"""
+    # pylint: disable-msg=W0612, F0401
+    # gtk may not be available, and is only needed by the models
+    try:
+        import gtk
+    except ImportError:
+        oRunner.skip('card list models', 'gtk not available')
+        return
+    from sutekh.gui.ConfigFile import ConfigFile
+    from sutekh.gui.CardListModel import CardListModel
+    from sutekh.gui.CardSetListModel import CardSetCardListModel, \
+            THIS_SET_ONLY, ALL_CARDS, PARENT_CARDS, CHILD_CARDS, \
+            NO_SECOND_LEVEL, SHOW_EXPANSIONS, SHOW_CARD_SETS, \
+            EXP_AND_CARD_SETS, CARD_SETS_AND_EXP, PARENT_COUNT
+    # pylint: enable-msg=W0612, F0401
+    oConfig = ConfigFile(os.path.join(sTempDir, 'sutekh.ini'))
+    oConfig.validate()
+    oModel = CardListModel(oConfig)
+    oRunner.time('CardListModel.load', oModel.load)
+    oModel.cleanup()
+    dCountModes = {'THIS_SET_ONLY': THIS_SET_ONLY, 'ALL_CARDS': ALL_CARDS,
+            'PARENT_CARDS': PARENT_CARDS, 'CHILD_CARDS': CHILD_CARDS}
+    dLevelModes = {'NO_SECOND_LEVEL': NO_SECOND_LEVEL,
+            'SHOW_EXPANSIONS': SHOW_EXPANSIONS,
+            'SHOW_CARD_SETS': SHOW_CARD_SETS,
+            'EXP_AND_CARD_SETS': EXP_AND_CARD_SETS,
+            'CARD_SETS_AND_EXP': CARD_SETS_AND_EXP}
+    # The top of the tree has the most children, and the last set is
+    # deepest in the tree
+    for sSet in (aNames[0], aNames[-1]):
+        oModel = CardSetCardListModel(sSet, oConfig)
+        # pylint: disable-msg=W0212
+        # We need to set the modes directly
+        oModel._change_parent_count_mode(PARENT_COUNT)
+        for sCount, iCount in sorted(dCountModes.items()):
+            oModel._change_count_mode(iCount)
+            for sLevel, iLevel in sorted(dLevelModes.items()):
+                oModel._change_level_mode(iLevel)
+                oRunner.time('CardSetCardListModel.load: %s, %s, %s' % (
+                    sSet, sCount, sLevel), oModel.load)
+        oModel.cleanup()
+
+
+def bench_zip(oRunner, sTempDir):
+    """Time dumping and restoring all the card sets"""
+    sZipFile = os.path.join(sTempDir, 'backup.zip')
+    oLogHandler = make_null_handler()
+    oRunner.time('ZipFileWrapper dump', lambda:
+            ZipFileWrapper(sZipFile).do_dump_all_to_zip(oLogHandler))
+    oRunner.time('ZipFileWrapper restore', lambda:
+            ZipFileWrapper(sZipFile).do_restore_from_zip(
+                oLogHandler=oLogHandler))
+
+
+def bench_upgrade(oRunner):
+    """Time the database upgrade, which copies the whole database to
+       memory and back"""
+    oLogHandler = make_null_handler()
+    oRunner.time('attempt_database_upgrade', attempt_database_upgrade,
+            oLogHandler)
+
+
+def run_benchmarks(dScale, iRepeats=3, iProcesses=1, iSeed=0,
+        bVerbose=False):
+    """Create the synthetic database and run all the benchmarks.
+
+       Returns the dictionary written as the JSON output."""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    sTempDir = tempfile.mkdtemp(prefix='sutekhbench')
+    # We may be called without a database set up
+    oOrigConn = getattr(sqlhub, 'processConnection', None)
+    try:
+        sDbFile = os.path.join(sTempDir, 'sutekh.db')
+        # windows is different, since we don't have a starting / for the
+        # path
+        if sys.platform.startswith("win"):
+            sDbFile = '/' + sDbFile.replace(os.sep, '/')
+        sqlhub.processConnection = connectionForURI('sqlite://%s' % sDbFile)
+        oRunner = BenchmarkRunner(iRepeats, bVerbose)
+        bench_card_list(oRunner, make_card_list(dScale['copies']), sTempDir,
+                iProcesses)
+        aNames = make_card_sets(dScale['card sets'], dScale['depth'],
+                dScale['cards per set'], random.Random(iSeed))
+        dSizes = {
+                'abstract cards': AbstractCard.select().count(),
+                'physical cards': PhysicalCard.select().count(),
+                'card sets': PhysicalCardSet.select().count(),
+                }
+        bench_filters(oRunner)
+        bench_models(oRunner, aNames, sTempDir)
+        bench_zip(oRunner, sTempDir)
+        # This recreates the tables, so it goes last
+        bench_upgrade(oRunner)
+        sqlhub.processConnection.close()
+    finally:
+        if oOrigConn is not None:
+            sqlhub.processConnection = oOrigConn
+        shutil.rmtree(sTempDir)
+    return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': dScale,
+            'sizes': dSizes,
+            'repeats': iRepeats,
+            'results': oRunner.aResults,
+            }
+
+
+def main(aArgs):
+    """Parse the options and run the benchmarks"""
+    oOptParser = optparse.OptionParser(usage="usage: %prog [options]")
+    oOptParser.add_option("-o", "--output", type="string", dest="output",
+            default=None, help="Write the JSON results to this file"
+            " (default is stdout)")
+    oOptParser.add_option("-n", "--repeats", type="int", dest="repeats",
+            default=3, help="Number of times to run each benchmark")
+    oOptParser.add_option("-j", "--processes", type="int", dest="processes",
+            default=1, help="Processes used to parse the card list")
+    oOptParser.add_option("--seed", type="int", dest="seed", default=0,
+            help="Seed for the random card sets")
+    oOptParser.add_option("--verbose", action="store_true", dest="verbose",
+            default=False, help="Print the times as they're measured")
+    for sKey, iDefault in sorted(DEFAULT_SCALE.items()):
+        sOption = sKey.replace(' ', '-')
+        oOptParser.add_option("--%s" % sOption, type="int",
+                dest=sOption.replace('-', '_'), default=iDefault,
+                help="Scale of the synthetic database: %s (default %d)" % (
+                    sKey, iDefault))
+    oOpts, aArgs = oOptParser.parse_args(aArgs)
+    if len(aArgs) != 1:
+        oOptParser.print_help()
+        return 1
+    dScale = {}
+    for sKey in DEFAULT_SCALE:
+        dScale[sKey] = getattr(oOpts, sKey.replace(' ', '_'))
+    if dScale['depth'] < 1 or dScale['card sets'] < dScale['depth']:
+        print >> sys.stderr, 'Need at least as many card sets as levels'
+        return 1
+    dOutput = run_benchmarks(dScale, oOpts.repeats, oOpts.processes,
+            oOpts.seed, oOpts.verbose)
+    if oOpts.output:
+        fOut = open(oOpts.output, 'w')
+    else:
+        fOut = sys.stdout
+    json.dump(dOutput, fOut, indent=2, sort_keys=True)
+    fOut.write('\n')
+    if oOpts.output:
+        fOut.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
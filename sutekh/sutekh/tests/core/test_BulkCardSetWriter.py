@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test changing the card counts in bulk"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.tests.core.test_Filters import make_card
+from sutekh.core.SutekhObjects import PhysicalCardSet, \
+        MapPhysicalCardToPhysicalCardSet
+from sutekh.core.BulkCardSetWriter import CardCountWriter
+from sutekh.core.CardSetCountStore import CardSetCountStore
+from sutekh.core.CountedRelatedJoin import set_count_storage
+from sutekh.core.DBSignals import send_bulk_changed_signal
+import unittest
+
+
+class CardCountWriterTests(SutekhTest):
+    """Class for the bulk card count tests."""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def _check_counts(self, oPCS, dExpected):
+        """Check the cards in the card set"""
+        dCounts = {}
+        for oCard in oPCS.cards:
+            dCounts[oCard] = dCounts.get(oCard, 0) + 1
+        self.assertEqual(dCounts, dExpected)
+
+    def _do_test(self):
+        """Change the counts and check the results"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oPCS = PhysicalCardSet(name='Test Set')
+        oOther = PhysicalCardSet(name='Other Set')
+        oCard1 = make_card('Alexandra', 'CE')
+        oCard2 = make_card('.44 magnum', 'Jyhad')
+        oCard3 = make_card('Abebe', None)
+        oNoExp = make_card('Alexandra', None)
+        oPCS.addPhysicalCard(oCard1.id)
+        oPCS.addPhysicalCard(oCard1.id)
+        oPCS.addPhysicalCard(oCard2.id)
+        oOther.addPhysicalCard(oCard2.id)
+
+        dDone = CardCountWriter().write({
+            oPCS: {oCard2: 3, oCard3: 2},
+            oOther: {oCard2: -5, oCard1: 1},
+            })
+        self.assertEqual(dDone, {
+            oPCS: {oCard2: 3, oCard3: 2},
+            oOther: {oCard2: -1, oCard1: 1},
+            })
+        self._check_counts(oPCS, {oCard1: 2, oCard2: 4, oCard3: 2})
+        self._check_counts(oOther, {oCard1: 1})
+
+        # Removing copies without an expansion falls back to the other
+        # expansions, as for the card set pane
+        dDone = CardCountWriter().write({oPCS: {oNoExp: -1, oCard2: -4,
+            oCard3: -1}})
+        self.assertEqual(dDone, {oPCS: {oCard1: -1, oCard2: -4,
+            oCard3: -1}})
+        self._check_counts(oPCS, {oCard1: 1, oCard3: 1})
+        # Cards not in the card set are ignored
+        self.assertEqual(CardCountWriter().write({oOther: {oCard3: -2}}),
+                {})
+        return oPCS
+
+    def test_write(self):
+        """Test changing the counts with one entry per copy"""
+        oPCS = self._do_test()
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject magic confuses pylint
+        self.assertEqual(MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardSetID=oPCS.id).count(), 2)
+
+    def test_count_storage(self):
+        """Test changing the counts with count based storage"""
+        set_count_storage(True)
+        try:
+            oPCS = self._do_test()
+            # pylint: disable-msg=E1101
+            # E1101: SQLObject magic confuses pylint
+            self.assertEqual([(x.count) for x in
+                MapPhysicalCardToPhysicalCardSet.selectBy(
+                    physicalCardSetID=oPCS.id)], [1, 1])
+        finally:
+            set_count_storage(False)
+
+    def test_signal(self):
+        """Test that the count store follows the bulk signal"""
+        oStore = CardSetCountStore()
+        try:
+            oPCS = PhysicalCardSet(name='Test Set')
+            oCard1 = make_card('Alexandra', 'CE')
+            oCard2 = make_card('.44 magnum', 'Jyhad')
+            oPCS.addPhysicalCard(oCard1.id)
+            self.assertEqual(oStore.get_counts(oPCS.id), {oCard1: 1})
+            dDone = CardCountWriter().write({oPCS: {oCard1: -1, oCard2: 4}})
+            send_bulk_changed_signal(oPCS, dDone[oPCS])
+            self.assertEqual(oStore.get_counts(oPCS.id), {oCard2: 4})
+        finally:
+            oStore.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the vectorised card clustering"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.SutekhObjects import AbstractCard
+from sutekh.core.CardListTabulator import CardListTabulator
+from sutekh.core.CardClustering import HAVE_NUMPY, METRICS, EUCLIDEAN, \
+        SUTEKH, numpy, k_means
+from nose import SkipTest
+import unittest
+
+
+class CardClusteringTests(SutekhTest):
+    """Class for the card clustering tests"""
+    # pylint: disable-msg=C0103, R0904
+    # C0103 - setUp name is needed by unittest, so use their convention
+    # R0904 - unittest.TestCase, so many public methods
+
+    def setUp(self):
+        """Skip the tests if NumPy isn't available"""
+        if not HAVE_NUMPY:
+            raise SkipTest
+        super(CardClusteringTests, self).setUp()
+
+    def test_tabulate_array(self):
+        """Test that the array table matches the nested list table"""
+        dPropFuncs = CardListTabulator.get_default_prop_funcs()
+        aColNames = sorted(dPropFuncs)
+        oTab = CardListTabulator(aColNames, dPropFuncs)
+        aCards = list(AbstractCard.select())
+        aArray = oTab.tabulate_array(aCards)
+        self.assertEqual(aArray.shape, (len(aCards), len(aColNames)))
+        self.assertEqual(aArray.tolist(), oTab.tabulate(aCards))
+
+    def test_distances(self):
+        """Test the distance matrices against the simple definitions"""
+        aData = numpy.array([[0, 1, 2], [-1, 0, 3], [2, 2, 0]], dtype=float)
+        aMeans = numpy.array([[0, 1, 2], [-1, 0.5, 0]])
+        aDists = METRICS[EUCLIDEAN](aData, aMeans)
+        self.assertAlmostEqual(aDists[0, 0], 0.0)
+        self.assertAlmostEqual(aDists[1, 0], (1 + 1 + 1) ** 0.5)
+        aDists = METRICS[SUTEKH](aData, aMeans)
+        self.assertAlmostEqual(aDists[0, 0], 0.0)
+        # -1 is 0.25 from anything, 0 is 4.0 from anything but 0
+        self.assertAlmostEqual(aDists[0, 1], (0.25 + 0.25 + 4.0) ** 0.5)
+        self.assertAlmostEqual(aDists[1, 1], (0.25 + 4.0 + 4.0) ** 0.5)
+        self.assertAlmostEqual(aDists[2, 1], (0.25 + 1.5 ** 2) ** 0.5)
+
+    def test_k_means(self):
+        """Test the k-means clustering"""
+        self.assertEqual(k_means([], 3, 10), ([], []))
+        # Three well separated groups of rows
+        oRandom = numpy.random.RandomState(7)
+        aData = numpy.vstack([oRandom.rand(20, 5) + 10 * iGroup for iGroup
+            in range(3)])
+        for sMetric in METRICS:
+            aMeans, aClusters = k_means(aData, 3, 50, sMetric, iSeed=5)
+            self.assertEqual(sorted([sorted(aCluster) for aCluster in
+                aClusters]), [range(iGroup * 20, iGroup * 20 + 20) for
+                    iGroup in range(3)])
+            self.assertEqual(aMeans.shape, (3, 5))
+            # The same seed gives the same results
+            aMeans2, aClusters2 = k_means(aData, 3, 50, sMetric, iSeed=5)
+            self.assertEqual(aClusters, aClusters2)
+            self.assertTrue((aMeans == aMeans2).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
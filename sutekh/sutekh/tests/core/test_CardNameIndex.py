@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the approximate card name index"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.CardNameIndex import CardNameIndex, NameIndexCache, \
+        normalise_name, edit_distance
+from sutekh.core.CardLookup import FuzzyLookup
+import unittest
+
+
+class CardNameIndexTests(SutekhTest):
+    """Class for the card name index tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_normalise(self):
+        """Test the name normalisation and edit distance"""
+        self.assertEqual(normalise_name('Path of Blood, The'),
+                normalise_name('The Path of Blood'))
+        self.assertEqual(normalise_name('Alan Sovereign (ADV)'),
+                normalise_name('Alan Sovereign (Advanced)'))
+        self.assertEqual(normalise_name(u'Fran\xe7ois'), 'francois')
+        self.assertEqual(normalise_name('AK-47'), 'ak47')
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'abc'), 3)
+        self.assertEqual(edit_distance('abc', 'abc'), 0)
+
+    def test_index(self):
+        """Test finding close names"""
+        oIndex = CardNameIndex(['Abbot', 'Abebe', 'Alan Sovereign',
+            'Alan Sovereign (Advanced)', 'The Path of Blood'],
+            {'Abebe the Wise': 'Abebe'})
+        aResults = oIndex.find('Alan Sovreign', 2)
+        self.assertEqual([sName for _fScore, sName in aResults],
+                ['Alan Sovereign', 'Alan Sovereign (Advanced)'])
+        self.assertTrue(aResults[0][0] > aResults[1][0])
+        self.assertEqual(oIndex.find('path of blood, the', 1),
+                [(1.0, 'The Path of Blood')])
+        self.assertEqual(oIndex.find('abebe the wise', 1), [(1.0, 'Abebe')])
+        self.assertEqual(oIndex.find('', 3), [])
+        self.assertEqual(oIndex.find('zzzz', 3), [])
+
+        self.assertEqual(oIndex.best_match('Abbott'), 'Abbot')
+        self.assertEqual(oIndex.best_match('Alan Sovreign'),
+                'Alan Sovereign')
+        self.assertEqual(oIndex.best_match('Something else'), None)
+        self.assertEqual(oIndex.exact_match('abebe!'), 'Abebe')
+        self.assertEqual(oIndex.exact_match('Abbott'), None)
+
+    def test_ambiguous(self):
+        """Test names shared by several cards once normalised"""
+        oIndex = CardNameIndex(['AK-47', 'AK 47', 'Abebe'])
+        self.assertEqual(oIndex.find('ak47', 2), [(1.0, 'AK 47'),
+            (1.0, 'AK-47')])
+        self.assertEqual(oIndex.exact_match('ak47'), None)
+        self.assertEqual(oIndex.best_match('ak47'), None)
+        self.assertEqual(oIndex.exact_match('Abebe.'), 'Abebe')
+
+    def test_lookup(self):
+        """Test the lookup using the index"""
+        oIndex = NameIndexCache.get_index()
+        self.assertTrue(oIndex is NameIndexCache.get_index())
+        self.assertEqual(oIndex.best_match('Alan Sovreign'),
+                'Alan Sovereign')
+        aCards = FuzzyLookup().lookup(['Alan Sovreign', 'AK47',
+            'Not a card', ''], 'Test')
+        self.assertEqual(aCards[0].name, 'Alan Sovereign')
+        self.assertEqual(aCards[1].name, 'AK-47')
+        self.assertEqual(aCards[2:], [None, None])
+        # Names with accents
+        self.assertEqual(oIndex.exact_match('Lazar Dobrescu'),
+                u'L\xe1z\xe1r Dobrescu')
+        aCards = FuzzyLookup().lookup(['Lazar Dobrescu', 'Lazar Dobresku'],
+                'Test')
+        self.assertEqual([oCard.name for oCard in aCards],
+                [u'L\xe1z\xe1r Dobrescu'] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
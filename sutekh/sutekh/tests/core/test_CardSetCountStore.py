@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the shared card set count store"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.tests.core.test_Filters import make_card
+from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.core.CardSetCountStore import CardSetCountStore
+from sutekh.core.CardSetUtilities import delete_physical_card_set
+from sutekh.core.DBSignals import send_changed_signal
+import unittest
+
+
+class CardSetCountStoreTests(SutekhTest):
+    """Class for the card set count store tests."""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_counts(self):
+        """Test that the counts follow the card set changes"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oStore = CardSetCountStore()
+        try:
+            oPCS = PhysicalCardSet(name='Test Set')
+            oCard1 = make_card('Alexandra', 'CE')
+            oCard2 = make_card('.44 magnum', 'Jyhad')
+            for oCard in [oCard1, oCard1, oCard2]:
+                oPCS.addPhysicalCard(oCard.id)
+            self.assertEqual(oStore.get_counts(oPCS.id),
+                    {oCard1: 2, oCard2: 1})
+            self.assertEqual(oStore.get_count(oPCS.id, oCard1), 2)
+
+            # Changes are tracked via the changed signal, without
+            # reloading the card set
+            oPCS.addPhysicalCard(oCard2.id)
+            send_changed_signal(oPCS, oCard2, 1)
+            self.assertEqual(oStore.get_count(oPCS.id, oCard2), 2)
+            send_changed_signal(oPCS, oCard1, -1)
+            send_changed_signal(oPCS, oCard1, -1)
+            self.assertEqual(oStore.get_counts(oPCS.id), {oCard2: 2})
+
+            # Deleting the card set drops the counts
+            iId = oPCS.id
+            delete_physical_card_set('Test Set')
+            self.assertEqual(oStore.get_counts(iId), {})
+
+            # Flushing forces a reload from the database
+            oPCS = PhysicalCardSet(name='Test Set 2')
+            oPCS.addPhysicalCard(oCard1.id)
+            self.assertEqual(oStore.get_counts(oPCS.id), {oCard1: 1})
+            oPCS.addPhysicalCard(oCard1.id)
+            oStore.flush()
+            self.assertEqual(oStore.get_counts(oPCS.id), {oCard1: 2})
+        finally:
+            oStore.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
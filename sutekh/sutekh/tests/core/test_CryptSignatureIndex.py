@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the crypt card signature index"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.SutekhObjects import IAbstractCard
+from sutekh.core.CryptSignatureIndex import CryptSignatureIndex, \
+        get_signature_index, flush_signature_index
+import unittest
+
+
+class CryptSignatureIndexTests(SutekhTest):
+    """Class for the crypt signature index tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_find_like(self):
+        """Test finding similar crypt cards"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oIndex = CryptSignatureIndex()
+        oAlan = IAbstractCard('Alan Sovereign')
+        self.assertEqual(oIndex.get_signature(IAbstractCard('AK-47')), None)
+        dDisciplines = dict([(oP.discipline.name, oP.discipline) for oP in
+            oAlan.discipline])
+        aDisciplines = [dDisciplines[x] for x in ('aus', 'dom', 'for',
+            'pre')]
+
+        aAll, dGroups = oIndex.find_like(oAlan, aDisciplines, 3)
+        # Anson (group 1) and Abdelsobek (group 5) are excluded by group
+        self.assertEqual(sorted([x.name for x in aAll]), [
+            u'Alan Sovereign (Advanced)', u'Alexandra', u'Alfred Benezri',
+            u'Gracis Nostinus', u'Kemintiri (Advanced)'])
+        self.assertEqual(len(dGroups), 4)
+        self.assertEqual(sorted([x.name for x in dGroups[tuple(
+            aDisciplines[:3])]]), [u'Alan Sovereign (Advanced)',
+                u'Gracis Nostinus'])
+        tKey = (aDisciplines[0], aDisciplines[1], aDisciplines[3])
+        self.assertEqual(sorted(dGroups[tKey]), sorted(aAll))
+
+        # Superior disciplines only
+        aAll, dGroups = oIndex.find_like(oAlan, aDisciplines[:2], 2, True)
+        self.assertEqual(sorted([x.name for x in aAll]), [
+            u'Alan Sovereign (Advanced)', u'Cesewayo'])
+        self.assertEqual(dGroups.keys(), [tuple(aDisciplines[:2])])
+
+        # Restricting the candidates
+        aAll, dGroups = oIndex.find_like(oAlan, aDisciplines, 3,
+                aCandidates=[IAbstractCard('Alexandra'),
+                    IAbstractCard('Abebe')])
+        self.assertEqual([x.name for x in aAll], [u'Alexandra'])
+
+        # Imbued
+        oAnna = IAbstractCard('Anna "Dictatrix11" Suljic')
+        aAll, dGroups = oIndex.find_like(oAnna, list(oAnna.virtue), 1)
+        self.assertEqual(sorted([x.name for x in aAll]), [
+            u'Earl "Shaka74" Deams'])
+        self.assertEqual(len(dGroups), 2)
+
+    def test_most_similar(self):
+        """Test ranking the most similar crypt cards"""
+        oIndex = CryptSignatureIndex()
+        oAlan = IAbstractCard('Alan Sovereign')
+        aSimilar = oIndex.most_similar(oAlan, 3)
+        self.assertEqual([(fScore, oCard.name) for fScore, oCard in
+            aSimilar], [(1.0, u'Alan Sovereign (Advanced)'),
+                (5 / 7.0, u'Gracis Nostinus'), (4 / 11.0, u'Alexandra')])
+        # Every vampire of group 2 to 4, other than Alan Sovereign
+        self.assertEqual(len(oIndex.most_similar(oAlan, 100)), 27)
+
+    def test_shared_index(self):
+        """Test that the shared index is kept until flushed"""
+        flush_signature_index()
+        oIndex = get_signature_index()
+        self.assertTrue(get_signature_index() is oIndex)
+        flush_signature_index()
+        self.assertFalse(get_signature_index() is oIndex)
+        flush_signature_index()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the inverted card to deck index"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.tests.core.test_PhysicalCardSet import get_phys_cards
+from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.core.DeckIndex import build_deck_index, load_deck_index, \
+        get_deck_index
+import unittest
+
+
+def _get_distinct_cards():
+    """Return physical cards with different abstract cards"""
+    aPhysCards = []
+    aSeen = set()
+    for oCard in get_phys_cards():
+        if oCard.abstractCardID not in aSeen:
+            aSeen.add(oCard.abstractCardID)
+            aPhysCards.append(oCard)
+    return aPhysCards
+
+
+class DeckIndexTests(SutekhTest):
+    """Class for the deck index tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_deck_index(self):
+        """Test searching the index"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aPhysCards = _get_distinct_cards()
+        aDecks = []
+        for iDeck in range(4):
+            oPCS = PhysicalCardSet(name='Deck %d' % iDeck)
+            for oCard in aPhysCards[iDeck:iDeck + 3]:
+                for _iCopy in range(iDeck + 1):
+                    oPCS.addPhysicalCard(oCard.id)
+            aDecks.append(oPCS.id)
+        # Not indexed
+        oPCS = PhysicalCardSet(name='Other')
+        oPCS.addPhysicalCard(aPhysCards[0].id)
+
+        oIndex = build_deck_index(aDecks)
+        aCardIds = [oCard.abstractCard.id for oCard in aPhysCards]
+        self.assertEqual(oIndex.find_any([aCardIds[0]]), aDecks[:1])
+        self.assertEqual(oIndex.find_any([aCardIds[0], aCardIds[3]]),
+                [aDecks[0], aDecks[1], aDecks[2], aDecks[3]])
+        self.assertEqual(oIndex.find_all([aCardIds[2], aCardIds[3]]),
+                aDecks[1:3])
+        self.assertEqual(oIndex.find_all([aCardIds[0], aCardIds[3]]), [])
+        self.assertEqual(oIndex.find_all([]), [])
+        self.assertEqual(oIndex.get_count(aDecks[2], aCardIds[3]), 3)
+        self.assertEqual(oIndex.get_count(aDecks[0], aCardIds[3]), 0)
+        self.assertEqual(oIndex.get_cards(aDecks[1], aCardIds[:3]),
+                {aCardIds[1]: 2, aCardIds[2]: 2})
+        # Decks with more of the cards come first, then those with more
+        # copies
+        self.assertEqual(oIndex.rank(aDecks, aCardIds[2:4]),
+                [aDecks[2], aDecks[1], aDecks[3], aDecks[0]])
+
+    def test_saved_index(self):
+        """Test saving and reloading the index"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aPhysCards = _get_distinct_cards()
+        oPCS = PhysicalCardSet(name='Deck')
+        for oCard in aPhysCards[:4]:
+            oPCS.addPhysicalCard(oCard.id)
+        sIndexFile = self._create_tmp_file()
+        oIndex = build_deck_index([oPCS.id])
+        self.assertTrue(oIndex.save(sIndexFile))
+        oLoaded = load_deck_index(sIndexFile, [oPCS.id])
+        self.assertEqual(oLoaded.dCards, oIndex.dCards)
+        # A different set of decks doesn't match
+        self.assertEqual(load_deck_index(sIndexFile, []), None)
+        # Neither do changed decks
+        oPCS.addPhysicalCard(aPhysCards[5].id)
+        self.assertEqual(load_deck_index(sIndexFile, [oPCS.id]), None)
+        oIndex = get_deck_index(sIndexFile, [oPCS.id])
+        self.assertEqual(oIndex.find_all([aPhysCards[5].abstractCard.id]),
+                [oPCS.id])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the draw probability calculations"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.DrawProbabilities import DrawProbabilities, choose, \
+        log_choose, gen_choice_list, multi_hyper_prob, hyper_prob_at_least
+from math import exp
+import unittest
+
+
+class DrawProbabilitiesTests(SutekhTest):
+    """Class for the draw probability tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_choose(self):
+        """Test the binomial coefficients"""
+        self.assertEqual(choose(0, 5), 1)
+        self.assertEqual(choose(2, 5), 10)
+        self.assertEqual(choose(6, 5), 0)
+        self.assertEqual(choose(7, 90), 7471375560)
+        self.assertAlmostEqual(exp(log_choose(7, 90)) / 7471375560, 1.0)
+
+    def test_choice_list(self):
+        """Test generating the choices"""
+        self.assertEqual(gen_choice_list([2, 1]), [[0, 0], [0, 1], [1, 0],
+            [1, 1], [2, 0], [2, 1]])
+        self.assertEqual(gen_choice_list([2, 1], 1), [[0, 0], [0, 1],
+            [1, 0]])
+
+    def test_probabilities(self):
+        """Test the probabilities against simple cases"""
+        # One group: drawing 1 of the 4 copies from 10 cards in 2 draws
+        self.assertAlmostEqual(multi_hyper_prob([1], 2, [4], 10),
+                4.0 * 6 / 45)
+        self.assertAlmostEqual(hyper_prob_at_least([1], 2, [4], 10),
+                1 - 15.0 / 45)
+        # Two groups, exhaustively counting the possible hands
+        aObjects = [3, 2]
+        iTotal = 8
+        aCards = [0, 0, 0, 1, 1, 2, 2, 2]
+        oProbs = DrawProbabilities(aObjects, iTotal)
+        dTable = oProbs.get_table(gen_choice_list(aObjects), [3, 4])
+        for iCol, iDraws in enumerate([3, 4]):
+            aHands = _combinations(range(iTotal), iDraws)
+            for aFound in gen_choice_list(aObjects):
+                iExact = 0
+                iAtLeast = 0
+                for aHand in aHands:
+                    aCounts = [len([x for x in aHand if aCards[x] == iGroup])
+                            for iGroup in range(2)]
+                    if aCounts == aFound:
+                        iExact += 1
+                    if aCounts[0] >= aFound[0] and aCounts[1] >= aFound[1]:
+                        iAtLeast += 1
+                fExact, fAtLeast = dTable[tuple(aFound)][iCol]
+                self.assertAlmostEqual(fExact, iExact / float(len(aHands)))
+                self.assertAlmostEqual(fAtLeast,
+                        iAtLeast / float(len(aHands)))
+        # The exact probabilities add up to 1
+        oProbs = DrawProbabilities([4, 4, 3, 2, 2], 90)
+        self.assertAlmostEqual(sum([oProbs.exact(aFound, 20) for aFound in
+            gen_choice_list([4, 4, 3, 2, 2])]), 1.0)
+        self.assertAlmostEqual(oProbs.at_least([0, 0, 0, 0, 0], 20), 1.0)
+        # Invalid input
+        self.assertRaises(RuntimeError, multi_hyper_prob, [1], 2, [4, 1], 10)
+        self.assertRaises(RuntimeError, oProbs.exact, [1, 0, 0, 0, 0], 91)
+        self.assertRaises(RuntimeError, DrawProbabilities, [4], 3)
+
+
+def _combinations(aItems, iNum):
+    """All the ways of choosing iNum of aItems"""
+    if iNum == 0:
+        return [[]]
+    return [[oItem] + aRest for iPos, oItem in enumerate(aItems)
+            for aRest in _combinations(aItems[iPos + 1:], iNum - 1)]
+
+
+if __name__ == "__main__":
+    unittest.main()
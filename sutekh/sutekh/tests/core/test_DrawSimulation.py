@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the batched draw simulation"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core import DrawSimulation
+from sutekh.core.DrawSimulation import DrawSimulator
+import unittest
+
+
+class DrawSimulationTests(SutekhTest):
+    """Class for the draw simulation tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def _check_simulation(self, iHands):
+        """Check the simulated values are consistent with the exact
+           values"""
+        aCards = ['A'] * 4 + ['B'] * 3 + ['C'] * 12 + ['D%d' % x for x in
+                range(21)]
+        dGroups = {'A and B': set(['A', 'B']), 'C': set(['C']),
+                'Missing': set(['E'])}
+        oSim = DrawSimulator(aCards, dGroups, iSeed=5)
+        dResults = oSim.simulate([7, 12, 40], iHands)
+        self.assertEqual(sorted(dResults), [7, 12, 40])
+        for iDraws, dGroupStats in dResults.iteritems():
+            self.assertEqual(sorted(dGroupStats), sorted(dGroups))
+            for dStats in dGroupStats.itervalues():
+                # Allow a little slack beyond the 95% intervals
+                fSlack = (dStats['high'] - dStats['low']) / 2
+                self.assertTrue(dStats['low'] - fSlack <= dStats['expected']
+                        <= dStats['high'] + fSlack)
+                fSlack = (dStats['any high'] - dStats['any low']) / 2
+                self.assertTrue(dStats['any low'] - fSlack <=
+                        dStats['expected any'] <= dStats['any high'] + fSlack)
+        self.assertAlmostEqual(dResults[7]['C']['expected'], 12 * 7 / 40.0)
+        self.assertEqual(dResults[7]['Missing']['mean'], 0.0)
+        self.assertEqual(dResults[7]['Missing']['expected any'], 0.0)
+        # Drawing the whole deck always gives every card
+        self.assertEqual(dResults[40]['A and B']['mean'], 7.0)
+        self.assertEqual(dResults[40]['A and B']['low'], 7.0)
+        self.assertEqual(dResults[40]['C']['any'], 1.0)
+        # The same seed gives the same results
+        self.assertEqual(oSim.simulate([7, 12, 40], iHands), dResults)
+        self.assertRaises(RuntimeError, oSim.simulate, [41], iHands)
+
+    def test_simulation(self):
+        """Test the simulation with and without NumPy"""
+        bHaveNumpy = DrawSimulation.HAVE_NUMPY
+        try:
+            if bHaveNumpy:
+                self._check_simulation(10000)
+            DrawSimulation.HAVE_NUMPY = False
+            self._check_simulation(1000)
+        finally:
+            DrawSimulation.HAVE_NUMPY = bHaveNumpy
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,6 +14,7 @@ from sutekh.core.SutekhObjects import AbstractCard, IAbstractCard, \
 from sutekh.core import Filters
 from sqlobject import SQLObjectNotFound
 from sutekh.core.CardLookup import best_guess_filter
+from sutekh.core.CardIndex import CardIndex
 import unittest
 
 
@@ -714,5 +715,71 @@ class FilterTests(SutekhTest):
                     '%s != expected %s for guess %s' % (aNames, aExpectedNames,
                         sGuess))
 
+    def test_card_index(self):
+        """Test that filtering with the card index matches the database"""
+        # pylint: disable-msg=E1101
+        # sqlobject confuses pylint
+        make_physical_card_sets()
+        aFilters = [
+                Filters.ClanFilter('Follower of Set'),
+                Filters.MultiDisciplineFilter(['nec', 'qui']),
+                Filters.FilterAndBox([Filters.DisciplineFilter('obf'),
+                    Filters.DisciplineFilter('dom')]),
+                Filters.FilterOrBox([Filters.CardTypeFilter('Reflex'),
+                    Filters.MultiCostFilter(['0', 'X'])]),
+                Filters.FilterNot(Filters.MultiCardTypeFilter(['Vampire',
+                    'Imbued'])),
+                Filters.FilterAndBox([Filters.MultiGroupFilter(['2', 'Any']),
+                    Filters.FilterNot(Filters.SectFilter('Sabbat'))]),
+                Filters.CachedFilter(Filters.FilterAndBox([
+                    Filters.MultiCostTypeFilter(['pool', 'blood']),
+                    Filters.CostFilter(1)])),
+                # Mixed filters
+                Filters.FilterAndBox([Filters.CardTypeFilter('Vampire'),
+                    Filters.CardTextFilter('+1 bleed')]),
+                Filters.FilterOrBox([Filters.CardNameFilter('Ab%'),
+                    Filters.ExpansionFilter('NoR'),
+                    Filters.MultiCapacityFilter(['4', '5'])]),
+                Filters.NullFilter(),
+                Filters.NotNullFilter(),
+                # Text filters
+                Filters.CardTextFilter('+_ stealth'),
+                Filters.CardTextFilter('{strength'),
+                Filters.CardTextFilter('bleed%at +_ bleed'),
+                Filters.CardNameFilter('a_e'),
+                Filters.CardNameFilter('%'),
+                Filters.CardNameFilter(u'lázár%'),
+                Filters.CardTextFilter(u'lázár may'),
+                Filters.CardFunctionFilter(
+                    Filters.CardFunctionFilter.get_values()),
+                ]
+
+        def get_results():
+            """Get the results of the filters on the card lists"""
+            aResults = []
+            for oFilter in aFilters:
+                aResults.append(sorted(oFilter.select(
+                    AbstractCard).distinct()))
+                aResults.append(sorted(Filters.FilterAndBox([
+                    Filters.PhysicalCardFilter(), oFilter]).select(
+                        PhysicalCard).distinct()))
+                # The physical expansion filter can't use the index
+                aResults.append(sorted(Filters.FilterAndBox([
+                    Filters.PhysicalCardFilter(),
+                    Filters.MultiPhysicalExpansionFilter(['LoB', 'Jyhad']),
+                    oFilter]).select(PhysicalCard).distinct()))
+                aResults.append(sorted(Filters.FilterAndBox([
+                    Filters.PhysicalCardSetFilter('Test 1'),
+                    oFilter]).select(
+                        MapPhysicalCardToPhysicalCardSet).distinct()))
+            return aResults
+
+        aSQLResults = get_results()
+        Filters.set_card_index(CardIndex())
+        try:
+            self.assertEqual(get_results(), aSQLResults)
+        finally:
+            Filters.set_card_index(None)
+
 if __name__ == "__main__":
     unittest.main()
@@ -9,7 +9,10 @@ from sutekh.tests.TestCore import SutekhTest
 from sutekh.core.SutekhObjects import PhysicalCardSet, IPhysicalCardSet, \
         MapPhysicalCardToPhysicalCardSet
 from sutekh.tests.core.test_Filters import make_card
-from sutekh.core.CardSetUtilities import delete_physical_card_set
+from sutekh.core.CardSetUtilities import delete_physical_card_set, \
+        count_map_cards, remove_map_card
+from sutekh.core.CountedRelatedJoin import set_count_storage
+from sutekh.core import Filters
 from sqlobject import SQLObjectNotFound
 import unittest
 
@@ -149,5 +152,48 @@ class PhysicalCardSetTests(SutekhTest):
         self.assertEqual(MapPhysicalCardToPhysicalCardSet.selectBy(
             physicalCardID=aAddedPhysCards[4].id).count(), 0)
 
+    def test_count_storage(self):
+        """Test storing counts in the card set mapping table"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        set_count_storage(True)
+        try:
+            oPhysCardSet1 = make_set_1()
+        finally:
+            set_count_storage(False)
+        aAddedPhysCards = get_phys_cards()
+        oCard = aAddedPhysCards[0]
+        # Every card gets a single entry in the mapping table
+        self.assertEqual(MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardSetID=oPhysCardSet1.id).count(), 15)
+        aMapCards = list(MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardID=oCard.id, physicalCardSetID=oPhysCardSet1.id))
+        self.assertEqual(len(aMapCards), 1)
+        self.assertEqual(aMapCards[0].count, 3)
+        # The join still returns one entry per copy
+        self.assertEqual(len(oPhysCardSet1.cards), 17)
+        self.assertEqual(len([x for x in oPhysCardSet1.cards
+            if x.id == oCard.id]), 3)
+        self.assertEqual(len(oCard.sets), 3)
+        self.assertEqual(count_map_cards(MapPhysicalCardToPhysicalCardSet.
+            selectBy(physicalCardSetID=oPhysCardSet1.id)), 17)
+        # Card count filter sums the counts - there are 3 copies of
+        # .44 Magnum with no expansion, and 1 from Jyhad
+        oFilter = Filters.FilterAndBox([
+            Filters.PhysicalCardSetFilter(CARD_SET_NAMES[0]),
+            Filters.CardSetMultiCardCountFilter((['4'], CARD_SET_NAMES[0]))])
+        aCards = set([x.physicalCard.abstractCardID for x in oFilter.select(
+            MapPhysicalCardToPhysicalCardSet).distinct()])
+        self.assertEqual(aCards, set([oCard.abstractCardID]))
+        # Removing a single copy decrements the count
+        remove_map_card(aMapCards[0])
+        self.assertEqual(len([x for x in oPhysCardSet1.cards
+            if x.id == oCard.id]), 2)
+        remove_map_card(aMapCards[0])
+        remove_map_card(aMapCards[0])
+        self.assertEqual(MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardID=oCard.id,
+            physicalCardSetID=oPhysCardSet1.id).count(), 0)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the SQL query profiler"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.QueryProfiler import start_profiling, stop_profiling, \
+        get_profiler, profile_operation, normalise_query, OTHER, \
+        REPEAT_LIMIT
+from sutekh.core.SutekhObjects import AbstractCard
+from sqlobject import sqlhub
+import unittest
+
+
+@profile_operation('Look up cards')
+def _lookup_cards(aIds):
+    """Fetch the cards one at a time"""
+    # pylint: disable-msg=E1101
+    # SQLObject confuses pylint
+    return [AbstractCard.get(iId).name for iId in aIds]
+
+
+@profile_operation('Outer')
+def _nested(aIds):
+    """Call the profiled lookup"""
+    return _lookup_cards(aIds)
+
+
+class QueryProfilerTests(SutekhTest):
+    """Class for the query profiler tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def tearDown(self):
+        """Ensure the connection is restored"""
+        stop_profiling()
+        super(QueryProfilerTests, self).tearDown()
+
+    def test_normalise(self):
+        """Test that statements differing in values match"""
+        self.assertEqual(normalise_query(
+            "SELECT name FROM t1 WHERE id = 5 AND name = 'Ab''ba'"),
+            "SELECT name FROM t1 WHERE id = ? AND name = ?")
+        self.assertEqual(normalise_query(
+            "SELECT id FROM t1 WHERE id IN (1, 2,\n 3)"),
+            "SELECT id FROM t1 WHERE id IN (?)")
+
+    def test_profile(self):
+        """Test recording queries against operations"""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        self.assertEqual(get_profiler(), None)
+        aIds = [oCard.id for oCard in AbstractCard.select()]
+        # Ensure the gets hit the database
+        sqlhub.processConnection.cache.clear()
+        oProfiler = start_profiling()
+        self.assertTrue(get_profiler() is oProfiler)
+        aNames = _nested(aIds)
+        self.assertEqual(len(aNames), len(aIds))
+        AbstractCard.select().count()
+
+        dStats = dict([(x.sName, x) for x in oProfiler.get_stats()])
+        self.assertEqual(sorted(dStats), sorted(['Look up cards', 'Outer',
+            OTHER]))
+        oStats = dStats['Look up cards']
+        self.assertEqual(oStats.iCalls, 1)
+        self.assertEqual(oStats.iStatements, len(aIds))
+        self.assertEqual(oStats.iRows, len(aIds))
+        self.assertTrue(oStats.fSlowest <= oStats.fTotal)
+        # Nested operations are included in the outer operation
+        self.assertEqual(dStats['Outer'].iStatements, len(aIds))
+        self.assertEqual(dStats[OTHER].iStatements, 1)
+        # The gets are all the same statement
+        self.assertTrue(len(aIds) >= REPEAT_LIMIT)
+        self.assertEqual(len(oStats.get_repeated()), 1)
+        self.assertEqual(oStats.get_repeated()[0][0], len(aIds))
+        self.assertTrue('N+1' in oProfiler.get_report())
+
+        oProfiler.reset()
+        self.assertEqual(oProfiler.get_stats(), [])
+        stop_profiling()
+        self.assertEqual(get_profiler(), None)
+        # Nothing is recorded once stopped
+        sqlhub.processConnection.cache.clear()
+        _lookup_cards(aIds[:2])
+        self.assertEqual(oProfiler.get_stats(), [])
+        self.assertFalse('_queryOne' in sqlhub.processConnection.__dict__)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the object cache snapshot handling"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.SutekhObjectCache import SutekhObjectCache, \
+        write_cache_snapshot, invalidate_cache_snapshot, _load_snapshot
+from sutekh.core.SutekhObjects import IAbstractCard, Keyword, flush_cache
+from sutekh.core.DatabaseVersion import DatabaseVersion
+from sqlobject import sqlhub
+import os
+import unittest
+
+
+class SutekhObjectCacheTests(SutekhTest):
+    """Class for the object cache snapshot tests."""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_snapshot(self):
+        """Test writing and reading the snapshot"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oConn = sqlhub.processConnection
+        sSnapshot = self._create_tmp_file()
+        os.remove(sSnapshot)
+        self.assertEqual(_load_snapshot(sSnapshot, oConn), None)
+
+        self.assertTrue(write_cache_snapshot(sSnapshot))
+        self.assertNotEqual(_load_snapshot(sSnapshot, oConn), None)
+
+        # Check the caches work when loaded from the snapshot
+        flush_cache()
+        _oCache = SutekhObjectCache(sSnapshot)
+        oCard = IAbstractCard('Abebe')
+        self.assertEqual([x.name for x in oCard.clan], [u'Samedi'])
+        self.assertEqual(oCard.capacity, 4)
+
+        # Changing a table version invalidates the snapshot
+        oVer = DatabaseVersion()
+        oVer.set_version(Keyword, Keyword.tableversion + 1)
+        self.assertEqual(_load_snapshot(sSnapshot, oConn), None)
+        oVer.set_version(Keyword, Keyword.tableversion)
+        self.assertNotEqual(_load_snapshot(sSnapshot, oConn), None)
+
+        # As does changing a card in place
+        oCard.capacity = 5
+        oCard.syncUpdate()
+        self.assertEqual(_load_snapshot(sSnapshot, oConn), None)
+        oCard.capacity = 4
+        oCard.syncUpdate()
+        self.assertNotEqual(_load_snapshot(sSnapshot, oConn), None)
+
+        # Corrupt snapshots are ignored
+        fOut = open(sSnapshot, 'wb')
+        fOut.write('Not a snapshot')
+        fOut.close()
+        self.assertEqual(_load_snapshot(sSnapshot, oConn), None)
+
+        invalidate_cache_snapshot(sSnapshot)
+        self.assertFalse(os.path.exists(sSnapshot))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -209,5 +209,28 @@ class CardListModelTests(ConfigSutekhTest):
         self.assertEqual('Dramatic Upheaval' in aCards, True)
         self.assertEqual('Motivated by Gehenna' in aCards, True)
 
+    def test_load_steps(self):
+        """Test loading the model one card at a time"""
+        oModel = CardListModel(self.oConfig)
+        oModel.enable_sorting()
+        oListener = TestListener(oModel)
+        oSteps = oModel.load_steps()
+        oSteps.next()
+        oSteps.next()
+        self.assertTrue(oModel.is_loading())
+        self.assertFalse(oListener.bLoadCalled)
+        # Sorting is disabled while loading
+        self.assertEqual(oModel.get_sort_column_id(), (None, None))
+        # Abandon the load, and check sorting is restored
+        oModel.cancel_load()
+        self.assertFalse(oModel.is_loading())
+        self.assertEqual(oModel.get_sort_column_id(), (0, 0))
+        aCards = list(oModel.load_steps())
+        self.assertFalse(oModel.is_loading())
+        self.assertTrue(oListener.bLoadCalled)
+        self.assertEqual(self._count_all_cards(oModel), len(aCards))
+        oModel.load()
+        self.assertEqual(self._count_all_cards(oModel), len(aCards))
+
 if __name__ == "__main__":
     unittest.main()
@@ -9,7 +9,9 @@ from sutekh.tests.GuiSutekhTest import GuiSutekhTest
 import unittest
 import gtk
 from sutekh.core.SutekhObjects import PhysicalCardSet, IPhysicalCard, \
-        IAbstractCard
+        IAbstractCard, MapPhysicalCardToPhysicalCardSet
+from sutekh.core.CountedRelatedJoin import set_count_storage
+from sutekh.gui.plugins.CardDrawProbabilities import CardDrawSimPlugin
 from sutekh.tests.core.test_Filters import make_card
 
 
@@ -216,6 +218,37 @@ class TestCardSetFrame(GuiSutekhTest):
         aExp2 = self.get_expanded(oFrame.view)
         self.assertEqual(aExp1, aExp2)  # But reload has retained the new state
 
+    def test_count_storage_plugin(self):
+        """Test that the plugins see every copy with count storage"""
+        # pylint: disable-msg=E1101, W0212
+        # E1101: PyProtocols confuses pylint
+        # W0212: We test the plugin's card counts directly
+        oPhysCardSet = PhysicalCardSet(name='Count Set')
+        aCards = [('Alexandra', 'CE')] * 3 + [('AK-47', None)] * 2 + \
+                [('Ablative Skin', None)]
+        set_count_storage(True)
+        try:
+            for sName, sExp in aCards:
+                oPhysCardSet.addPhysicalCard(make_card(sName, sExp).id)
+            oPhysCardSet.syncUpdate()
+        finally:
+            set_count_storage(False)
+        # A single mapping entry for each card
+        self.assertEqual(MapPhysicalCardToPhysicalCardSet.selectBy(
+            physicalCardSetID=oPhysCardSet.id).count(), 3)
+        self.oWin.setup(self.oConfig)
+        oFrame = self.oWin.add_new_physical_card_set('Count Set', False)
+        oPlugin = CardDrawSimPlugin(oFrame.view, oFrame.view.get_model(),
+                PhysicalCardSet)
+        self.assertEqual(len(oPlugin.get_all_cards()), 6)
+        self.assertTrue(oPlugin.check_cs_size('Card Draw probabilities', 6))
+        oPlugin._setup_cardlists([IAbstractCard('AK-47')], False)
+        self.assertEqual(oPlugin.iTotal, 3)
+        self.assertEqual(oPlugin.iSelectedCount, 2)
+        oPlugin._setup_cardlists([IAbstractCard('Alexandra')], True)
+        self.assertEqual(oPlugin.iTotal, 3)
+        self.assertEqual(oPlugin.iSelectedCount, 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1104,5 +1104,64 @@ class CardSetListModelTests(ConfigSutekhTest):
         self._loop_modes(oChildPCS, [oChildModel])
         self._cleanup_models([oChildModel])
 
+    def _check_lazy_model(self, oModel, oLazyModel, oPCS, sMode):
+        """Add all the children to the lazy model, and check it matches
+           the model"""
+        oIter = oLazyModel.get_iter_first()
+        while oIter:
+            for oCardIter in oLazyModel.get_all_iter_children(oIter):
+                oLazyModel.build_children(oCardIter)
+            oIter = oLazyModel.iter_next(oIter)
+        aList = self._get_all_counts(oModel)
+        aLazyList = self._get_all_counts(oLazyModel)
+        self.assertEqual(aLazyList, aList, self._format_error(
+            "Card lists for lazy and full models differ after %s cards"
+            % sMode, aLazyList, aList, oLazyModel, oPCS))
+
+    def test_lazy_children(self):
+        """Test only adding the child rows when they're needed"""
+        # pylint: disable-msg=W0212, E1101
+        # W0212: we need to access protected methods
+        # E1101: PyProtocols confuses pylint
+        _oCache = SutekhObjectCache()
+        oPCS, _oSibPCS, oChildPCS, _oGCPCS, _oGC2PCS = \
+                self._setup_relationships()
+        oModel = self._get_model(self.aNames[0])
+        oLazyModel = self._get_model(self.aNames[0])
+        oLazyModel.bLazyChildren = True
+        aModels = [oModel, oLazyModel]
+        aCards = [make_card('Alexandra', 'CE'), make_card('AK-47', None),
+                make_card('Sha-Ennu', 'Third Edition')]
+        for iShowMode in (ALL_CARDS, CHILD_CARDS, THIS_SET_ONLY):
+            for iLevelMode in (SHOW_EXPANSIONS, SHOW_CARD_SETS,
+                    EXP_AND_CARD_SETS, CARD_SETS_AND_EXP):
+                for oThisModel in aModels:
+                    oThisModel._change_count_mode(iShowMode)
+                    oThisModel._change_level_mode(iLevelMode)
+                    oThisModel._change_parent_count_mode(PARENT_COUNT)
+                for oCS in (oPCS, oChildPCS):
+                    # Changes to cards which haven't been expanded
+                    for oThisModel in aModels:
+                        oThisModel.load()
+                    for oCard in aCards:
+                        oCS.addPhysicalCard(oCard.id)
+                        oCS.syncUpdate()
+                        send_changed_signal(oCS, oCard, 1)
+                    self._check_lazy_model(oModel, oLazyModel, oCS,
+                            'adding')
+                    for oThisModel in aModels:
+                        oThisModel.load()
+                    for oCard in aCards:
+                        oMapEntry = list(
+                                MapPhysicalCardToPhysicalCardSet.selectBy(
+                                    physicalCardID=oCard.id,
+                                    physicalCardSetID=oCS.id))[-1]
+                        MapPhysicalCardToPhysicalCardSet.delete(oMapEntry.id)
+                        oCS.syncUpdate()
+                        send_changed_signal(oCS, oCard, -1)
+                    self._check_lazy_model(oModel, oLazyModel, oCS,
+                            'removing')
+        self._cleanup_models(aModels)
+
 if __name__ == "__main__":
     unittest.main()
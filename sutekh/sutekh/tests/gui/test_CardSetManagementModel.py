@@ -8,6 +8,7 @@
 from sutekh.tests.TestCore import SutekhTest
 from sutekh.core.SutekhObjects import PhysicalCardSet
 from sutekh.core import Filters
+from sutekh.core.CardSetUtilities import delete_physical_card_set
 from sutekh.gui.CardSetManagementModel import CardSetManagementModel
 
 
@@ -91,3 +92,46 @@ class CardSetManagementModelTests(SutekhTest):
         self.assertEqual(oModel.get_path_from_name('Sib'), None)
         self.assertEqual(oModel.get_path_from_name('Child 2 Branch'), (0, 0))
         self.assertEqual(oModel.get_path_from_name('Child 2 Card Set 0'), None)
+
+    def test_updates(self):
+        """Test following the database changes without reloading"""
+        # pylint: disable-msg=E1101
+        # SQLObject confuses pylint
+        oRoot = PhysicalCardSet(name='Root')
+        oChild = PhysicalCardSet(name='Child', parent=oRoot)
+        PhysicalCardSet(name='Grand Child', parent=oChild)
+        oModel = CardSetManagementModel(DummyWindow())
+        oModel.enable_sorting()
+        oModel.listen_for_changes()
+        oModel.load()
+        self.assertEqual(oModel.get_path_from_name('Grand Child'), (0, 0, 0))
+
+        oNew = PhysicalCardSet(name='New', parent=oChild)
+        self.assertEqual(oModel.get_path_from_name('New'), (0, 0, 1))
+        oNew.name = 'Card Set 1'
+        self.assertEqual(oModel.get_path_from_name('New'), None)
+        self.assertEqual(oModel.get_path_from_name('Card Set 1'), (0, 0, 0))
+        self.assertEqual(oModel.get_value(oModel.get_iter((0, 0, 0)), 0),
+                '<span foreground="blue">Card Set 1</span>')
+        oChild.inuse = True
+        self.assertEqual(oModel.get_value(oModel.get_iter((0, 0)), 0),
+                '<b>Child</b>')
+        # Moving a card set moves the children as well
+        oChild.parent = None
+        self.assertEqual(oModel.get_path_from_name('Child'), (0,))
+        self.assertEqual(oModel.get_path_from_name('Root'), (1,))
+        self.assertEqual(oModel.get_path_from_name('Grand Child'), (0, 1))
+        delete_physical_card_set('Child')
+        self.assertEqual(oModel.get_path_from_name('Child'), None)
+        self.assertEqual(oModel.get_path_from_name('Card Set 1'), (0,))
+        self.assertEqual(oModel.get_path_from_name('Grand Child'), (1,))
+        self.assertEqual(oModel.get_path_from_name('Root'), (2,))
+
+        # Filtered models aren't updated
+        oModel.selectfilter = Filters.CardSetNameFilter('Root')
+        oModel.applyfilter = True
+        oModel.load()
+        self.assertFalse(oModel.follows_changes())
+        PhysicalCardSet(name='Root 2')
+        self.assertEqual(oModel.get_path_from_name('Root 2'), None)
+        oModel.cleanup()
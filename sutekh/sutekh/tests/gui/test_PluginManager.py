@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8 ai ts=4 sts=4 et sw=4
+# Copyright 2013 Neil Muller <drnlmuller+sutekh@gmail.com>
+# GPL - see COPYING for details
+
+"""Test the plugin manifest"""
+
+from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.SutekhObjects import PhysicalCardSet
+from sutekh.gui.PluginManager import PluginManager
+import gtk
+import unittest
+
+
+class PluginManagerTests(SutekhTest):
+    """Class for the plugin manifest tests"""
+    # pylint: disable-msg=R0904
+    # R0904 - unittest.TestCase, so many public methods
+
+    def test_manifest(self):
+        """Test loading the plugins from the manifest"""
+        # pylint: disable-msg=W0212
+        # We check the internal state
+        sManifest = self._create_tmp_file()
+        oManager = PluginManager(sManifest)
+        oManager.load_plugins()
+        aClasses = oManager.get_card_list_plugins()
+        self.assertTrue(aClasses)
+        dEntries = dict([(x.name, x) for x in oManager._aPlugins])
+
+        # The second manager uses the manifest, and doesn't import anything
+        # until needed
+        oCached = PluginManager(sManifest)
+        oCached.load_plugins()
+        dCached = dict([(x.name, x) for x in oCached._aPlugins])
+        self.assertEqual(sorted(dCached), sorted(dEntries))
+        for sName, oInfo in dCached.iteritems():
+            self.assertEqual(oInfo.entry, dEntries[sName].entry)
+            self.assertEqual(oInfo._cPlugin, None)
+
+        oInfo = dCached['CardSetCompare']
+        self.assertTrue(oInfo.supports(PhysicalCardSet))
+        self.assertFalse(oInfo.supports('MainWindow'))
+        self.assertTrue(oInfo.check_versions())
+        self.assertEqual(oInfo.get_menus(PhysicalCardSet), None)
+        oInfo.record_menus(PhysicalCardSet,
+                ('Analyze', gtk.MenuItem('Compare')))
+        self.assertEqual(oInfo.get_menus(PhysicalCardSet),
+                [('Analyze', 'Compare')])
+        self.assertEqual(oInfo.get_class().__name__, 'CardSetCompare')
+
+        # Plugins with more complex menus are never lazy
+        oMenuItem = gtk.MenuItem('Export')
+        oMenuItem.set_submenu(gtk.Menu())
+        oInfo.record_menus('MainWindow', [('Export', oMenuItem)])
+        self.assertEqual(oInfo.get_menus(PhysicalCardSet), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,8 @@
 
 import unittest
 from sutekh.tests.TestCore import SutekhTest
-from sutekh.io.GuessFileParser import GuessFileParser
+from sutekh.io.GuessFileParser import GuessFileParser, sniff_format, \
+        SNIFF_SIZE
 from sutekh.io.AbstractCardSetParser import AbstractCardSetParser
 from sutekh.io.PhysicalCardSetParser import PhysicalCardSetParser
 from sutekh.io.ARDBXMLDeckParser import ARDBXMLDeckParser
@@ -18,6 +19,8 @@ from sutekh.io.ELDBInventoryParser import ELDBInventoryParser
 from sutekh.io.ELDBDeckFileParser import ELDBDeckFileParser
 from sutekh.io.ELDBHTMLParser import ELDBHTMLParser
 from sutekh.io.LackeyDeckParser import LackeyDeckParser
+from sutekh.io.SLDeckParser import SLDeckParser
+from sutekh.io.SLInventoryParser import SLInventoryParser
 from sutekh.tests.io.test_JOLDeckParser import JOL_EXAMPLE_1
 from sutekh.tests.io.test_ARDBTextParser import ARDB_TEXT_EXAMPLE_1
 from sutekh.tests.io.test_ARDBXMLDeckParser import ARDB_DECK_EXAMPLE_1
@@ -28,6 +31,8 @@ from sutekh.tests.io.test_ELDBDeckFileParser import ELDB_TEXT_EXAMPLE_1
 from sutekh.tests.io.test_LackeyDeckParser import LACKEY_EXAMPLE_1
 from sutekh.tests.io.test_AbstractCardSetParser import ACS_EXAMPLE_1
 from sutekh.tests.io.test_PhysicalCardSetParser import PCS_EXAMPLE_1
+from sutekh.tests.io.test_SLDeckParser import TestSLDeckParser
+from sutekh.tests.io.test_SLInventoryParser import TestSLInventoryParser
 
 
 class TestGuessFileParser(SutekhTest):
@@ -67,5 +72,20 @@ class TestGuessFileParser(SutekhTest):
                         oHolder2.get_cards(), oGuessParser.oChosenParser,
                         cCorrectParser))
 
+    def test_sniff(self):
+        """Test that the start of the file picks the correct parser"""
+        aTests = self.TESTS + [
+                (SLDeckParser, TestSLDeckParser.sTestText1),
+                (SLInventoryParser, TestSLInventoryParser.sTestText1),
+                ]
+        for cCorrectParser, sData in aTests:
+            aGuesses = sniff_format(sData[:SNIFF_SIZE])
+            self.assertTrue(aGuesses, "No guess for %s" % cCorrectParser)
+            self.assertEqual(aGuesses[0][1], cCorrectParser)
+        # Unrecognised data gives no guesses, so everything is tried
+        self.assertEqual(sniff_format('<unknown />'), [])
+        self.assertEqual(sniff_format('   \n  '), [])
+        self.assertEqual(sniff_format('"Unmatched quote\n2\tCard'), [])
+
 if __name__ == "__main__":
     unittest.main()
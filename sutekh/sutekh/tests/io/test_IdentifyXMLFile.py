@@ -6,6 +6,7 @@
 """Test IdentifyXMLFile handling"""
 
 from sutekh.tests.TestCore import SutekhTest
+from sutekh.core.SutekhObjects import PhysicalCardSet
 from sutekh.io.IdentifyXMLFile import IdentifyXMLFile
 from sutekh.tests.io.test_AbstractCardSetParser import ACS_EXAMPLE_1
 from sutekh.tests.io.test_PhysicalCardSetParser import PCS_EXAMPLE_1
@@ -47,5 +48,27 @@ class TestIdentifyXMLFile(SutekhTest):
         oIdFile.parse(StringIO(PCS_EXAMPLE_1))
         self.assertEqual(oIdFile.type, 'PhysicalCardSet')
 
+    def test_root_only(self):
+        """Test that only the root element is used"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oIdFile = IdentifyXMLFile()
+        # The rest of the file isn't read, so truncated files are
+        # identified
+        oIdFile.parse(StringIO(PCS_EXAMPLE_1[:150]))
+        self.assertEqual(oIdFile.type, 'PhysicalCardSet')
+        self.assertEqual(oIdFile.name, 'Test Set 1')
+        self.assertFalse(oIdFile.exists)
+
+        # Existence checks are cached until the cache is cleared
+        oPCS = PhysicalCardSet(name='Test Set 1')
+        oIdFile.parse(StringIO(PCS_EXAMPLE_1))
+        self.assertFalse(oIdFile.exists)
+        oIdFile.clear_cache()
+        oIdFile.parse(StringIO(PCS_EXAMPLE_1))
+        self.assertTrue(oIdFile.exists)
+        self.assertTrue(oIdFile.parent_exists)
+        PhysicalCardSet.delete(oPCS.id)
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,10 +5,17 @@
 
 """Test the white wolf card reader"""
 
-from sutekh.tests.TestCore import SutekhTest
+from sutekh.tests.TestCore import SutekhTest, make_null_handler
+from sutekh.tests.TestData import TEST_CARD_LIST
 from sutekh.core.SutekhObjects import AbstractCard, IAbstractCard, \
         IPhysicalCard, IClan, IDisciplinePair, ICardType, ISect, ITitle, \
-        ICreed, IVirtue, IExpansion, IRarity, IRarityPair, IArtist, IKeyword
+        ICreed, IVirtue, IExpansion, IRarity, IRarityPair, IArtist, \
+        IKeyword, PhysicalCard, RarityPair, Keyword, PhysicalCardSet
+from sutekh.SutekhUtility import read_white_wolf_list, update_white_wolf_list
+from sutekh.core.CardSetUtilities import delete_physical_card_set
+from sutekh.io.WhiteWolfTextParser import parse_card_records, \
+        MessageRecorder
+from sutekh.io.WwFile import WwFile
 from sqlobject import SQLObjectNotFound
 import unittest
 
@@ -564,6 +571,85 @@ class WhiteWolfParserTests(SutekhTest):
         self.assertEqual(oSmite.costtype, "conviction")
         self.failUnless(oSmite.text.startswith('{Strike:}'))
 
+    def test_reread(self):
+        """Test reading the card list into an existing database"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aTables = [AbstractCard, PhysicalCard, RarityPair, Keyword]
+        aCounts = [cTable.select().count() for cTable in aTables]
+        oAbebe = IAbstractCard('Abebe')
+        aKeywords = sorted([oK.keyword for oK in oAbebe.keywords])
+
+        sCardList = self._create_tmp_file(TEST_CARD_LIST)
+        read_white_wolf_list([WwFile(sCardList)], make_null_handler())
+
+        # The existing cards are updated, rather than duplicated
+        self.assertEqual([cTable.select().count() for cTable in aTables],
+                aCounts)
+        self.assertEqual(IAbstractCard('Abebe').id, oAbebe.id)
+        self.assertEqual(sorted([oK.keyword for oK in oAbebe.keywords]),
+                aKeywords)
+        self.assertEqual([oC.name for oC in oAbebe.clan], [u'Samedi'])
+        self.assertEqual(oAbebe.capacity, 4)
+
+    def test_parallel_parse(self):
+        """Test that parsing in several processes matches a serial
+           parse"""
+        sCardList = self._create_tmp_file(TEST_CARD_LIST)
+        oSerialLog = MessageRecorder()
+        aSerial = parse_card_records([WwFile(sCardList)], oSerialLog)
+        oParallelLog = MessageRecorder()
+        aParallel = parse_card_records([WwFile(sCardList)], oParallelLog, 3)
+        self.assertEqual(len(aParallel), len(aSerial))
+        self.assertEqual([vars(oRec) for oRec in aParallel],
+                [vars(oRec) for oRec in aSerial])
+        # Both report the same messages, apart from the timing
+        self.assertEqual(oParallelLog.aMessages[:-1],
+                oSerialLog.aMessages[:-1])
+
+    def test_update(self):
+        """Test updating the card list in place"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        oHandler = make_null_handler()
+        oAbebe = IAbstractCard('Abebe')
+        sCardList = self._create_tmp_file(TEST_CARD_LIST)
+        # Nothing changes if the card list is the same
+        self.assertEqual(update_white_wolf_list([WwFile(sCardList)],
+            oHandler), set())
+
+        iStart = TEST_CARD_LIST.index('Name: Abebe')
+        iEnd = TEST_CARD_LIST.index('\n\n', iStart) + 2
+        sAbebe = TEST_CARD_LIST[iStart:iEnd]
+        sErrata = self._create_tmp_file(TEST_CARD_LIST.replace(sAbebe,
+            sAbebe.replace('Capacity: 4', 'Capacity: 5').replace(
+                'Clan: Samedi', 'Clan: Brujah')))
+        sRemoved = self._create_tmp_file(TEST_CARD_LIST.replace(sAbebe, ''))
+        oPCS = None
+        try:
+            self.assertEqual(update_white_wolf_list([WwFile(sErrata)],
+                oHandler), set([oAbebe.id]))
+            self.assertEqual(oAbebe.capacity, 5)
+            self.assertEqual([oC.name for oC in oAbebe.clan], [u'Brujah'])
+
+            # Cards in card sets aren't removed
+            oPCS = PhysicalCardSet(name='Test Update')
+            oPCS.addPhysicalCard(IPhysicalCard((oAbebe, None)))
+            update_white_wolf_list([WwFile(sRemoved)], oHandler)
+            self.assertEqual(IAbstractCard('Abebe').id, oAbebe.id)
+            self.assertEqual(len(oPCS.cards), 1)
+        finally:
+            # The other tests expect the original card list, so restore it
+            # even if the checks above fail
+            if oPCS is not None:
+                delete_physical_card_set(oPCS.name)
+            aRestored = update_white_wolf_list([WwFile(sCardList)],
+                    oHandler)
+
+        self.assertEqual(aRestored, set([oAbebe.id]))
+        self.assertEqual(oAbebe.capacity, 4)
+        self.assertEqual([oC.name for oC in oAbebe.clan], [u'Samedi'])
+
 
 if __name__ == "__main__":
     unittest.main()
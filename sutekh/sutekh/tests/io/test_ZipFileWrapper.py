@@ -16,10 +16,20 @@ from sutekh.core.SutekhObjects import IPhysicalCardSet, PhysicalCardSet
 from sutekh.io.ZipFileWrapper import ZipFileWrapper
 from sutekh.gui.ProgressDialog import SutekhCountLogHandler
 from sutekh.core.CardSetUtilities import delete_physical_card_set
+from sutekh.core.CardLookup import SimpleLookup, LookupFailed
+from sqlobject import sqlhub
+from logging import Logger
 import unittest
 import zipfile
 
 
+class CancelledLookup(SimpleLookup):
+    """Lookup which behaves as if the user cancelled the lookup"""
+
+    def lookup(self, aNames, sInfo):
+        raise LookupFailed('Cancelled')
+
+
 class ZipFileWrapperTest(SutekhTest):
     """class for the Zip File tests"""
     # pylint: disable-msg=R0904
@@ -109,6 +119,107 @@ class ZipFileWrapperTest(SutekhTest):
         self.assertEqual(len(oPhysCardSet1.cards), 6)
         self.assertEqual(len(oPhysCardSet2.cards), 5)
 
+    def test_parallel_dump(self):
+        """Test that dumping with several processes gives the same zip
+           file contents as a serial dump"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aPhysCards = get_phys_cards()
+        oMyCollection = PhysicalCardSet(name='My Collection')
+        for oCard in aPhysCards:
+            oMyCollection.addPhysicalCard(oCard.id)
+        for iLoop, sName in enumerate(CARD_SET_NAMES):
+            oPCS = PhysicalCardSet(name=sName, parent=oMyCollection)
+            for oCard in aPhysCards[iLoop:]:
+                oPCS.addPhysicalCard(oCard.id)
+                oPCS.addPhysicalCard(oCard.id)
+
+        dContents = {}
+        for iProcesses in (1, 3):
+            sTempFileName = self._create_tmp_file()
+            oZipFile = ZipFileWrapper(sTempFileName)
+            aNames = oZipFile.do_dump_all_to_zip(iProcesses=iProcesses)
+            oZip = zipfile.ZipFile(sTempFileName, 'r')
+            self.assertEqual(oZip.testzip(), None)
+            self.assertEqual(oZip.namelist(), aNames)
+            dContents[iProcesses] = [oZip.read(sName) for sName in aNames]
+            oZip.close()
+        self.assertEqual(len(dContents[1]), len(CARD_SET_NAMES) + 1)
+        self.assertEqual(dContents[1], dContents[3])
+
+    def test_restore_order(self):
+        """Test restoring card sets stored before their parents"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aPhysCards = get_phys_cards()
+        oParent = None
+        for iLevel in range(6):
+            oParent = PhysicalCardSet(name='Level %d' % iLevel,
+                    parent=oParent)
+            oParent.addPhysicalCard(aPhysCards[iLevel].id)
+        # Children are written first, so every card set is stored before
+        # its parent
+        sTempFileName = self._create_tmp_file()
+        oZipFile = ZipFileWrapper(sTempFileName)
+        oZipFile.write_pcs_list_to_zip([IPhysicalCardSet('Level %d' % iLevel)
+            for iLevel in range(5, -1, -1)], Logger('test'))
+
+        oZipFile = ZipFileWrapper(sTempFileName)
+        oZipFile.do_restore_from_zip()
+        self.assertEqual(oZipFile.get_warnings(), [])
+        self.assertEqual(PhysicalCardSet.select().count(), 6)
+        for iLevel in range(1, 6):
+            oPCS = IPhysicalCardSet('Level %d' % iLevel)
+            self.assertEqual(oPCS.parent.name, 'Level %d' % (iLevel - 1))
+            self.assertEqual([x.abstractCard.name for x in oPCS.cards],
+                    [aPhysCards[iLevel].abstractCard.name])
+        self.assertEqual(IPhysicalCardSet('Level 0').parent, None)
+
+        # Unsatisfiable parents leave the database untouched
+        sTempFileName = self._create_tmp_file()
+        oZip = zipfile.ZipFile(sTempFileName, 'w')
+        oZip.writestr('loop.xml', '<physicalcardset sutekh_xml_version="1.3"'
+                ' name="Loop" parent="Loop"><comment /><annotations />'
+                '</physicalcardset>')
+        oZip.close()
+        oZipFile = ZipFileWrapper(sTempFileName)
+        self.assertRaises(IOError, oZipFile.do_restore_from_zip)
+        self.assertEqual(PhysicalCardSet.select().count(), 6)
+
+    def test_failed_restore(self):
+        """Test that a failed restore keeps the existing card sets"""
+        # pylint: disable-msg=E1101
+        # E1101: SQLObject + PyProtocols magic confuses pylint
+        aPhysCards = get_phys_cards()
+        oPCS = PhysicalCardSet(name='Existing Set')
+        oPCS.addPhysicalCard(aPhysCards[0].id)
+        oPCS.syncUpdate()
+        sTempFileName = self._create_tmp_file()
+        ZipFileWrapper(sTempFileName).do_dump_all_to_zip()
+
+        # Cancelling a lookup
+        oZipFile = ZipFileWrapper(sTempFileName)
+        self.assertRaises(LookupFailed, oZipFile.do_restore_from_zip,
+                CancelledLookup())
+        self.assertEqual([x.name for x in PhysicalCardSet.select()],
+                ['Existing Set'])
+
+        # Duplicate card set names
+        sTempFileName = self._create_tmp_file()
+        oZip = zipfile.ZipFile(sTempFileName, 'w')
+        for sFilename in ['dup1.xml', 'dup2.xml']:
+            oZip.writestr(sFilename, '<physicalcardset'
+                    ' sutekh_xml_version="1.3" name="Dup"><comment />'
+                    '<annotations /></physicalcardset>')
+        oZip.close()
+        oZipFile = ZipFileWrapper(sTempFileName)
+        self.assertRaises(sqlhub.processConnection.module.IntegrityError,
+                oZipFile.do_restore_from_zip)
+        oPCS = IPhysicalCardSet('Existing Set')
+        self.assertEqual(PhysicalCardSet.select().count(), 1)
+        self.assertEqual([x.abstractCard.name for x in oPCS.cards],
+                [aPhysCards[0].abstractCard.name])
+
     def test_read_single(self):
         """Check read_single_works"""
         # pylint: disable-msg=E1101